@@ -6,9 +6,10 @@ from flask_login import LoginManager
 from flask_wtf.csrf import CSRFProtect
 from config import config # Import the config dictionary
 from datetime import datetime # Import datetime
+from .db_routing import RoutingSession
 
 # Initialize extensions, but don't associate with an app yet
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession}) # Read-only views may read from a replica (app/db_routing.py)
 login_manager = LoginManager()
 csrf = CSRFProtect()
 
@@ -29,10 +30,37 @@ def create_app(config_name='default'):
     config[config_name].init_app(app)
     app.config.from_pyfile('config.py', silent=True)
 
+    # Pool settings (server databases) and per-connection PRAGMAs (SQLite) from the config's database profile
+    from . import db_profile
+    db_profile.configure_engine_options(app)
     db.init_app(app)
+    db_profile.init_app(app)
+    # Read-only views can read from the optional 'replica' bind
+    from . import db_routing
+    db_routing.init_app(app)
     login_manager.init_app(app)
     csrf.init_app(app)
 
+    # In-process barcode/SKU lookup index (one per worker, built on first use)
+    from . import product_index
+    product_index.init_app(app)
+
+    # TTL cache for dashboard metric blocks (invalidated after commits that change them)
+    from . import cache
+    cache.init_app(app)
+
+    # Rendered barcode images for sticker sheets (LRU, optionally backed by files under instance/)
+    from . import barcode_images
+    barcode_images.init_app(app)
+
+    # Auto-generated barcode numbers, reserved from the database in blocks per worker
+    from . import barcode_sequence
+    barcode_sequence.init_app(app)
+
+    # Per-request timing and SQL statistics, slow query log and the /metrics endpoint
+    from . import instrumentation
+    instrumentation.init_app(app)
+
     # --- Register Blueprints ---
     # Import and register each blueprint
     from .auth import auth_bp as auth_blueprint
@@ -51,6 +79,9 @@ def create_app(config_name='default'):
     # Use the correct variable name 'customers_blueprint' here:
     app.register_blueprint(customers_blueprint, url_prefix='/customers') # CORRECTED LINE
 
+    from .jobs import jobs_bp as jobs_blueprint
+    app.register_blueprint(jobs_blueprint, url_prefix='/jobs')
+
     # --- Context Processors ---
     @app.context_processor
     def inject_global_variables():
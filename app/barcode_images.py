@@ -0,0 +1,82 @@
+# app/barcode_images.py
+"""
+Barcode artwork for sticker sheets, produced once per distinct barcode.
+
+* Raster: Code128 PNGs rendered by python-barcode's ImageWriter are kept in
+  an in-process LRU (BARCODE_CACHE_MAX_ENTRIES) keyed by (value, options).
+  With BARCODE_DISK_CACHE enabled they are also stored as files under
+  BARCODE_CACHE_DIR (instance/barcodes by default), so they are shared by
+  all workers and survive restarts. A barcode's image never changes for the
+  same options, so entries never need invalidating.
+* Vector: ReportLab's own Code128 widget draws the bars directly on the PDF
+  canvas, with no PIL rendering or image embedding at all
+  (BARCODE_STICKER_RENDERER = 'vector').
+"""
+from reportlab.graphics.barcode.code128 import Code128 as VectorCode128
+from barcode import Code128
+from barcode.writer import ImageWriter
+from flask import current_app
+import io
+import os
+
+from .cache import FileCache, MemoryCache
+
+NEVER_EXPIRES = 10 * 365 * 24 * 3600 # Seconds; rendered barcodes stay valid for good
+
+# Options used for sticker rasters: python-barcode ImageWriter options plus the image mode.
+# Grayscale ('L') PNGs are a third the size of RGB ones and much cheaper for ReportLab to embed.
+STICKER_RASTER_OPTIONS = { 'module_height': 5.0, 'font_size': 6, 'text_distance': 2.0, 'quiet_zone': 2.0, 'write_text': True, 'mode': 'L' }
+
+
+def render_barcode_png(value, options):
+    """Renders a Code128 PNG with python-barcode (the slow path the store avoids repeating)."""
+    options = dict(options); buffer = io.BytesIO()
+    Code128(value, writer=ImageWriter(mode=options.pop('mode', 'RGB'))).write(buffer, options=options)
+    return buffer.getvalue()
+
+
+class BarcodeImageStore:
+    """LRU of rendered barcode PNGs with an optional on-disk second level."""
+    def __init__(self, max_entries=2048, directory=None):
+        self.memory = MemoryCache(default_ttl=NEVER_EXPIRES, max_entries=max_entries)
+        self.disk = FileCache(directory, default_ttl=NEVER_EXPIRES) if directory else None
+        self.renders = 0
+
+    @staticmethod
+    def key(value, options):
+        return 'barcode:code128:' + value + '|' + ','.join(f'{name}={options[name]}' for name in sorted(options))
+
+    def png(self, value, options=STICKER_RASTER_OPTIONS):
+        key = self.key(value, options)
+        png = self.memory.get(key)
+        if png is None and self.disk is not None:
+            png = self.disk.get(key)
+            if png is not None: self.memory.set(key, png)
+        if png is None:
+            png = render_barcode_png(value, options); self.renders += 1
+            self.memory.set(key, png)
+            if self.disk is not None: self.disk.set(key, png)
+        return png
+
+    def info(self):
+        info = dict(self.memory.info(), renders=self.renders, disk=self.disk is not None)
+        if self.disk is not None: info['disk_directory'] = self.disk.directory
+        return info
+
+
+def vector_barcode(value, width, bar_height, font_size=6):
+    """ReportLab Code128 widget for value, with module width chosen so the bars span width (draw with .drawOn(canvas, x, y))."""
+    widget = VectorCode128(value, barHeight=bar_height, humanReadable=True, fontSize=font_size, quiet=False)
+    return VectorCode128(value, barWidth=widget.barWidth * width / widget.width, barHeight=bar_height,
+                         humanReadable=True, fontSize=font_size, quiet=False)
+
+
+def get_barcode_store():
+    """Returns the barcode image store of the current app."""
+    return current_app.extensions['barcode_images']
+
+
+def init_app(app):
+    directory = app.config.get('BARCODE_CACHE_DIR') or os.path.join(app.instance_path, 'barcodes')
+    if not app.config.get('BARCODE_DISK_CACHE'): directory = None
+    app.extensions['barcode_images'] = BarcodeImageStore(app.config.get('BARCODE_CACHE_MAX_ENTRIES', 2048), directory)
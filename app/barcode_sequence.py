@@ -0,0 +1,112 @@
+# app/barcode_sequence.py
+"""
+Allocator for auto-generated barcodes (BARCODE_PREFIX + zero-padded number, e.g. A3M00001).
+
+The next unreserved number of each prefix is a row in barcode_sequences. Each
+worker process reserves BARCODE_BLOCK_SIZE numbers at a time with one atomic
+UPDATE in a short transaction of its own (separate from the request's session),
+then hands them out from memory. Concurrent workers never receive the same
+number and most allocations do not touch the database. Numbers still unused in
+a block when a worker stops are never handed out, so barcodes can have gaps.
+
+allocate_barcodes(n) returns n barcodes in one call (bulk product creation). It
+skips numbers already used by a barcode typed in by hand.
+
+The sequence row is created on first use, starting after the highest existing
+barcode with the prefix (or at BARCODE_START_NUMBER).
+"""
+import threading
+
+from flask import current_app
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from . import db
+from .models import BarcodeSequence, Product
+from .stock_ledger import CHUNK_SIZE
+
+_sequences = BarcodeSequence.__table__
+
+BARCODE_PADDING_DIGITS = 5 # A3M00001; larger numbers simply get longer
+
+
+class BarcodeAllocator:
+    """Per-process block of reserved numbers for one prefix."""
+
+    def __init__(self, prefix, block_size=50, start_number=1):
+        self.prefix = prefix
+        self.block_size = max(1, block_size)
+        self.start_number = start_number
+        self.reservations = 0 # Blocks taken from the database by this process
+        self._lock = threading.Lock()
+        self._next = self._end = 0
+
+    def format(self, number):
+        return f'{self.prefix}{number:0{BARCODE_PADDING_DIGITS}d}'
+
+    def allocate(self, count=1):
+        """Returns count unused barcode numbers (reserving further blocks as needed)."""
+        numbers = []
+        with self._lock:
+            while len(numbers) < count:
+                if self._next >= self._end:
+                    self._next, self._end = self._reserve(max(self.block_size, count - len(numbers)))
+                take = min(count - len(numbers), self._end - self._next)
+                numbers.extend(range(self._next, self._next + take)); self._next += take
+        return numbers
+
+    def _reserve(self, size):
+        """Moves the sequence on by size in a transaction of its own and returns the reserved range (first, end)."""
+        engine = db.engine
+        for _ in range(2):
+            with engine.begin() as connection:
+                if engine.dialect.update_returning:
+                    end = connection.execute(update(_sequences).where(_sequences.c.prefix == self.prefix)
+                                             .values(next_value=_sequences.c.next_value + size).returning(_sequences.c.next_value)).scalar()
+                else: # e.g. MySQL: lock the row, then move it on
+                    first = connection.execute(select(_sequences.c.next_value).where(_sequences.c.prefix == self.prefix).with_for_update()).scalar()
+                    end = None if first is None else first + size
+                    if end is not None: connection.execute(update(_sequences).where(_sequences.c.prefix == self.prefix).values(next_value=end))
+            if end is not None:
+                self.reservations += 1
+                return end - size, end
+            try:
+                with engine.begin() as connection:
+                    connection.execute(insert(_sequences).values(prefix=self.prefix, next_value=self._first_free(connection)))
+                current_app.logger.info(f"Barcode sequence '{self.prefix}' created.")
+            except IntegrityError: # Another worker created it first
+                pass
+        raise RuntimeError(f"Barcode sequence '{self.prefix}' could not be created.")
+
+    def _first_free(self, connection):
+        """One after the highest number among existing barcodes with the prefix (read once, when the sequence is created)."""
+        highest = self.start_number - 1
+        for barcode in connection.execute(select(Product.barcode).where(Product.barcode.like(f'{self.prefix}%'))).scalars():
+            suffix = barcode[len(self.prefix):]
+            if suffix.isdigit(): highest = max(highest, int(suffix))
+        return highest + 1
+
+
+def init_app(app):
+    app.extensions['barcode_sequence'] = BarcodeAllocator(app.config.get('BARCODE_PREFIX', 'A3M'), app.config.get('BARCODE_BLOCK_SIZE', 50),
+                                                          app.config.get('BARCODE_START_NUMBER', 1))
+
+
+def get_barcode_allocator():
+    return current_app.extensions['barcode_sequence']
+
+
+def allocate_barcodes(count):
+    """
+    Returns count new, unused barcodes in allocation order. Call it before the request's
+    own write transaction starts: on SQLite, reserving a block needs the write lock.
+    """
+    allocator = get_barcode_allocator()
+    barcodes = []
+    while len(barcodes) < count:
+        candidates = [allocator.format(number) for number in allocator.allocate(count - len(barcodes))]
+        taken = set()
+        for start in range(0, len(candidates), CHUNK_SIZE): # Barcodes typed in by hand can match a sequence number
+            taken.update(db.session.execute(select(Product.barcode).where(Product.barcode.in_(candidates[start:start + CHUNK_SIZE]))).scalars())
+        barcodes.extend(barcode for barcode in candidates if barcode not in taken)
+    return barcodes
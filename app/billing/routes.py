@@ -1,19 +1,31 @@
 # app/billing/routes.py
 from flask import render_template, redirect, url_for, flash, request, current_app, jsonify, Response, abort
 from flask_login import login_required, current_user
-from sqlalchemy import or_
+from sqlalchemy import func, or_
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import joinedload
-from datetime import datetime
+from datetime import date, datetime
 
 from . import billing_bp
-from ..models import Product, Customer, Sale, SaleItem, SaleReturn, SaleReturnItem
+from ..models import Product, Customer, Sale, SaleItem, SaleReturn
 from .. import db
 from ..utils import generate_a4_invoice_pdf, generate_thermal_receipt
+from ..invoice_pdf import load_invoice_data, render_invoices_pdf, render_invoices_zip
+from ..job_queue import enqueue, job_handler
+from ..pagination import keyset_paginate
+from ..stock_ledger import commit_with_retry, decrement_stock
+from ..product_index import get_product_index
+from ..sales_rollup import record_sale
+from ..sale_returns import ReturnError, record_return_lines
+from ..offline_sales import ingest_offline_sales, parse_sale_lines, stored_refs, valid_client_ref
+from ..instrumentation import sampled_debug
+from ..db_routing import use_replica
 
 @billing_bp.route('/billing')
 @login_required
 def billing_page():
     """Displays the main billing interface."""
+    get_product_index().ensure_built() # Warm the scan index before the first barcode arrives
     return render_template('billing/billing.html', title='Billing')
 
 
@@ -21,61 +33,38 @@ def billing_page():
 @login_required
 def process_sale():
     """Processes the submitted sale data from the billing interface."""
-    current_app.logger.info("--- process_sale route initiated ---")
     data = request.get_json()
     if not data:
         current_app.logger.error("Invalid data format: No JSON data received.")
         return jsonify({'status': 'error', 'message': 'Invalid data format. JSON expected.'}), 400
     
-    current_app.logger.info(f"Received sale data: {data}")
+    sampled_debug("process_sale received: %s", data)
 
     items_data = data.get('items', [])
     customer_id = data.get('customer_id')
     payment_method = data.get('payment_method', 'Cash')
     notes = data.get('notes')
+    client_ref = valid_client_ref(data) # Lets a copy of this sale queued offline after a lost response sync as a duplicate
 
     if not items_data:
          current_app.logger.warning("Attempted to process sale with no items.")
          return jsonify({'status': 'error', 'message': 'Cannot process a sale with no items.'}), 400
+    if client_ref:
+        stored_sale_id = stored_refs([client_ref]).get(client_ref)
+        if stored_sale_id: return _duplicate_sale_response(stored_sale_id) # A retry of a sale whose response was lost
 
-    sale_items_to_add = []
-    stock_updates = []
-    subtotal = 0.0
-    total_discount = 0.0
-
-    current_app.logger.info("Starting item processing loop...")
     try:
-        for i, item_data in enumerate(items_data):
-            current_app.logger.info(f"Processing item {i+1}: {item_data}")
-            product_id = item_data.get('product_id')
-            quantity = item_data.get('quantity')
-            price_at_sale = item_data.get('price_at_sale')
-            discount_applied = item_data.get('discount_applied', 0.0)
-
-            if not all([product_id, quantity, price_at_sale is not None]):
-                raise ValueError(f"Item {i+1}: Missing data (product_id, quantity, or price_at_sale).")
-            if int(quantity) <= 0 or float(price_at_sale) < 0 or float(discount_applied) < 0:
-                 raise ValueError(f"Item {i+1}: Quantity must be positive and prices/discounts non-negative.")
-
-            product = Product.query.get(int(product_id))
-            if not product:
-                raise ValueError(f"Item {i+1}: Product with ID {product_id} not found.")
-            
-            current_app.logger.info(f"Item {i+1} - Product '{product.name}': Current stock {product.stock_quantity}, Requested {quantity}")
-            if product.stock_quantity < int(quantity):
-                 raise ValueError(f"Insufficient stock for product '{product.name}'. Available: {product.stock_quantity}, Requested: {quantity}")
-
-            item_subtotal = int(quantity) * float(price_at_sale)
-            subtotal += item_subtotal
-            total_discount += float(discount_applied)
+        sale_lines, requested_quantities, subtotal, total_discount = parse_sale_lines(items_data)
 
-            sale_item = SaleItem(
-                product_id=product.id, quantity=int(quantity),
-                price_at_sale=float(price_at_sale), discount_applied=float(discount_applied)
-            )
-            sale_items_to_add.append(sale_item)
-            stock_updates.append({'product': product, 'quantity': int(quantity)})
-        current_app.logger.info("Item processing loop completed.")
+        # Load every product in the cart with a single IN (...) query and validate against the map
+        products = {p.id: p for p in Product.query.filter(Product.id.in_(list(requested_quantities))).all()}
+        for i, line in enumerate(sale_lines):
+            if line['product_id'] not in products:
+                raise ValueError(f"Item {i+1}: Product with ID {line['product_id']} not found.")
+        for product_id, quantity in requested_quantities.items():
+            product = products[product_id]
+            if product.stock_quantity < quantity:
+                 raise ValueError(f"Insufficient stock for product '{product.name}'. Available: {product.stock_quantity}, Requested: {quantity}")
     except ValueError as e:
          current_app.logger.error(f"Sale processing validation error during item loop: {e}")
          return jsonify({'status': 'error', 'message': str(e)}), 400
@@ -85,67 +74,50 @@ def process_sale():
 
     final_amount = subtotal - total_discount
     if final_amount < 0: final_amount = 0
-    current_app.logger.info(f"Calculated totals: Subtotal={subtotal}, Discount={total_discount}, Final={final_amount}")
+    sampled_debug("process_sale totals: subtotal=%s discount=%s final=%s", subtotal, total_discount, final_amount)
 
     try:
-        current_app.logger.info("Attempting to create Sale record...")
         customer = None
         if customer_id:
             customer = Customer.query.get(int(customer_id))
-            current_app.logger.info(f"Customer fetched: {customer.name if customer else 'None'}")
-
-        new_sale = Sale(
-            sale_timestamp=datetime.utcnow(), total_amount=subtotal, discount_total=total_discount,
-            final_amount=final_amount, payment_method=payment_method, notes=notes,
-            user_id=current_user.id, customer_id=customer.id if customer else None
-        )
-        db.session.add(new_sale)
-        current_app.logger.info("Sale object added to session. Flushing session...")
-        db.session.flush() # Get the new_sale.id
-        current_app.logger.info(f"Sale flushed, new_sale.id: {new_sale.id}. Adding sale items...")
-
-        for item in sale_items_to_add:
-            item.sale_id = new_sale.id
-            db.session.add(item)
-        current_app.logger.info("Sale items added to session. Updating stock...")
-
-        for update in stock_updates:
-            product_to_update = db.session.merge(update['product']) # Ensure product is in current session
-            current_app.logger.info(f"Updating stock for {product_to_update.name}: current {product_to_update.stock_quantity}, change -{update['quantity']}")
-            if product_to_update.stock_quantity >= update['quantity']:
-                 product_to_update.stock_quantity -= update['quantity']
-            else:
-                 db.session.rollback()
-                 current_app.logger.error(f"Stock level discrepancy for {product_to_update.name} during final save.")
-                 raise ValueError(f"Stock level discrepancy for {product_to_update.name} during final save.")
-        current_app.logger.info("Stock updates prepared. Attempting commit...")
-        db.session.commit()
-        current_app.logger.info(f"Sale {new_sale.id} committed successfully.")
-
-        receipt_items = []
-        for item in new_sale.items:
-             item_total_before_discount = item.quantity * item.price_at_sale
-             discount_percent = 0.0
-             if item_total_before_discount > 0 and item.discount_applied > 0:
-                 discount_percent = (item.discount_applied / item_total_before_discount) * 100
-             receipt_items.append({
-                'name': item.product.name, 'quantity': item.quantity, 'price': "%.2f" % item.price_at_sale,
-                'item_total_before_discount': "%.2f" % item_total_before_discount,
-                'discount_percent': "%.2f" % discount_percent, 'discount_amount': "%.2f" % item.discount_applied,
-                'net_amount': "%.2f" % (item_total_before_discount - item.discount_applied) })
-        receipt_data = {
-            'sale_id': new_sale.id, 'timestamp': new_sale.sale_timestamp.isoformat(),
-            'subtotal': "%.2f" % new_sale.total_amount, 'discount': "%.2f" % new_sale.discount_total,
-            'total': "%.2f" % new_sale.final_amount, 'payment_method': new_sale.payment_method,
-            'customer_name': new_sale.customer.name if new_sale.customer else None,
-            'customer_phone': new_sale.customer.phone_number if new_sale.customer else None,
-            'items': receipt_items
-        }
+
+        # Plain values only from here on: a retried transaction rolls back and expires ORM objects
+        user_id = current_user.id
+        product_names = {product_id: product.name for product_id, product in products.items()}
+        product_categories = {product_id: product.category for product_id, product in products.items()}
+        customer_info = {'id': customer.id, 'name': customer.name, 'phone': customer.phone_number} if customer else None
+
+        def save_sale():
+            new_sale = Sale(
+                sale_timestamp=datetime.utcnow(), total_amount=subtotal, discount_total=total_discount,
+                final_amount=final_amount, payment_method=payment_method, notes=notes,
+                user_id=user_id, customer_id=customer_info['id'] if customer_info else None, client_ref=client_ref
+            )
+            db.session.add(new_sale)
+            db.session.flush() # Get the new_sale.id
+
+            item_rows = [dict(line, sale_id=new_sale.id) for line in sale_lines]
+            db.session.execute(SaleItem.__table__.insert(), item_rows)
+
+            decrement_stock(requested_quantities) # Conditional UPDATE; raises InsufficientStockError if a till beat us to it
+            record_sale(new_sale, sale_lines, product_categories) # Dashboard/report rollups, same transaction
+            # Build the receipt before committing: the commit expires every loaded object
+            return _build_receipt_data(new_sale, sale_lines, product_names, customer_info)
+
+        receipt_data = commit_with_retry(save_sale)
+        sampled_debug("Sale %s committed with %d lines.", receipt_data['sale_id'], len(sale_lines))
+
         thermal_receipt_text = generate_thermal_receipt(receipt_data)
         return jsonify({
             'status': 'success', 'message': 'Sale processed successfully!',
             'receipt_data': receipt_data, 'thermal_receipt': thermal_receipt_text
             }), 200
+    except IntegrityError as e:
+        db.session.rollback()
+        stored_sale_id = stored_refs([client_ref]).get(client_ref) if client_ref else None
+        if stored_sale_id: return _duplicate_sale_response(stored_sale_id) # The same sale was stored by a concurrent retry
+        current_app.logger.error(f"Error saving sale (IntegrityError): {e}", exc_info=True)
+        return jsonify({'status': 'error', 'message': 'Failed to save sale record due to an internal error.'}), 500
     except ValueError as e: # Specific stock error from transaction or earlier
          db.session.rollback()
          current_app.logger.error(f"Error saving sale (ValueError): {e}", exc_info=True)
@@ -156,35 +128,71 @@ def process_sale():
         return jsonify({'status': 'error', 'message': 'Failed to save sale record due to an internal error.'}), 500
 
 
+@billing_bp.route('/billing/sync', methods=['POST'])
+@login_required
+def sync_offline_sales():
+    """Bulk ingest of sales queued by a till while offline (see app/offline_sales.py); one result per sale."""
+    data = request.get_json(silent=True) or {}
+    queued_sales = data.get('sales')
+    if not isinstance(queued_sales, list) or not queued_sales:
+        return jsonify({'status': 'error', 'message': 'Invalid data format. A list of sales is expected.'}), 400
+    max_sales = current_app.config.get('OFFLINE_SYNC_MAX_SALES', 500)
+    if len(queued_sales) > max_sales:
+        return jsonify({'status': 'error', 'message': f'At most {max_sales} sales per sync request.'}), 413
+    try:
+        results = ingest_offline_sales(queued_sales, current_user.id)
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Error syncing {len(queued_sales)} offline sales: {e}", exc_info=True)
+        return jsonify({'status': 'error', 'message': 'Failed to sync queued sales due to an internal error.'}), 500
+    return jsonify({'status': 'success', 'results': results}), 200
+
+
+def _build_receipt_data(sale, sale_lines, product_names, customer_info):
+    """Builds the receipt dictionary from the in-memory cart instead of re-reading sale.items."""
+    receipt_items = []
+    for line in sale_lines:
+         item_total_before_discount = line['quantity'] * line['price_at_sale']
+         discount_percent = 0.0
+         if item_total_before_discount > 0 and line['discount_applied'] > 0:
+             discount_percent = (line['discount_applied'] / item_total_before_discount) * 100
+         receipt_items.append({
+            'name': product_names[line['product_id']], 'quantity': line['quantity'], 'price': "%.2f" % line['price_at_sale'],
+            'item_total_before_discount': "%.2f" % item_total_before_discount,
+            'discount_percent': "%.2f" % discount_percent, 'discount_amount': "%.2f" % line['discount_applied'],
+            'net_amount': "%.2f" % (item_total_before_discount - line['discount_applied']) })
+    return {
+        'sale_id': sale.id, 'timestamp': sale.sale_timestamp.isoformat(),
+        'subtotal': "%.2f" % sale.total_amount, 'discount': "%.2f" % sale.discount_total,
+        'total': "%.2f" % sale.final_amount, 'payment_method': sale.payment_method,
+        'customer_name': customer_info['name'] if customer_info else None,
+        'customer_phone': customer_info['phone'] if customer_info else None,
+        'items': receipt_items
+    }
+
+
+def _duplicate_sale_response(sale_id):
+    """The receipt of an already stored sale, for a process_sale retry carrying its client_ref."""
+    sale = Sale.query.options(joinedload(Sale.customer)).get(sale_id)
+    items = SaleItem.query.options(joinedload(SaleItem.product)).filter_by(sale_id=sale_id).order_by(SaleItem.id).all()
+    sale_lines = [{'product_id': item.product_id, 'quantity': item.quantity, 'price_at_sale': item.price_at_sale, 'discount_applied': item.discount_applied or 0.0} for item in items]
+    customer_info = {'id': sale.customer.id, 'name': sale.customer.name, 'phone': sale.customer.phone_number} if sale.customer else None
+    receipt_data = _build_receipt_data(sale, sale_lines, {item.product_id: item.product.name for item in items}, customer_info)
+    current_app.logger.info(f"process_sale: client_ref of Sale ID {sale_id} posted again, returned as a duplicate.")
+    return jsonify({
+        'status': 'duplicate', 'message': f'This sale was already recorded as Sale ID {sale_id}.',
+        'receipt_data': receipt_data, 'thermal_receipt': generate_thermal_receipt(receipt_data)
+        }), 200
+
+
 @billing_bp.route('/invoice/pdf/<int:sale_id>')
 @login_required
 def download_invoice_pdf(sale_id):
     """Generates and downloads an A4 PDF invoice for a specific sale."""
-    sale = Sale.query.options(
-        joinedload(Sale.items).joinedload(SaleItem.product), # Eager load for PDF data
-        joinedload(Sale.customer),
-        joinedload(Sale.user)
-    ).get_or_404(sale_id)
-
-    sale_data_for_pdf = {
-        'sale_id': sale.id,
-        'timestamp': sale.sale_timestamp.isoformat(),
-        'subtotal': "%.2f" % sale.total_amount,
-        'discount': "%.2f" % sale.discount_total,
-        'total': "%.2f" % sale.final_amount,
-        'payment_method': sale.payment_method,
-        'customer_name': sale.customer.name if sale.customer else None,
-        'items': [
-            {
-                'name': item.product.name,
-                'quantity': item.quantity,
-                'price': "%.2f" % item.price_at_sale,
-                'discount_percent': "%.2f" % ((item.discount_applied / (item.quantity * item.price_at_sale) * 100) if (item.quantity * item.price_at_sale) > 0 and item.discount_applied > 0 else 0.0),
-                'net_amount': "%.2f" % ((item.quantity * item.price_at_sale) - item.discount_applied)
-             } for item in sale.items
-        ]
-    }
-    current_app.logger.info(f"Data for PDF Invoice (Sale ID: {sale_id}): {sale_data_for_pdf}")
+    invoices = load_invoice_data([sale_id]) # Sale.items is a dynamic relationship, so items are loaded by their own query
+    if not invoices: abort(404)
+    sale_data_for_pdf = invoices[0]
+    sampled_debug("Invoice PDF data for sale %s: %s", sale_id, sale_data_for_pdf)
 
     pdf_buffer = generate_a4_invoice_pdf(sale_data_for_pdf)
 
@@ -194,59 +202,102 @@ def download_invoice_pdf(sale_id):
         return redirect(url_for('billing.view_sale', sale_id=sale_id))
 
     response = Response(pdf_buffer.getvalue(), mimetype='application/pdf')
-    response.headers['Content-Disposition'] = f'attachment; filename=Invoice_{sale.id}.pdf'
+    response.headers['Content-Disposition'] = f'attachment; filename=Invoice_{sale_id}.pdf'
     return response
 
 
+INVOICE_BATCH_FORMATS = {'pdf': ('application/pdf', render_invoices_pdf), 'zip': ('application/zip', render_invoices_zip)}
+
+def _batch_sale_ids(day, customers_only):
+    """Ids of the day's sales in invoice order; customers_only keeps B2B sales (those billed to a customer)."""
+    query = db.session.query(Sale.id).filter(Sale.sale_timestamp >= datetime.combine(day, datetime.min.time()),
+                                            Sale.sale_timestamp <= datetime.combine(day, datetime.max.time()))
+    if customers_only: query = query.filter(Sale.customer_id.isnot(None))
+    return [sale_id for sale_id, in query.order_by(Sale.id)]
+
+@billing_bp.route('/invoices/batch')
+@login_required
+def download_invoice_batch():
+    """All invoices of one day in a single PDF or a zip of PDFs (large batches run as a background job)."""
+    batch_format = request.args.get('format', 'pdf'); customers_only = request.args.get('customers_only') == '1'
+    try: day = date.fromisoformat(request.args.get('date', date.today().isoformat()))
+    except ValueError: flash('Invalid date.', 'danger'); return redirect(url_for('billing.list_sales'))
+    if batch_format not in INVOICE_BATCH_FORMATS: batch_format = 'pdf'
+    sale_ids = _batch_sale_ids(day, customers_only)
+    if not sale_ids: flash(f'No {"customer " if customers_only else ""}sales on {day:%d-%b-%Y}.', 'info'); return redirect(url_for('billing.list_sales'))
+    if len(sale_ids) >= current_app.config.get('JOB_INVOICE_BATCH_MIN_SALES', 100):
+        job_id = enqueue('invoice_batch', {'sale_ids': sale_ids, 'day': day.isoformat(), 'batch_format': batch_format}, user_id=current_user.id)
+        flash(f'{len(sale_ids)} invoices: the batch is being prepared in the background.', 'info')
+        return redirect(url_for('jobs.job_status', job_id=job_id))
+    mimetype, render = INVOICE_BATCH_FORMATS[batch_format]
+    response = Response(render(load_invoice_data(sale_ids)).getvalue(), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=Invoices_{day.isoformat()}.{batch_format}'
+    return response
+
+@job_handler('invoice_batch')
+def invoice_batch_job(job, sale_ids, day, batch_format):
+    """Background version of download_invoice_batch for days with many invoices."""
+    mimetype, render = INVOICE_BATCH_FORMATS[batch_format]
+    job.progress(5, f'Loading {len(sale_ids)} sales...')
+    sales_data = load_invoice_data(sale_ids)
+    buffer = render(sales_data, progress=lambda done, total: job.progress(5 + 90 * done // total, f'Rendered {done:,} of {total:,} invoices...'))
+    with open(job.result_file(f'Invoices_{day}.{batch_format}', mimetype), 'wb') as f: f.write(buffer.getvalue())
+    return f'{len(sales_data)} invoices ready.'
+
+
 @billing_bp.route('/sales')
 @login_required
+@use_replica
 def list_sales():
     """Displays a list of past sales transactions with pagination."""
-    page = request.args.get('page', 1, type=int); query = request.args.get('query', '')
-    sales_query = Sale.query.order_by(Sale.sale_timestamp.desc())
+    query = request.args.get('query', '')
+    sales_query = Sale.query.options(joinedload(Sale.customer))
     if query:
         search_term = f"%{query}%"
         sales_query = sales_query.outerjoin(Customer).filter( or_( Sale.id.like(search_term), Customer.name.ilike(search_term), Sale.payment_method.ilike(search_term) ) )
-    pagination = sales_query.paginate( page=page, per_page=current_app.config.get('ITEMS_PER_PAGE', 15), error_out=False )
+    pagination = keyset_paginate(sales_query, [Sale.sale_timestamp, Sale.id], descending=True, count_key=f'sales:{query}')
     sales = pagination.items
-    return render_template( 'billing/sales.html', title='Sales History', sales=sales, pagination=pagination, query=query )
+    # Item counts of the whole page in one grouped query (Sale.items is dynamic, so sale.items.count() would query per row)
+    item_counts = dict(db.session.query(SaleItem.sale_id, func.count(SaleItem.id)).filter(SaleItem.sale_id.in_([sale.id for sale in sales])).group_by(SaleItem.sale_id).all()) if sales else {}
+    return render_template( 'billing/sales.html', title='Sales History', sales=sales, pagination=pagination, query=query, today=date.today().isoformat(), item_counts=item_counts )
 
 @billing_bp.route('/sales/view/<int:sale_id>')
 @login_required
 def view_sale(sale_id):
     """Displays the details of a specific sale."""
     sale = Sale.query.options( joinedload(Sale.customer), joinedload(Sale.user) ).get_or_404(sale_id)
-    # Items and their products will be loaded when sale.items is accessed in the template due to lazy='dynamic'
-    # or the default lazy='select' on SaleItem.product
-    return render_template('billing/sale_detail.html', title=f'Sale Details #{sale.id}', sale=sale)
+    # Sale.items is dynamic and cannot be eager loaded: fetch the items with their products in one query instead
+    items = SaleItem.query.options(joinedload(SaleItem.product), joinedload(SaleItem.return_ledger)).filter_by(sale_id=sale.id).order_by(SaleItem.id).all()
+    returns = SaleReturn.query.filter_by(original_sale_id=sale.id).order_by(SaleReturn.return_timestamp).all() # Indexed on original_sale_id
+    returnable = {item.id: item.quantity - (item.return_ledger.quantity_returned if item.return_ledger else 0) for item in items}
+    return render_template('billing/sale_detail.html', title=f'Sale Details #{sale.id}', sale=sale, items=items, returns=returns, returnable=returnable)
 
 @billing_bp.route('/sales/return/<int:sale_id>', methods=['POST'])
 @login_required
 def process_return(sale_id):
-    """Processes a return against an original sale."""
-    original_sale = Sale.query.options(joinedload(Sale.items).joinedload(SaleItem.product)).get_or_404(sale_id)
-    existing_return = SaleReturn.query.filter_by(original_sale_id=original_sale.id).first()
-    if existing_return:
-        flash(f'A return has already been processed for Sale ID {original_sale.id}.', 'warning')
-        return redirect(url_for('billing.view_sale', sale_id=sale_id))
-    reason = request.form.get('return_reason', 'Full return processed'); total_refund = 0.0
-    return_items_to_add = []; stock_updates = []
+    """Returns the quantities entered per line (return_qty_<sale item id>), or everything still returnable with return_all."""
+    original_sale = Sale.query.get_or_404(sale_id)
+    exchange = bool(request.form.get('exchange'))
+    reason = (request.form.get('return_reason') or '').strip() or ('Exchange' if exchange else 'Full return processed' if request.form.get('return_all') else 'Partial return')
+    try:
+        quantities = None if request.form.get('return_all') else {
+            int(name[len('return_qty_'):]): int(value) for name, value in request.form.items() if name.startswith('return_qty_') and value.strip()}
+    except ValueError:
+        flash('Return quantities must be whole numbers.', 'danger'); return redirect(url_for('billing.view_sale', sale_id=sale_id))
+    if quantities is not None and any(quantity < 0 for quantity in quantities.values()):
+        flash('Return quantities cannot be negative.', 'danger'); return redirect(url_for('billing.view_sale', sale_id=sale_id))
+    user_id = current_user.id
     try:
-        for item in original_sale.items:
-            amount_refunded_for_item = (item.quantity * item.price_at_sale) - item.discount_applied; total_refund += amount_refunded_for_item
-            return_item = SaleReturnItem( product_id=item.product.id, quantity=item.quantity, amount_refunded=amount_refunded_for_item )
-            return_items_to_add.append(return_item)
-            stock_updates.append({'product': item.product, 'quantity': item.quantity})
-        new_return = SaleReturn( return_timestamp=datetime.utcnow(), reason=reason, total_refunded_amount=total_refund, original_sale_id=original_sale.id, customer_id=original_sale.customer_id, processed_by_user_id=current_user.id )
-        db.session.add(new_return); db.session.flush()
-        for ret_item in return_items_to_add: ret_item.sale_return_id = new_return.id; db.session.add(ret_item)
-        for update in stock_updates:
-            product_to_update = db.session.merge(update['product'])
-            product_to_update.stock_quantity += update['quantity']
-        db.session.commit()
-        flash(f'Return for Sale ID {original_sale.id} processed successfully. Stock updated.', 'success')
+        sale_return = commit_with_retry(lambda: record_return_lines(original_sale, quantities, reason, user_id))
+    except ReturnError as e:
+        db.session.rollback(); flash(str(e), 'warning')
         return redirect(url_for('billing.view_sale', sale_id=sale_id))
     except Exception as e:
         db.session.rollback(); current_app.logger.error(f"Error processing return for Sale ID {sale_id}: {e}", exc_info=True)
         flash(f'An error occurred while processing the return: {e}', 'danger')
         return redirect(url_for('billing.view_sale', sale_id=sale_id))
+    if exchange:
+        flash(f'Return #{sale_return.id} recorded: ₹{sale_return.total_refunded_amount:.2f} to credit against the replacement items. Stock updated.', 'success')
+        return redirect(url_for('billing.billing_page'))
+    flash(f'Return #{sale_return.id} for Sale ID {sale_id} processed: ₹{sale_return.total_refunded_amount:.2f} refunded. Stock updated.', 'success')
+    return redirect(url_for('billing.view_sale', sale_id=sale_id))
@@ -0,0 +1,338 @@
+# app/cache.py
+"""
+Small TTL cache for expensive read-mostly data (dashboard metric blocks).
+
+Backends (CACHE_BACKEND):
+
+* 'memory' - per-process LRU with TTL (default). Invalidations only reach the
+             worker that made the write; other workers catch up within the TTL.
+* 'file'   - pickle files under CACHE_DIR, shared by all workers on one host.
+* 'redis'  - any Redis-compatible server at CACHE_REDIS_URL (needs the
+             optional `redis` package), shared by all hosts. While the server
+             is unreachable, lookups are logged and served uncached.
+* 'null'   - caching disabled.
+
+Values cached with cached(..., topics=...) are invalidated by topic after
+commit: writes to the models in INVALIDATING_MODELS (collected in after_flush)
+and stock changes made through the stock ledger invalidate their topic.
+Hit/miss counters are per process.
+"""
+import hashlib
+import os
+import pickle
+import random
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from itertools import chain
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+
+from . import db
+from .models import Customer, Product, Purchase, Sale, SaleReturn, StockAdjustment
+from .stock_ledger import on_stock_committed
+
+_PENDING_KEY = 'cache.pending_topics'
+
+# Model written -> topic published after commit
+INVALIDATING_MODELS = {
+    Sale: 'sales', SaleReturn: 'sales',
+    Purchase: 'stock', StockAdjustment: 'stock',
+    Product: 'products', Customer: 'customers',
+}
+
+_MISSING = object()
+
+
+class CacheStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.sets = self.invalidations = self.evictions = 0
+
+    def count(self, name, amount=1):
+        with self._lock: setattr(self, name, getattr(self, name) + amount)
+
+    def as_dict(self):
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_ratio': round(self.hits / lookups, 3) if lookups else 0.0,
+                'sets': self.sets, 'invalidations': self.invalidations, 'evictions': self.evictions}
+
+
+class BaseCache:
+    """
+    get/set on a store plus topic invalidation and counters shared by all backends.
+    A value cached under topics is stored at a key that includes each topic's current
+    generation; invalidating a topic starts a new generation, so older entries are never
+    read again and simply expire. Subclasses store values and generations.
+    Errors of the store listed in `outage_errors` are logged and treated as misses,
+    so pages are computed uncached while the store is down.
+    """
+    name = None
+    outage_errors = () # Exception types meaning the store is unreachable
+
+    def __init__(self, default_ttl=60):
+        self.default_ttl = default_ttl
+        self.stats = CacheStats()
+
+    def _get(self, key): raise NotImplementedError
+    def _set(self, key, value, ttl): raise NotImplementedError
+    def _delete(self, key): raise NotImplementedError
+    def _generation(self, topic): raise NotImplementedError
+    def _new_generation(self, topic): raise NotImplementedError
+
+    def _versioned(self, key, topics):
+        if not topics: return key
+        return key + '@' + '.'.join(f'{topic}:{self._generation(topic)}' for topic in sorted(topics))
+
+    def _outage(self, action, key, e):
+        current_app.logger.error(f"Cache backend '{self.name}' failed to {action} '{key}' ({e}); skipping the cache.")
+
+    def _lookup(self, key, topics):
+        """(versioned key, value or _MISSING); (None, _MISSING) when the store is unreachable."""
+        try:
+            versioned = self._versioned(key, topics)
+            return versioned, self._get(versioned)
+        except self.outage_errors as e:
+            self._outage('read', key, e)
+            return None, _MISSING
+
+    def _store(self, versioned, value, ttl):
+        if versioned is None: return # Unreachable at lookup: not retried for this request
+        try:
+            self._set(versioned, value, self.default_ttl if ttl is None else ttl)
+        except self.outage_errors as e:
+            self._outage('store', versioned, e)
+            return
+        self.stats.count('sets')
+
+    def get(self, key, default=None, topics=()):
+        _, value = self._lookup(key, topics)
+        self.stats.count('hits' if value is not _MISSING else 'misses')
+        return default if value is _MISSING else value
+
+    def set(self, key, value, ttl=None, topics=()):
+        try:
+            versioned = self._versioned(key, topics)
+        except self.outage_errors as e:
+            self._outage('store', key, e)
+            return
+        self._store(versioned, value, ttl)
+
+    def delete(self, key, topics=()):
+        self._delete(self._versioned(key, topics))
+
+    def get_or_set(self, key, producer, ttl=None, topics=()):
+        """Returns the cached value for key, calling producer() to fill it on a miss."""
+        versioned, value = self._lookup(key, topics)
+        if value is not _MISSING:
+            self.stats.count('hits')
+            return value
+        self.stats.count('misses')
+        value = producer()
+        self._store(versioned, value, ttl)
+        return value
+
+    def invalidate(self, *topics):
+        """Makes every value cached under any of the topics unreachable."""
+        for topic in set(topics): self._new_generation(topic)
+        self.stats.count('invalidations', len(set(topics)))
+
+    def info(self):
+        return dict(self.stats.as_dict(), backend=self.name)
+
+
+class NullCache(BaseCache):
+    name = 'null'
+    def _get(self, key): return _MISSING
+    def _set(self, key, value, ttl): pass
+    def _delete(self, key): pass
+    def _generation(self, topic): return 0
+    def _new_generation(self, topic): pass
+
+
+class MemoryCache(BaseCache):
+    """Thread-safe LRU with a per-entry expiry time. Generations live outside the LRU so they are never evicted."""
+    name = 'memory'
+
+    def __init__(self, default_ttl=60, max_entries=1024):
+        super().__init__(default_ttl)
+        self.max_entries = max_entries
+        self._entries = OrderedDict() # key -> (expires_at, value)
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None: return _MISSING
+            if entry[0] <= time.monotonic():
+                del self._entries[key]; return _MISSING
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def _set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value); self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False); self.stats.count('evictions')
+
+    def _delete(self, key):
+        with self._lock: self._entries.pop(key, None)
+
+    def _generation(self, topic):
+        return self._generations.get(topic, 0)
+
+    def _new_generation(self, topic):
+        with self._lock: self._generations[topic] = self._generations.get(topic, 0) + 1
+
+    def info(self):
+        return dict(super().info(), entries=len(self._entries), max_entries=self.max_entries)
+
+
+class FileCache(BaseCache):
+    """One pickle file per key (expiry stored inside), written with atomic renames; shared by the workers of one host."""
+    name = 'file'
+    PRUNE_PROBABILITY = 0.01
+
+    def __init__(self, directory, default_ttl=60):
+        super().__init__(default_ttl)
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.cache')
+
+    def _read(self, path):
+        try:
+            with open(path, 'rb') as f: return pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return _MISSING
+
+    def _write(self, path, payload):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def _get(self, key):
+        entry = self._read(self._path(key))
+        if entry is _MISSING or entry[0] <= time.time(): return _MISSING
+        return entry[1]
+
+    def _set(self, key, value, ttl):
+        self._write(self._path(key), (time.time() + ttl, value))
+        if random.random() < self.PRUNE_PROBABILITY: self.prune()
+
+    def prune(self):
+        """Removes expired entry files (entries of old generations are never read again)."""
+        now = time.time()
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.cache'):
+                payload = self._read(entry.path)
+                if payload is _MISSING or payload[0] <= now: self._delete_path(entry.path)
+
+    def _delete_path(self, path):
+        try: os.remove(path)
+        except FileNotFoundError: pass
+
+    def _delete(self, key):
+        self._delete_path(self._path(key))
+
+    def _generation(self, topic):
+        generation = self._read(os.path.join(self.directory, f'topic-{topic}.gen'))
+        return 0 if generation is _MISSING else generation
+
+    def _new_generation(self, topic):
+        # A fresh token rather than a counter: concurrent invalidations never need a read-modify-write
+        self._write(os.path.join(self.directory, f'topic-{topic}.gen'), time.time_ns())
+
+
+class RedisCache(BaseCache):
+    """Any Redis-compatible server; shared by every worker on every host."""
+    name = 'redis'
+
+    def __init__(self, url, default_ttl=60, prefix='a3mart:cache:'):
+        super().__init__(default_ttl)
+        import redis # Optional dependency, only needed for this backend
+        self.client = redis.Redis.from_url(url)
+        self.outage_errors = (redis.exceptions.RedisError,)
+        self.prefix = prefix
+
+    def _get(self, key):
+        raw = self.client.get(self.prefix + key)
+        return _MISSING if raw is None else pickle.loads(raw)
+
+    def _set(self, key, value, ttl):
+        self.client.set(self.prefix + key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), ex=max(1, int(ttl)))
+
+    def _delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def _generation(self, topic):
+        return int(self.client.get(f'{self.prefix}topic:{topic}') or 0)
+
+    def _new_generation(self, topic):
+        self.client.incr(f'{self.prefix}topic:{topic}')
+
+
+def _create_cache(app):
+    backend = app.config.get('CACHE_BACKEND', 'memory'); ttl = app.config.get('CACHE_DEFAULT_TTL', 60)
+    try:
+        if backend == 'file':
+            return FileCache(app.config.get('CACHE_DIR') or os.path.join(app.instance_path, 'cache'), ttl)
+        if backend == 'redis':
+            return RedisCache(app.config['CACHE_REDIS_URL'], ttl)
+        if backend == 'null':
+            return NullCache(ttl)
+    except Exception as e:
+        app.logger.error(f"Cache backend '{backend}' unavailable ({e}); using the in-process cache.")
+    return MemoryCache(ttl, app.config.get('CACHE_MAX_ENTRIES', 1024))
+
+
+def get_cache():
+    """Returns the cache of the current app."""
+    return current_app.extensions['cache']
+
+
+def init_app(app):
+    app.extensions['cache'] = _create_cache(app)
+
+
+def cached(key, producer, ttl=None, topics=()):
+    """get_or_set on the app cache; topics name the writes that invalidate this key."""
+    return get_cache().get_or_set(key, producer, ttl, topics)
+
+
+def invalidate(*topics):
+    """Invalidates every value cached under the topics (e.g. invalidate('sales'))."""
+    get_cache().invalidate(*topics)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _collect_topics(session, flush_context):
+    topics = {INVALIDATING_MODELS[type(obj)] for obj in chain(session.new, session.dirty, session.deleted)
+              if type(obj) in INVALIDATING_MODELS}
+    if topics: session.info.setdefault(_PENDING_KEY, set()).update(topics)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _publish_topics(session):
+    topics = session.info.pop(_PENDING_KEY, None)
+    if topics and has_app_context() and 'cache' in current_app.extensions:
+        try:
+            invalidate(*topics)
+        except Exception as e: # A cache outage must not fail a write that already committed
+            current_app.logger.error(f"Cache invalidation for {sorted(topics)} failed: {e}")
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_topics(session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+@on_stock_committed
+def _stock_changed(levels):
+    if 'cache' in current_app.extensions:
+        invalidate('stock')
@@ -0,0 +1,89 @@
+# app/catalogue_snapshot.py
+"""
+Versioned product catalogue snapshot for the tills (inventory.product_snapshot_api).
+
+The payload is columnar: one array per field (id, barcode, sku, name, price,
+discount, stock, expiry) instead of one object per product, so field names are
+not repeated 100k times and similar values sit together for gzip. It is sent
+gzip-encoded to clients that accept it.
+
+The version is the highest Product.updated_at, as microseconds since the epoch.
+Every product write moves it, including stock changes made through the stock
+ledger (updated_at is an onupdate column). The version therefore also serves as
+the ETag: a till that already holds the current version gets a 304 and the
+catalogue is not read. Encoded full snapshots are cached per version.
+
+since=<version> returns only the products changed after that version, plus the
+ids of products deactivated meanwhile ('removed'). The delta window starts
+CATALOGUE_DELTA_OVERLAP_SECONDS before the given version. A write that committed
+just after its timestamp was taken is then still picked up. Applying a product
+twice is harmless.
+"""
+import gzip
+import json
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import func, select
+
+from . import db
+from .cache import cached
+from .models import Product
+
+SNAPSHOT_COLUMNS = {
+    'id': Product.id, 'barcode': Product.barcode, 'sku': Product.sku, 'name': Product.name,
+    'price': Product.selling_price, 'discount': Product.discount_percent, 'stock': Product.stock_quantity,
+    'expiry': Product.expiry_date, # The billing page derives the near-expiry offer from it
+}
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def format_version(updated_at):
+    return str((updated_at - _EPOCH) // _MICROSECOND) if updated_at else '0'
+
+
+def parse_version(token):
+    """The updated_at a version token stands for; None if the token is missing or malformed."""
+    try: return _EPOCH + int(token) * _MICROSECOND if token else None
+    except (TypeError, ValueError, OverflowError): return None
+
+
+def current_version():
+    """Version of the catalogue as committed now (one indexed MAX lookup)."""
+    return format_version(db.session.execute(select(func.max(Product.updated_at))).scalar())
+
+
+def build_snapshot(version, since=None):
+    """
+    Payload dict of the whole active catalogue, or of the products changed since `since`
+    (a datetime from parse_version). Read the version before calling, so that writes
+    committed during the build are picked up again by the next delta.
+    """
+    stmt = select(*SNAPSHOT_COLUMNS.values(), Product.is_active)
+    if since is None:
+        stmt = stmt.where(Product.is_active == True)
+    else:
+        overlap = timedelta(seconds=current_app.config.get('CATALOGUE_DELTA_OVERLAP_SECONDS', 60))
+        stmt = stmt.where(Product.updated_at >= since - overlap)
+    rows = db.session.execute(stmt.order_by(Product.id)).all()
+    removed = [row[0] for row in rows if not row[-1]]
+    if removed: rows = [row for row in rows if row[-1]]
+    columns = [list(values) for values in zip(*rows)][:len(SNAPSHOT_COLUMNS)] or [[] for _ in SNAPSHOT_COLUMNS] # Transposed in C
+    expiry = list(SNAPSHOT_COLUMNS).index('expiry')
+    columns[expiry] = [value.isoformat() if value else None for value in columns[expiry]]
+    return {'version': version, 'full': since is None, 'count': len(columns[0]),
+            'columns': dict(zip(SNAPSHOT_COLUMNS, columns)), 'removed': removed}
+
+
+def encode_snapshot(payload):
+    """Compact JSON, gzip-compressed."""
+    return gzip.compress(json.dumps(payload, separators=(',', ':')).encode('utf-8'), compresslevel=6)
+
+
+def snapshot_body(version, since=None):
+    """gzip-encoded payload for the given version; full snapshots are built once per version and cached."""
+    if since is not None:
+        return encode_snapshot(build_snapshot(version, since))
+    return cached(f'catalogue_snapshot:{version}', lambda: encode_snapshot(build_snapshot(version)),
+                  ttl=current_app.config.get('CATALOGUE_SNAPSHOT_TTL', 600))
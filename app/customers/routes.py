@@ -7,19 +7,22 @@ from . import customers_bp # Import the blueprint instance
 from ..models import Customer # Import Customer model
 from ..forms import CustomerForm # Import Customer form
 from .. import db # Import the database instance
+from .. import search_index
+from ..pagination import keyset_paginate
+from ..db_routing import use_replica
 
 @customers_bp.route('/customers')
 @login_required
+@use_replica
 def list_customers():
     """Displays a list of customers with search and pagination."""
-    page = request.args.get('page', 1, type=int)
     query = request.args.get('query', '')
-    customers_query = Customer.query.order_by(Customer.name.asc())
+    customers_query = Customer.query
     if query:
         search_term = f"%{query}%"
         customers_query = customers_query.filter(
             or_( Customer.name.ilike(search_term), Customer.phone_number.ilike(search_term), Customer.email.ilike(search_term) ))
-    pagination = customers_query.paginate( page=page, per_page=current_app.config.get('ITEMS_PER_PAGE', 15), error_out=False )
+    pagination = keyset_paginate(customers_query, [Customer.name, Customer.id], count_key=f'customers:{query}')
     customers = pagination.items
     return render_template( 'customers/customers.html', title='Customers', customers=customers, pagination=pagination, query=query )
 
@@ -144,10 +147,10 @@ def edit_customer(customer_id):
 
 @customers_bp.route('/api/customers/search')
 @login_required
+@use_replica
 def search_customers_api():
     query = request.args.get('q', ''); limit = request.args.get('limit', 10, type=int)
     if not query: return jsonify([])
-    search_term = f"%{query}%"
-    customers = Customer.query.filter( or_( Customer.name.ilike(search_term), Customer.phone_number.ilike(search_term), Customer.email.ilike(search_term) )).limit(limit).all()
+    customers = search_index.search('customers', query, limit) # Ranked: exact phone/email, name prefix, substring
     results = [ { 'id': c.id, 'text': f"{c.name} ({c.phone_number or c.email or 'No Contact'})", 'name': c.name, 'phone': c.phone_number, 'email': c.email } for c in customers ]
     return jsonify(results)
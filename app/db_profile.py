@@ -0,0 +1,72 @@
+# app/db_profile.py
+"""
+Database connection profile (SQLITE_PRAGMAS and DB_POOL_OPTIONS in config.py;
+ProductionConfig sets both).
+
+SQLite: PRAGMAs such as busy_timeout and cache_size hold for one connection
+only, so they are run from each engine's 'connect' event on every new DBAPI
+connection. journal_mode=WAL is stored in the database file by the first
+connection that sets it. Several Gunicorn workers writing to one SQLite file
+then wait for each other (busy_timeout) instead of failing with 'database is
+locked', and readers are not blocked by the writer.
+
+With SQLITE_IMMEDIATE_WRITES, commit_with_retry opens its write transactions
+with BEGIN IMMEDIATE. pysqlite otherwise starts a transaction at its first
+INSERT/UPDATE, after the unit of work has already read. SQLite cannot wait for
+the write lock in that case and fails at once with 'database is locked', so
+every collision between two tills became a rollback and a backoff sleep.
+Taking the write lock first makes the writers queue up behind busy_timeout.
+
+Server databases (PostgreSQL): DB_POOL_OPTIONS become the engine's pool
+options. SQLALCHEMY_ENGINE_OPTIONS set explicitly take precedence.
+"""
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+from . import db
+
+
+def is_sqlite(uri):
+    return make_url(uri).get_backend_name() == 'sqlite'
+
+
+def configure_engine_options(app):
+    """Adds the pool options for a server database to SQLALCHEMY_ENGINE_OPTIONS. Call before db.init_app."""
+    pool_options = app.config.get('DB_POOL_OPTIONS') or {}
+    if not pool_options or is_sqlite(app.config['SQLALCHEMY_DATABASE_URI']): return
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {**pool_options, **app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})}
+
+
+def begin_write(session):
+    """
+    Takes the SQLite write lock for the session's next transaction (BEGIN IMMEDIATE) when
+    SQLITE_IMMEDIATE_WRITES is on. Does nothing on other backends or inside an open transaction.
+    """
+    if not current_app.config.get('SQLITE_IMMEDIATE_WRITES'): return
+    connection = session.connection()
+    if connection.dialect.name != 'sqlite' or connection.connection.dbapi_connection.in_transaction: return
+    connection.exec_driver_sql('BEGIN IMMEDIATE')
+
+
+def _pragma_listener(pragmas):
+    statements = [f"PRAGMA {name}={value}" for name, value in pragmas.items()]
+
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for statement in statements: cursor.execute(statement)
+        finally:
+            cursor.close()
+    return set_pragmas
+
+
+def init_app(app):
+    """Registers the SQLite PRAGMAs on every SQLite engine of the app. Call after db.init_app."""
+    pragmas = app.config.get('SQLITE_PRAGMAS') or {}
+    if not pragmas: return
+    with app.app_context():
+        engines = list(db.engines.values())
+    for engine in engines:
+        if engine.dialect.name == 'sqlite':
+            event.listen(engine, 'connect', _pragma_listener(pragmas))
@@ -0,0 +1,130 @@
+# app/db_routing.py
+"""
+Read/write routing between the primary database and an optional read replica.
+
+The replica is the 'replica' bind in SQLALCHEMY_BINDS (DATABASE_REPLICA_URL).
+Views decorated with @use_replica (dashboard, reports, listings and search
+APIs) run their plain SELECTs there. RoutingSession.get_bind keeps everything
+else on the primary: flushes, INSERT/UPDATE/DELETE, SELECT ... FOR UPDATE,
+raw SQL, and every statement after the request has written something (a
+report that queues an export job, for instance).
+
+Read-your-writes: when a request commits a write, the user's session cookie
+gets a marker, and for READ_YOUR_WRITES_SECONDS that user's replica views read
+the primary. A cashier who has just made a sale sees it on the dashboard even
+if the replica has not caught up. Other users may see data up to the
+replica's lag old (plus the dashboard cache TTL when the cache is filled from
+the replica).
+
+Fallback: without a replica configured, @use_replica does nothing. A connection
+or operational error on the replica takes it out of rotation for
+REPLICA_RETRY_SECONDS, and the view is run again on the primary. A streamed
+export that fails halfway cannot be retried that way.
+
+For local testing a second SQLite file can stand in for the replica:
+`flask sync-replica` copies the primary into it, once or every --interval
+seconds (sync_sqlite_replica).
+"""
+import sqlite3
+import time
+from functools import wraps
+
+from flask import current_app, g, has_app_context, has_request_context, session as user_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DBAPIError, OperationalError
+
+REPLICA_BIND = 'replica'
+_PRIMARY_UNTIL_KEY = '_primary_reads_until'
+
+
+def _routing_to_replica():
+    return has_app_context() and g.get('_use_replica', False) and not g.get('_db_wrote', False)
+
+
+class RoutingSession(Session):
+    """Flask-SQLAlchemy session that sends read-only statements of @use_replica views to the replica bind."""
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and clause is not None and getattr(clause, 'is_select', False)
+                and getattr(clause, '_for_update_arg', None) is None and _routing_to_replica()):
+            engine = current_app.extensions['sqlalchemy'].engines.get(REPLICA_BIND)
+            if engine is not None: return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _note_write():
+    if has_app_context(): g._db_wrote = True
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _note_flush(session, flush_context):
+    _note_write()
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _note_dml(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        _note_write()
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _remember_write(session):
+    if has_request_context() and g.get('_db_wrote') and replica_configured():
+        user_session[_PRIMARY_UNTIL_KEY] = time.time() + current_app.config.get('READ_YOUR_WRITES_SECONDS', 10)
+
+
+def replica_configured():
+    return REPLICA_BIND in (current_app.config.get('SQLALCHEMY_BINDS') or {})
+
+
+def replica_available():
+    """True if a replica is configured and not taken out of rotation after an error."""
+    return replica_configured() and time.time() >= current_app.extensions['db_routing']['down_until']
+
+
+def _on_replica_error(context):
+    if context.is_disconnect or isinstance(context.sqlalchemy_exception, OperationalError):
+        if has_app_context(): g._replica_failed = True
+
+
+def use_replica(view):
+    """Runs a read-only view's SELECTs on the replica (see the module docstring for the exceptions)."""
+    @wraps(view)
+    def replica_view(*args, **kwargs):
+        if not replica_available() or user_session.get(_PRIMARY_UNTIL_KEY, 0) > time.time():
+            return view(*args, **kwargs)
+        g._use_replica = True
+        try:
+            return view(*args, **kwargs)
+        except DBAPIError as e:
+            if not g.pop('_replica_failed', False): raise
+            from . import db
+            db.session.rollback(); g._use_replica = False
+            retry = current_app.config.get('REPLICA_RETRY_SECONDS', 30)
+            current_app.extensions['db_routing']['down_until'] = time.time() + retry
+            current_app.logger.warning(f"Read replica failed, using the primary for {retry}s: {e}")
+            return view(*args, **kwargs)
+    return replica_view
+
+
+def sync_sqlite_replica():
+    """Copies the primary SQLite database into the replica file (online backup). Returns the seconds taken."""
+    primary = make_url(current_app.config['SQLALCHEMY_DATABASE_URI']); replica = make_url(current_app.config['SQLALCHEMY_BINDS'][REPLICA_BIND])
+    if primary.get_backend_name() != 'sqlite' or replica.get_backend_name() != 'sqlite':
+        raise ValueError('sync-replica only copies between SQLite files; use the database server\'s replication otherwise.')
+    started = time.perf_counter()
+    source = sqlite3.connect(primary.database); target = sqlite3.connect(replica.database)
+    try:
+        source.backup(target)
+    finally:
+        target.close(); source.close()
+    return time.perf_counter() - started
+
+
+def init_app(app):
+    from . import db
+    app.extensions['db_routing'] = {'down_until': 0.0}
+    if REPLICA_BIND not in (app.config.get('SQLALCHEMY_BINDS') or {}): return
+    with app.app_context():
+        event.listen(db.engines[REPLICA_BIND], 'handle_error', _on_replica_error)
@@ -0,0 +1,99 @@
+# app/exports.py
+"""
+Streaming report exports (CSV and XLSX) with bounded memory.
+
+Rows come from a generator, typically a single joined query executed with
+yield_per, so only one batch of rows is in memory at a time:
+
+* CSV is encoded and sent in chunks while the query is still running.
+* XLSX is written with openpyxl's write-only mode (rows go straight to a
+  temporary file) and the finished workbook is sent from disk in chunks.
+
+Routes call export_response(format, filename, columns, rows); background jobs
+call write_export(path, format, columns, rows) with the same rows.
+"""
+import csv
+import io
+import os
+import tempfile
+
+from flask import Response, stream_with_context
+from openpyxl import Workbook
+
+YIELD_PER = 2000 # Rows fetched per batch by export queries
+CSV_FLUSH_ROWS = 1000 # Rows buffered before a CSV chunk is sent
+FILE_CHUNK_BYTES = 64 * 1024
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+FORMATS = {'excel': ('xlsx', XLSX_MIMETYPE), 'csv': ('csv', 'text/csv')}
+
+
+def stream_rows(query, transform=None):
+    """Yields the rows of a SQLAlchemy select/Query in batches of YIELD_PER (optionally transformed)."""
+    from . import db
+    statement = query.statement if hasattr(query, 'statement') else query
+    for row in db.session.execute(statement.execution_options(yield_per=YIELD_PER)):
+        yield transform(row) if transform else tuple(row)
+
+
+def _csv_chunks(columns, rows):
+    buffer = io.StringIO(); writer = csv.writer(buffer)
+    buffer.write('\ufeff') # BOM so Excel opens UTF-8 (e.g. the ₹ in headers) correctly
+    writer.writerow(columns)
+    for count, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if count % CSV_FLUSH_ROWS == 0:
+            yield buffer.getvalue().encode('utf-8'); buffer.seek(0); buffer.truncate(0)
+    yield buffer.getvalue().encode('utf-8')
+
+
+def _write_xlsx(path, columns, rows, sheet_name):
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=sheet_name[:31]) # Excel limits sheet names to 31 characters
+    sheet.append(list(columns))
+    for row in rows:
+        sheet.append(list(row))
+    workbook.save(path)
+
+
+def _xlsx_chunks(columns, rows, sheet_name):
+    fd, path = tempfile.mkstemp(prefix='a3mart_export_', suffix='.xlsx'); os.close(fd)
+    try:
+        _write_xlsx(path, columns, rows, sheet_name)
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(FILE_CHUNK_BYTES)
+                if not chunk: break
+                yield chunk
+    finally:
+        os.remove(path)
+
+
+def export_filename(filename, export_format):
+    return f'{filename}.{FORMATS[export_format][0]}'
+
+
+def write_export(path, export_format, columns, rows, sheet_name='Report'):
+    """Writes the file export_response would send to path instead (used by background jobs)."""
+    if export_format == 'csv':
+        with open(path, 'wb') as f:
+            for chunk in _csv_chunks(columns, rows): f.write(chunk)
+    else:
+        _write_xlsx(path, columns, rows, sheet_name)
+
+
+def with_progress(rows, total, progress, every=5000):
+    """Passes rows through, calling progress(percent, message) every `every` rows."""
+    for count, row in enumerate(rows, start=1):
+        if count % every == 0: progress(count * 100 // max(total, count), f'{count:,} of {total:,} rows written...')
+        yield row
+
+
+def export_response(export_format, filename, columns, rows, sheet_name='Report'):
+    """
+    Returns a streamed download of rows (an iterable of tuples matching columns).
+    export_format: 'excel' or 'csv'; filename: without extension.
+    """
+    chunks = _csv_chunks(columns, rows) if export_format == 'csv' else _xlsx_chunks(columns, rows, sheet_name)
+    return Response(stream_with_context(chunks), mimetype=FORMATS[export_format][1],
+                    headers={'Content-Disposition': f'attachment;filename={export_filename(filename, export_format)}'})
@@ -0,0 +1,155 @@
+# app/instrumentation.py
+"""
+Request-level performance instrumentation.
+
+For every request it records the wall time, the number of SQL statements run
+and the time spent in them. The statements are seen through the Engine's
+before/after_cursor_execute events, so ORM loads, lazy loads and Core
+statements on every engine and bind are all counted. The totals are:
+
+* added to per-endpoint Prometheus metrics, served as text at /metrics
+  (request latency histogram, request counter, SQL statement and time
+  counters, slow query counter);
+* sent back in a Server-Timing header (browser dev tools show it);
+* logged with the endpoint when a request takes longer than SLOW_REQUEST_MS.
+
+A statement taking longer than SLOW_QUERY_MS is logged as a warning with its
+bound parameters, whether it runs in a request, a background job or a CLI
+command.
+
+Metrics live in the memory of each worker process, so with several Gunicorn
+workers each scrape sees the worker that answered it. /metrics needs the
+METRICS_TOKEN bearer token when one is configured, and an admin login otherwise.
+
+Hot-path debug logging goes through sampled_debug(), which logs for a sampled
+HOT_PATH_LOG_SAMPLE_RATE share of requests only (0 turns it off). The message
+is formatted only for sampled requests.
+"""
+import random
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+from flask import Response, abort, current_app, g, has_app_context, has_request_context, request
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0) # Seconds
+PARAMETERS_LOG_LIMIT = 500 # Characters of bound parameters shown in the slow query log
+_START_KEY = 'instrumentation.query_start'
+
+
+class RequestMetrics:
+    """Per-endpoint counters and latency histograms of one worker process, rendered in Prometheus text format."""
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self.requests = defaultdict(int) # (endpoint, method, status) -> count
+        self.latency = {} # (endpoint, method) -> [bucket counts..., +Inf count, sum]
+        self.sql_queries = defaultdict(int) # endpoint -> statements
+        self.sql_seconds = defaultdict(float) # endpoint -> seconds in SQL
+        self.slow_queries = 0
+
+    def observe(self, endpoint, method, status, seconds, queries, sql_seconds):
+        with self._lock:
+            self.requests[(endpoint, method, status)] += 1
+            histogram = self.latency.get((endpoint, method))
+            if histogram is None: histogram = self.latency[(endpoint, method)] = [0] * (len(self.buckets) + 1) + [0.0]
+            histogram[bisect_left(self.buckets, seconds)] += 1; histogram[-1] += seconds
+            self.sql_queries[endpoint] += queries; self.sql_seconds[endpoint] += sql_seconds
+
+    def count_slow_query(self):
+        with self._lock: self.slow_queries += 1
+
+    def render(self):
+        """The metrics in Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            lines = ['# HELP a3mart_http_requests_total Requests handled, by endpoint, method and status.',
+                     '# TYPE a3mart_http_requests_total counter']
+            lines += [f'a3mart_http_requests_total{{endpoint="{e}",method="{m}",status="{s}"}} {n}' for (e, m, s), n in sorted(self.requests.items())]
+            lines += ['# HELP a3mart_http_request_duration_seconds Request latency, by endpoint and method.',
+                      '# TYPE a3mart_http_request_duration_seconds histogram']
+            for (endpoint, method), histogram in sorted(self.latency.items()):
+                labels = f'endpoint="{endpoint}",method="{method}"'; cumulative = 0
+                for bound, count in zip(self.buckets, histogram):
+                    cumulative += count; lines.append(f'a3mart_http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                total = cumulative + histogram[len(self.buckets)]
+                lines += [f'a3mart_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {total}',
+                          f'a3mart_http_request_duration_seconds_sum{{{labels}}} {histogram[-1]:.6f}',
+                          f'a3mart_http_request_duration_seconds_count{{{labels}}} {total}']
+            lines += ['# HELP a3mart_db_queries_total SQL statements run by requests, by endpoint.', '# TYPE a3mart_db_queries_total counter']
+            lines += [f'a3mart_db_queries_total{{endpoint="{e}"}} {n}' for e, n in sorted(self.sql_queries.items())]
+            lines += ['# HELP a3mart_db_query_seconds_total Time requests spent in SQL statements, by endpoint.', '# TYPE a3mart_db_query_seconds_total counter']
+            lines += [f'a3mart_db_query_seconds_total{{endpoint="{e}"}} {s:.6f}' for e, s in sorted(self.sql_seconds.items())]
+            lines += ['# HELP a3mart_db_slow_queries_total Statements slower than SLOW_QUERY_MS.', '# TYPE a3mart_db_slow_queries_total counter',
+                      f'a3mart_db_slow_queries_total {self.slow_queries}']
+        return '\n'.join(lines) + '\n'
+
+
+def get_metrics():
+    return current_app.extensions['instrumentation']
+
+
+def sampled_debug(message, *args):
+    """Debug log for hot paths, written only for sampled requests. Use %-style args so unsampled calls format nothing."""
+    if has_request_context() and g.get('_log_sampled'):
+        current_app.logger.debug(message, *args)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info[_START_KEY] = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop(_START_KEY, None)
+    if started is None or not has_app_context() or 'instrumentation' not in current_app.extensions: return
+    elapsed = time.perf_counter() - started
+    if '_request_started' in g: g._sql_count += 1; g._sql_seconds += elapsed
+    threshold = current_app.config.get('SLOW_QUERY_MS', 200)
+    if threshold and elapsed * 1000 >= threshold:
+        get_metrics().count_slow_query()
+        shown = repr(parameters)
+        if len(shown) > PARAMETERS_LOG_LIMIT: shown = shown[:PARAMETERS_LOG_LIMIT] + '...'
+        current_app.logger.warning("Slow query (%.1f ms%s): %s | parameters: %s", elapsed * 1000,
+                                   f", {request.endpoint}" if has_request_context() else '', ' '.join(statement.split()), shown)
+
+
+def _start_request():
+    g._request_started = time.perf_counter(); g._sql_count = 0; g._sql_seconds = 0.0
+    rate = current_app.config.get('HOT_PATH_LOG_SAMPLE_RATE', 0.0)
+    g._log_sampled = rate > 0 and random.random() < rate
+
+
+def _finish_request(response):
+    started = g.pop('_request_started', None)
+    if started is None: return response
+    seconds = time.perf_counter() - started; endpoint = request.endpoint or 'unmatched'
+    get_metrics().observe(endpoint, request.method, response.status_code, seconds, g._sql_count, g._sql_seconds)
+    response.headers.add('Server-Timing', f'app;dur={seconds * 1000:.1f}, db;dur={g._sql_seconds * 1000:.1f};desc="{g._sql_count} queries"')
+    slow = current_app.config.get('SLOW_REQUEST_MS', 1000)
+    if slow and seconds * 1000 >= slow:
+        current_app.logger.warning(f"Slow request {request.method} {request.path} ({endpoint}): {seconds * 1000:.0f} ms, "
+                                   f"{g._sql_count} queries in {g._sql_seconds * 1000:.0f} ms")
+    return response
+
+
+def metrics_view():
+    """Prometheus scrape endpoint of this worker process."""
+    token = current_app.config.get('METRICS_TOKEN')
+    if token:
+        if request.headers.get('Authorization') != f'Bearer {token}': abort(401)
+    elif not (current_user.is_authenticated and current_user.is_admin):
+        abort(403)
+    return Response(get_metrics().render(), mimetype='text/plain; version=0.0.4')
+
+
+def init_app(app):
+    if not app.config.get('INSTRUMENTATION_ENABLED', True): return
+    app.extensions['instrumentation'] = RequestMetrics()
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
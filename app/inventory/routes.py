@@ -1,19 +1,31 @@
 # app/inventory/routes.py
-from flask import render_template, redirect, url_for, flash, request, current_app, jsonify, Response, abort, session
+from flask import render_template, redirect, url_for, flash, request, current_app, jsonify, Response, abort, send_file
 from flask_login import login_required, current_user
-from sqlalchemy import or_
-from datetime import datetime, date, timedelta # Added date, timedelta
+from sqlalchemy import func, or_
+from sqlalchemy.orm import joinedload
+from datetime import datetime, date
+import gzip
 import os
 from werkzeug.utils import secure_filename
-import pandas as pd
 
 from . import inventory_bp
-from ..models import Product, Purchase, PurchaseItem, StockAdjustment
+from ..models import Product, Purchase, PurchaseItem, StockAdjustment, SupplierProductCode
 from ..forms import ProductForm, PurchaseForm, StockAdjustmentForm
 from .. import db
 from ..utils import generate_barcode_logic, generate_barcode_sticker_pdf
+from ..stock_ledger import commit_with_retry, increment_stock, adjust_stock_level, InsufficientStockError
+from ..product_index import get_product_index, product_search_result
+from .. import search_index
+from .. import catalogue_snapshot
+from ..stock_import import StockSheetError, import_stock_levels, read_stock_sheet, report_path
+from ..product_import import count_rows, import_products, read_product_chunks
+from ..purchase_import import import_supplier_invoice, read_invoice_sheet, save_supplier_code, supplier_key
+from ..reorder import suggest_purchase_items
+from ..job_queue import JobError, enqueue, job_handler, save_job_input
+from ..pagination import keyset_paginate
+from ..db_routing import use_replica
 
-ALLOWED_EXTENSIONS = {'xlsx', 'xls'}
+ALLOWED_EXTENSIONS = {'xlsx', 'xls', 'csv'} # CSV reads much faster than Excel for large stock-takes
 
 def allowed_file(filename):
     return '.' in filename and \
@@ -22,11 +34,11 @@ def allowed_file(filename):
 # --- Product Routes ---
 @inventory_bp.route('/products')
 @login_required
+@use_replica
 def list_products():
-    page = request.args.get('page', 1, type=int)
     query = request.args.get('query', '')
     low_stock_filter = request.args.get('low_stock', 'false').lower() == 'true'
-    products_query = Product.query.order_by(Product.name.asc())
+    products_query = Product.query
     if query:
         search_term = f"%{query}%"
         products_query = products_query.filter(
@@ -36,7 +48,7 @@ def list_products():
     if low_stock_filter:
         products_query = products_query.filter(
              Product.stock_quantity <= Product.low_stock_threshold, Product.is_active == True )
-    pagination = products_query.paginate( page=page, per_page=current_app.config.get('ITEMS_PER_PAGE', 15), error_out=False )
+    pagination = keyset_paginate(products_query, [Product.name, Product.id], count_key=f'products:{query}:{low_stock_filter}')
     products = pagination.items
     return render_template( 'inventory/products.html', title='Products', products=products,
                            pagination=pagination, query=query, low_stock=low_stock_filter )
@@ -113,28 +125,34 @@ def edit_product(product_id):
 # --- Purchase Routes ---
 @inventory_bp.route('/purchases')
 @login_required
+@use_replica
 def list_purchases():
-    page = request.args.get('page', 1, type=int)
-    purchases_query = Purchase.query.order_by(Purchase.purchase_date.desc())
-    pagination = purchases_query.paginate( page=page, per_page=current_app.config.get('ITEMS_PER_PAGE', 15), error_out=False )
+    pagination = keyset_paginate(Purchase.query.options(joinedload(Purchase.user)), [Purchase.purchase_date, Purchase.id], descending=True, count_key='purchases')
     purchases = pagination.items
-    return render_template( 'inventory/purchases.html', title='Purchases', purchases=purchases, pagination=pagination )
+    item_counts = dict(db.session.query(PurchaseItem.purchase_id, func.count(PurchaseItem.id)).filter(PurchaseItem.purchase_id.in_([purchase.id for purchase in purchases])).group_by(PurchaseItem.purchase_id).all()) if purchases else {}
+    return render_template( 'inventory/purchases.html', title='Purchases', purchases=purchases, pagination=pagination, item_counts=item_counts )
 
 @inventory_bp.route('/purchases/add', methods=['GET', 'POST'])
 @login_required
 def add_purchase():
     form = PurchaseForm(); prefill_items = None
-    if request.method == 'GET':
-        if 'prefill_purchase_items' in session:
-            prefill_items = session.pop('prefill_purchase_items', None)
-            if prefill_items: flash('Low stock items added to purchase order.', 'info')
+    if request.method == 'GET' and request.args.get('reorder'):
+        # Draft computed on the server from sales velocity (app/reorder.py), not carried in the session cookie
+        try:
+            prefill_items, to_order = suggest_purchase_items()
+        except Exception as e:
+            current_app.logger.error(f"Error computing reorder suggestions: {e}"); flash('An error occurred while generating the purchase order draft.', 'danger'); prefill_items = None
+        else:
+            if not prefill_items: flash('No items need reordering.', 'info')
+            elif to_order > len(prefill_items): flash(f'{to_order} products need reordering; the {len(prefill_items)} with the fewest days of stock left were added to the purchase order.', 'info')
+            else: flash(f'{len(prefill_items)} products to reorder were added to the purchase order.', 'info')
     if request.method == 'POST':
         data = request.get_json()
         if not data: flash('Invalid data received.', 'danger'); return redirect(url_for('inventory.add_purchase'))
         supplier_name = data.get('supplier_name'); invoice_number = data.get('invoice_number')
         notes = data.get('notes'); items_data = data.get('items', [])
         if not items_data: flash('Cannot record a purchase with no items.', 'warning'); return render_template('inventory/purchase_form.html', title='Record Purchase', form=form)
-        total_cost = 0; purchase_items_to_add = []; stock_updates = []
+        total_cost = 0; purchase_lines = []; stock_increments = {}
         try:
             for item_data in items_data:
                 product_id = item_data.get('product_id'); quantity = item_data.get('quantity'); cost_price = item_data.get('cost_price')
@@ -143,79 +161,127 @@ def add_purchase():
                 product = Product.query.get(int(product_id));
                 if not product: raise ValueError(f"Product ID {product_id} not found.")
                 item_total = int(quantity) * float(cost_price); total_cost += item_total
-                purchase_item = PurchaseItem( product_id=product.id, quantity=int(quantity), cost_price=float(cost_price) )
-                purchase_items_to_add.append(purchase_item)
-                stock_updates.append({'product': product, 'quantity': int(quantity)})
+                purchase_lines.append({'product_id': product.id, 'quantity': int(quantity), 'cost_price': float(cost_price)})
+                stock_increments[product.id] = stock_increments.get(product.id, 0) + int(quantity)
         except ValueError as e: flash(f'Error processing items: {e}', 'danger'); return render_template('inventory/purchase_form.html', title='Record Purchase', form=form)
         except Exception as e: flash(f'An unexpected error occurred: {e}', 'danger'); current_app.logger.error(f"Purchase item processing error: {e}"); return render_template('inventory/purchase_form.html', title='Record Purchase', form=form)
         try:
-            new_purchase = Purchase( supplier_name=supplier_name, invoice_number=invoice_number, total_cost=total_cost, notes=notes, user_id=current_user.id, purchase_date=datetime.utcnow() )
-            db.session.add(new_purchase); db.session.flush()
-            for item in purchase_items_to_add: item.purchase_id = new_purchase.id; db.session.add(item)
-            for update in stock_updates: update['product'].stock_quantity += update['quantity']
-            db.session.commit(); flash('Purchase recorded successfully!', 'success'); return redirect(url_for('inventory.list_purchases'))
+            user_id = current_user.id
+            def save_purchase():
+                new_purchase = Purchase( supplier_name=supplier_name, invoice_number=invoice_number, total_cost=total_cost, notes=notes, user_id=user_id, purchase_date=datetime.utcnow() )
+                db.session.add(new_purchase); db.session.flush()
+                for line in purchase_lines: db.session.add(PurchaseItem(purchase_id=new_purchase.id, **line))
+                increment_stock(stock_increments)
+            commit_with_retry(save_purchase); flash('Purchase recorded successfully!', 'success'); return redirect(url_for('inventory.list_purchases'))
         except Exception as e:
             db.session.rollback(); current_app.logger.error(f"Error saving purchase: {e}"); flash(f'Error saving purchase record: {e}', 'danger')
             return render_template('inventory/purchase_form.html', title='Record Purchase', form=form)
     return render_template('inventory/purchase_form.html', title='Record Purchase', form=form, prefill_items=prefill_items)
 
+@inventory_bp.route('/purchases/import', methods=['GET', 'POST'])
+@login_required
+def import_supplier_invoice_view():
+    if request.method == 'POST':
+        file = request.files.get('invoice_file'); supplier_name = supplier_key(request.form.get('supplier_name'))
+        if not supplier_name: flash('Enter the supplier the invoice is from.', 'warning'); return redirect(request.url)
+        if file is None or file.filename == '': flash('No selected file.', 'warning'); return redirect(request.url)
+        filename = secure_filename(file.filename)
+        if not filename.lower().endswith(('.xlsx', '.csv')): flash('Invalid file type. Only .xlsx or .csv allowed.', 'danger'); return redirect(request.url)
+        invoice_number = (request.form.get('invoice_number') or '').strip() or None
+        try:
+            result = import_supplier_invoice(read_invoice_sheet(file.stream, filename), supplier_name, invoice_number,
+                                             notes=(request.form.get('notes') or '').strip() or f"File: {filename}", user_id=current_user.id,
+                                             update_costs=bool(request.form.get('update_costs')), allow_partial=bool(request.form.get('allow_partial')))
+        except StockSheetError as e:
+            flash(str(e), 'danger'); return redirect(request.url)
+        except Exception as e:
+            db.session.rollback(); current_app.logger.error(f"Error importing supplier invoice {filename}: {e}")
+            flash(f'Error processing file: {e}', 'danger'); return redirect(request.url)
+        if result.purchase_id:
+            flash(f'Purchase recorded: {result.recorded} lines, total cost {result.total_cost:.2f}.', 'success')
+            if result.learned: flash(f'{len(result.learned)} new supplier codes were matched by barcode and saved.', 'info')
+        else: flash('The invoice was not recorded.', 'danger')
+        if result.errors:
+            for row, _, _, _, _, message in result.errors[:10]: flash(f"Row {row}: {message}", 'info')
+            if len(result.errors) > 10: flash(f"... and {len(result.errors)-10} more lines with errors.", 'info')
+            return redirect(url_for('inventory.import_supplier_invoice_view', report=result.report_name, supplier=supplier_name))
+        return redirect(url_for('inventory.list_purchases'))
+    report_name = request.args.get('report')
+    return render_template('inventory/import_supplier_invoice.html', title='Import Supplier Invoice', supplier=request.args.get('supplier', ''),
+                           report_name=report_name if report_name and report_path(report_name) else None)
+
+@inventory_bp.route('/purchases/supplier-codes', methods=['GET', 'POST'])
+@login_required
+def supplier_codes():
+    supplier = supplier_key(request.args.get('supplier'))
+    if request.method == 'POST':
+        supplier = supplier_key(request.form.get('supplier_name')); code = (request.form.get('supplier_code') or '').strip(); product_code = (request.form.get('product_code') or '').strip()
+        if not supplier or not code or not product_code: flash('Supplier, supplier code and product barcode/SKU are all required.', 'warning'); return redirect(url_for('inventory.supplier_codes', supplier=supplier))
+        if len(code) > 64: flash('Supplier codes are at most 64 characters.', 'warning'); return redirect(url_for('inventory.supplier_codes', supplier=supplier))
+        product = Product.query.filter(or_(Product.barcode == product_code, Product.sku == product_code)).first()
+        if not product: flash(f"No product with barcode or SKU '{product_code}'.", 'danger'); return redirect(url_for('inventory.supplier_codes', supplier=supplier))
+        try:
+            save_supplier_code(supplier, code, product.id); db.session.commit()
+            flash(f"{supplier} code '{code}' now maps to {product.name}.", 'success')
+        except Exception as e:
+            db.session.rollback(); current_app.logger.error(f"Error saving supplier code {supplier}/{code}: {e}"); flash(f'Error saving supplier code: {e}', 'danger')
+        return redirect(url_for('inventory.supplier_codes', supplier=supplier))
+    codes_query = SupplierProductCode.query.options(joinedload(SupplierProductCode.product))
+    if supplier: codes_query = codes_query.filter(SupplierProductCode.supplier_name == supplier)
+    pagination = keyset_paginate(codes_query, [SupplierProductCode.supplier_name, SupplierProductCode.supplier_code, SupplierProductCode.id], per_page=25, count_key=f'supplier_codes:{supplier}')
+    return render_template('inventory/supplier_codes.html', title='Supplier Codes', codes=pagination.items, pagination=pagination, supplier=supplier)
+
+@inventory_bp.route('/purchases/supplier-codes/<int:mapping_id>/delete', methods=['POST'])
+@login_required
+def delete_supplier_code(mapping_id):
+    mapping = SupplierProductCode.query.get_or_404(mapping_id); supplier = mapping.supplier_name
+    db.session.delete(mapping); db.session.commit()
+    flash(f"{supplier} code '{mapping.supplier_code}' removed.", 'success')
+    return redirect(url_for('inventory.supplier_codes', supplier=supplier))
+
 @inventory_bp.route('/inventory/generate-low-stock-order', methods=['POST'])
 @login_required
 def generate_low_stock_order():
-    try:
-        low_stock_products = Product.query.filter( Product.stock_quantity <= Product.low_stock_threshold, Product.is_active == True ).all()
-        if not low_stock_products: flash('No items are currently below the low stock threshold.', 'info'); return redirect(url_for('main.dashboard'))
-        prefill_items = []
-        for p in low_stock_products:
-            order_qty = p.low_stock_threshold if p.low_stock_threshold and p.low_stock_threshold > 0 else 1
-            prefill_items.append({ 'product_id': p.id, 'name': p.name, 'quantity': order_qty, 'cost_price': p.purchase_price or 0.0 })
-        session['prefill_purchase_items'] = prefill_items
-        flash(f'Generated order draft for {len(prefill_items)} low stock items.', 'success')
-    except Exception as e:
-        current_app.logger.error(f"Error generating low stock order: {e}")
-        flash('An error occurred while generating the low stock order.', 'danger')
-        return redirect(url_for('main.dashboard'))
-    return redirect(url_for('inventory.add_purchase'))
+    """Opens the purchase form with a draft of the products to reorder (see app/reorder.py)."""
+    return redirect(url_for('inventory.add_purchase', reorder=1))
 
 # --- Product Search API ---
 @inventory_bp.route('/api/products/search')
 @login_required
+@use_replica
 def search_products_api():
     """API endpoint to search products for dynamic forms."""
     query = request.args.get('q', ''); limit = request.args.get('limit', 10, type=int)
+    if not query: return jsonify([])
+    products = search_index.search('products', query, limit) # Ranked: exact code, name prefix, substring
     today = date.today()
-    expiry_alert_days = 10 # Consistent with dashboard logic
-    near_expiry_date_limit = today + timedelta(days=expiry_alert_days)
+    return jsonify([product_search_result(p, today) for p in products])
 
-    if not query: return jsonify([])
-    search_term = f"%{query}%"
-    products = Product.query.filter(
-        Product.is_active == True,
-        or_(
-            Product.name.ilike(search_term),
-            Product.barcode.ilike(search_term),
-            Product.sku.ilike(search_term)
-        )
-    ).limit(limit).all()
+@inventory_bp.route('/api/products/scan')
+@login_required
+def scan_product_api():
+    """Exact barcode/SKU lookup for scan-to-cart, served from the in-process index (no SQL on the hot path)."""
+    code = request.args.get('code', '').strip()
+    if not code: return jsonify({'status': 'error', 'message': 'No code provided.'}), 400
+    product = get_product_index().lookup(code)
+    if product is None: return jsonify({'status': 'error', 'message': f"No active product with barcode or SKU '{code}'."}), 404
+    return jsonify(product_search_result(product))
 
-    results = []
-    for p in products:
-        is_near_expiry = False
-        if p.expiry_date and p.stock_quantity > 0: # Check if expiry_date is set and in stock
-            if today <= p.expiry_date <= near_expiry_date_limit:
-                is_near_expiry = True
-        
-        results.append({
-            'id': p.id,
-            'text': f"{p.name} (Barcode: {p.barcode or 'N/A'}, SKU: {p.sku or 'N/A'})",
-            'name': p.name, 'barcode': p.barcode, 'sku': p.sku,
-            'selling_price': p.selling_price, 'purchase_price': p.purchase_price,
-            'stock_quantity': p.stock_quantity,
-            'discount_percent': p.discount_percent,
-            'brand': p.brand, # ** Added brand here as well if not already present **
-            'is_near_expiry': is_near_expiry # ** ADDED: Near Expiry Flag **
-        })
-    return jsonify(results)
+
+@inventory_bp.route('/api/products/snapshot')
+@login_required
+def product_snapshot_api():
+    """Versioned, columnar catalogue the tills keep locally (see app/catalogue_snapshot.py); ?since=<version> returns only the changes."""
+    version = catalogue_snapshot.current_version(); since = catalogue_snapshot.parse_version(request.args.get('since'))
+    if request.if_none_match.contains_weak(f'catalogue-{version}'): # The till already holds this version
+        response = Response(status=304)
+    else:
+        body = catalogue_snapshot.snapshot_body(version, since)
+        if 'gzip' in request.accept_encodings: response = Response(body, mimetype='application/json', headers={'Content-Encoding': 'gzip'})
+        else: response = Response(gzip.decompress(body), mimetype='application/json')
+    response.set_etag(f'catalogue-{version}', weak=True)
+    response.headers['Cache-Control'] = 'private, no-cache'; response.vary.add('Accept-Encoding')
+    return response
 
 
 # --- Barcode Sticker PDF Route ---
@@ -224,7 +290,7 @@ def search_products_api():
 def download_sticker_pdf():
     product_ids_str = request.form.getlist('product_ids')
     if not product_ids_str: flash('No products selected.', 'warning'); return redirect(url_for('inventory.list_products'))
-    products_data_for_pdf = []
+    products_data_for_pdf = []; sticker_items = []
     try:
         for pid_str in product_ids_str:
             product_id = int(pid_str)
@@ -233,15 +299,32 @@ def download_sticker_pdf():
             product = Product.query.get(product_id)
             if product and product.barcode:
                 for _ in range(quantity): products_data_for_pdf.append(product)
+                sticker_items.append((product.id, quantity))
             elif product and not product.barcode: flash(f'Product "{product.name}" has no barcode.', 'info')
     except ValueError: flash('Invalid product selection or quantity.', 'danger'); return redirect(url_for('inventory.list_products'))
     if not products_data_for_pdf: flash('No valid products selected for stickers.', 'warning'); return redirect(url_for('inventory.list_products'))
+    if len(products_data_for_pdf) >= current_app.config.get('JOB_STICKER_MIN_LABELS', 300):
+        job_id = enqueue('sticker_pdf', {'items': sticker_items}, user_id=current_user.id)
+        flash(f'{len(products_data_for_pdf)} stickers: the PDF is being drawn in the background.', 'info')
+        return redirect(url_for('jobs.job_status', job_id=job_id))
     pdf_buffer = generate_barcode_sticker_pdf(products_data_for_pdf)
     if pdf_buffer is None: flash('Error generating barcode sticker PDF.', 'danger'); return redirect(url_for('inventory.list_products'))
     response = Response(pdf_buffer.getvalue(), mimetype='application/pdf')
     response.headers['Content-Disposition'] = f'attachment; filename=Barcode_Stickers_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf'
     return response
 
+@job_handler('sticker_pdf')
+def sticker_pdf_job(job, items):
+    """Background version of download_sticker_pdf for large sheets. items: [[product_id, quantity], ...]"""
+    products = {p.id: p for p in Product.query.filter(Product.id.in_([product_id for product_id, _ in items]))}
+    stickers = [products[product_id] for product_id, quantity in items if product_id in products for _ in range(quantity)]
+    job.progress(5, f'Drawing {len(stickers)} stickers...')
+    pdf_buffer = generate_barcode_sticker_pdf(stickers)
+    if pdf_buffer is None: raise JobError('Error generating barcode sticker PDF.')
+    with open(job.result_file(f'Barcode_Stickers_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf', 'application/pdf'), 'wb') as f:
+        f.write(pdf_buffer.getvalue())
+    return f'{len(stickers)} stickers ready.'
+
 # --- Stock Adjustment Routes ---
 @inventory_bp.route('/products/adjust/<int:product_id>', methods=['GET', 'POST'])
 @login_required
@@ -250,29 +333,32 @@ def adjust_stock(product_id):
     form = StockAdjustmentForm()
     if form.validate_on_submit():
         change = form.quantity_change.data; reason = form.reason.data; notes = form.notes.data
-        if product.stock_quantity + change < 0 and reason not in ['Initial Stock', 'Correction', 'Damage', 'Theft']:
-             flash(f'Adjustment would result in negative stock ({product.stock_quantity + change}). Please verify.', 'danger')
-        else:
-            try:
-                stock_before = product.stock_quantity; stock_after = stock_before + change
-                adjustment = StockAdjustment( product_id=product.id, user_id=current_user.id, quantity_change=change, reason=reason, notes=notes, stock_level_before=stock_before, stock_level_after=stock_after )
-                product.stock_quantity = stock_after
-                db.session.add(adjustment); db.session.commit()
-                flash(f'Stock for "{product.name}" adjusted by {change}. New stock: {stock_after}.', 'success')
-                return redirect(url_for('inventory.list_products'))
-            except Exception as e:
-                db.session.rollback(); current_app.logger.error(f"Error adjusting stock for product {product_id}: {e}")
-                flash(f'An error occurred while adjusting stock: {e}', 'danger')
+        allow_negative = reason in ['Initial Stock', 'Correction', 'Damage', 'Theft']
+        product_name = product.name; user_id = current_user.id
+        def save_adjustment():
+            stock_before, stock_after = adjust_stock_level(product_id, change, allow_negative=allow_negative)
+            db.session.add(StockAdjustment( product_id=product_id, user_id=user_id, quantity_change=change, reason=reason, notes=notes, stock_level_before=stock_before, stock_level_after=stock_after ))
+            return stock_after
+        try:
+            stock_after = commit_with_retry(save_adjustment)
+            flash(f'Stock for "{product_name}" adjusted by {change}. New stock: {stock_after}.', 'success')
+            return redirect(url_for('inventory.list_products'))
+        except InsufficientStockError:
+            db.session.rollback()
+            flash(f'Adjustment would result in negative stock ({product.stock_quantity + change}). Please verify.', 'danger')
+        except Exception as e:
+            db.session.rollback(); current_app.logger.error(f"Error adjusting stock for product {product_id}: {e}")
+            flash(f'An error occurred while adjusting stock: {e}', 'danger')
     form.product_id.data = product.id; form.product_name.data = product.name; form.current_stock.data = product.stock_quantity
     if request.method == 'GET': form.quantity_change.data = None
     return render_template('inventory/stock_adjustment_form.html', title=f'Adjust Stock - {product.name}', form=form, product=product)
 
 @inventory_bp.route('/stock/adjustments')
 @login_required
+@use_replica
 def list_stock_adjustments():
-    page = request.args.get('page', 1, type=int)
-    adjustments_query = StockAdjustment.query.order_by(StockAdjustment.timestamp.desc())
-    pagination = adjustments_query.paginate( page=page, per_page=current_app.config.get('ITEMS_PER_PAGE', 20), error_out=False )
+    adjustments_query = StockAdjustment.query.options(joinedload(StockAdjustment.product), joinedload(StockAdjustment.adjusted_by_user))
+    pagination = keyset_paginate(adjustments_query, [StockAdjustment.timestamp, StockAdjustment.id], descending=True, per_page=20, count_key='stock_adjustments')
     adjustments = pagination.items
     return render_template('inventory/adjustments_history.html', title='Stock Adjustment History', adjustments=adjustments, pagination=pagination)
 
@@ -285,47 +371,89 @@ def bulk_upload_stock():
         if file.filename == '': flash('No selected file.', 'warning'); return redirect(request.url)
         if file and allowed_file(file.filename):
             filename = secure_filename(file.filename)
+            file.stream.seek(0, os.SEEK_END); file_size = file.stream.tell(); file.stream.seek(0)
+            if file_size >= current_app.config.get('JOB_STOCK_UPLOAD_MIN_BYTES', 256 * 1024):
+                job_id = enqueue('stock_upload', {'path': save_job_input(file, filename), 'filename': filename, 'user_id': current_user.id}, user_id=current_user.id)
+                flash('Large file: the stock update is running in the background.', 'info')
+                return redirect(url_for('jobs.job_status', job_id=job_id))
             try:
-                excel_data = pd.read_excel(file.stream, engine='openpyxl')
-                required_qty_col = 'NewQuantity'; identifier_col = None
-                if 'Barcode' in excel_data.columns: identifier_col = 'Barcode'
-                elif 'SKU' in excel_data.columns: identifier_col = 'SKU'
-                elif 'ProductID' in excel_data.columns: identifier_col = 'ProductID'
-                if not identifier_col or required_qty_col not in excel_data.columns:
-                     flash(f'Excel file must contain "{required_qty_col}" and one of "Barcode", "SKU", or "ProductID".', 'danger')
-                     return redirect(request.url)
-                updated_count = 0; skipped_count = 0; errors = []
-                for index, row in excel_data.iterrows():
-                    identifier_value = row[identifier_col]; new_quantity_val = row[required_qty_col]
-                    if pd.isna(identifier_value) or pd.isna(new_quantity_val):
-                        skipped_count += 1; errors.append(f"Row {index+2}: Skipped missing data."); continue
-                    try:
-                        new_quantity = int(new_quantity_val)
-                        if new_quantity < 0: raise ValueError("Quantity cannot be negative.")
-                    except (ValueError, TypeError):
-                        skipped_count += 1; errors.append(f"Row {index+2}: Invalid quantity '{new_quantity_val}'. Must be a whole non-negative number."); continue
-                    product = None
-                    if identifier_col == 'Barcode': product = Product.query.filter_by(barcode=str(identifier_value)).first()
-                    elif identifier_col == 'SKU': product = Product.query.filter_by(sku=str(identifier_value)).first()
-                    elif identifier_col == 'ProductID':
-                         try: product = Product.query.get(int(identifier_value))
-                         except ValueError: product = None
-                    if product:
-                        stock_before = product.stock_quantity; change = new_quantity - stock_before
-                        adjustment = StockAdjustment( product_id=product.id, user_id=current_user.id, quantity_change=change, reason="Bulk Upload", notes=f"File: {filename}", stock_level_before=stock_before, stock_level_after=new_quantity )
-                        product.stock_quantity = new_quantity; db.session.add(adjustment); updated_count += 1
-                    else: skipped_count += 1; errors.append(f"Row {index+2}: Product {identifier_col} '{identifier_value}' not found.")
-                db.session.commit()
-                flash(f'Bulk upload: Updated {updated_count}, Skipped {skipped_count}.', 'success')
-                if errors:
+                result = import_stock_levels(read_stock_sheet(file.stream, filename), current_user.id, filename)
+                flash(f'Bulk upload: Updated {result.updated}, Skipped {result.skipped}.', 'success')
+                if result.errors:
                     flash('Details for skipped rows:', 'warning')
-                    for error_msg in errors[:10]: flash(error_msg, 'info')
-                    if len(errors) > 10: flash(f"... and {len(errors)-10} more errors.", 'info')
+                    for row, _, _, message in result.errors[:10]: flash(f"Row {row}: {message}", 'info')
+                    if len(result.errors) > 10: flash(f"... and {len(result.errors)-10} more errors.", 'info')
+                    return redirect(url_for('inventory.bulk_upload_stock', report=result.report_name)) # Page offers the full error report
                 return redirect(url_for('inventory.list_products'))
+            except StockSheetError as e:
+                flash(str(e), 'danger'); return redirect(request.url)
             except Exception as e:
                 db.session.rollback(); current_app.logger.error(f"Error processing bulk upload {filename}: {e}")
                 flash(f'Error processing file: {e}', 'danger'); return redirect(request.url)
-        else: flash('Invalid file type. Only .xlsx or .xls allowed.', 'danger'); return redirect(request.url)
-    return render_template('inventory/bulk_upload_stock.html', title='Bulk Stock Upload')
+        else: flash('Invalid file type. Only .xlsx, .xls or .csv allowed.', 'danger'); return redirect(request.url)
+    report_name = request.args.get('report')
+    return render_template('inventory/bulk_upload_stock.html', title='Bulk Stock Upload', report_name=report_name if report_name and report_path(report_name) else None)
+
+@job_handler('stock_upload')
+def stock_upload_job(job, path, filename, user_id):
+    """Background version of bulk_upload_stock for large files; the error report becomes the job's download."""
+    try:
+        try: sheet = read_stock_sheet(path, filename)
+        except StockSheetError as e: raise JobError(str(e))
+        job.progress(10, f'Read {len(sheet):,} rows; updating stock...')
+        result = import_stock_levels(sheet, user_id, filename, progress=job.progress)
+    finally:
+        if os.path.exists(path): os.remove(path)
+    if result.report_name: job.attach_result(report_path(result.report_name), result.report_name, 'text/csv')
+    return f'Bulk upload: Updated {result.updated}, Skipped {result.skipped}.' + (' Download the error report for details.' if result.errors else '')
+
+@inventory_bp.route('/products/import', methods=['GET', 'POST'])
+@login_required
+def import_product_catalogue():
+    if request.method == 'POST':
+        file = request.files.get('catalogue_file')
+        if file is None or file.filename == '': flash('No selected file.', 'warning'); return redirect(request.url)
+        filename = secure_filename(file.filename)
+        if not filename.lower().endswith(('.xlsx', '.csv')): flash('Invalid file type. Only .xlsx or .csv allowed.', 'danger'); return redirect(request.url)
+        file.stream.seek(0, os.SEEK_END); file_size = file.stream.tell(); file.stream.seek(0)
+        if file_size >= current_app.config.get('JOB_PRODUCT_IMPORT_MIN_BYTES', 256 * 1024):
+            job_id = enqueue('product_import', {'path': save_job_input(file, filename), 'filename': filename}, user_id=current_user.id)
+            flash('Large file: the products are being imported in the background.', 'info')
+            return redirect(url_for('jobs.job_status', job_id=job_id))
+        try:
+            result = import_products(read_product_chunks(file.stream, filename))
+        except StockSheetError as e:
+            flash(str(e), 'danger'); return redirect(request.url)
+        except Exception as e:
+            db.session.rollback(); current_app.logger.error(f"Error importing product catalogue {filename}: {e}")
+            flash(f'Error processing file: {e}', 'danger'); return redirect(request.url)
+        flash(f'Product import: Created {result.created}, Skipped {result.skipped}.', 'success')
+        if result.errors:
+            for row, _, _, _, message in result.errors[:10]: flash(f"Row {row}: {message}", 'info')
+            if len(result.errors) > 10: flash(f"... and {len(result.errors)-10} more rejected rows.", 'info')
+            return redirect(url_for('inventory.import_product_catalogue', report=result.report_name)) # Page offers the reject report
+        return redirect(url_for('inventory.list_products'))
+    report_name = request.args.get('report')
+    return render_template('inventory/import_products.html', title='Import Products', report_name=report_name if report_name and report_path(report_name) else None)
+
+@job_handler('product_import')
+def product_import_job(job, path, filename):
+    """Background version of import_product_catalogue for large files; the reject report becomes the job's download."""
+    try:
+        total = count_rows(path, filename)
+        job.progress(1, f'Importing {total:,} rows...')
+        try: result = import_products(read_product_chunks(path, filename), progress=lambda done: job.progress(99 * done // max(total, 1), f'Processed {done:,} of {total:,} rows...'))
+        except StockSheetError as e: raise JobError(str(e))
+    finally:
+        if os.path.exists(path): os.remove(path)
+    if result.report_name: job.attach_result(report_path(result.report_name), result.report_name, 'text/csv')
+    return f'Product import: Created {result.created}, Skipped {result.skipped}.' + (' Download the reject report for details.' if result.errors else '')
+
+@inventory_bp.route('/products/bulk_upload_stock/report/<report_name>')
+@login_required
+def download_stock_upload_report(report_name):
+    path = report_path(report_name)
+    if not path: abort(404)
+    return send_file(path, mimetype='text/csv', as_attachment=True, download_name=report_name)
 
 4
\ No newline at end of file
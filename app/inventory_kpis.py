@@ -0,0 +1,206 @@
+# app/inventory_kpis.py
+"""
+Inventory KPIs kept as running totals, so the dashboard does not scan the
+products table on every load:
+
+* inventory_kpi_totals (one row): stock value (stock * purchase price of active
+  products in stock), active product count and low-stock count.
+* inventory_kpi_products: each product's current contribution to those totals.
+  Its indexes double as the low-stock set and the set of in-stock expiry dates.
+
+Every transaction that changes stock through the stock ledger (sales, returns,
+purchases, adjustments, stock uploads) or writes Product rows through the ORM
+(product add/edit) is folded in just before it commits: the touched products'
+contributions are recomputed and only the differences are added to the totals,
+in the same transaction. Code that changes products with its own SQL must call
+mark_products_changed(ids).
+
+reconcile() recounts everything from the products table and corrects (and logs)
+any drift. Workers run it as the 'inventory_kpi_reconcile' job every
+INVENTORY_KPI_RECONCILE_SECONDS; `flask reconcile-inventory-kpis` runs it on demand.
+"""
+from datetime import datetime
+from itertools import chain
+
+from flask import current_app
+from sqlalchemy import bindparam, delete, event, insert, select, update
+
+from . import db
+from .job_queue import periodic_job
+from .models import InventoryKpiProduct, InventoryKpiTotals, Product
+from .stock_ledger import CHUNK_SIZE, commit_with_retry, pending_stock_changes
+
+_totals = InventoryKpiTotals.__table__
+_contributions = InventoryKpiProduct.__table__
+_products = Product.__table__
+
+_CHANGED_KEY = 'inventory_kpis.changed_products'
+TOTALS_ID = 1
+MEASURES = ('stock_value', 'active_products', 'low_stock_count')
+STOCK_VALUE_TOLERANCE = 0.01 # Rounding from adding float differences is not drift
+
+_SOURCE_COLUMNS = (_products.c.id, _products.c.stock_quantity, _products.c.purchase_price,
+                   _products.c.low_stock_threshold, _products.c.is_active, _products.c.expiry_date)
+# Statements run on every commit that touches products are built once
+_source_with_stored = (select(*_SOURCE_COLUMNS, *(column.label(f'stored_{column.name}') for column in _contributions.c))
+                       .select_from(_products.outerjoin(_contributions, _contributions.c.product_id == _products.c.id))
+                       .where(_products.c.id.in_(bindparam('ids', expanding=True))))
+_stored_by_id = select(_contributions).where(_contributions.c.product_id.in_(bindparam('ids', expanding=True)))
+_update_contribution = update(_contributions).where(_contributions.c.product_id == bindparam('pid'))
+_add_to_totals = update(_totals).where(_totals.c.id == TOTALS_ID).values(
+    updated_at=bindparam('now'), **{name: _totals.c[name] + bindparam(f'delta_{name}') for name in MEASURES})
+
+
+def _chunks(items):
+    items = sorted(items)
+    for start in range(0, len(items), CHUNK_SIZE):
+        yield items[start:start + CHUNK_SIZE]
+
+
+def _contribution(row):
+    """The inventory_kpi_products row for a products row."""
+    stock, active = row.stock_quantity, bool(row.is_active)
+    in_stock = active and (stock or 0) > 0
+    return {'product_id': row.id, 'stock_value': (stock or 0) * (row.purchase_price or 0.0) if in_stock else 0.0,
+            'is_active': active, 'is_low_stock': active and stock is not None and row.low_stock_threshold is not None and stock <= row.low_stock_threshold,
+            'stock_quantity': stock or 0, 'expiry_date': row.expiry_date if in_stock else None}
+
+
+def _measures(contribution):
+    if contribution is None: return (0.0, 0, 0)
+    return (contribution['stock_value'], int(contribution['is_active']), int(contribution['is_low_stock']))
+
+
+def _read_contributions(session, product_ids=None):
+    """({product_id: current contribution}, {product_id: stored contribution}) for the ids (all products when None)."""
+    if product_ids is None:
+        return ({row.id: _contribution(row) for row in session.execute(select(*_SOURCE_COLUMNS))},
+                {row.product_id: dict(row._mapping) for row in session.execute(select(_contributions))})
+    current, stored = {}, {}
+    for chunk in _chunks(product_ids): # Each product with its stored row in one query
+        for row in session.execute(_source_with_stored, {'ids': chunk}):
+            current[row.id] = _contribution(row)
+            if row.stored_product_id is not None: stored[row.id] = {name: row._mapping[f'stored_{name}'] for name in _contributions.c.keys()}
+    for chunk in _chunks(set(product_ids) - current.keys()): # Deleted products
+        stored.update({row.product_id: dict(row._mapping) for row in session.execute(_stored_by_id, {'ids': chunk})})
+    return current, stored
+
+
+def _write_contributions(session, current, stored):
+    """Brings the stored rows in line with current and returns the differences of the totals' measures."""
+    deltas = [0.0, 0, 0]
+    inserts, updates, removed = [], [], []
+    for product_id in current.keys() | stored.keys():
+        new, old = current.get(product_id), stored.get(product_id)
+        if new == old: continue
+        for index, (after, before) in enumerate(zip(_measures(new), _measures(old))): deltas[index] += after - before
+        if new is None: removed.append(product_id)
+        elif old is None: inserts.append(new)
+        else: updates.append({**{name: value for name, value in new.items() if name != 'product_id'}, 'pid': product_id})
+    if inserts: session.execute(insert(_contributions), inserts)
+    if updates: session.execute(_update_contribution, updates)
+    for chunk in _chunks(removed):
+        session.execute(delete(_contributions).where(_contributions.c.product_id.in_(chunk)))
+    return deltas, len(inserts) + len(updates) + len(removed)
+
+
+def mark_products_changed(product_ids):
+    """Folds these products into the KPIs when the current transaction commits (for writes that bypass the ORM and the stock ledger)."""
+    db.session.info.setdefault(_CHANGED_KEY, set()).update(product_ids)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _collect_changed_products(session, flush_context):
+    product_ids = {obj.id for obj in chain(session.new, session.dirty, session.deleted) if isinstance(obj, Product)}
+    if product_ids: session.info.setdefault(_CHANGED_KEY, set()).update(product_ids)
+
+
+@event.listens_for(db.session, 'before_commit')
+def _apply_changes(session):
+    if any(isinstance(obj, Product) for obj in chain(session.new, session.dirty, session.deleted)):
+        session.flush() # Collects the ids of products about to be written
+    product_ids = session.info.pop(_CHANGED_KEY, set()) | pending_stock_changes(session).keys()
+    if not product_ids: return
+    # Backends with row locks: lock the totals row first, so concurrent writers and reconcile() apply their differences
+    # one at a time (SQLite transactions already hold the database write lock). Without a totals row (never populated)
+    # the final UPDATE changes nothing and the next reconcile() counts everything.
+    if session.get_bind(mapper=Product).dialect.name != 'sqlite':
+        if session.execute(select(_totals.c.id).where(_totals.c.id == TOTALS_ID).with_for_update()).scalar() is None: return
+    deltas, changed = _write_contributions(session, *_read_contributions(session, product_ids))
+    if changed:
+        session.execute(_add_to_totals, {'now': datetime.utcnow(), **{f'delta_{name}': delta for name, delta in zip(MEASURES, deltas)}})
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_changed_products(session):
+    session.info.pop(_CHANGED_KEY, None)
+
+
+def _drifted(stored, actual):
+    if stored is None: return {}
+    return {name: (stored[name], value) for name, value in actual.items()
+            if abs(stored[name] - value) > (STOCK_VALUE_TOLERANCE if name == 'stock_value' else 0)}
+
+
+def reconcile():
+    """
+    Recounts every product's contribution and the totals from the products table, corrects
+    whatever differs and commits. Returns (product rows corrected, {measure: (stored, actual)}
+    for totals that had drifted).
+    """
+    def recount():
+        session = db.session()
+        stored_totals = session.execute(select(_totals).where(_totals.c.id == TOTALS_ID).with_for_update()).mappings().first()
+        current, stored = _read_contributions(session)
+        _, corrected = _write_contributions(session, current, stored)
+        actual = dict(zip(MEASURES, (sum(values) for values in zip((0.0, 0, 0), *map(_measures, current.values())))))
+        now = datetime.utcnow()
+        if stored_totals is None:
+            session.execute(insert(_totals).values(id=TOTALS_ID, updated_at=now, reconciled_at=now, **actual))
+        else:
+            session.execute(update(_totals).where(_totals.c.id == TOTALS_ID).values(updated_at=now, reconciled_at=now, **actual))
+        return stored_totals is None, corrected, _drifted(stored_totals, actual)
+    populated, corrected, drift = commit_with_retry(recount)
+    if populated:
+        current_app.logger.info(f"Inventory KPIs populated from {corrected} products.")
+    elif corrected or drift:
+        current_app.logger.warning(f"Inventory KPI drift corrected: {corrected} product rows, totals {drift or 'unchanged'}.")
+    return corrected, drift
+
+
+def describe_reconcile(corrected, drift):
+    if not corrected and not drift: return 'Inventory KPIs match the products table.'
+    totals = ', '.join(f'{name} {stored:,.2f} -> {actual:,.2f}' for name, (stored, actual) in drift.items()) or 'totals unchanged'
+    return f'Inventory KPIs corrected: {corrected} product rows, {totals}.'
+
+
+@periodic_job('inventory_kpi_reconcile', 'INVENTORY_KPI_RECONCILE_SECONDS')
+def reconcile_job(job):
+    return describe_reconcile(*reconcile())
+
+
+def _ensure_populated():
+    if db.session.execute(select(_totals.c.id).where(_totals.c.id == TOTALS_ID)).scalar() is None:
+        db.session.rollback(); reconcile()
+
+
+def get_totals():
+    """{'stock_value', 'active_products', 'low_stock_count'}: a single-row read."""
+    _ensure_populated()
+    row = db.session.execute(select(*(_totals.c[name] for name in MEASURES)).where(_totals.c.id == TOTALS_ID)).first()
+    return dict(row._mapping)
+
+
+def low_stock_query():
+    """Active products at or below their low-stock threshold, lowest stock first (an index range on the low-stock set)."""
+    _ensure_populated()
+    return (Product.query.join(InventoryKpiProduct, InventoryKpiProduct.product_id == Product.id)
+            .filter(InventoryKpiProduct.is_low_stock == True).order_by(InventoryKpiProduct.stock_quantity.asc(), InventoryKpiProduct.product_id.asc()))
+
+
+def near_expiry_query(start, end):
+    """Active products in stock that expire between start and end (inclusive), soonest first."""
+    _ensure_populated()
+    return (Product.query.join(InventoryKpiProduct, InventoryKpiProduct.product_id == Product.id)
+            .filter(InventoryKpiProduct.expiry_date >= start, InventoryKpiProduct.expiry_date <= end)
+            .order_by(InventoryKpiProduct.expiry_date.asc(), InventoryKpiProduct.product_id.asc()))
@@ -0,0 +1,162 @@
+# app/invoice_pdf.py
+"""
+A4 invoice PDFs.
+
+Everything that is the same for every invoice is built once per process when
+the module is imported: paragraph styles, table styles, column widths and the
+store header flowables. Rendering a sale only builds its details, item table
+and totals.
+
+Item names that fit their column are plain table cells; only names that need
+wrapping become Paragraphs, which are far more expensive to lay out.
+
+render_invoices_pdf / render_invoices_zip render many sales (e.g. a day's
+B2B invoices) into one document or a zip of one PDF per sale.
+"""
+import io
+import zipfile
+from datetime import datetime
+from xml.sax.saxutils import escape
+
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_RIGHT
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.units import inch
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.platypus import PageBreak, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload
+
+from . import db
+from .models import Sale, SaleItem
+
+STORE_LINES = ["<b>A3 Mart</b>", "Near KRPL, Anora Kala", "Lucknow, Uttar Pradesh - 226028", "Phone: 8931869849"]
+PAGE_MARGIN = 0.75 * inch
+
+STYLES = getSampleStyleSheet()
+STYLES.add(ParagraphStyle(name='RightAlign', parent=STYLES['Normal'], alignment=TA_RIGHT))
+STYLES.add(ParagraphStyle(name='RightAlignBold', parent=STYLES['h6'], alignment=TA_RIGHT))
+
+ITEM_HEADER = ['#', 'Item Description', 'Qty', 'Unit Price (₹)', 'Disc %', 'Net Amount (₹)']
+ITEM_COL_WIDTHS = [0.4*inch, 3.0*inch, 0.6*inch, 1.0*inch, 0.8*inch, 1.2*inch]
+ITEM_CELL_PADDING = 4
+ITEM_CELL_FONT = ('Helvetica', 10) # Table default font for plain string cells
+ITEM_NAME_WIDTH = ITEM_COL_WIDTHS[1] - 2 * ITEM_CELL_PADDING # Text width available in the description column
+ITEMS_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0,0), (-1,0), colors.darkblue),('TEXTCOLOR', (0,0), (-1,0), colors.whitesmoke),
+    ('ALIGN', (0,0), (-1,0), 'CENTER'),('VALIGN', (0,0), (-1,0), 'MIDDLE'),
+    ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),('BOTTOMPADDING', (0,0), (-1,0), 10),
+    ('GRID', (0,0), (-1,-1), 1, colors.black), ('ALIGN', (2,1), (-1,-1), 'RIGHT'),
+    ('VALIGN', (0,1), (-1,-1), 'TOP'), ('LEFTPADDING', (0,0), (-1,-1), ITEM_CELL_PADDING), ('RIGHTPADDING', (0,0), (-1,-1), ITEM_CELL_PADDING),
+])
+SUMMARY_COL_WIDTHS = [5.8*inch, 1.2*inch]
+SUMMARY_TABLE_STYLE = TableStyle([
+    ('ALIGN', (0,0), (-1,-1), 'RIGHT'), ('LEFTPADDING', (0,0), (-1,-1), 0), ('RIGHTPADDING', (0,0), (-1,-1), 0),
+    ('TEXTCOLOR', (0,1), (0,1), colors.red), ('TEXTCOLOR', (1,1), (1,1), colors.red),
+    ('BOTTOMPADDING', (0,0), (-1,-1), 2), ('TOPPADDING', (0,0), (-1,-1), 2),
+])
+
+# Static flowables shared by every invoice (they hold no per-document state once wrapped)
+STORE_HEADER = [Paragraph("INVOICE", STYLES['h1']), Spacer(1, 0.2*inch)] + [Paragraph(line, STYLES['Normal']) for line in STORE_LINES] + [Spacer(1, 0.2*inch)]
+INVOICE_FOOTER = [Spacer(1, 0.5*inch), Paragraph("Thank you for your business!", STYLES['Normal'])]
+
+
+def sale_invoice_data(sale, items):
+    """Invoice dictionary (the format generate_a4_invoice_pdf takes) for a Sale and its SaleItems with products loaded."""
+    def discount_percent(item):
+        gross = item.quantity * item.price_at_sale
+        return (item.discount_applied / gross * 100) if gross > 0 and item.discount_applied > 0 else 0.0
+    return {
+        'sale_id': sale.id, 'timestamp': sale.sale_timestamp.isoformat(),
+        'subtotal': "%.2f" % sale.total_amount, 'discount': "%.2f" % sale.discount_total, 'total': "%.2f" % sale.final_amount,
+        'payment_method': sale.payment_method, 'customer_name': sale.customer.name if sale.customer else None,
+        'items': [{
+            'name': item.product.name, 'quantity': item.quantity, 'price': "%.2f" % item.price_at_sale,
+            'discount_percent': "%.2f" % discount_percent(item),
+            'net_amount': "%.2f" % ((item.quantity * item.price_at_sale) - item.discount_applied),
+        } for item in items],
+    }
+
+
+def load_invoice_data(sale_ids):
+    """Invoice dictionaries for sale_ids (in that order) with two queries: the sales, then all their items."""
+    sales = db.session.execute(select(Sale).options(joinedload(Sale.customer)).where(Sale.id.in_(sale_ids))).scalars().all()
+    items = {}
+    for item in db.session.execute(select(SaleItem).options(joinedload(SaleItem.product))
+                                   .where(SaleItem.sale_id.in_(sale_ids)).order_by(SaleItem.id)).scalars():
+        items.setdefault(item.sale_id, []).append(item)
+    by_id = {sale.id: sale for sale in sales}
+    return [sale_invoice_data(by_id[sale_id], items.get(sale_id, [])) for sale_id in sale_ids if sale_id in by_id]
+
+
+def _item_name_cell(name):
+    """Plain string when the name fits on one line, otherwise a wrapping Paragraph."""
+    if stringWidth(name, *ITEM_CELL_FONT) <= ITEM_NAME_WIDTH: return name
+    return Paragraph(escape(name), STYLES['Normal'])
+
+
+def invoice_story(sale_data):
+    """Flowables of one invoice: the shared header plus this sale's details, items and totals."""
+    normal = STYLES['Normal']
+    story = list(STORE_HEADER)
+    story.append(Paragraph(f"<b>Invoice #:</b> {sale_data.get('sale_id', 'N/A')}", normal))
+    try:
+        timestamp_str = sale_data.get('timestamp')
+        date_text = datetime.fromisoformat(timestamp_str).strftime('%d-%b-%Y %H:%M:%S') if timestamp_str else 'N/A'
+    except (ValueError, TypeError):
+        date_text = 'Invalid Format'
+    story.append(Paragraph(f"<b>Date:</b> {date_text}", normal))
+    if sale_data.get('customer_name'):
+        story.append(Paragraph(f"<b>Bill To:</b> {escape(sale_data['customer_name'])}", normal))
+    story.append(Spacer(1, 0.3*inch))
+    table_data = [ITEM_HEADER]
+    for i, item in enumerate(sale_data.get('items', [])):
+        table_data.append([str(i+1), _item_name_cell(item['name']), str(item['quantity']),
+                           item['price'], item['discount_percent'] + "%", item['net_amount']])
+    story.append(Table(table_data, colWidths=ITEM_COL_WIDTHS, style=ITEMS_TABLE_STYLE, repeatRows=1))
+    story.append(Spacer(1, 0.1*inch))
+    summary_data = [
+        ['Subtotal:', f"₹{sale_data.get('subtotal', '0.00')}"],
+        ['Discount:', f"- ₹{sale_data.get('discount', '0.00')}"],
+        [Paragraph('<b>TOTAL:</b>', STYLES['RightAlignBold']), Paragraph(f"<b>₹{sale_data.get('total', '0.00')}</b>", STYLES['RightAlignBold'])]
+    ]
+    story.append(Table(summary_data, colWidths=SUMMARY_COL_WIDTHS, style=SUMMARY_TABLE_STYLE))
+    story.append(Spacer(1, 0.2*inch))
+    story.append(Paragraph(f"<b>Payment Method:</b> {escape(str(sale_data.get('payment_method', 'N/A')))}", normal))
+    story.extend(INVOICE_FOOTER)
+    return story
+
+
+def _build(story):
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4, leftMargin=PAGE_MARGIN, rightMargin=PAGE_MARGIN, topMargin=PAGE_MARGIN, bottomMargin=PAGE_MARGIN)
+    doc.build(story)
+    buffer.seek(0)
+    return buffer
+
+
+def render_invoice_pdf(sale_data):
+    """One invoice as a PDF in a BytesIO buffer."""
+    return _build(invoice_story(sale_data))
+
+
+def render_invoices_pdf(sales_data, progress=None):
+    """Many invoices in one PDF, each starting on a new page. progress(done, total) is called per invoice."""
+    story = []
+    for done, sale_data in enumerate(sales_data, 1):
+        if story: story.append(PageBreak())
+        story.extend(invoice_story(sale_data))
+        if progress: progress(done, len(sales_data))
+    return _build(story)
+
+
+def render_invoices_zip(sales_data, progress=None):
+    """Many invoices as a zip of Invoice_<sale id>.pdf files. progress(done, total) is called per invoice."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for done, sale_data in enumerate(sales_data, 1):
+            archive.writestr(f"Invoice_{sale_data['sale_id']}.pdf", render_invoice_pdf(sale_data).getvalue())
+            if progress: progress(done, len(sales_data))
+    buffer.seek(0)
+    return buffer
@@ -0,0 +1,310 @@
+# app/job_queue.py
+"""
+Background job queue for work that is too slow for a request: large stock
+uploads, large report exports and multi-page sticker PDFs.
+
+Jobs are rows in the `jobs` table, so the queue needs no extra services and
+survives restarts:
+
+* Routes call enqueue(kind, params) and redirect to the job's status page
+  (app/jobs), which polls /jobs/<id>/status and offers the result for download.
+* `flask run-workers` (run.py) starts a WorkerPool. Each worker thread claims
+  the oldest queued job with a conditional UPDATE (only one worker can move a
+  row from 'queued' to 'running') and calls the handler registered for the
+  job kind with @job_handler. Handlers report progress through their JobContext
+  and may attach a result file.
+* A supervisor thread writes progress and heartbeats for running jobs every
+  JOB_HEARTBEAT_SECONDS. If a job's heartbeat is older than JOB_STALE_SECONDS
+  (its worker died), the job is queued again, up to JOB_MAX_ATTEMPTS.
+* Handlers registered with @periodic_job are also queued by the supervisor
+  whenever their last run is older than the interval named by their config key.
+* With JOB_EMBEDDED_WORKERS > 0, each web process also starts that many worker
+  threads on its first enqueue. This suits single-process setups.
+
+Worker threads share one process (and its GIL). For CPU-heavy jobs, run one
+`flask run-workers` process per core rather than many threads.
+"""
+import json
+import os
+import signal
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import select, update
+from sqlalchemy.exc import DBAPIError
+
+from . import db
+from .models import Job
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = 'queued', 'running', 'succeeded', 'failed'
+
+_jobs = Job.__table__
+
+JOB_HANDLERS = {}
+PERIODIC_JOBS = {} # kind -> config key with the interval in seconds
+_embedded_pool = None
+_embedded_lock = threading.Lock()
+
+
+class JobError(Exception):
+    """Raised by handlers for expected failures; the message is shown to the user as is."""
+
+
+def job_handler(kind):
+    """Registers handler(job_context, **params) for a job kind. The handler returns an optional summary message."""
+    def register(handler):
+        JOB_HANDLERS[kind] = handler
+        return handler
+    return register
+
+
+def periodic_job(kind, interval_key):
+    """Like job_handler, and the supervisor queues the job every app.config[interval_key] seconds (0 or unset: never)."""
+    def register(handler):
+        PERIODIC_JOBS[kind] = interval_key
+        return job_handler(kind)(handler)
+    return register
+
+
+def job_files_dir(*parts):
+    """Directory (created on demand) under JOB_FILES_DIR for job inputs and results."""
+    directory = os.path.join(current_app.config.get('JOB_FILES_DIR') or os.path.join(current_app.instance_path, 'jobs'), *parts)
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def save_job_input(file_storage, filename):
+    """Saves an uploaded file for a job to process later and returns its path."""
+    path = os.path.join(job_files_dir('inputs'), f'{uuid.uuid4().hex}_{filename}')
+    file_storage.save(path)
+    return path
+
+
+def enqueue(kind, params=None, user_id=None, message='Waiting for a worker...'):
+    """Adds a job to the queue, commits, and returns its id. params must be JSON-serialisable."""
+    if kind not in JOB_HANDLERS:
+        raise JobError(f"Unknown job kind '{kind}'.")
+    job = Job(kind=kind, status=QUEUED, params=json.dumps(params or {}), progress=0, attempts=0, message=message, user_id=user_id)
+    db.session.add(job); db.session.commit()
+    current_app.logger.info(f"Job {job.id} ({kind}) queued.")
+    _ensure_embedded_workers(current_app._get_current_object())
+    return job.id
+
+
+class JobContext:
+    """Passed to handlers: progress reporting and result files. Progress is kept in memory and flushed by the supervisor."""
+    def __init__(self, job_id, pool):
+        self.job_id = job_id
+        self._pool = pool
+        self.result = None # (path, download name, mimetype)
+
+    def progress(self, percent, message=None):
+        self._pool.report_progress(self.job_id, max(0, min(100, int(percent))), message)
+
+    def result_file(self, download_name, mimetype=None):
+        """Returns a path for the handler to write its result to; it becomes the job's download."""
+        path = os.path.join(job_files_dir('results'), f'{self.job_id}_{uuid.uuid4().hex[:8]}_{download_name}')
+        self.attach_result(path, download_name, mimetype)
+        return path
+
+    def attach_result(self, path, download_name, mimetype=None):
+        """Makes an existing file the job's download."""
+        self.result = (path, download_name, mimetype)
+
+
+def _now():
+    return datetime.utcnow()
+
+
+def claim_next_job(worker_name):
+    """Moves the oldest queued job to 'running' for this worker and returns its id (None if the queue is empty)."""
+    for _ in range(5):
+        try:
+            job_id = db.session.execute(select(_jobs.c.id).where(_jobs.c.status == QUEUED).order_by(_jobs.c.id).limit(1)).scalar()
+            if job_id is None:
+                db.session.rollback(); return None
+            now = _now()
+            claimed = db.session.execute(
+                update(_jobs).where(_jobs.c.id == job_id, _jobs.c.status == QUEUED)
+                .values(status=RUNNING, worker=worker_name, started_at=now, heartbeat_at=now, attempts=_jobs.c.attempts + 1)
+            ).rowcount
+            db.session.commit()
+            if claimed: return job_id
+        except DBAPIError as e: # e.g. the database is locked by another writer; try again on the next poll
+            db.session.rollback(); current_app.logger.warning(f"Job claim by {worker_name} failed: {e}")
+            return None
+    return None # Other workers kept winning the race; poll again
+
+
+def _finish(job_id, status, **values):
+    values.update(status=status, finished_at=_now())
+    db.session.execute(update(_jobs).where(_jobs.c.id == job_id).values(**values)); db.session.commit()
+
+
+def run_job(job_id, pool):
+    """Runs a claimed job's handler and records the outcome. Handlers commit their own work."""
+    job = db.session.get(Job, job_id)
+    kind, params = job.kind, json.loads(job.params or '{}')
+    db.session.rollback() # End the read transaction before the handler starts its own work
+    context = JobContext(job_id, pool)
+    current_app.logger.info(f"Job {job_id} ({kind}) started.")
+    try:
+        handler = JOB_HANDLERS.get(kind)
+        if handler is None:
+            raise JobError(f"No handler registered for job kind '{kind}'.")
+        message = handler(context, **params)
+        db.session.rollback() # Discard anything the handler left open (its work is already committed)
+        pool.forget_progress(job_id)
+        path, name, mimetype = context.result or (None, None, None)
+        _finish(job_id, SUCCEEDED, progress=100, message=(message or 'Done.')[:255], error=None,
+                result_path=path, result_name=name, result_mimetype=mimetype)
+        current_app.logger.info(f"Job {job_id} ({kind}) succeeded.")
+    except Exception as e:
+        db.session.rollback(); pool.forget_progress(job_id)
+        current_app.logger.error(f"Job {job_id} ({kind}) failed: {e}", exc_info=not isinstance(e, JobError))
+        _finish(job_id, FAILED, message='Failed.', error=str(e) or type(e).__name__)
+
+
+def requeue_stale_jobs():
+    """Requeues running jobs whose worker stopped sending heartbeats (or fails them after JOB_MAX_ATTEMPTS)."""
+    cutoff = _now() - timedelta(seconds=current_app.config.get('JOB_STALE_SECONDS', 120))
+    max_attempts = current_app.config.get('JOB_MAX_ATTEMPTS', 3)
+    stale = (_jobs.c.status == RUNNING) & (_jobs.c.heartbeat_at < cutoff)
+    requeued = db.session.execute(update(_jobs).where(stale, _jobs.c.attempts < max_attempts)
+                                  .values(status=QUEUED, worker=None, message='Worker stopped; waiting for another worker...')).rowcount
+    failed = db.session.execute(update(_jobs).where(stale, _jobs.c.attempts >= max_attempts)
+                                .values(status=FAILED, finished_at=_now(), error='The worker running this job stopped responding.')).rowcount
+    db.session.commit()
+    if requeued or failed:
+        current_app.logger.warning(f"Stale jobs: {requeued} requeued, {failed} failed.")
+    return requeued, failed
+
+
+def prune_finished_jobs():
+    """Deletes finished jobs older than JOB_RETENTION_DAYS together with their files."""
+    cutoff = _now() - timedelta(days=current_app.config.get('JOB_RETENTION_DAYS', 7))
+    old = db.session.execute(select(_jobs.c.id, _jobs.c.result_path, _jobs.c.params)
+                             .where(_jobs.c.status.in_((SUCCEEDED, FAILED)), _jobs.c.finished_at < cutoff)).all()
+    files_dir = job_files_dir()
+    for row in old:
+        input_path = json.loads(row.params or '{}').get('path')
+        for path in (row.result_path, input_path):
+            # Only files the queue owns are removed (handlers may attach files that live elsewhere)
+            if path and os.path.abspath(path).startswith(os.path.abspath(files_dir) + os.sep) and os.path.exists(path):
+                os.remove(path)
+    if old:
+        db.session.execute(_jobs.delete().where(_jobs.c.id.in_([row.id for row in old]))); db.session.commit()
+    else:
+        db.session.rollback()
+    return len(old)
+
+
+def enqueue_due_jobs():
+    """Queues each periodic job whose latest run was queued more than its interval ago and has finished. Returns the new job ids."""
+    due = []
+    for kind, interval_key in PERIODIC_JOBS.items():
+        interval = current_app.config.get(interval_key)
+        if not interval: continue
+        latest = db.session.execute(select(_jobs.c.status, _jobs.c.created_at).where(_jobs.c.kind == kind).order_by(_jobs.c.id.desc()).limit(1)).first()
+        if latest is None or (latest.status not in (QUEUED, RUNNING) and (_now() - latest.created_at).total_seconds() >= interval):
+            due.append(kind)
+    db.session.rollback()
+    return [enqueue(kind, message='Scheduled; waiting for a worker...') for kind in due]
+
+
+class WorkerPool:
+    """A set of worker threads plus a supervisor thread (progress/heartbeat flushes, stale job recovery, periodic jobs, pruning)."""
+    PRUNE_INTERVAL_SECONDS = 3600
+
+    def __init__(self, app, size=None, poll_interval=None):
+        self.app = app
+        self.size = max(1, size or app.config.get('JOB_WORKERS', 2))
+        self.poll_interval = poll_interval or app.config.get('JOB_POLL_SECONDS', 1.0)
+        prefix = f'{socket.gethostname()}:{os.getpid()}'
+        self.worker_names = [f'{prefix}:{index}' for index in range(self.size)]
+        self.stop_event = threading.Event()
+        self._progress = {} # job_id -> (percent, message) not yet written
+        self._progress_lock = threading.Lock()
+        self._running = set()
+        self._threads = []
+
+    def report_progress(self, job_id, percent, message):
+        with self._progress_lock: self._progress[job_id] = (percent, message)
+
+    def forget_progress(self, job_id):
+        with self._progress_lock: self._progress.pop(job_id, None)
+
+    def start(self):
+        self._threads = [threading.Thread(target=self._work, args=(name,), name=f'job-worker-{index}', daemon=True)
+                         for index, name in enumerate(self.worker_names)]
+        self._threads.append(threading.Thread(target=self._supervise, name='job-supervisor', daemon=True))
+        for thread in self._threads: thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        """Stops polling; running jobs are allowed to finish (up to timeout seconds)."""
+        self.stop_event.set()
+        for thread in self._threads: thread.join(timeout)
+
+    def run_forever(self):
+        """Starts the pool and blocks until interrupted (Ctrl+C or SIGTERM), then waits for running jobs."""
+        self.start()
+        try: signal.signal(signal.SIGTERM, lambda *args: self.stop_event.set())
+        except ValueError: pass # Not on the main thread
+        try:
+            while not self.stop_event.wait(1.0): pass
+        except KeyboardInterrupt:
+            pass
+        self.stop()
+
+    def _work(self, worker_name):
+        with self.app.app_context():
+            while not self.stop_event.is_set():
+                job_id = claim_next_job(worker_name)
+                if job_id is None:
+                    self.stop_event.wait(self.poll_interval); continue
+                self._running.add(job_id)
+                try: run_job(job_id, self)
+                except Exception as e: # Recording the outcome failed (e.g. database unavailable); recovery requeues it
+                    db.session.rollback(); self.app.logger.error(f"Worker {worker_name} lost job {job_id}: {e}")
+                finally: self._running.discard(job_id)
+                db.session.remove()
+
+    def _supervise(self):
+        interval = self.app.config.get('JOB_HEARTBEAT_SECONDS', 5)
+        last_prune = None
+        with self.app.app_context():
+            while not self.stop_event.wait(interval):
+                try:
+                    self._flush_heartbeats()
+                    requeue_stale_jobs()
+                    enqueue_due_jobs()
+                    if last_prune is None or (_now() - last_prune).total_seconds() > self.PRUNE_INTERVAL_SECONDS:
+                        prune_finished_jobs(); last_prune = _now()
+                except Exception as e: # Best effort; the next round tries again
+                    db.session.rollback(); self.app.logger.warning(f"Job supervisor round failed: {e}")
+
+    def _flush_heartbeats(self):
+        running = list(self._running)
+        if not running: return
+        with self._progress_lock: progress, self._progress = self._progress, {}
+        now = _now()
+        for job_id, (percent, message) in progress.items():
+            values = {'progress': percent, 'heartbeat_at': now}
+            if message: values['message'] = message[:255]
+            db.session.execute(update(_jobs).where(_jobs.c.id == job_id, _jobs.c.status == RUNNING).values(**values))
+        db.session.execute(update(_jobs).where(_jobs.c.id.in_(running), _jobs.c.status == RUNNING).values(heartbeat_at=now))
+        db.session.commit()
+
+
+def _ensure_embedded_workers(app):
+    global _embedded_pool
+    if _embedded_pool is not None or not app.config.get('JOB_EMBEDDED_WORKERS'): return
+    with _embedded_lock:
+        if _embedded_pool is None:
+            _embedded_pool = WorkerPool(app, size=app.config['JOB_EMBEDDED_WORKERS']).start()
+            app.logger.info(f"Started {_embedded_pool.size} embedded job worker thread(s).")
+
@@ -0,0 +1,7 @@
+# app/jobs/__init__.py
+from flask import Blueprint
+
+# Status pages and downloads for background jobs (the queue itself is app/job_queue.py)
+jobs_bp = Blueprint('jobs', __name__, template_folder='templates')
+
+from . import routes
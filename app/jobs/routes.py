@@ -0,0 +1,47 @@
+# app/jobs/routes.py
+import os
+from flask import render_template, url_for, jsonify, abort, send_file
+from flask_login import login_required, current_user
+
+from . import jobs_bp
+from ..models import Job
+
+
+def _visible_job(job_id):
+    """The job if the current user may see it (its creator or an admin), else 404."""
+    job = Job.query.get_or_404(job_id)
+    if job.user_id != current_user.id and not current_user.is_admin: abort(404)
+    return job
+
+def _job_status(job):
+    return { 'id': job.id, 'kind': job.kind, 'status': job.status, 'progress': job.progress, 'message': job.message, 'error': job.error,
+             'created_at': job.created_at.isoformat() if job.created_at else None,
+             'started_at': job.started_at.isoformat() if job.started_at else None,
+             'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+             'download_url': url_for('jobs.download_job_result', job_id=job.id) if job.status == 'succeeded' and job.result_path else None }
+
+
+@jobs_bp.route('/')
+@login_required
+def list_jobs():
+    jobs_query = Job.query.order_by(Job.id.desc())
+    if not current_user.is_admin: jobs_query = jobs_query.filter(Job.user_id == current_user.id)
+    return render_template('jobs/jobs.html', title='Background Jobs', jobs=jobs_query.limit(50).all())
+
+@jobs_bp.route('/<int:job_id>')
+@login_required
+def job_status(job_id):
+    job = _visible_job(job_id)
+    return render_template('jobs/job_status.html', title=f'Job #{job.id}', job=job, status=_job_status(job))
+
+@jobs_bp.route('/<int:job_id>/status')
+@login_required
+def job_status_api(job_id):
+    return jsonify(_job_status(_visible_job(job_id)))
+
+@jobs_bp.route('/<int:job_id>/download')
+@login_required
+def download_job_result(job_id):
+    job = _visible_job(job_id)
+    if job.status != 'succeeded' or not job.result_path or not os.path.isfile(job.result_path): abort(404)
+    return send_file(job.result_path, mimetype=job.result_mimetype, as_attachment=True, download_name=job.result_name)
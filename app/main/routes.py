@@ -1,20 +1,26 @@
 # app/main/routes.py
-from flask import render_template, redirect, url_for, flash, request, current_app, Response
+from flask import render_template, redirect, url_for, flash, request, current_app, jsonify
 from flask_login import login_required, current_user
-from sqlalchemy import func, extract
+from sqlalchemy import func, or_, select
 from sqlalchemy.orm import joinedload
 from collections import defaultdict
-import pandas as pd
-import io
+import calendar
 
 from . import main_bp
-from ..models import Sale, Product, SaleItem, Customer
+from ..models import Sale, SaleItem, SaleReturn, Product, Customer, User, DailySalesRollup, DailyProductRollup
 from .. import db
+from ..sales_rollup import product_rollup_rows
+from ..cache import cached, get_cache
+from ..exports import FORMATS, export_filename, export_response, stream_rows, with_progress, write_export
+from ..job_queue import enqueue, job_handler
+from ..db_routing import use_replica
+from .. import inventory_kpis
 from datetime import datetime, date, timedelta
 
 @main_bp.route('/')
 @main_bp.route('/dashboard')
 @login_required
+@use_replica
 def dashboard():
     """Renders the main dashboard page with enhanced metrics and optional export for near expiry."""
 
@@ -25,87 +31,92 @@ def dashboard():
     # --- Near Expiry Items Query (needed for both display and export) ---
     expiry_alert_days = 10
     near_expiry_date_limit = today + timedelta(days=expiry_alert_days)
-    near_expiry_items_query = Product.query.filter(
-        Product.expiry_date != None,
-        Product.expiry_date >= today,
-        Product.expiry_date <= near_expiry_date_limit,
-        Product.is_active == True,
-        Product.stock_quantity > 0
-    ).order_by(Product.expiry_date.asc())
-
-    if export_format_near_expiry == 'excel':
-        near_expiry_items_data = near_expiry_items_query.all()
-        if not near_expiry_items_data:
+    near_expiry_items_query = inventory_kpis.near_expiry_query(today, near_expiry_date_limit) # Active products in stock only
+
+    if export_format_near_expiry in FORMATS:
+        if not near_expiry_items_query.first():
             flash('No near expiry items to export.', 'info')
             return redirect(url_for('main.dashboard')) # Redirect back to dashboard
-
-        export_data_list = [
-            {
-                'Product ID': p.id,
-                'Product Name': p.name,
-                'Barcode': p.barcode or 'N/A',
-                'SKU': p.sku or 'N/A',
-                'Stock Quantity': p.stock_quantity,
-                'Expiry Date': p.expiry_date.strftime('%Y-%m-%d') if p.expiry_date else 'N/A',
-                'Days to Expire': (p.expiry_date - today).days if p.expiry_date else 'N/A'
-            } for p in near_expiry_items_data
-        ]
-        df = pd.DataFrame(export_data_list)
-        output = io.BytesIO()
-        writer = pd.ExcelWriter(output, engine='openpyxl')
-        try:
-            df.to_excel(writer, index=False, sheet_name='Near_Expiry_Items')
-        finally:
-            writer.close()
-        output.seek(0)
-        return Response(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            headers={'Content-Disposition': f'attachment;filename=near_expiry_items_{today.isoformat()}.xlsx'}
-        )
+        near_expiry_columns = ['Product ID', 'Product Name', 'Barcode', 'SKU', 'Stock Quantity', 'Expiry Date', 'Days to Expire']
+        near_expiry_rows = stream_rows(
+            near_expiry_items_query.with_entities(Product.id, Product.name, Product.barcode, Product.sku, Product.stock_quantity, Product.expiry_date),
+            lambda r: (r.id, r.name, r.barcode or 'N/A', r.sku or 'N/A', r.stock_quantity, r.expiry_date.strftime('%Y-%m-%d'), (r.expiry_date - today).days))
+        return export_response(export_format_near_expiry, f'near_expiry_items_{today.isoformat()}', near_expiry_columns, near_expiry_rows, sheet_name='Near_Expiry_Items')
 
     # --- Proceed with normal dashboard data fetching if not exporting near expiry ---
+    # Each metric block is cached separately and invalidated by the writes that change it (see app/cache.py)
     today_start = datetime.combine(today, datetime.min.time())
     today_end = datetime.combine(today, datetime.max.time())
     current_month_start = today.replace(day=1)
     next_month_start = (current_month_start + timedelta(days=32)).replace(day=1)
     current_month_end = next_month_start - timedelta(days=1)
-    current_month_end_dt = datetime.combine(current_month_end, datetime.max.time())
 
-    todays_sales_query = db.session.query( func.sum(Sale.final_amount).label('total_sales'), func.count(Sale.id).label('order_count') ).filter( Sale.sale_timestamp >= today_start, Sale.sale_timestamp <= today_end )
-    todays_summary = todays_sales_query.first()
-    todays_sales_total = todays_summary.total_sales if todays_summary and todays_summary.total_sales is not None else 0.0
-    todays_order_count = todays_summary.order_count if todays_summary and todays_summary.order_count is not None else 0
+    def todays_sales_block():
+        # Sales figures come from the daily rollups (one row per day and payment method / product)
+        # Net of the refunds processed that day (returns are booked on the day they are processed)
+        todays_summary = db.session.query( func.sum(DailySalesRollup.net_sales - DailySalesRollup.refunded_amount).label('total_sales'), func.sum(DailySalesRollup.order_count).label('order_count') ).filter( DailySalesRollup.sale_date == today ).first()
+        return {
+            'todays_sales': todays_summary.total_sales if todays_summary and todays_summary.total_sales is not None else 0.0,
+            'todays_orders': todays_summary.order_count if todays_summary and todays_summary.order_count is not None else 0 }
+
+    def monthly_sales_block():
+        return db.session.query( func.sum(DailySalesRollup.net_sales - DailySalesRollup.refunded_amount) ).filter( DailySalesRollup.sale_date >= current_month_start, DailySalesRollup.sale_date <= current_month_end ).scalar() or 0.0
+
+    def top_items_block():
+        top_items_query = db.session.query( Product.name, func.sum(DailyProductRollup.quantity_sold).label('total_quantity') ).join(DailyProductRollup, DailyProductRollup.product_id == Product.id).filter(DailyProductRollup.sale_date == today, DailyProductRollup.quantity_sold > 0).group_by(Product.name).order_by(db.desc('total_quantity')).limit(5)
+        return [(row[0], row[1]) for row in top_items_query.all()]
+
+    def low_stock_block():
+        low_stock_items = inventory_kpis.low_stock_query().limit(10).all()
+        return [ {'id': p.id, 'name': p.name, 'stock_quantity': p.stock_quantity} for p in low_stock_items ]
 
-    monthly_sales_query = db.session.query( func.sum(Sale.final_amount).label('total_sales') ).filter( Sale.sale_timestamp >= datetime.combine(current_month_start, datetime.min.time()), Sale.sale_timestamp <= current_month_end_dt )
-    sales_this_month_total = monthly_sales_query.scalar() or 0.0
+    def customers_block():
+        return { 'new_customers_today': Customer.query.filter( Customer.created_at >= today_start, Customer.created_at <= today_end ).count(),
+                 'total_customers': Customer.query.count() }
 
-    top_items_query = db.session.query( Product.name, func.sum(SaleItem.quantity).label('total_quantity') ).join(SaleItem, SaleItem.product_id == Product.id).join(Sale, Sale.id == SaleItem.sale_id).filter(Sale.sale_timestamp >= today_start, Sale.sale_timestamp <= today_end).group_by(Product.name).order_by(db.desc('total_quantity')).limit(5)
-    top_items_result = top_items_query.all()
-    top_items_serializable = [(row[0], row[1]) for row in top_items_result]
+    def catalogue_block():
+        # Running totals kept by app/inventory_kpis.py (one row, not a scan of the products table)
+        totals = inventory_kpis.get_totals()
+        return { 'total_active_products': totals['active_products'], 'total_stock_value': totals['stock_value'], 'low_stock_count': totals['low_stock_count'] }
 
-    low_stock_items = Product.query.filter( Product.stock_quantity <= Product.low_stock_threshold, Product.is_active == True ).order_by(Product.stock_quantity.asc()).limit(10).all()
-    new_customers_today = Customer.query.filter( Customer.created_at >= today_start, Customer.created_at <= today_end ).count()
-    total_customers = Customer.query.count()
-    total_active_products = Product.query.filter_by(is_active=True).count()
-    total_stock_value_query = db.session.query( func.sum(Product.stock_quantity * func.coalesce(Product.purchase_price, 0)) ).filter(Product.is_active == True, Product.stock_quantity > 0)
-    total_stock_value = total_stock_value_query.scalar() or 0.0
-    
-    near_expiry_items = near_expiry_items_query.limit(10).all() # Limit for display on dashboard
+    def near_expiry_block():
+        near_expiry_items = near_expiry_items_query.limit(10).all() # Limit for display on dashboard
+        return [ {'id': p.id, 'name': p.name, 'stock_quantity': p.stock_quantity, 'expiry_date': p.expiry_date} for p in near_expiry_items ]
 
     dashboard_data = {
-        'todays_sales': todays_sales_total, 'todays_orders': todays_order_count,
-        'sales_this_month': sales_this_month_total, 'new_customers_today': new_customers_today,
-        'total_customers': total_customers, 'total_active_products': total_active_products,
-        'total_stock_value': total_stock_value, 'top_items': top_items_serializable,
-        'low_stock_items': low_stock_items, 'near_expiry_items': near_expiry_items
+        'sales_this_month': cached(f'dashboard:monthly_sales:{current_month_start}', monthly_sales_block, topics=('sales',)),
+        'top_items': cached(f'dashboard:top_items:{today}', top_items_block, topics=('sales', 'products')),
+        'low_stock_items': cached('dashboard:low_stock', low_stock_block, topics=('stock', 'products')),
+        'near_expiry_items': cached(f'dashboard:near_expiry:{today}', near_expiry_block, topics=('stock', 'products')),
     }
+    dashboard_data.update(cached(f'dashboard:todays_sales:{today}', todays_sales_block, topics=('sales',)))
+    dashboard_data.update(cached(f'dashboard:customers:{today}', customers_block, topics=('customers',)))
+    dashboard_data.update(cached('dashboard:catalogue', catalogue_block, topics=('stock', 'products')))
     return render_template('main/dashboard.html', title='Dashboard', data=dashboard_data)
 
 
 # --- Sales Report by Date Range Route ---
+SALES_EXPORT_COLUMNS = ['Sale ID', 'Timestamp', 'Customer', 'Product Name', 'Quantity', 'Price @ Sale', 'Discount Applied', 'Net Amount (Item)', 'Payment Method', 'Sold By']
+
+def _sales_export_rows(start_dt, end_dt):
+    """One row per line item from a single query joining the sale, product, customer and cashier, streamed in batches."""
+    line_items_query = select( Sale.id, Sale.sale_timestamp, Customer.name, Product.name, SaleItem.quantity, SaleItem.price_at_sale, SaleItem.discount_applied, Sale.payment_method, User.username ).select_from(SaleItem).join(Sale, SaleItem.sale_id == Sale.id).join(Product, SaleItem.product_id == Product.id).outerjoin(Customer, Sale.customer_id == Customer.id).outerjoin(User, Sale.user_id == User.id).where( Sale.sale_timestamp >= start_dt, Sale.sale_timestamp <= end_dt ).order_by(Sale.sale_timestamp.asc(), Sale.id.asc(), SaleItem.id.asc())
+    def line_item_row(r):
+        sale_id, timestamp, customer_name, product_name, quantity, price, discount, payment_method, username = r
+        return ( sale_id, timestamp.strftime('%Y-%m-%d %H:%M:%S'), customer_name or 'Walk-in', product_name, quantity, price, discount, (quantity * price) - (discount or 0.0), payment_method, username or 'N/A' )
+    return stream_rows(line_items_query, line_item_row)
+
+@job_handler('sales_export')
+def sales_export_job(job, start_date, end_date, export_format, total_rows):
+    """Background version of the sales_by_date_report export for large date ranges."""
+    start_dt = datetime.combine(date.fromisoformat(start_date), datetime.min.time()); end_dt = datetime.combine(date.fromisoformat(end_date), datetime.max.time())
+    path = job.result_file(export_filename(f'sales_report_{start_date}_to_{end_date}', export_format), FORMATS[export_format][1])
+    write_export(path, export_format, SALES_EXPORT_COLUMNS, with_progress(_sales_export_rows(start_dt, end_dt), total_rows, job.progress), sheet_name='Sales_Report')
+    return f'Sales export of {total_rows:,} line items ready.'
+
 @main_bp.route('/reports/sales_by_date')
 @login_required
+@use_replica
 def sales_by_date_report():
     today_iso = date.today().isoformat()
     start_date_str = request.args.get('start_date', today_iso)
@@ -122,66 +133,61 @@ def sales_by_date_report():
         start_date_str = end_date_str = start_date_obj.isoformat()
     start_dt = datetime.combine(start_date_obj, datetime.min.time()); end_dt = datetime.combine(end_date_obj, datetime.max.time())
     sales_in_range_query = Sale.query.options( joinedload(Sale.customer), joinedload(Sale.user) ).filter( Sale.sale_timestamp >= start_dt, Sale.sale_timestamp <= end_dt ).order_by(Sale.sale_timestamp.asc())
-    if export_format == 'excel':
-        sales_data = sales_in_range_query.all()
-        if not sales_data:
+    if export_format in FORMATS:
+        line_count = db.session.query(func.count(SaleItem.id)).join(Sale, SaleItem.sale_id == Sale.id).filter( Sale.sale_timestamp >= start_dt, Sale.sale_timestamp <= end_dt ).scalar()
+        if not line_count:
             flash('No data to export for the selected date range.', 'info')
             return redirect(url_for('main.sales_by_date_report', start_date=start_date_str, end_date=end_date_str))
-        export_data_list = []
-        for sale in sales_data:
-            for item in sale.items:
-                export_data_list.append({
-                    'Sale ID': sale.id, 'Timestamp': sale.sale_timestamp.strftime('%Y-%m-%d %H:%M:%S'),
-                    'Customer': sale.customer.name if sale.customer else 'Walk-in',
-                    'Product Name': item.product.name, 'Quantity': item.quantity,
-                    'Price @ Sale': item.price_at_sale, 'Discount Applied': item.discount_applied,
-                    'Net Amount (Item)': (item.quantity * item.price_at_sale) - item.discount_applied,
-                    'Payment Method': sale.payment_method, 'Sold By': sale.user.username if sale.user else 'N/A' })
-        df = pd.DataFrame(export_data_list); output = io.BytesIO()
-        writer = pd.ExcelWriter(output, engine='openpyxl')
-        try: df.to_excel(writer, index=False, sheet_name='Sales_Report')
-        finally: writer.close()
-        output.seek(0)
-        return Response( output, mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', headers={'Content-Disposition': f'attachment;filename=sales_report_{start_date_str}_to_{end_date_str}.xlsx'} )
+        if line_count >= current_app.config.get('JOB_EXPORT_MIN_ROWS', 50000):
+            job_id = enqueue('sales_export', {'start_date': start_date_obj.isoformat(), 'end_date': end_date_obj.isoformat(), 'export_format': export_format, 'total_rows': line_count}, user_id=current_user.id)
+            flash(f'{line_count:,} line items: the export is being prepared in the background.', 'info')
+            return redirect(url_for('jobs.job_status', job_id=job_id))
+        return export_response(export_format, f'sales_report_{start_date_str}_to_{end_date_str}', SALES_EXPORT_COLUMNS, _sales_export_rows(start_dt, end_dt), sheet_name='Sales_Report')
     sales_in_range = sales_in_range_query.all()
-    total_sales = sum(s.final_amount for s in sales_in_range); total_discount = sum(s.discount_total for s in sales_in_range); number_of_sales = len(sales_in_range)
-    report_data = { 'start_date': start_date_obj, 'end_date': end_date_obj, 'sales': sales_in_range, 'total_sales': total_sales, 'total_discount': total_discount, 'number_of_sales': number_of_sales }
+    # Totals from the daily rollup for the range; refunds count on the day the return was processed
+    totals = db.session.query( func.sum(DailySalesRollup.net_sales), func.sum(DailySalesRollup.discount_total), func.sum(DailySalesRollup.order_count), func.sum(DailySalesRollup.refunded_amount) ).filter( DailySalesRollup.sale_date >= start_date_obj, DailySalesRollup.sale_date <= end_date_obj ).one()
+    total_sales, total_discount, number_of_sales, total_refunded = (totals[0] or 0.0), (totals[1] or 0.0), (totals[2] or 0), (totals[3] or 0.0)
+    # Refunded so far per listed sale: one grouped query on the indexed original_sale_id
+    refunded_by_sale = dict(db.session.query( SaleReturn.original_sale_id, func.sum(SaleReturn.total_refunded_amount) ).join(Sale, Sale.id == SaleReturn.original_sale_id).filter( Sale.sale_timestamp >= start_dt, Sale.sale_timestamp <= end_dt ).group_by(SaleReturn.original_sale_id).all())
+    report_data = { 'start_date': start_date_obj, 'end_date': end_date_obj, 'sales': sales_in_range, 'total_sales': total_sales, 'total_discount': total_discount, 'number_of_sales': number_of_sales,
+                    'total_refunded': total_refunded, 'net_sales': total_sales - total_refunded, 'refunded_by_sale': refunded_by_sale }
     return render_template( 'main/daily_sales_report.html', title=f'Sales Report: {start_date_obj.strftime("%d %b %Y")} to {end_date_obj.strftime("%d %b %Y")}', data=report_data, start_date_str=start_date_str, end_date_str=end_date_str )
 
 # --- Monthly Sales Report Route ---
 @main_bp.route('/reports/monthly_sales')
 @login_required
+@use_replica
 def monthly_sales_report():
     current_year = date.today().year
     try: report_year = int(request.args.get('year', current_year))
     except ValueError: report_year = current_year; flash('Invalid year. Showing current year.', 'warning')
     export_format = request.args.get('export')
-    monthly_sales_data_query = db.session.query( extract('year', Sale.sale_timestamp).label('sale_year'), extract('month', Sale.sale_timestamp).label('sale_month'), func.sum(Sale.final_amount).label('total_sales'), func.sum(Sale.discount_total).label('total_discount'), func.count(Sale.id).label('order_count') ).filter( extract('year', Sale.sale_timestamp) == report_year ).group_by('sale_year', 'sale_month').order_by('sale_year', 'sale_month')
-    if export_format == 'excel':
-        monthly_data = monthly_sales_data_query.all()
-        if not monthly_data:
+    # Reads the daily rollup for the year with an index range scan on sale_date, then folds days into months
+    has_activity = or_(DailySalesRollup.order_count > 0, DailySalesRollup.return_count > 0)
+    year_rows = db.session.query( DailySalesRollup.sale_date, DailySalesRollup.net_sales, DailySalesRollup.discount_total, DailySalesRollup.order_count, DailySalesRollup.refunded_amount ).filter( DailySalesRollup.sale_date >= date(report_year, 1, 1), DailySalesRollup.sale_date <= date(report_year, 12, 31), has_activity ).all()
+    report_summary = {}
+    for row in year_rows:
+        month = report_summary.setdefault(row.sale_date.month, { 'month_name': calendar.month_name[row.sale_date.month], 'total_sales': 0.0, 'total_discount': 0.0, 'order_count': 0, 'total_refunded': 0.0 })
+        month['total_sales'] += row.net_sales or 0.0; month['total_discount'] += row.discount_total or 0.0; month['order_count'] += row.order_count or 0; month['total_refunded'] += row.refunded_amount or 0.0
+    if export_format in FORMATS:
+        if not report_summary:
             flash(f'No sales data to export for the year {report_year}.', 'info')
             return redirect(url_for('main.monthly_sales_report', year=report_year))
-        export_data_list = [ { 'Year': int(row.sale_year), 'Month': date(report_year, int(row.sale_month), 1).strftime('%B'), 'Number of Sales': row.order_count or 0, 'Total Sales (₹)': row.total_sales or 0.0, 'Total Discount (₹)': row.total_discount or 0.0 } for row in monthly_data ]
-        df = pd.DataFrame(export_data_list); output = io.BytesIO()
-        writer = pd.ExcelWriter(output, engine='openpyxl')
-        try: df.to_excel(writer, index=False, sheet_name=f'Monthly_Sales_{report_year}')
-        finally: writer.close()
-        output.seek(0)
-        return Response( output, mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', headers={'Content-Disposition': f'attachment;filename=monthly_sales_report_{report_year}.xlsx'} )
-    monthly_sales_data = monthly_sales_data_query.all()
-    report_summary = {}; grand_total_sales = 0.0; grand_total_discount = 0.0; grand_total_orders = 0
-    for row in monthly_sales_data:
-        month_num = int(row.sale_month); month_name = date(report_year, month_num, 1).strftime('%B')
-        report_summary[month_num] = { 'month_name': month_name, 'total_sales': row.total_sales or 0.0, 'total_discount': row.total_discount or 0.0, 'order_count': row.order_count or 0 }
-        grand_total_sales += report_summary[month_num]['total_sales']; grand_total_discount += report_summary[month_num]['total_discount']; grand_total_orders += report_summary[month_num]['order_count']
-    available_years = db.session.query( extract('year', Sale.sale_timestamp).label('sale_year') ).distinct().order_by(db.desc('sale_year')).all()
-    years = [y.sale_year for y in available_years if y.sale_year]
-    return render_template( 'main/monthly_sales_report.html', title=f'Monthly Sales Report - {report_year}', report_year=report_year, report_summary=report_summary, grand_total_sales=grand_total_sales, grand_total_discount=grand_total_discount, grand_total_orders=grand_total_orders, available_years=years )
+        columns = ['Year', 'Month', 'Number of Sales', 'Total Sales (₹)', 'Total Discount (₹)', 'Refunded (₹)', 'Net Sales (₹)']
+        rows = ( (report_year, month['month_name'], month['order_count'], month['total_sales'], month['total_discount'], round(month['total_refunded'], 2), round(month['total_sales'] - month['total_refunded'], 2)) for _, month in sorted(report_summary.items()) )
+        return export_response(export_format, f'monthly_sales_report_{report_year}', columns, rows, sheet_name=f'Monthly_Sales_{report_year}')
+    grand_total_sales = sum(month['total_sales'] for month in report_summary.values())
+    grand_total_discount = sum(month['total_discount'] for month in report_summary.values())
+    grand_total_orders = sum(month['order_count'] for month in report_summary.values())
+    grand_total_refunded = sum(month['total_refunded'] for month in report_summary.values())
+    first_day, last_day = db.session.query( func.min(DailySalesRollup.sale_date), func.max(DailySalesRollup.sale_date) ).filter( has_activity ).one()
+    years = list(range(last_day.year, first_day.year - 1, -1)) if first_day and last_day else []
+    return render_template( 'main/monthly_sales_report.html', title=f'Monthly Sales Report - {report_year}', report_year=report_year, report_summary=report_summary, grand_total_sales=grand_total_sales, grand_total_discount=grand_total_discount, grand_total_orders=grand_total_orders, grand_total_refunded=grand_total_refunded, available_years=years, month_names=list(calendar.month_name) )
 
 # --- Product Sales Report Route ---
 @main_bp.route('/reports/product_sales')
 @login_required
+@use_replica
 def product_sales_report():
     today = date.today(); default_start = today - timedelta(days=6)
     start_date_str = request.args.get('start_date', default_start.isoformat()); end_date_str = request.args.get('end_date', today.isoformat())
@@ -195,20 +201,26 @@ def product_sales_report():
         flash('Invalid date format. Showing report for last 7 days.', 'warning')
         start_date_obj = default_start; end_date_obj = today
         start_date_str = start_date_obj.isoformat(); end_date_str = end_date_obj.isoformat()
-    start_dt = datetime.combine(start_date_obj, datetime.min.time()); end_dt = datetime.combine(end_date_obj, datetime.max.time())
-    product_sales_query = db.session.query( Product.id.label('product_id'), Product.name.label('product_name'), Product.barcode.label('product_barcode'), Product.category.label('product_category'), Product.brand.label('product_brand'), func.sum(SaleItem.quantity).label('total_quantity_sold'), func.sum((SaleItem.quantity * SaleItem.price_at_sale) - SaleItem.discount_applied).label('total_revenue') ).join(SaleItem, SaleItem.product_id == Product.id).join(Sale, Sale.id == SaleItem.sale_id).filter( Sale.sale_timestamp >= start_dt, Sale.sale_timestamp <= end_dt ).group_by(Product.id, Product.name, Product.barcode, Product.category, Product.brand).order_by(db.desc('total_revenue'))
-    if export_format == 'excel':
-        product_sales_data = product_sales_query.all()
-        if not product_sales_data:
+    # Totals per product from the rollups (whole months from the monthly table), aggregated before joining products
+    rollup_rows = product_rollup_rows(start_date_obj, end_date_obj)
+    # Returns processed in the range are netted out of quantity and revenue
+    per_product = select( rollup_rows.c.product_id, func.sum(rollup_rows.c.quantity_sold).label('total_quantity_sold'), func.sum(rollup_rows.c.net_revenue).label('total_revenue'),
+                          func.sum(rollup_rows.c.quantity_returned).label('total_quantity_returned'), func.sum(rollup_rows.c.refunded_amount).label('total_refunded') ).group_by(rollup_rows.c.product_id).having(or_(func.sum(rollup_rows.c.quantity_sold) > 0, func.sum(rollup_rows.c.quantity_returned) > 0)).subquery()
+    net_quantity = (per_product.c.total_quantity_sold - per_product.c.total_quantity_returned).label('net_quantity_sold'); net_revenue = (per_product.c.total_revenue - per_product.c.total_refunded).label('net_revenue')
+    product_sales_query = db.session.query( Product.id.label('product_id'), Product.name.label('product_name'), Product.barcode.label('product_barcode'), Product.category.label('product_category'), Product.brand.label('product_brand'), per_product.c.total_quantity_sold, per_product.c.total_revenue, per_product.c.total_quantity_returned, per_product.c.total_refunded, net_quantity, net_revenue ).join(per_product, per_product.c.product_id == Product.id).order_by(net_revenue.desc())
+    if export_format in FORMATS:
+        if not product_sales_query.first():
             flash('No product sales data to export for the selected date range.', 'info')
             return redirect(url_for('main.product_sales_report', start_date=start_date_str, end_date=end_date_str))
-        export_data_list = [ { 'Product ID': p.product_id, 'Product Name': p.product_name, 'Barcode': p.product_barcode, 'Category': p.product_category, 'Brand': p.product_brand, 'Quantity Sold': p.total_quantity_sold, 'Total Revenue (Net) (₹)': p.total_revenue } for p in product_sales_data ]
-        df = pd.DataFrame(export_data_list); output = io.BytesIO()
-        writer = pd.ExcelWriter(output, engine='openpyxl')
-        try: df.to_excel(writer, index=False, sheet_name='Product_Sales_Report')
-        finally: writer.close()
-        output.seek(0)
-        return Response( output, mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', headers={'Content-Disposition': f'attachment;filename=product_sales_{start_date_str}_to_{end_date_str}.xlsx'} )
+        columns = ['Product ID', 'Product Name', 'Barcode', 'Category', 'Brand', 'Quantity Sold', 'Total Revenue (Net) (₹)', 'Quantity Returned', 'Refunded (₹)', 'Net Quantity', 'Net Revenue after Returns (₹)']
+        return export_response(export_format, f'product_sales_{start_date_str}_to_{end_date_str}', columns, stream_rows(product_sales_query), sheet_name='Product_Sales_Report')
     product_sales_data = product_sales_query.all()
     report_data = { 'start_date': start_date_obj, 'end_date': end_date_obj, 'product_sales': product_sales_data }
     return render_template( 'main/product_sales_report.html', title=f'Product Sales Report: {start_date_obj.strftime("%d %b %Y")} to {end_date_obj.strftime("%d %b %Y")}', data=report_data, start_date_str=start_date_str, end_date_str=end_date_str )
+
+
+@main_bp.route('/cache/stats')
+@login_required
+def cache_stats():
+    """Hit/miss counters of this worker's cache, to check the dashboard cache is working."""
+    return jsonify(get_cache().info())
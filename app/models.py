@@ -8,16 +8,17 @@ from . import db, login_manager
 class SaleItem(db.Model):
     __tablename__ = 'sale_items'
     id = db.Column(db.Integer, primary_key=True)
-    sale_id = db.Column(db.Integer, db.ForeignKey('sales.id'), nullable=False)
+    sale_id = db.Column(db.Integer, db.ForeignKey('sales.id'), nullable=False, index=True) # Items of a sale are always fetched by sale_id
     product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
     quantity = db.Column(db.Integer, nullable=False)
     price_at_sale = db.Column(db.Float, nullable=False)
     discount_applied = db.Column(db.Float, default=0.0)
+    return_ledger = db.relationship('SaleItemReturn', uselist=False, viewonly=True) # None until part of the line is returned
 
 class PurchaseItem(db.Model):
     __tablename__ = 'purchase_items'
     id = db.Column(db.Integer, primary_key=True)
-    purchase_id = db.Column(db.Integer, db.ForeignKey('purchases.id'), nullable=False)
+    purchase_id = db.Column(db.Integer, db.ForeignKey('purchases.id'), nullable=False, index=True)
     product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
     quantity = db.Column(db.Integer, nullable=False)
     cost_price = db.Column(db.Float, nullable=False)
@@ -25,11 +26,21 @@ class PurchaseItem(db.Model):
 class SaleReturnItem(db.Model):
     __tablename__ = 'sale_return_items'
     id = db.Column(db.Integer, primary_key=True)
-    sale_return_id = db.Column(db.Integer, db.ForeignKey('sale_returns.id'), nullable=False)
+    sale_return_id = db.Column(db.Integer, db.ForeignKey('sale_returns.id'), nullable=False, index=True)
+    sale_item_id = db.Column(db.Integer, db.ForeignKey('sale_items.id'), nullable=True, index=True) # The returned sale line (NULL for returns recorded before line-level returns)
     product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
     quantity = db.Column(db.Integer, nullable=False)
     amount_refunded = db.Column(db.Float, nullable=False)
 
+class SaleItemReturn(db.Model):
+    """Return ledger (app/sale_returns.py): how much of a sale line has been returned and refunded so far."""
+    __tablename__ = 'sale_item_returns'
+    sale_item_id = db.Column(db.Integer, db.ForeignKey('sale_items.id'), primary_key=True, autoincrement=False)
+    sale_id = db.Column(db.Integer, db.ForeignKey('sales.id'), nullable=False, index=True) # A sale's returnable lines are one index range
+    quantity_returned = db.Column(db.Integer, nullable=False, default=0)
+    amount_refunded = db.Column(db.Float, nullable=False, default=0.0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
 # --- Main Models ---
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
@@ -66,7 +77,7 @@ class Product(db.Model):
     discount_percent = db.Column(db.Float, default=0.0)
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True) # Drives product index refreshes
     # ** ADDED: Expiry Date field **
     expiry_date = db.Column(db.Date, nullable=True, index=True) # Assuming one expiry date per product listing for simplicity
 
@@ -100,6 +111,7 @@ class Sale(db.Model):
     notes = db.Column(db.Text, nullable=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
     customer_id = db.Column(db.Integer, db.ForeignKey('customers.id'), nullable=True)
+    client_ref = db.Column(db.String(64), unique=True, index=True, nullable=True) # Idempotency key of a sale queued offline by a till
     items = db.relationship('SaleItem', backref='sale', lazy='dynamic', cascade="all, delete-orphan")
     returns = db.relationship('SaleReturn', backref='original_sale', lazy='dynamic')
     def __repr__(self): return f'<Sale ID: {self.id} Time: {self.sale_timestamp} Amount: {self.final_amount}>'
@@ -123,7 +135,7 @@ class SaleReturn(db.Model):
     return_timestamp = db.Column(db.DateTime, index=True, default=datetime.utcnow)
     reason = db.Column(db.String(255), nullable=True)
     total_refunded_amount = db.Column(db.Float, nullable=False)
-    original_sale_id = db.Column(db.Integer, db.ForeignKey('sales.id'), nullable=False)
+    original_sale_id = db.Column(db.Integer, db.ForeignKey('sales.id'), nullable=False, index=True) # Returns are looked up by sale
     customer_id = db.Column(db.Integer, db.ForeignKey('customers.id'), nullable=True)
     processed_by_user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
     items = db.relationship('SaleReturnItem', backref='sale_return', lazy='dynamic', cascade="all, delete-orphan")
@@ -141,3 +153,119 @@ class StockAdjustment(db.Model):
     product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     def __repr__(self): change_type = '+' if self.quantity_change > 0 else ''; return f'<StockAdjustment ID: {self.id} ProductID: {self.product_id} Change: {change_type}{self.quantity_change}>'
+
+
+# --- Reporting Rollups (maintained by app/sales_rollup.py) ---
+class DailySalesRollup(db.Model):
+    __tablename__ = 'daily_sales_rollup'
+    sale_date = db.Column(db.Date, primary_key=True)
+    payment_method = db.Column(db.String(50), primary_key=True)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+    gross_amount = db.Column(db.Float, nullable=False, default=0.0) # Sum of Sale.total_amount
+    discount_total = db.Column(db.Float, nullable=False, default=0.0)
+    net_sales = db.Column(db.Float, nullable=False, default=0.0) # Sum of Sale.final_amount
+    return_count = db.Column(db.Integer, nullable=False, default=0) # Returns are booked on the day they are processed
+    refunded_amount = db.Column(db.Float, nullable=False, default=0.0)
+    def __repr__(self): return f'<DailySalesRollup {self.sale_date} {self.payment_method}: {self.net_sales}>'
+
+class DailyProductRollup(db.Model):
+    __tablename__ = 'daily_product_rollup'
+    sale_date = db.Column(db.Date, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), primary_key=True, index=True)
+    category = db.Column(db.String(64), index=True) # Product category when the row was last written
+    quantity_sold = db.Column(db.Integer, nullable=False, default=0)
+    gross_revenue = db.Column(db.Float, nullable=False, default=0.0) # Sum of quantity * price_at_sale
+    discount_total = db.Column(db.Float, nullable=False, default=0.0)
+    net_revenue = db.Column(db.Float, nullable=False, default=0.0)
+    quantity_returned = db.Column(db.Integer, nullable=False, default=0)
+    refunded_amount = db.Column(db.Float, nullable=False, default=0.0)
+    product = db.relationship('Product')
+    def __repr__(self): return f'<DailyProductRollup {self.sale_date} Product {self.product_id}: {self.quantity_sold}>'
+
+class MonthlyProductRollup(db.Model):
+    """Same measures as DailyProductRollup per calendar month, so long report ranges read ~12 rows per product a year."""
+    __tablename__ = 'monthly_product_rollup'
+    month = db.Column(db.Date, primary_key=True) # First day of the month
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), primary_key=True, index=True)
+    category = db.Column(db.String(64), index=True)
+    quantity_sold = db.Column(db.Integer, nullable=False, default=0)
+    gross_revenue = db.Column(db.Float, nullable=False, default=0.0)
+    discount_total = db.Column(db.Float, nullable=False, default=0.0)
+    net_revenue = db.Column(db.Float, nullable=False, default=0.0)
+    quantity_returned = db.Column(db.Integer, nullable=False, default=0)
+    refunded_amount = db.Column(db.Float, nullable=False, default=0.0)
+    product = db.relationship('Product')
+    def __repr__(self): return f'<MonthlyProductRollup {self.month:%Y-%m} Product {self.product_id}: {self.quantity_sold}>'
+
+
+# --- Barcode numbering (app/barcode_sequence.py) ---
+class BarcodeSequence(db.Model):
+    """Next unreserved number of the auto-generated barcodes with this prefix."""
+    __tablename__ = 'barcode_sequences'
+    prefix = db.Column(db.String(16), primary_key=True)
+    next_value = db.Column(db.BigInteger, nullable=False)
+    def __repr__(self): return f'<BarcodeSequence {self.prefix}: {self.next_value}>'
+
+
+# --- Supplier invoice import (app/purchase_import.py) ---
+class SupplierProductCode(db.Model):
+    """A supplier's own code for one of our products, used to match the lines of that supplier's invoices."""
+    __tablename__ = 'supplier_product_codes'
+    __table_args__ = (db.UniqueConstraint('supplier_name', 'supplier_code', name='uq_supplier_product_codes_supplier_code'),) # Invoice lines are resolved by (supplier, code)
+    id = db.Column(db.Integer, primary_key=True)
+    supplier_name = db.Column(db.String(128), nullable=False) # As entered on purchases, stripped
+    supplier_code = db.Column(db.String(64), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    product = db.relationship('Product')
+    def __repr__(self): return f'<SupplierProductCode {self.supplier_name}/{self.supplier_code} -> {self.product_id}>'
+
+
+# --- Inventory KPIs (kept up to date by app/inventory_kpis.py) ---
+class InventoryKpiTotals(db.Model):
+    """Single row (id 1) with the running inventory totals shown on the dashboard."""
+    __tablename__ = 'inventory_kpi_totals'
+    id = db.Column(db.Integer, primary_key=True)
+    stock_value = db.Column(db.Float, nullable=False, default=0.0) # Sum of stock * purchase price over active products in stock
+    active_products = db.Column(db.Integer, nullable=False, default=0)
+    low_stock_count = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    reconciled_at = db.Column(db.DateTime) # Last full recount
+    def __repr__(self): return f'<InventoryKpiTotals {self.active_products} products, {self.stock_value:.2f}>'
+
+class InventoryKpiProduct(db.Model):
+    """Each product's current contribution to the totals, so a change only adds its difference. Also the low-stock and in-stock expiry sets."""
+    __tablename__ = 'inventory_kpi_products'
+    __table_args__ = (db.Index('ix_inventory_kpi_products_low_stock', 'is_low_stock', 'stock_quantity'),)
+    product_id = db.Column(db.Integer, primary_key=True, autoincrement=False) # No foreign key: a derived row, removed in the commit that deletes its product
+    stock_value = db.Column(db.Float, nullable=False, default=0.0)
+    is_active = db.Column(db.Boolean, nullable=False, default=False)
+    is_low_stock = db.Column(db.Boolean, nullable=False, default=False) # Active and at or below its threshold
+    stock_quantity = db.Column(db.Integer, nullable=False, default=0)
+    expiry_date = db.Column(db.Date, index=True) # Only set for active products in stock (near-expiry candidates)
+    def __repr__(self): return f'<InventoryKpiProduct {self.product_id}: {self.stock_value:.2f}>'
+
+
+# --- Background Jobs (run by app/job_queue.py workers) ---
+class Job(db.Model):
+    __tablename__ = 'jobs'
+    __table_args__ = (db.Index('ix_jobs_status_id', 'status', 'id'),) # Workers claim the oldest queued job
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(64), nullable=False) # Handler name, e.g. 'stock_upload'
+    status = db.Column(db.String(16), nullable=False, default='queued') # queued, running, succeeded, failed
+    params = db.Column(db.Text, nullable=False, default='{}') # JSON keyword arguments for the handler
+    progress = db.Column(db.Integer, nullable=False, default=0) # Percent complete
+    message = db.Column(db.String(255)) # Latest progress or final summary message
+    error = db.Column(db.Text)
+    result_path = db.Column(db.String(512)) # Server-side path of the downloadable result file, if any
+    result_name = db.Column(db.String(255)) # Download file name
+    result_mimetype = db.Column(db.String(128))
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    worker = db.Column(db.String(128)) # Worker that claimed the job
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    started_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime) # Refreshed while a worker is running the job
+    finished_at = db.Column(db.DateTime)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    user = db.relationship('User')
+    def __repr__(self): return f'<Job {self.id} {self.kind}: {self.status} {self.progress}%>'
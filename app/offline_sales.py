@@ -0,0 +1,202 @@
+# app/offline_sales.py
+"""
+Bulk ingest of sales that tills queued while the server was unreachable.
+
+When the billing page cannot reach process_sale it keeps the sale in the
+browser under a client-generated idempotency key (Sale.client_ref) and later
+posts the queue to billing.sync_offline_sales, hundreds of sales per request. Each request
+is applied in one transaction:
+
+* a sale whose key is already stored (a retried sync) or repeated in the batch
+  is reported 'duplicate' with the id of the stored sale;
+* a malformed sale, or one naming an unknown product, is reported 'invalid';
+* the rest are checked in queue order against the stock read at the start of
+  the transaction. A sale that would take a product below zero is reported
+  'conflict' with its shortages and is not applied; the till keeps it for review;
+* the accepted sales are inserted with one multi-row INSERT for the sales and
+  one for their items, stock is decremented once for the whole batch, and the
+  rollups are updated once per key.
+
+Results come back in request order, one per queued sale.
+"""
+from datetime import datetime, timezone
+
+from flask import current_app
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from . import db
+from .models import Customer, Product, Sale, SaleItem
+from .sales_rollup import record_sales
+from .stock_ledger import CHUNK_SIZE, InsufficientStockError, commit_with_retry, decrement_stock, get_stock_levels
+
+CLIENT_REF_MAX_LENGTH = 64 # Sale.client_ref
+INGEST_ATTEMPTS = 3 # Re-runs of a batch that lost a race (stock taken or the same key stored meanwhile)
+
+
+def _chunks(items):
+    items = list(items)
+    for start in range(0, len(items), CHUNK_SIZE):
+        yield items[start:start + CHUNK_SIZE]
+
+
+def parse_sale_lines(items_data):
+    """
+    Validates the cart lines of a sale as posted by the billing page.
+    Returns (lines, quantities, subtotal, total_discount), where quantities is
+    {product_id: total quantity across all lines}. Raises ValueError.
+    """
+    lines = []; quantities = {}; subtotal = 0.0; total_discount = 0.0
+    for i, item_data in enumerate(items_data):
+        if not isinstance(item_data, dict): raise ValueError(f"Item {i+1}: Invalid item.")
+        product_id = item_data.get('product_id')
+        quantity = item_data.get('quantity')
+        price_at_sale = item_data.get('price_at_sale')
+        discount_applied = item_data.get('discount_applied') or 0.0
+        if not all([product_id, quantity, price_at_sale is not None]):
+            raise ValueError(f"Item {i+1}: Missing data (product_id, quantity, or price_at_sale).")
+        if int(quantity) <= 0 or float(price_at_sale) < 0 or float(discount_applied) < 0:
+            raise ValueError(f"Item {i+1}: Quantity must be positive and prices/discounts non-negative.")
+        lines.append({'product_id': int(product_id), 'quantity': int(quantity),
+                      'price_at_sale': float(price_at_sale), 'discount_applied': float(discount_applied)})
+        quantities[int(product_id)] = quantities.get(int(product_id), 0) + int(quantity)
+        subtotal += int(quantity) * float(price_at_sale)
+        total_discount += float(discount_applied)
+    return lines, quantities, subtotal, total_discount
+
+
+def _parse_timestamp(value, now):
+    """The till's sale time as naive UTC (like Sale.sale_timestamp), never later than now."""
+    if not value: return now
+    timestamp = datetime.fromisoformat(str(value))
+    if timestamp.tzinfo is not None: timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return min(timestamp, now)
+
+
+def _parse_sale(data, now):
+    """One queued sale as a plain dict ready to insert. Raises ValueError."""
+    if not isinstance(data, dict): raise ValueError("Invalid sale.")
+    items_data = data.get('items') or []
+    if not isinstance(items_data, list) or not items_data: raise ValueError("Cannot process a sale with no items.")
+    lines, quantities, subtotal, total_discount = parse_sale_lines(items_data)
+    customer_id = data.get('customer_id')
+    return {
+        'client_ref': data['client_ref'], 'lines': lines, 'quantities': quantities,
+        'sale_timestamp': _parse_timestamp(data.get('created_at'), now), 'total_amount': subtotal,
+        'discount_total': total_discount, 'final_amount': max(subtotal - total_discount, 0),
+        'payment_method': data.get('payment_method') or 'Cash', 'notes': data.get('notes') or None,
+        'customer_id': int(customer_id) if customer_id else None,
+    }
+
+
+def valid_client_ref(data):
+    """The idempotency key of a posted sale, or None if it is missing or malformed."""
+    ref = data.get('client_ref') if isinstance(data, dict) else None
+    return ref if isinstance(ref, str) and 0 < len(ref) <= CLIENT_REF_MAX_LENGTH else None
+
+
+def stored_refs(refs):
+    """{client_ref: sale_id} of the keys that are already stored."""
+    stored = {}
+    for chunk in _chunks(refs):
+        stored.update(db.session.execute(select(Sale.client_ref, Sale.id).where(Sale.client_ref.in_(chunk))).all())
+    return stored
+
+
+def _apply(sales, product_names, product_categories, user_id):
+    """
+    Unit of work for commit_with_retry: inserts the sales that fit the current stock, in queue order.
+    Returns ({client_ref: sale_id} of the inserted sales, {client_ref: shortages} of the rejected ones).
+    """
+    levels = get_stock_levels({product_id for sale in sales for product_id in sale['quantities']}, lock=True)
+    accepted = []; conflicts = {}
+    for sale in sales:
+        shortages = [(product_id, product_names[product_id], levels.get(product_id, 0), quantity)
+                     for product_id, quantity in sorted(sale['quantities'].items()) if levels.get(product_id, 0) < quantity]
+        if shortages: conflicts[sale['client_ref']] = shortages; continue
+        for product_id, quantity in sale['quantities'].items(): levels[product_id] -= quantity
+        accepted.append(sale)
+    if not accepted: return {}, conflicts
+
+    new_sales = [Sale(client_ref=sale['client_ref'], sale_timestamp=sale['sale_timestamp'], total_amount=sale['total_amount'],
+                      discount_total=sale['discount_total'], final_amount=sale['final_amount'], payment_method=sale['payment_method'],
+                      notes=sale['notes'], user_id=user_id, customer_id=sale['customer_id']) for sale in accepted]
+    db.session.add_all(new_sales)
+    db.session.flush() # One multi-row INSERT; assigns the ids
+    db.session.execute(SaleItem.__table__.insert(), [dict(line, sale_id=new_sale.id)
+                                                     for new_sale, sale in zip(new_sales, accepted) for line in sale['lines']])
+    totals = {}
+    for sale in accepted:
+        for product_id, quantity in sale['quantities'].items(): totals[product_id] = totals.get(product_id, 0) + quantity
+    decrement_stock(totals) # Still conditional: raises InsufficientStockError if another till sold the stock meanwhile
+    record_sales([(new_sale, sale['lines']) for new_sale, sale in zip(new_sales, accepted)], product_categories)
+    return {new_sale.client_ref: new_sale.id for new_sale in new_sales}, conflicts
+
+
+def ingest_offline_sales(queued_sales, user_id):
+    """
+    Applies a batch of queued offline sales (dicts with client_ref, created_at, customer_id,
+    payment_method, notes and items as posted to process_sale) in one transaction.
+    Returns one result dict per queued sale, in order: client_ref, status
+    ('created', 'duplicate', 'conflict' or 'invalid') and sale_id, message or shortages.
+    """
+    now = datetime.utcnow(); results = [None] * len(queued_sales); parsed = {} # client_ref -> parsed sale
+    for i, data in enumerate(queued_sales):
+        ref = valid_client_ref(data)
+        if ref is None:
+            results[i] = {'client_ref': data.get('client_ref') if isinstance(data, dict) else None, 'status': 'invalid',
+                          'message': f"A client_ref of 1 to {CLIENT_REF_MAX_LENGTH} characters is required."}
+            continue
+        if ref in parsed: continue # Repeated in the batch: reported as a duplicate of the first copy below
+        try: parsed[ref] = _parse_sale(data, now)
+        except (ValueError, TypeError) as e: parsed[ref] = None; results[i] = {'client_ref': ref, 'status': 'invalid', 'message': str(e)}
+
+    product_ids = {product_id for sale in parsed.values() if sale for product_id in sale['quantities']}
+    products = {}
+    for chunk in _chunks(product_ids):
+        products.update({row.id: row for row in db.session.execute(select(Product.id, Product.name, Product.category).where(Product.id.in_(chunk)))})
+    customer_ids = {sale['customer_id'] for sale in parsed.values() if sale and sale['customer_id']}
+    known_customers = set()
+    for chunk in _chunks(customer_ids):
+        known_customers.update(db.session.execute(select(Customer.id).where(Customer.id.in_(chunk))).scalars())
+    invalid = {}
+    for ref, sale in parsed.items():
+        if sale is None: continue
+        missing = sorted(set(sale['quantities']) - set(products))
+        if missing: invalid[ref] = f"Product with ID {missing[0]} not found."
+        elif sale['customer_id'] not in known_customers: sale['customer_id'] = None # Deleted meanwhile: keep the sale as a walk-in, as process_sale does
+    product_names = {product_id: row.name for product_id, row in products.items()}
+    product_categories = {product_id: row.category for product_id, row in products.items()}
+
+    candidates = [ref for ref, sale in parsed.items() if sale and ref not in invalid]
+    for attempt in range(1, INGEST_ATTEMPTS + 1):
+        stored = stored_refs(parsed)
+        pending = [parsed[ref] for ref in candidates if ref not in stored]
+        try:
+            created, conflicts = commit_with_retry(lambda: _apply(pending, product_names, product_categories, user_id)) if pending else ({}, {})
+            break
+        except (InsufficientStockError, IntegrityError) as e: # Lost a race with another till or a concurrent retry of this sync
+            db.session.rollback()
+            if attempt >= INGEST_ATTEMPTS: raise
+            current_app.logger.warning(f"Offline sync batch raced another writer (attempt {attempt}/{INGEST_ATTEMPTS}), re-checking: {e}")
+
+    first_seen = set()
+    for i, data in enumerate(queued_sales):
+        ref = valid_client_ref(data)
+        if ref is None: continue
+        if ref in first_seen or ref in stored:
+            sale_id = stored.get(ref) or created.get(ref)
+            results[i] = {'client_ref': ref, 'status': 'duplicate', 'sale_id': sale_id} if sale_id else \
+                         {'client_ref': ref, 'status': 'invalid', 'message': 'Repeats a queued sale that was not applied.'}
+        elif ref in created: results[i] = {'client_ref': ref, 'status': 'created', 'sale_id': created[ref]}
+        elif ref in conflicts:
+            shortages = conflicts[ref]
+            results[i] = {'client_ref': ref, 'status': 'conflict', 'message': str(InsufficientStockError(shortages)),
+                          'shortages': [{'product_id': product_id, 'name': name, 'available': available, 'requested': requested}
+                                        for product_id, name, available, requested in shortages]}
+        elif ref in invalid: results[i] = {'client_ref': ref, 'status': 'invalid', 'message': invalid[ref]}
+        first_seen.add(ref)
+    counts = {}
+    for result in results: counts[result['status']] = counts.get(result['status'], 0) + 1
+    current_app.logger.info(f"Offline sync of {len(queued_sales)} queued sales by user {user_id}: {counts}")
+    return results
@@ -0,0 +1,106 @@
+# app/pagination.py
+"""
+Keyset (seek) pagination for the listing pages.
+
+Instead of OFFSET, each page continues from the sort key of the last row
+shown: for sales, WHERE (sale_timestamp, id) < (:last_timestamp, :last_id)
+ORDER BY sale_timestamp DESC, id DESC LIMIT n. With an index on the sort
+column (which also holds the row id), a deep page costs the same as page 1.
+
+The position travels in the URL as an opaque cursor (?after=... or
+?before=...). The page number is carried only for display. Pages are reached
+with Previous/Next, so there is no jumping to page N.
+
+The total row count is optional and approximate. It is cached for
+PAGINATION_COUNT_TTL seconds per listing and filter, so a COUNT(*) does not
+run on every click (0 disables totals).
+"""
+import base64
+import json
+from datetime import date, datetime
+
+from flask import current_app, request, url_for
+from sqlalchemy import tuple_
+
+from .cache import cached
+
+
+class KeysetPage:
+    """One page of rows plus the cursors of its neighbours (the template side of keyset_paginate)."""
+    def __init__(self, items, number, per_page, next_cursor=None, prev_cursor=None, total=None):
+        self.items = items
+        self.number = number # 1-based, for display only
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total # Approximate, or None when totals are disabled
+
+    has_next = property(lambda self: self.next_cursor is not None)
+    has_prev = property(lambda self: self.prev_cursor is not None)
+    first = property(lambda self: (self.number - 1) * self.per_page + 1 if self.items else 0)
+    last = property(lambda self: (self.number - 1) * self.per_page + len(self.items))
+
+    def link_args(self, direction):
+        """URL arguments of the previous ('prev') or next ('next') page."""
+        if direction == 'next': return {'after': self.next_cursor, 'page': self.number + 1}
+        return {'before': self.prev_cursor, 'page': self.number - 1} if self.number > 2 else {}
+
+    def url(self, direction, endpoint, **args):
+        """url_for(endpoint) of the previous or next page, keeping the listing's filter arguments."""
+        return url_for(endpoint, **args, **self.link_args(direction))
+
+
+def encode_cursor(values):
+    """Opaque URL-safe cursor for a row's sort key values."""
+    plain = [value.isoformat() if isinstance(value, (date, datetime)) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(plain, separators=(',', ':')).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, columns):
+    """Sort key values of a cursor, converted back to the columns' Python types; None if it is malformed."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != len(columns): return None
+        decoded = []
+        for value, column in zip(values, columns):
+            python_type = column.type.python_type
+            if value is not None and python_type in (datetime, date): value = python_type.fromisoformat(value)
+            decoded.append(value)
+        return decoded
+    except (ValueError, TypeError, NotImplementedError):
+        return None
+
+
+def keyset_paginate(query, order_by, descending=False, per_page=None, count_key=None):
+    """
+    Returns the KeysetPage of `query` selected by the request's after/before/page arguments.
+
+    order_by: the sort columns, ending with a unique one (e.g. [Sale.sale_timestamp, Sale.id]),
+    all sorted the same way (descending or not). The sort columns must not be NULL.
+    count_key: cache key that identifies the listing and its filters; enables the approximate total.
+    """
+    per_page = per_page or current_app.config.get('ITEMS_PER_PAGE', 15)
+    after = request.args.get('after'); before = request.args.get('before')
+    number = max(request.args.get('page', 1, type=int), 1)
+    cursor = decode_cursor(before or after, order_by) if (before or after) else None
+    backwards = cursor is not None and bool(before)
+    if cursor is None: number = 1
+
+    key = tuple_(*order_by); base_query = query
+    if cursor is not None:
+        query = query.filter(key > tuple_(*cursor) if descending == backwards else key < tuple_(*cursor))
+    reverse = descending != backwards # Walk towards older rows, or back towards newer ones for 'before'
+    query = query.order_by(*[column.desc() if reverse else column.asc() for column in order_by])
+    rows = query.limit(per_page + 1).all()
+    more = len(rows) > per_page; rows = rows[:per_page]
+    if backwards: rows.reverse()
+
+    def cursor_of(row): return encode_cursor([getattr(row, column.key) for column in order_by])
+    next_cursor = cursor_of(rows[-1]) if rows and (more if not backwards else True) else None
+    prev_cursor = cursor_of(rows[0]) if rows and cursor is not None and (more if backwards else True) else None
+    if backwards and not more: number = 1 # Walked back to the start (e.g. rows were added meanwhile)
+
+    total = None; ttl = current_app.config.get('PAGINATION_COUNT_TTL', 300)
+    if count_key and ttl:
+        total = cached(f'page_count:{count_key}', lambda: base_query.order_by(None).count(), ttl=ttl)
+    return KeysetPage(rows, number, per_page, next_cursor, prev_cursor, total)
@@ -0,0 +1,223 @@
+# app/product_import.py
+"""
+Bulk product catalogue import: creates new products from a spreadsheet.
+
+Like the stock-take upload (app/stock_import.py), the pipeline works on chunks
+and whole columns instead of row by row:
+
+1. The file is read in chunks of PRODUCT_IMPORT_CHUNK_SIZE rows (pandas
+   chunked CSV reader, or openpyxl in read-only mode for Excel), so a large
+   catalogue is never held in memory at once.
+2. Each chunk is validated with vectorized pandas operations (required
+   columns, numbers, ranges, dates, lengths). Barcodes and SKUs repeated in
+   the file are rejected after their first row.
+3. Rows without a barcode get one from the barcode sequence, one batch per
+   chunk (allocate_barcodes).
+4. In one transaction per chunk, barcodes and SKUs that already exist are
+   found with one set-based query and the rest of the chunk is bulk inserted.
+
+Rows that were not imported are written to a CSV reject report under
+UPLOAD_REPORT_DIR, downloadable from the import page. New products reach other
+workers' barcode index and search cache through their periodic refresh.
+"""
+from datetime import date, datetime
+
+import pandas as pd
+from flask import current_app
+from openpyxl import load_workbook
+from sqlalchemy import insert, or_, select
+
+from . import db
+from .barcode_sequence import allocate_barcodes
+from .cache import invalidate
+from .inventory_kpis import mark_products_changed
+from .models import Product
+from .stock_import import StockSheetError, write_report
+from .stock_ledger import commit_with_retry
+
+# Sheet column -> (Product attribute, maximum length) for text columns
+TEXT_COLUMNS = {
+    'Name': ('name', 128), 'Barcode': ('barcode', 64), 'SKU': ('sku', 64), 'Category': ('category', 64),
+    'Brand': ('brand', 64), 'Description': ('description', 256),
+}
+# Sheet column -> (Product attribute, default, whole numbers only, maximum)
+NUMBER_COLUMNS = {
+    'PurchasePrice': ('purchase_price', None, False, None), 'SellingPrice': ('selling_price', None, False, None),
+    'StockQuantity': ('stock_quantity', 0, True, None), 'LowStockThreshold': ('low_stock_threshold', 10, True, None),
+    'DiscountPercent': ('discount_percent', 0.0, False, 100),
+}
+EXPIRY_COLUMN = 'ExpiryDate'
+REQUIRED_COLUMNS = ('Name', 'PurchasePrice', 'SellingPrice')
+SHEET_COLUMNS = (*TEXT_COLUMNS, *NUMBER_COLUMNS, EXPIRY_COLUMN)
+REPORT_COLUMNS = ['Row', 'Name', 'Barcode', 'SKU', 'Error']
+
+_products = Product.__table__
+
+
+class ProductImportResult:
+    """Outcome of an import: counts, per-row errors as (row, name, barcode, sku, message) and the report file name."""
+    def __init__(self, created, skipped, errors, report_name=None):
+        self.created = created
+        self.skipped = skipped
+        self.errors = errors
+        self.report_name = report_name
+
+
+def _cell_text(value):
+    """Excel cell -> the text a CSV export of it would hold (whole-number floats without '.0', dates as YYYY-MM-DD)."""
+    if value is None: return None
+    if isinstance(value, float) and value.is_integer(): return str(int(value))
+    if isinstance(value, datetime): return value.date().isoformat()
+    if isinstance(value, date): return value.isoformat()
+    return str(value)
+
+
+def _excel_chunks(source, chunk_size):
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(cell).strip() if cell is not None else '' for cell in next(rows, ())]
+        wanted = [(index, name) for index, name in enumerate(header) if name in SHEET_COLUMNS]
+        chunk = []
+        for row in rows:
+            chunk.append([_cell_text(row[index]) if index < len(row) else None for index, _ in wanted])
+            if len(chunk) == chunk_size:
+                yield pd.DataFrame(chunk, columns=[name for _, name in wanted], dtype='string'); chunk = []
+        if chunk or not wanted:
+            yield pd.DataFrame(chunk, columns=[name for _, name in wanted], dtype='string')
+    finally:
+        workbook.close()
+
+
+def read_product_chunks(source, filename, chunk_size=None):
+    """
+    Yields the known columns of an .xlsx/.csv upload as string DataFrames of up to chunk_size
+    rows (PRODUCT_IMPORT_CHUNK_SIZE), indexed by spreadsheet row number.
+    """
+    chunk_size = chunk_size or current_app.config.get('PRODUCT_IMPORT_CHUNK_SIZE', 2000)
+    if filename.lower().endswith('.csv'):
+        chunks = pd.read_csv(source, usecols=lambda column: column.strip() in SHEET_COLUMNS, dtype='string',
+                             keep_default_na=False, na_values=[''], chunksize=chunk_size)
+    elif filename.lower().endswith('.xlsx'):
+        chunks = _excel_chunks(source, chunk_size)
+    else:
+        raise StockSheetError('Product catalogues must be .xlsx or .csv files.')
+    first_row = 2 # Header is row 1
+    for chunk in chunks:
+        chunk.columns = [column.strip() for column in chunk.columns]
+        missing = [column for column in REQUIRED_COLUMNS if column not in chunk.columns]
+        if missing: raise StockSheetError(f'The file must contain the columns {", ".join(REQUIRED_COLUMNS)} (missing: {", ".join(missing)}).')
+        chunk.index = pd.RangeIndex(first_row, first_row + len(chunk)); first_row += len(chunk)
+        yield chunk
+
+
+def count_rows(path, filename):
+    """Data rows in a saved upload, for progress reporting (Excel: the sheet's recorded dimensions)."""
+    if filename.lower().endswith('.csv'):
+        with open(path, 'rb') as f: return max(0, sum(1 for _ in f) - 1)
+    workbook = load_workbook(path, read_only=True)
+    try: return max(0, (workbook.active.max_row or 1) - 1)
+    finally: workbook.close()
+
+
+def _validate(chunk):
+    """Returns (values DataFrame with Product attribute columns, Series with each row's first error or NA)."""
+    error = pd.Series(pd.NA, index=chunk.index, dtype='object')
+    def reject(mask, message):
+        mask = mask.fillna(False).astype(bool) & error.isna()
+        error[mask] = message if isinstance(message, str) else message[mask]
+    values = pd.DataFrame(index=chunk.index)
+    for column, (attribute, max_length) in TEXT_COLUMNS.items():
+        text = chunk[column].str.strip().replace('', pd.NA) if column in chunk else pd.Series(pd.NA, index=chunk.index, dtype='string')
+        if column in REQUIRED_COLUMNS: reject(text.isna(), f'Missing {column}.')
+        reject(text.str.len() > max_length, f'{column} is longer than {max_length} characters.')
+        values[attribute] = text
+    for column, (attribute, default, whole, maximum) in NUMBER_COLUMNS.items():
+        raw = chunk[column].str.strip().replace('', pd.NA) if column in chunk else pd.Series(pd.NA, index=chunk.index, dtype='string')
+        number = pd.to_numeric(raw, errors='coerce')
+        if default is None: reject(raw.isna(), f'Missing {column}.')
+        invalid = raw.notna() & (number.isna() | (number < 0) | ((number % 1 != 0) if whole else False) | ((number > maximum) if maximum is not None else False))
+        limits = ('a whole' if whole else 'a') + ' non-negative number' + (f' up to {maximum}' if maximum is not None else '')
+        reject(invalid, f"Invalid {column} '" + raw.fillna('') + f"'. Must be {limits}.")
+        values[attribute] = number.fillna(default) if default is not None else number
+    raw_expiry = chunk[EXPIRY_COLUMN].str.strip().replace('', pd.NA) if EXPIRY_COLUMN in chunk else pd.Series(pd.NA, index=chunk.index, dtype='string')
+    expiry = pd.to_datetime(raw_expiry, format='%Y-%m-%d', errors='coerce')
+    reject(raw_expiry.notna() & expiry.isna(), f"Invalid {EXPIRY_COLUMN} '" + raw_expiry.fillna('') + "'. Use YYYY-MM-DD.")
+    values['expiry_date'] = expiry
+    return values, error
+
+
+def _reject_repeated_codes(values, error, seen):
+    """Rejects barcodes/SKUs that appeared earlier in the file (in this chunk or an imported one)."""
+    for attribute, column in (('barcode', 'Barcode'), ('sku', 'SKU')):
+        codes = values[attribute].where(error.isna())
+        repeated = codes.notna() & (codes.duplicated() | codes.isin(seen[attribute]))
+        repeated &= error.isna()
+        error[repeated] = f'{column} ' + codes[repeated].astype(str) + ' appears earlier in the file.'
+
+
+def _new_barcodes(count, *reserved):
+    """count auto-generated barcodes that are in none of the reserved sets (the file's own barcodes)."""
+    barcodes = []
+    while len(barcodes) < count:
+        barcodes += [barcode for barcode in allocate_barcodes(count - len(barcodes)) if not any(barcode in codes for codes in reserved)]
+    return barcodes
+
+
+def _insert_chunk(values):
+    """
+    One transaction: rejects rows whose barcode or SKU already exists (one query for the chunk)
+    and bulk inserts the rest. Returns ({row: error message} for rejected rows, created count).
+    """
+    barcodes = values['barcode'].dropna().tolist(); skus = values['sku'].dropna().tolist()
+    existing = db.session.execute(select(Product.barcode, Product.sku).where(or_(Product.barcode.in_(barcodes), Product.sku.in_(skus)))).all()
+    existing_barcodes = {barcode for barcode, _ in existing if barcode}; existing_skus = {sku for _, sku in existing if sku}
+    taken_barcode = values['barcode'].isin(existing_barcodes); taken_sku = values['sku'].isin(existing_skus) & ~taken_barcode
+    rejected = {row: f"Barcode '{code}' already exists." for row, code in values['barcode'][taken_barcode].items()}
+    rejected.update({row: f"SKU '{code}' already exists." for row, code in values['sku'][taken_sku].items()})
+    new = values[~(taken_barcode | taken_sku)]
+    if len(new):
+        records = new.astype(object).where(new.notna(), None).to_dict('records')
+        for record in records:
+            record['stock_quantity'] = int(record['stock_quantity']); record['low_stock_threshold'] = int(record['low_stock_threshold'])
+            record['expiry_date'] = record['expiry_date'].date() if record['expiry_date'] is not None else None
+            record['is_active'] = True
+        if db.session.get_bind(mapper=Product).dialect.insert_returning:
+            product_ids = db.session.execute(insert(_products).returning(_products.c.id), records).scalars().all()
+        else: # No INSERT ... RETURNING (MySQL): the new ids are looked up by barcode, which every imported row has
+            db.session.execute(insert(_products), records)
+            product_ids = db.session.execute(select(_products.c.id).where(_products.c.barcode.in_(new['barcode'].tolist()))).scalars().all()
+        mark_products_changed(product_ids)
+    return rejected, len(new)
+
+
+def import_products(chunks, progress=None):
+    """
+    Runs the pipeline over the chunks yielded by read_product_chunks, committing each chunk.
+    progress(rows_done), if given, is called after each chunk.
+    """
+    seen = {'barcode': set(), 'sku': set()}
+    errors = []; created = 0; rows_done = 0
+    for chunk in chunks:
+        values, error = _validate(chunk)
+        _reject_repeated_codes(values, error, seen)
+        valid = values[error.isna()].copy()
+        missing_barcode = valid['barcode'].isna()
+        if missing_barcode.any(): # Reserved before the write transaction (see allocate_barcodes)
+            valid.loc[missing_barcode, 'barcode'] = _new_barcodes(int(missing_barcode.sum()), seen['barcode'], set(valid['barcode'].dropna()))
+        db.session.rollback()
+        try:
+            rejected, chunk_created = commit_with_retry(lambda: _insert_chunk(valid))
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f"Product import: chunk of {len(valid)} rows failed: {e}")
+            rejected, chunk_created = dict.fromkeys(valid.index, f'Not imported: {e}'), 0
+        error.update(pd.Series(rejected, dtype='object'))
+        accepted = valid.drop(index=list(rejected))
+        seen['barcode'].update(accepted['barcode'].dropna()); seen['sku'].update(accepted['sku'].dropna())
+        failed = error.notna()
+        errors += list(zip(chunk.index[failed], values['name'][failed], values['barcode'][failed], values['sku'][failed], error[failed]))
+        created += chunk_created; rows_done += len(chunk)
+        if progress: progress(rows_done)
+    if created: invalidate('products', 'stock')
+    return ProductImportResult(created, len(errors), errors, write_report(errors, REPORT_COLUMNS, 'product_import_errors') if errors else None)
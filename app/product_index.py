@@ -0,0 +1,199 @@
+# app/product_index.py
+"""
+In-process exact-match index of active products by barcode and SKU.
+
+Barcode scans resolve against plain dicts, so a scan costs a hash lookup
+instead of an `ilike '%q%'` table scan. Each worker process keeps its own copy:
+
+* it is built on first use (the billing page warms it when a till opens),
+* products added or edited in this worker are patched in after commit
+  (collected from the session in after_flush),
+* stock changes made through the stock ledger are patched in after commit,
+* changes made by other workers are picked up by a delta refresh on
+  Product.updated_at at most every PRODUCT_INDEX_REFRESH_SECONDS.
+"""
+import threading
+import time
+from datetime import date, timedelta
+from itertools import chain
+from operator import attrgetter
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, select
+
+from . import db
+from .models import Product
+from .stock_ledger import on_stock_committed
+
+EXPIRY_ALERT_DAYS = 10 # Consistent with dashboard logic
+
+_PENDING_KEY = 'product_index.pending'
+
+
+class IndexedProduct:
+    """Compact, attribute-compatible snapshot of the Product fields the billing screen needs."""
+    __slots__ = ('id', 'name', 'barcode', 'sku', 'selling_price', 'purchase_price',
+                 'stock_quantity', 'discount_percent', 'brand', 'expiry_date')
+
+    def __init__(self, id, name, barcode, sku, selling_price, purchase_price,
+                 stock_quantity, discount_percent, brand, expiry_date):
+        self.id = id; self.name = name; self.barcode = barcode; self.sku = sku
+        self.selling_price = selling_price; self.purchase_price = purchase_price
+        self.stock_quantity = stock_quantity; self.discount_percent = discount_percent
+        self.brand = brand; self.expiry_date = expiry_date
+
+
+_indexed_fields = attrgetter(*IndexedProduct.__slots__)
+_INDEX_COLUMNS = [getattr(Product, field) for field in IndexedProduct.__slots__] + [Product.is_active, Product.updated_at]
+_FIELD_COUNT = len(IndexedProduct.__slots__)
+
+
+def product_search_result(p, today=None):
+    """JSON-ready dict used by the product search and scan APIs (p: Product or IndexedProduct)."""
+    today = today or date.today()
+    is_near_expiry = False
+    if p.expiry_date and (p.stock_quantity or 0) > 0: # Check if expiry_date is set and in stock
+        is_near_expiry = today <= p.expiry_date <= today + timedelta(days=EXPIRY_ALERT_DAYS)
+    return {
+        'id': p.id,
+        'text': f"{p.name} (Barcode: {p.barcode or 'N/A'}, SKU: {p.sku or 'N/A'})",
+        'name': p.name, 'barcode': p.barcode, 'sku': p.sku,
+        'selling_price': p.selling_price, 'purchase_price': p.purchase_price,
+        'stock_quantity': p.stock_quantity,
+        'discount_percent': p.discount_percent,
+        'brand': p.brand,
+        'is_near_expiry': is_near_expiry
+    }
+
+
+class ProductLookupIndex:
+    """barcode -> product and SKU -> product hash maps for one app in one worker process."""
+
+    def __init__(self, refresh_seconds=30):
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.RLock()
+        self._by_id = {}; self._by_barcode = {}; self._by_sku = {}
+        self._built = False
+        self._synced_through = None # Highest Product.updated_at seen
+        self._checked_at = 0.0
+
+    def __len__(self): return len(self._by_id)
+
+    @property
+    def is_built(self): return self._built
+
+    def _put(self, row):
+        """Inserts or replaces one product (row: _ProductSnapshot or an _INDEX_COLUMNS row)."""
+        self._drop(row.id)
+        if row.is_active:
+            self._add(IndexedProduct(*_indexed_fields(row)))
+
+    def _add(self, entry):
+        self._by_id[entry.id] = entry
+        if entry.barcode: self._by_barcode[entry.barcode] = entry
+        if entry.sku: self._by_sku[entry.sku] = entry
+
+    def _drop(self, product_id):
+        old = self._by_id.pop(product_id, None)
+        if old is None: return
+        if old.barcode and self._by_barcode.get(old.barcode) is old: del self._by_barcode[old.barcode]
+        if old.sku and self._by_sku.get(old.sku) is old: del self._by_sku[old.sku]
+
+    def _note_synced(self, updated_at):
+        if updated_at and (self._synced_through is None or updated_at > self._synced_through):
+            self._synced_through = updated_at
+
+    def build(self):
+        """(Re)builds the index from the database with one streamed query."""
+        with self._lock:
+            self._by_id = {}; self._by_barcode = {}; self._by_sku = {}; self._synced_through = None
+            rows = db.session.execute(select(*_INDEX_COLUMNS).where(Product.is_active == True).execution_options(yield_per=10000))
+            latest = None
+            for row in rows.tuples(): # Positional: avoids per-attribute Row access for large catalogues
+                self._add(IndexedProduct(*row[:_FIELD_COUNT]))
+                if row[-1] and (latest is None or row[-1] > latest): latest = row[-1]
+            self._note_synced(latest)
+            self._built = True; self._checked_at = time.monotonic()
+        current_app.logger.info(f"Product lookup index built with {len(self._by_id)} products.")
+
+    def ensure_built(self):
+        if not self._built: self.build()
+
+    def refresh_if_stale(self):
+        """Applies rows changed by other workers since the last sync, at most every refresh_seconds."""
+        if time.monotonic() - self._checked_at < self.refresh_seconds:
+            return
+        with self._lock:
+            self._checked_at = time.monotonic()
+            stmt = select(*_INDEX_COLUMNS)
+            if self._synced_through is not None:
+                stmt = stmt.where(Product.updated_at >= self._synced_through)
+            for row in db.session.execute(stmt):
+                self._put(row); self._note_synced(row.updated_at)
+
+    def lookup(self, code):
+        """Returns the IndexedProduct whose barcode (or else SKU) equals code, or None."""
+        self.ensure_built(); self.refresh_if_stale()
+        code = (code or '').strip()
+        return self._by_barcode.get(code) or self._by_sku.get(code)
+
+    def apply_product_changes(self, rows):
+        """rows: {product_id: row-like snapshot, or None if the product was deleted}."""
+        if not self._built: return
+        with self._lock:
+            for product_id, row in rows.items():
+                if row is None: self._drop(product_id)
+                else: self._put(row)
+
+    def apply_stock_levels(self, levels):
+        """levels: {product_id: new stock_quantity} committed through the stock ledger."""
+        if not self._built: return
+        with self._lock:
+            for product_id, level in levels.items():
+                entry = self._by_id.get(product_id)
+                if entry is not None: entry.stock_quantity = level
+
+
+class _ProductSnapshot:
+    """Plain copy of a flushed Product, taken while its attributes are still loaded."""
+    __slots__ = IndexedProduct.__slots__ + ('is_active',)
+
+    def __init__(self, product):
+        for field in self.__slots__:
+            setattr(self, field, getattr(product, field))
+
+
+def get_product_index():
+    """Returns the lookup index of the current app."""
+    return current_app.extensions['product_index']
+
+
+def init_app(app):
+    app.extensions['product_index'] = ProductLookupIndex(refresh_seconds=app.config.get('PRODUCT_INDEX_REFRESH_SECONDS', 30))
+
+
+@event.listens_for(db.session, 'after_flush')
+def _collect_product_changes(session, flush_context):
+    pending = session.info.setdefault(_PENDING_KEY, {})
+    for obj in chain(session.new, session.dirty):
+        if isinstance(obj, Product): pending[obj.id] = _ProductSnapshot(obj)
+    for obj in session.deleted:
+        if isinstance(obj, Product): pending[obj.id] = None
+
+
+@event.listens_for(db.session, 'after_commit')
+def _apply_product_changes(session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if pending and has_app_context() and 'product_index' in current_app.extensions:
+        get_product_index().apply_product_changes(pending)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_product_changes(session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+@on_stock_committed
+def _apply_stock_levels(levels):
+    if 'product_index' in current_app.extensions:
+        get_product_index().apply_stock_levels(levels)
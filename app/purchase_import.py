@@ -0,0 +1,192 @@
+# app/purchase_import.py
+"""
+Supplier invoice import: records a delivery as a purchase from the supplier's
+own invoice file (.xlsx/.csv) instead of a hand-built cart.
+
+1. The invoice is validated with vectorized pandas operations (supplier code,
+   whole positive quantity, non-negative unit cost).
+2. Lines are resolved to products through supplier_product_codes, the persisted
+   (supplier, supplier code) -> product mapping, with one keyed IN query per
+   chunk of distinct codes. Codes not mapped yet are matched by barcode (the
+   line's Barcode column, or the supplier code itself); those matches are saved
+   as new mappings, so the next invoice from that supplier resolves directly.
+3. One transaction writes the Purchase, all PurchaseItem rows with one
+   multi-row INSERT and the stock increments through the stock ledger.
+   Optionally each product's purchase_price becomes the moving average of the
+   stock on hand and the delivered units (one prepared UPDATE run for all
+   products, evaluated by the database).
+
+By default an invoice with lines that cannot be recorded is not recorded at all;
+the lines are listed in a CSV reject report (UPLOAD_REPORT_DIR) so the mapping
+or the file can be fixed first.
+"""
+from datetime import datetime
+
+import pandas as pd
+from flask import current_app
+from sqlalchemy import bindparam, case, insert, select, update
+
+from . import db
+from .inventory_kpis import mark_products_changed
+from .models import Product, Purchase, PurchaseItem, SupplierProductCode
+from .stock_import import LOOKUP_CHUNK_SIZE, StockSheetError, resolve_product_ids, write_report
+from .stock_ledger import commit_with_retry, increment_stock
+
+CODE_COLUMN = 'SupplierCode'
+QUANTITY_COLUMN = 'Quantity'
+COST_COLUMN = 'UnitCost'
+INVOICE_COLUMNS = (CODE_COLUMN, QUANTITY_COLUMN, COST_COLUMN, 'Barcode', 'Description')
+REQUIRED_COLUMNS = (CODE_COLUMN, QUANTITY_COLUMN, COST_COLUMN)
+REPORT_COLUMNS = ['Row', CODE_COLUMN, 'Description', QUANTITY_COLUMN, COST_COLUMN, 'Error']
+
+_codes = SupplierProductCode.__table__
+_products = Product.__table__
+_stock = db.func.coalesce(_products.c.stock_quantity, 0)
+# New price = (stock on hand * current price + delivered units * unit cost) / (stock on hand + delivered units); with no stock on hand, the unit cost
+_moving_average = update(_products).where(_products.c.id == bindparam('pid')).values(
+    purchase_price=case((_stock > 0, (_stock * db.func.coalesce(_products.c.purchase_price, 0.0) + bindparam('qty') * bindparam('cost')) / (_stock + bindparam('qty'))),
+                        else_=bindparam('cost')),
+    updated_at=bindparam('now'))
+
+
+class InvoiceImportResult:
+    """Outcome of an import: the purchase (None if nothing was recorded), counts, per-line errors and the report file name."""
+    def __init__(self, purchase_id, recorded, total_cost, learned, errors, report_name=None):
+        self.purchase_id = purchase_id
+        self.recorded = recorded
+        self.total_cost = total_cost
+        self.learned = learned # Supplier codes mapped to products by this import
+        self.errors = errors # (row, supplier code, description, quantity, unit cost, message)
+        self.report_name = report_name
+
+
+def supplier_key(supplier_name):
+    """Supplier names are matched as entered, without surrounding whitespace."""
+    return (supplier_name or '').strip()
+
+
+def read_invoice_sheet(stream, filename):
+    """Reads the invoice columns of an .xlsx/.csv upload as text, indexed by spreadsheet row number."""
+    options = dict(usecols=lambda column: str(column).strip() in INVOICE_COLUMNS, dtype=str, keep_default_na=False, na_values=[''])
+    if filename.lower().endswith('.csv'): sheet = pd.read_csv(stream, **options)
+    elif filename.lower().endswith('.xlsx'): sheet = pd.read_excel(stream, engine='openpyxl', **options)
+    else: raise StockSheetError('Supplier invoices must be .xlsx or .csv files.')
+    sheet.columns = [str(column).strip() for column in sheet.columns]
+    missing = [column for column in REQUIRED_COLUMNS if column not in sheet.columns]
+    if missing: raise StockSheetError(f'The invoice must contain the columns {", ".join(REQUIRED_COLUMNS)} (missing: {", ".join(missing)}).')
+    sheet.index = pd.RangeIndex(2, 2 + len(sheet)) # Header is row 1
+    return sheet.astype('string')
+
+
+def _column(sheet, name):
+    if name not in sheet: return pd.Series(pd.NA, index=sheet.index, dtype='string')
+    return sheet[name].str.strip().replace('', pd.NA)
+
+
+def _validate(sheet):
+    """Returns (lines DataFrame: code, barcode, description, quantity, unit_cost; Series with each line's error or NA)."""
+    lines = pd.DataFrame({'code': _column(sheet, CODE_COLUMN), 'barcode': _column(sheet, 'Barcode'), 'description': _column(sheet, 'Description')})
+    raw_quantity = _column(sheet, QUANTITY_COLUMN); raw_cost = _column(sheet, COST_COLUMN)
+    lines['quantity'] = pd.to_numeric(raw_quantity, errors='coerce'); lines['unit_cost'] = pd.to_numeric(raw_cost, errors='coerce')
+    error = pd.Series(pd.NA, index=sheet.index, dtype='object')
+    for mask, message in (
+            (lines['code'].isna(), f'Missing {CODE_COLUMN}.'),
+            (lines['code'].str.len() > 64, f'{CODE_COLUMN} is longer than 64 characters.'),
+            (raw_quantity.isna(), f'Missing {QUANTITY_COLUMN}.'),
+            (lines['quantity'].isna() | (lines['quantity'] <= 0) | (lines['quantity'] % 1 != 0), f"Invalid {QUANTITY_COLUMN} '" + raw_quantity.fillna('') + "'. Must be a whole number above 0."),
+            (raw_cost.isna(), f'Missing {COST_COLUMN}.'),
+            (lines['unit_cost'].isna() | (lines['unit_cost'] < 0), f"Invalid {COST_COLUMN} '" + raw_cost.fillna('') + "'. Must be a non-negative number.")):
+        mask = mask.fillna(False).astype(bool) & error.isna()
+        error[mask] = message if isinstance(message, str) else message[mask]
+    return lines, error
+
+
+def resolve_supplier_codes(supplier_name, codes):
+    """{supplier code: product id} for the codes the supplier has mapped, one keyed query per chunk of distinct codes."""
+    distinct = sorted(set(codes)); found = {}
+    for start in range(0, len(distinct), LOOKUP_CHUNK_SIZE):
+        found.update(db.session.execute(select(_codes.c.supplier_code, _codes.c.product_id).where(
+            _codes.c.supplier_name == supplier_name, _codes.c.supplier_code.in_(distinct[start:start + LOOKUP_CHUNK_SIZE]))).tuples().all())
+    return found
+
+
+def _resolve(supplier_name, lines, error):
+    """Adds a product_id column to the valid lines; returns {code: product id} for codes matched by barcode (mappings to save)."""
+    valid = error.isna()
+    mapped = resolve_supplier_codes(supplier_name, lines['code'][valid])
+    lines['product_id'] = lines['code'].map(mapped).where(valid)
+    unmapped = valid & lines['product_id'].isna()
+    learned = {}
+    if unmapped.any():
+        by_barcode = resolve_product_ids('Barcode', lines['barcode'].fillna(lines['code'])[unmapped])
+        lines.loc[unmapped, 'product_id'] = by_barcode
+        found = by_barcode.dropna(); found_codes = lines['code'][found.index]
+        first = ~found_codes.duplicated() # A code repeated in the file is mapped by its first line
+        learned = dict(zip(found_codes[first].tolist(), found[first].astype('int64').tolist()))
+    not_found = unmapped & lines['product_id'].isna()
+    error[not_found] = f"{CODE_COLUMN} '" + lines['code'][not_found] + "' is not mapped to a product and matches no barcode."
+    return learned
+
+
+def _record(supplier_name, invoice_number, notes, user_id, lines, learned, update_costs):
+    """The write transaction: purchase, items, cost averages, stock increments and new mappings. Returns the purchase id."""
+    purchase = Purchase(supplier_name=supplier_name, invoice_number=invoice_number, notes=notes, user_id=user_id,
+                        total_cost=float((lines['quantity'] * lines['unit_cost']).sum()), purchase_date=datetime.utcnow())
+    db.session.add(purchase); db.session.flush()
+    db.session.execute(insert(PurchaseItem.__table__), [
+        {'purchase_id': purchase.id, 'product_id': product_id, 'quantity': quantity, 'cost_price': unit_cost}
+        for product_id, quantity, unit_cost in zip(lines['product_id'].tolist(), lines['quantity'].tolist(), lines['unit_cost'].tolist())])
+    delivered = lines.assign(cost=lines['quantity'] * lines['unit_cost']).groupby('product_id')[['quantity', 'cost']].sum()
+    if update_costs: # Before the increments: the average weighs the stock that was on hand
+        now = datetime.utcnow()
+        db.session.execute(_moving_average, [{'pid': product_id, 'qty': quantity, 'cost': cost / quantity, 'now': now}
+                                             for product_id, quantity, cost in zip(delivered.index.tolist(), delivered['quantity'].tolist(), delivered['cost'].tolist())])
+        mark_products_changed(delivered.index.tolist())
+    increment_stock(dict(zip(delivered.index.tolist(), delivered['quantity'].tolist())))
+    if learned: # Another import may have mapped some of these codes meanwhile
+        known = resolve_supplier_codes(supplier_name, learned)
+        new = [{'supplier_name': supplier_name, 'supplier_code': code, 'product_id': product_id, 'created_at': datetime.utcnow()}
+               for code, product_id in learned.items() if code not in known]
+        if new: db.session.execute(insert(_codes), new)
+    return purchase.id
+
+
+def import_supplier_invoice(sheet, supplier_name, invoice_number=None, notes=None, user_id=None, update_costs=False, allow_partial=False):
+    """
+    Records a DataFrame read by read_invoice_sheet as one purchase from supplier_name. Lines that fail
+    validation or cannot be resolved are reported; unless allow_partial, any such line stops the
+    whole invoice from being recorded.
+    """
+    supplier_name = supplier_key(supplier_name)
+    if not supplier_name: raise StockSheetError('A supplier is required to match supplier codes.')
+    lines, error = _validate(sheet)
+    learned = _resolve(supplier_name, lines, error)
+    good = lines[error.isna()].astype({'product_id': 'int64', 'quantity': 'int64', 'unit_cost': 'float64'})
+    purchase_id = None
+    if len(good) and (allow_partial or error.isna().all()):
+        recorded_codes = set(good['code']); learned = {code: product_id for code, product_id in learned.items() if code in recorded_codes}
+        db.session.rollback() # The resolution reads must not hold a snapshot into the write transaction
+        try:
+            purchase_id = commit_with_retry(lambda: _record(supplier_name, invoice_number, notes, user_id, good, learned, update_costs))
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f"Supplier invoice {invoice_number or ''} from {supplier_name}: {len(good)} lines not recorded: {e}")
+            error[good.index] = f'Not recorded: {e}'
+    elif len(good):
+        error[good.index] = 'Not recorded: other lines of the invoice have errors.'
+    failed = error.notna()
+    errors = list(zip(lines.index[failed], lines['code'][failed], lines['description'][failed],
+                      sheet[QUANTITY_COLUMN][failed], sheet[COST_COLUMN][failed], error[failed]))
+    recorded = 0 if purchase_id is None else len(good)
+    total_cost = 0.0 if purchase_id is None else float((good['quantity'] * good['unit_cost']).sum())
+    return InvoiceImportResult(purchase_id, recorded, total_cost, learned if purchase_id else {}, errors,
+                               write_report(errors, REPORT_COLUMNS, 'supplier_invoice_errors') if errors else None)
+
+
+def save_supplier_code(supplier_name, supplier_code, product_id):
+    """Maps (or re-maps) a supplier's code to a product. The caller commits."""
+    supplier_name = supplier_key(supplier_name); supplier_code = (supplier_code or '').strip()
+    mapping = SupplierProductCode.query.filter_by(supplier_name=supplier_name, supplier_code=supplier_code).first()
+    if mapping is None: mapping = SupplierProductCode(supplier_name=supplier_name, supplier_code=supplier_code); db.session.add(mapping)
+    mapping.product_id = product_id
+    return mapping
@@ -0,0 +1,62 @@
+# app/query_count.py
+"""
+Counting the SQL statements a block of code runs, to catch N+1 query regressions.
+
+    with count_queries() as counter:
+        client.get('/billing/sales')
+    print(counter.count, counter.statements)
+
+    with assert_max_queries(4):
+        client.get('/billing/sales')
+
+The counter listens to the engine's before_cursor_execute event, so it sees
+every statement: ORM loads, lazy loads made from templates, and Core
+statements.
+"""
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from . import db
+
+
+class QueryCountError(AssertionError):
+    """More statements ran than the budget allows."""
+
+
+class QueryCounter:
+    """Records the statements executed on an engine while it is active (a context manager)."""
+    def __init__(self, engine=None):
+        self.engine = engine
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def __enter__(self):
+        if self.engine is None: self.engine = db.engine
+        event.listen(self.engine, 'before_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(self.engine, 'before_cursor_execute', self._record)
+        return False
+
+
+def count_queries(engine=None):
+    """QueryCounter for engine (default: the current app's engine)."""
+    return QueryCounter(engine)
+
+
+@contextmanager
+def assert_max_queries(limit, engine=None, label=None):
+    """Raises QueryCountError, listing the statements, if the block runs more than `limit` statements."""
+    with QueryCounter(engine) as counter:
+        yield counter
+    if counter.count > limit:
+        statements = '\n'.join(f'  {i}. {statement}' for i, statement in enumerate(counter.statements, 1))
+        raise QueryCountError(f'{label or "Block"} ran {counter.count} queries (budget {limit}):\n{statements}')
@@ -0,0 +1,170 @@
+# app/reorder.py
+"""
+Reorder suggestions from sales velocity, for the purchase order draft
+(Generate Purchase Order -> Record Purchase).
+
+Units sold per product come from the sales rollups (kept in each sale's
+transaction, net of returns), never from a scan of sale_items:
+
+- the last REORDER_VELOCITY_DAYS days: one grouped query on the daily rollup
+  (units, sum of squared daily units and first selling day per product);
+- the rest of the REORDER_HISTORY_DAYS history: one grouped query on the
+  product rollup rows of that range, monthly rows for whole months
+  (product_rollup_rows), so a year costs about 12 rows per product.
+
+Both results go into NumPy arrays aligned with the active products, and every
+product is computed in one vectorized pass:
+
+- velocity: the moving average of daily units over the velocity window
+  (since the first sale, but over at least MIN_AVERAGING_DAYS days, for
+  products first sold within the window); products without sales in the
+  window fall back to their average over the rest of the history, so slow
+  movers are still reordered;
+- safety stock: REORDER_SERVICE_Z standard deviations of daily units over the
+  window, scaled to the lead time;
+- reorder point: velocity * REORDER_LEAD_TIME_DAYS + safety stock;
+- days of cover: stock on hand / velocity;
+- suggested quantity, for products at or below their reorder point or their
+  low-stock threshold: enough to cover the lead time plus REORDER_COVER_DAYS,
+  and at least the low-stock threshold for low-stock products (what the draft
+  used to order).
+"""
+from datetime import date, timedelta
+
+import numpy as np
+from flask import current_app
+from sqlalchemy import func, select
+
+from . import db
+from .models import DailyProductRollup, Product
+from .sales_rollup import product_rollup_rows
+from .stock_import import LOOKUP_CHUNK_SIZE
+
+MIN_AVERAGING_DAYS = 7 # A product first sold a few days ago is still averaged over at least this many days
+
+_products = Product.__table__
+_rollup = DailyProductRollup.__table__
+
+
+class ReorderPlan:
+    """Per-product arrays for the active products, ordered by product id."""
+    def __init__(self, product_ids, stock, low_stock_threshold, velocity, safety_stock, reorder_point, days_of_cover, suggested_quantity):
+        self.product_ids = product_ids
+        self.stock = stock
+        self.low_stock_threshold = low_stock_threshold
+        self.velocity = velocity # Units per day
+        self.safety_stock = safety_stock
+        self.reorder_point = reorder_point
+        self.days_of_cover = days_of_cover # inf for products without sales
+        self.suggested_quantity = suggested_quantity # 0: nothing to order
+
+    def to_order(self, limit=None):
+        """Indexes of the products with a suggested quantity, fewest days of cover (then lowest stock) first."""
+        wanted = np.flatnonzero(self.suggested_quantity > 0)
+        order = wanted[np.lexsort((self.stock[wanted], self.days_of_cover[wanted]))]
+        return order if limit is None else order[:limit]
+
+
+def _settings(overrides):
+    config = current_app.config
+    settings = {'history_days': config.get('REORDER_HISTORY_DAYS', 365), 'velocity_days': config.get('REORDER_VELOCITY_DAYS', 28),
+                'lead_time_days': config.get('REORDER_LEAD_TIME_DAYS', 7), 'cover_days': config.get('REORDER_COVER_DAYS', 14),
+                'service_z': config.get('REORDER_SERVICE_Z', 1.65)}
+    settings.update({name: value for name, value in overrides.items() if value is not None})
+    settings['velocity_days'] = min(settings['velocity_days'], settings['history_days'])
+    return settings
+
+
+def load_active_products():
+    """(ids, stock, low-stock threshold) arrays of the active products, ordered by id."""
+    rows = db.session.execute(select(_products.c.id, _products.c.stock_quantity, _products.c.low_stock_threshold)
+                              .where(_products.c.is_active == True).order_by(_products.c.id)).all()
+    if not rows: return np.empty(0, np.int64), np.empty(0, np.float64), np.empty(0, np.float64)
+    ids, stock, threshold = zip(*rows)
+    return (np.array(ids, np.int64), np.array(stock, np.float64), np.array(threshold, np.float64))
+
+
+def _aligned(product_ids, keys, *columns):
+    """Scatters per-product query columns onto the positions of product_ids (0 for products without rows)."""
+    n = len(product_ids)
+    keys = np.array(keys, np.int64); position = np.searchsorted(product_ids, keys)
+    known = position < n
+    known[known] = product_ids[position[known]] == keys[known] # Drops rows of inactive or deleted products
+    aligned = []
+    for column in columns:
+        values = np.zeros(n); values[position[known]] = np.array(column, np.float64)[known]
+        aligned.append(values)
+    return aligned
+
+
+def load_sales(product_ids, as_of, history_days, velocity_days):
+    """
+    (window units, window sum of squared daily units, days since the first sale in the window,
+    units sold before the window) arrays aligned with product_ids. Days with more returned than
+    sold count as no sales.
+    """
+    window_start = as_of - timedelta(days=velocity_days - 1)
+    net = _rollup.c.quantity_sold - _rollup.c.quantity_returned
+    window = db.session.execute(select(_rollup.c.product_id, func.sum(net), func.sum(net * net), func.min(_rollup.c.sale_date))
+                                .where(_rollup.c.sale_date >= window_start, _rollup.c.sale_date <= as_of, net > 0)
+                                .group_by(_rollup.c.product_id)).all()
+    keys, units, squares, first_days = zip(*window) if window else ((), (), (), ())
+    days_since = (np.datetime64(as_of, 'D') - np.array(first_days, 'datetime64[D]')).astype(np.int64)
+    window_units, window_squares, first_sold = _aligned(product_ids, keys, units, squares, days_since)
+    earlier_units = np.zeros(len(product_ids))
+    if history_days > velocity_days:
+        rows = product_rollup_rows(as_of - timedelta(days=history_days - 1), window_start - timedelta(days=1))
+        earlier = db.session.execute(select(rows.c.product_id, func.sum(rows.c.quantity_sold - rows.c.quantity_returned))
+                                     .group_by(rows.c.product_id)).all()
+        if earlier: earlier_units, = _aligned(product_ids, *zip(*earlier))
+    return window_units, window_squares, first_sold, np.clip(earlier_units, 0, None)
+
+
+def plan_reorders(product_ids, stock, low_stock_threshold, window_units, window_squares, first_sold, earlier_units,
+                  history_days, velocity_days, lead_time_days, cover_days, service_z):
+    """The vectorized pass over the arrays from load_active_products and load_sales. Returns a ReorderPlan."""
+    stock = np.nan_to_num(stock, nan=0.0); threshold = np.nan_to_num(low_stock_threshold, nan=0.0)
+    new = (window_units > 0) & (earlier_units == 0)
+    window_days = np.where(new, np.clip(first_sold + 1, min(MIN_AVERAGING_DAYS, velocity_days), velocity_days), velocity_days) # New products are averaged since their first sale
+    mean = window_units / window_days
+    earlier_days = max(history_days - velocity_days, 1)
+    velocity = np.where(window_units > 0, mean, earlier_units / earlier_days)
+    variance = np.where(window_units > 0, window_squares / window_days - mean ** 2, 0.0)
+    safety_stock = service_z * np.sqrt(np.clip(variance, 0, None)) * np.sqrt(lead_time_days)
+    reorder_point = velocity * lead_time_days + safety_stock
+    with np.errstate(divide='ignore', invalid='ignore'):
+        days_of_cover = np.where(velocity > 0, stock / velocity, np.inf)
+
+    low_stock = stock <= threshold
+    needs_order = low_stock | ((velocity > 0) & (stock <= reorder_point))
+    order_up_to = velocity * (lead_time_days + cover_days) + safety_stock
+    minimum = np.where(low_stock, np.maximum(threshold, 1), 1)
+    suggested = np.where(needs_order, np.maximum(np.ceil(order_up_to - stock), minimum), 0).astype(np.int64)
+    return ReorderPlan(product_ids, stock, threshold, velocity, safety_stock, reorder_point, days_of_cover, suggested)
+
+
+def compute_reorder_plan(as_of=None, **overrides):
+    """Reorder plan for every active product from the daily rollup up to as_of (today). overrides replace the REORDER_* settings."""
+    settings = _settings(overrides)
+    as_of = as_of or date.today()
+    product_ids, stock, threshold = load_active_products()
+    return plan_reorders(product_ids, stock, threshold, *load_sales(product_ids, as_of, settings['history_days'], settings['velocity_days']), **settings)
+
+
+def suggest_purchase_items(plan=None, limit=None):
+    """
+    Purchase draft lines (product_id, name, quantity, cost_price) for the products with a suggested
+    quantity, most urgent first, at most limit (REORDER_MAX_DRAFT_ITEMS). Returns (lines, total products to order).
+    """
+    plan = plan or compute_reorder_plan()
+    limit = limit or current_app.config.get('REORDER_MAX_DRAFT_ITEMS', 500)
+    order = plan.to_order(); chosen = order[:limit]
+    product_ids = plan.product_ids[chosen].tolist(); details = {}
+    for start in range(0, len(product_ids), LOOKUP_CHUNK_SIZE):
+        details.update((row.id, row) for row in db.session.execute(select(_products.c.id, _products.c.name, _products.c.purchase_price)
+                                                                   .where(_products.c.id.in_(product_ids[start:start + LOOKUP_CHUNK_SIZE]))))
+    lines = [{'product_id': product_id, 'name': details[product_id].name, 'quantity': quantity, 'cost_price': details[product_id].purchase_price or 0.0,
+              'velocity': round(velocity, 2), 'days_of_cover': None if np.isinf(cover) else round(cover, 1)}
+             for product_id, quantity, velocity, cover in zip(product_ids, plan.suggested_quantity[chosen].tolist(), plan.velocity[chosen].tolist(), plan.days_of_cover[chosen].tolist())
+             if product_id in details]
+    return lines, len(order)
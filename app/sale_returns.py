@@ -0,0 +1,116 @@
+# app/sale_returns.py
+"""
+Line-level returns: any quantity of any line of a sale can be returned, over
+as many returns (or exchanges) as needed, until the whole line is back.
+
+sale_item_returns is the return ledger: one row per returned sale line with
+the quantity returned and the amount refunded so far. "How much of this line
+is still returnable" is the line's quantity minus its ledger row, read for a
+whole sale with one index range on sale_id (SaleItem.return_ledger).
+
+record_return_lines runs inside the return's transaction:
+
+1. The sale's lines are read with their ledger rows in one query, locking the
+   sale lines (SELECT ... FOR UPDATE where the backend supports row locks;
+   SQLite write transactions are already serialized), and the requested
+   quantities are checked against what is left.
+2. Each line is refunded pro rata to its net amount; the return that takes the
+   last units refunds the remainder, so a line never refunds more than it sold.
+3. SaleReturn, its SaleReturnItem rows (one multi-row INSERT) and the ledger
+   rows are written, ledger updates as one prepared compare-and-set UPDATE.
+   A concurrent return of the same lines (a changed ledger row, or a ledger
+   row inserted first) raises StockConflictError, so commit_with_retry runs
+   the return again against the new ledger.
+   Stock goes back with one batched increment through the stock ledger, and
+   the return is added to the reporting rollups.
+"""
+from datetime import datetime
+
+from sqlalchemy import bindparam, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from . import db
+from .models import Product, Sale, SaleItem, SaleItemReturn, SaleReturn, SaleReturnItem
+from .sales_rollup import record_return
+from .stock_ledger import StockConflictError, increment_stock
+
+_items = SaleItem.__table__
+_ledger = SaleItemReturn.__table__
+_products = Product.__table__
+
+_lines_with_ledger = (select(_items.c.id, _items.c.product_id, _items.c.quantity, _items.c.price_at_sale, _items.c.discount_applied, _products.c.name,
+                             _ledger.c.quantity_returned, _ledger.c.amount_refunded)
+                      .select_from(_items.join(_products, _products.c.id == _items.c.product_id).outerjoin(_ledger, _ledger.c.sale_item_id == _items.c.id))
+                      .where(_items.c.sale_id == bindparam('sale_id')).order_by(_items.c.id))
+_add_to_ledger = (update(_ledger)
+                  .where(_ledger.c.sale_item_id == bindparam('line_id'), _ledger.c.quantity_returned == bindparam('expected'))
+                  .values(quantity_returned=_ledger.c.quantity_returned + bindparam('quantity'),
+                          amount_refunded=_ledger.c.amount_refunded + bindparam('refund'), updated_at=bindparam('now')))
+
+
+class ReturnError(ValueError):
+    """The requested return is not possible (nothing selected, unknown line, more than is left to return)."""
+
+
+def line_net_amount(quantity, price_at_sale, discount_applied):
+    return quantity * price_at_sale - (discount_applied or 0.0)
+
+
+def returnable_quantities(sale_id):
+    """{sale_item_id: quantity still returnable} for a sale: one query on the sale's lines and their ledger rows."""
+    rows = db.session.execute(select(_items.c.id, _items.c.quantity, _ledger.c.quantity_returned)
+                              .select_from(_items.outerjoin(_ledger, _ledger.c.sale_item_id == _items.c.id)).where(_items.c.sale_id == sale_id))
+    return {row.id: row.quantity - (row.quantity_returned or 0) for row in rows}
+
+
+def _refund(line, quantity):
+    """Refund for quantity units of the line: pro rata, or the remainder when these are its last units."""
+    net = line_net_amount(line.quantity, line.price_at_sale, line.discount_applied)
+    if (line.quantity_returned or 0) + quantity == line.quantity: return round(net - (line.amount_refunded or 0.0), 2)
+    return round(net * quantity / line.quantity, 2)
+
+
+def record_return_lines(sale, quantities, reason, user_id):
+    """
+    Returns the given units of the sale: quantities is {sale_item_id: quantity}, or None for everything
+    still returnable. Call inside the return's transaction (commit_with_retry). Raises ReturnError if the
+    return is not possible. Returns the new SaleReturn.
+    """
+    stmt = _lines_with_ledger
+    if db.session.get_bind(mapper=Sale).dialect.name != 'sqlite': stmt = stmt.with_for_update(of=_items)
+    lines = {line.id: line for line in db.session.execute(stmt, {'sale_id': sale.id})}
+    if quantities is None:
+        quantities = {line_id: line.quantity - (line.quantity_returned or 0) for line_id, line in lines.items()}
+    quantities = {int(line_id): int(quantity) for line_id, quantity in quantities.items() if int(quantity) > 0}
+    if not quantities: raise ReturnError('Nothing left to return.' if lines else 'This sale has no items.')
+    unknown = sorted(set(quantities) - set(lines))
+    if unknown: raise ReturnError(f"Line(s) {', '.join(map(str, unknown))} are not part of sale {sale.id}.")
+    over = [(lines[line_id], quantity) for line_id, quantity in sorted(quantities.items()) if quantity > lines[line_id].quantity - (lines[line_id].quantity_returned or 0)]
+    if over: raise ReturnError(' '.join(f"Only {line.quantity - (line.quantity_returned or 0)} of '{line.name}' can still be returned (requested {quantity})." for line, quantity in over))
+
+    refunds = {line_id: _refund(lines[line_id], quantity) for line_id, quantity in quantities.items()}
+    now = datetime.utcnow()
+    sale_return = SaleReturn(return_timestamp=now, reason=reason, total_refunded_amount=round(sum(refunds.values()), 2), original_sale_id=sale.id,
+                             customer_id=sale.customer_id, processed_by_user_id=user_id)
+    db.session.add(sale_return); db.session.flush()
+    return_lines = [{'sale_return_id': sale_return.id, 'sale_item_id': line_id, 'product_id': lines[line_id].product_id,
+                     'quantity': quantity, 'amount_refunded': refunds[line_id]} for line_id, quantity in sorted(quantities.items())]
+    db.session.execute(insert(SaleReturnItem.__table__), return_lines)
+    updates = [{'line_id': line_id, 'expected': lines[line_id].quantity_returned, 'quantity': quantity, 'refund': refunds[line_id], 'now': now}
+               for line_id, quantity in sorted(quantities.items()) if lines[line_id].quantity_returned is not None]
+    if updates:
+        if db.session.get_bind(mapper=Sale).dialect.supports_sane_multi_rowcount: written = db.session.execute(_add_to_ledger, updates).rowcount
+        else: written = sum(db.session.execute(_add_to_ledger, row).rowcount for row in updates)
+        if written != len(updates): # Another return of these lines committed after they were read; commit_with_retry starts over
+            raise StockConflictError('The sale was returned against while this return was being recorded.')
+    new_rows = [{'sale_item_id': line_id, 'sale_id': sale.id, 'quantity_returned': quantity, 'amount_refunded': refunds[line_id], 'updated_at': now}
+                for line_id, quantity in sorted(quantities.items()) if lines[line_id].quantity_returned is None]
+    if new_rows:
+        try: db.session.execute(insert(_ledger), new_rows)
+        except IntegrityError as e: # A concurrent first return of one of these lines inserted its ledger row; commit_with_retry starts over
+            raise StockConflictError('The sale was returned against while this return was being recorded.') from e
+    restock = {}
+    for line in return_lines: restock[line['product_id']] = restock.get(line['product_id'], 0) + line['quantity']
+    increment_stock(restock)
+    record_return(sale_return, return_lines, sale.payment_method)
+    return sale_return
@@ -0,0 +1,230 @@
+# app/sales_rollup.py
+"""
+Daily reporting rollups: daily_sales_rollup (by payment method) and
+daily_product_rollup (by product, with its category), plus
+monthly_product_rollup with the same product measures per calendar month
+so that long report ranges read whole months instead of every day.
+
+record_sale / record_sales / record_return add committed sales or returns to
+the rollups inside the same transaction, so the dashboard and reports never disagree
+with the raw tables. rebuild_rollups recomputes a date range from history
+(`flask rebuild-rollups`), e.g. after importing old data or editing sales.
+
+Days follow Sale.sale_timestamp / SaleReturn.return_timestamp, i.e. the same
+calendar day the raw-table reports used.
+"""
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import delete, func, select, union_all, update
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+
+from . import db
+from .models import DailyProductRollup, DailySalesRollup, MonthlyProductRollup, Product, Sale, SaleItem, SaleReturn, SaleReturnItem
+
+_sales_rollup = DailySalesRollup.__table__
+_product_rollup = DailyProductRollup.__table__
+_monthly_product_rollup = MonthlyProductRollup.__table__
+
+SALES_KEY = ('sale_date', 'payment_method')
+PRODUCT_KEY = ('sale_date', 'product_id')
+MONTHLY_PRODUCT_KEY = ('month', 'product_id')
+PRODUCT_MEASURES = ('quantity_sold', 'gross_revenue', 'discount_total', 'net_revenue', 'quantity_returned', 'refunded_amount')
+_REPLACED_COLUMNS = ('category',) # Dimensions overwritten (not added) on upsert
+
+DEFAULT_PAYMENT_METHOD = 'Cash' # Matches Sale.payment_method's default
+
+
+def _as_date(value):
+    """func.date() returns a string on SQLite and a date elsewhere."""
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def _add_rows(table, key, rows):
+    """
+    Adds the measure columns of rows into the rollup rows with the same key,
+    inserting missing keys. One INSERT ... ON CONFLICT statement where supported.
+    """
+    if not rows: return
+    dialect = db.session.get_bind(mapper=Product).dialect.name
+    measures = [name for name in rows[0] if name not in key and name not in _REPLACED_COLUMNS]
+    replaced = [name for name in rows[0] if name in _REPLACED_COLUMNS]
+    if dialect in ('sqlite', 'postgresql'):
+        stmt = (sqlite.insert if dialect == 'sqlite' else postgresql.insert)(table)
+        changes = {name: table.c[name] + stmt.excluded[name] for name in measures}
+        changes.update({name: stmt.excluded[name] for name in replaced})
+        db.session.execute(stmt.on_conflict_do_update(index_elements=list(key), set_=changes), rows)
+    elif dialect in ('mysql', 'mariadb'):
+        stmt = mysql.insert(table)
+        changes = {name: table.c[name] + stmt.inserted[name] for name in measures}
+        changes.update({name: stmt.inserted[name] for name in replaced})
+        db.session.execute(stmt.on_duplicate_key_update(**changes), rows)
+    else:
+        for row in rows:
+            match = [table.c[name] == row[name] for name in key]
+            values = {name: table.c[name] + row[name] for name in measures}
+            values.update({name: row[name] for name in replaced})
+            if db.session.execute(update(table).where(*match).values(**values)).rowcount == 0:
+                db.session.execute(table.insert().values(**row))
+
+
+def _categories(product_ids):
+    return dict(db.session.execute(select(Product.id, Product.category).where(Product.id.in_(list(product_ids)))).all())
+
+
+def _month_start(day):
+    return day.replace(day=1)
+
+
+def _next_month_start(day):
+    return (day.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+def _add_product_rows(day, rows):
+    """rows: product rollup dicts without a date; added to both the daily and the monthly table."""
+    _add_rows(_product_rollup, PRODUCT_KEY, [dict(row, sale_date=day) for row in rows])
+    _add_rows(_monthly_product_rollup, MONTHLY_PRODUCT_KEY, [dict(row, month=_month_start(day)) for row in rows])
+
+
+def record_sale(sale, lines, categories=None):
+    """
+    Adds a new sale to the rollups. Call inside the sale's transaction.
+    lines: dicts with product_id, quantity, price_at_sale, discount_applied.
+    categories: optional {product_id: category}, looked up when omitted.
+    """
+    record_sales([(sale, lines)], categories)
+
+
+def record_sales(sales, categories=None):
+    """
+    Adds several new sales to the rollups (e.g. a batch of synced offline sales),
+    summed per key first so each rollup row is written once. Call inside the sales' transaction.
+    sales: (sale, lines) pairs as for record_sale.
+    """
+    per_method = defaultdict(lambda: [0, 0.0, 0.0, 0.0])
+    per_product = defaultdict(lambda: defaultdict(lambda: [0, 0.0, 0.0])) # day -> product_id -> totals
+    for sale, lines in sales:
+        day = sale.sale_timestamp.date()
+        totals = per_method[(day, sale.payment_method or DEFAULT_PAYMENT_METHOD)]
+        totals[0] += 1; totals[1] += sale.total_amount or 0.0; totals[2] += sale.discount_total or 0.0; totals[3] += sale.final_amount or 0.0
+        for line in lines:
+            totals = per_product[day][line['product_id']]
+            totals[0] += line['quantity']; totals[1] += line['quantity'] * line['price_at_sale']; totals[2] += line.get('discount_applied') or 0.0
+    _add_rows(_sales_rollup, SALES_KEY, [{
+        'sale_date': day, 'payment_method': method, 'order_count': count, 'gross_amount': gross,
+        'discount_total': discount, 'net_sales': net, 'return_count': 0, 'refunded_amount': 0.0}
+        for (day, method), (count, gross, discount, net) in sorted(per_method.items())])
+    if categories is None: categories = _categories({product_id for products in per_product.values() for product_id in products})
+    for day, products in sorted(per_product.items()): # One call per day: a statement must not upsert the same monthly row twice
+        _add_product_rows(day, [{
+            'product_id': product_id, 'category': categories.get(product_id),
+            'quantity_sold': quantity, 'gross_revenue': gross, 'discount_total': discount, 'net_revenue': gross - discount,
+            'quantity_returned': 0, 'refunded_amount': 0.0} for product_id, (quantity, gross, discount) in sorted(products.items())])
+
+
+def record_return(sale_return, lines, payment_method, categories=None):
+    """
+    Adds a new return to the rollups on the day it was processed. Call inside the return's transaction.
+    lines: dicts with product_id, quantity, amount_refunded. payment_method: that of the original sale.
+    """
+    day = sale_return.return_timestamp.date()
+    _add_rows(_sales_rollup, SALES_KEY, [{
+        'sale_date': day, 'payment_method': payment_method or DEFAULT_PAYMENT_METHOD, 'order_count': 0,
+        'gross_amount': 0.0, 'discount_total': 0.0, 'net_sales': 0.0,
+        'return_count': 1, 'refunded_amount': sale_return.total_refunded_amount or 0.0}])
+    per_product = defaultdict(lambda: [0, 0.0])
+    for line in lines:
+        totals = per_product[line['product_id']]
+        totals[0] += line['quantity']; totals[1] += line['amount_refunded']
+    if categories is None: categories = _categories(per_product)
+    _add_product_rows(day, [{
+        'product_id': product_id, 'category': categories.get(product_id),
+        'quantity_sold': 0, 'gross_revenue': 0.0, 'discount_total': 0.0, 'net_revenue': 0.0,
+        'quantity_returned': quantity, 'refunded_amount': refunded} for product_id, (quantity, refunded) in sorted(per_product.items())])
+
+
+def _window_rows(start_dt, end_dt):
+    """Aggregates raw sales and returns in [start_dt, end_dt) into rollup rows."""
+    sales = defaultdict(lambda: dict(order_count=0, gross_amount=0.0, discount_total=0.0, net_sales=0.0, return_count=0, refunded_amount=0.0))
+    products = defaultdict(lambda: dict(quantity_sold=0, gross_revenue=0.0, discount_total=0.0, net_revenue=0.0, quantity_returned=0, refunded_amount=0.0))
+    sale_day = func.date(Sale.sale_timestamp); return_day = func.date(SaleReturn.return_timestamp)
+    payment = func.coalesce(Sale.payment_method, DEFAULT_PAYMENT_METHOD)
+    in_sale_window = [Sale.sale_timestamp >= start_dt, Sale.sale_timestamp < end_dt]
+    in_return_window = [SaleReturn.return_timestamp >= start_dt, SaleReturn.return_timestamp < end_dt]
+
+    for day, method, count, gross, discount, net in db.session.execute(
+            select(sale_day, payment, func.count(Sale.id), func.sum(Sale.total_amount), func.sum(func.coalesce(Sale.discount_total, 0.0)), func.sum(Sale.final_amount))
+            .where(*in_sale_window).group_by(sale_day, payment)):
+        sales[(_as_date(day), method)].update(order_count=count, gross_amount=gross or 0.0, discount_total=discount or 0.0, net_sales=net or 0.0)
+    for day, method, count, refunded in db.session.execute(
+            select(return_day, payment, func.count(SaleReturn.id), func.sum(SaleReturn.total_refunded_amount))
+            .join(Sale, Sale.id == SaleReturn.original_sale_id).where(*in_return_window).group_by(return_day, payment)):
+        sales[(_as_date(day), method)].update(return_count=count, refunded_amount=refunded or 0.0)
+
+    line_gross = SaleItem.quantity * SaleItem.price_at_sale; line_discount = func.coalesce(SaleItem.discount_applied, 0.0)
+    for day, product_id, quantity, gross, discount in db.session.execute(
+            select(sale_day, SaleItem.product_id, func.sum(SaleItem.quantity), func.sum(line_gross), func.sum(line_discount))
+            .join(Sale, Sale.id == SaleItem.sale_id).where(*in_sale_window).group_by(sale_day, SaleItem.product_id)):
+        products[(_as_date(day), product_id)].update(quantity_sold=quantity or 0, gross_revenue=gross or 0.0, discount_total=discount or 0.0,
+                                                     net_revenue=(gross or 0.0) - (discount or 0.0))
+    for day, product_id, quantity, refunded in db.session.execute(
+            select(return_day, SaleReturnItem.product_id, func.sum(SaleReturnItem.quantity), func.sum(SaleReturnItem.amount_refunded))
+            .join(SaleReturn, SaleReturn.id == SaleReturnItem.sale_return_id).where(*in_return_window).group_by(return_day, SaleReturnItem.product_id)):
+        products[(_as_date(day), product_id)].update(quantity_returned=quantity or 0, refunded_amount=refunded or 0.0)
+
+    categories = _categories({product_id for _, product_id in products})
+    return ([dict(measures, sale_date=day, payment_method=method) for (day, method), measures in sales.items()],
+            [dict(measures, sale_date=day, product_id=product_id, category=categories.get(product_id)) for (day, product_id), measures in products.items()])
+
+
+def rebuild_rollups(start=None, end=None):
+    """
+    Recomputes the rollups for the calendar months covering start..end (dates; defaults
+    to all history), one month at a time, committing after each.
+    Returns (sales_rows, product_rows) written to the daily tables.
+    """
+    if start is None or end is None:
+        first, last = db.session.execute(select(func.min(Sale.sale_timestamp), func.max(Sale.sale_timestamp))).one()
+        first_return, last_return = db.session.execute(select(func.min(SaleReturn.return_timestamp), func.max(SaleReturn.return_timestamp))).one()
+        stamps = [stamp for stamp in (first, last, first_return, last_return) if stamp]
+        if not stamps: return 0, 0
+        start = start or min(stamps).date(); end = end or max(stamps).date()
+    written = [0, 0]
+    month = _month_start(start)
+    while month <= end:
+        next_month = _next_month_start(month); month_end = next_month - timedelta(days=1)
+        db.session.execute(delete(_sales_rollup).where(_sales_rollup.c.sale_date.between(month, month_end)))
+        db.session.execute(delete(_product_rollup).where(_product_rollup.c.sale_date.between(month, month_end)))
+        db.session.execute(delete(_monthly_product_rollup).where(_monthly_product_rollup.c.month == month))
+        sales_rows, product_rows = _window_rows(datetime.combine(month, datetime.min.time()), datetime.combine(next_month, datetime.min.time()))
+        monthly_rows = {}
+        for row in product_rows:
+            total = monthly_rows.setdefault(row['product_id'], dict({name: 0 for name in PRODUCT_MEASURES}, month=month, product_id=row['product_id'], category=row['category']))
+            for name in PRODUCT_MEASURES: total[name] += row[name]
+        if sales_rows: db.session.execute(_sales_rollup.insert(), sales_rows)
+        for table, rows in ((_product_rollup, product_rows), (_monthly_product_rollup, list(monthly_rows.values()))):
+            for chunk_start in range(0, len(rows), 5000):
+                db.session.execute(table.insert(), rows[chunk_start:chunk_start + 5000])
+        db.session.commit()
+        written[0] += len(sales_rows); written[1] += len(product_rows)
+        month = next_month
+    return tuple(written)
+
+
+def product_rollup_rows(start, end):
+    """
+    Selectable of product rollup rows (product_id, category and the PRODUCT_MEASURES) covering
+    start..end inclusive: monthly rows for whole months, daily rows for the partial months at the edges.
+    """
+    def daily(first, last):
+        return select(_product_rollup.c.product_id, _product_rollup.c.category, *[_product_rollup.c[name] for name in PRODUCT_MEASURES]) \
+            .where(_product_rollup.c.sale_date.between(first, last))
+    first_full = start if start.day == 1 else _next_month_start(start)
+    after_last_full = _month_start(end) if _next_month_start(end) - timedelta(days=1) != end else _next_month_start(end)
+    if first_full >= after_last_full:
+        return daily(start, end).subquery()
+    parts = [select(_monthly_product_rollup.c.product_id, _monthly_product_rollup.c.category, *[_monthly_product_rollup.c[name] for name in PRODUCT_MEASURES])
+             .where(_monthly_product_rollup.c.month >= first_full, _monthly_product_rollup.c.month < after_last_full)]
+    if start < first_full: parts.append(daily(start, first_full - timedelta(days=1)))
+    if after_last_full <= end: parts.append(daily(after_last_full, end))
+    return union_all(*parts).subquery()
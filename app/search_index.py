@@ -0,0 +1,323 @@
+# app/search_index.py
+"""
+Typeahead search for products and customers with pluggable backends.
+
+Results are ranked in three tiers, each served by an index:
+
+1. exact code (product barcode/SKU, customer phone/email),
+2. name prefix (case-insensitive),
+3. substring of name or code (queries of 3+ characters; shorter queries
+   only match tiers 1 and 2, since one or two characters carry no trigram).
+
+Backends (SEARCH_BACKEND = 'auto' picks by database dialect):
+
+* 'sqlite_fts'    - FTS5 trigram tables plus lower(name) indexes (migration f3a9c1d27b64).
+* 'postgres_trgm' - pg_trgm GIN indexes serving ILIKE (same migration).
+* 'python'        - in-process trigram index; used when neither is available
+                    (e.g. a SQLite build without FTS5, or a database created
+                    with db.create_all() instead of migrations).
+"""
+import bisect
+import threading
+import time
+from itertools import chain
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, func, inspect, or_, select, text
+
+from . import db
+from .models import Customer, Product
+
+_PENDING_KEY = 'search_index.pending'
+_MAX_CHAR = '\U0010ffff' # Upper bound for prefix range scans
+MIN_SUBSTRING_LENGTH = 3
+
+
+class SearchSpec:
+    """What a search kind looks at: its model, exact-match columns and searchable text columns."""
+    def __init__(self, kind, model, exact, text, fts_table, active_only=False):
+        self.kind = kind
+        self.model = model
+        self.exact = exact # Column names compared with ==
+        self.text = text # Column names searched by substring (first one is the name)
+        self.fts_table = fts_table
+        self.active_only = active_only
+
+    @property
+    def name_column(self): return getattr(self.model, self.text[0])
+
+    def columns(self, names): return [getattr(self.model, name) for name in names]
+
+    def base_filters(self):
+        return [self.model.is_active == True] if self.active_only else []
+
+
+SEARCH_SPECS = {
+    'products': SearchSpec('products', Product, exact=('barcode', 'sku'), text=('name', 'barcode', 'sku'), fts_table='products_fts', active_only=True),
+    'customers': SearchSpec('customers', Customer, exact=('phone_number', 'email'), text=('name', 'phone_number', 'email'), fts_table='customers_fts'),
+}
+
+
+def _escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+class SearchBackend:
+    """Runs the three ranking tiers; subclasses supply one query per tier."""
+    name = None
+
+    def search(self, kind, query, limit=10):
+        """Returns up to limit ids of `kind`, best matches first."""
+        spec = SEARCH_SPECS[kind]
+        query = (query or '').strip()
+        if not query or limit <= 0:
+            return []
+        ranked = []; seen = set()
+        tiers = [self.exact_ids, self.prefix_ids]
+        if len(query) >= MIN_SUBSTRING_LENGTH:
+            tiers.append(self.substring_ids)
+        for tier in tiers:
+            # Ask for enough rows to still fill the page after dropping ids from earlier tiers
+            for object_id in tier(spec, query, limit + len(ranked)):
+                if object_id not in seen:
+                    seen.add(object_id); ranked.append(object_id)
+                    if len(ranked) >= limit: return ranked
+        return ranked
+
+    def exact_ids(self, spec, query, limit): raise NotImplementedError
+    def prefix_ids(self, spec, query, limit): raise NotImplementedError
+    def substring_ids(self, spec, query, limit): raise NotImplementedError
+
+
+class _SqlSearchBackend(SearchBackend):
+    """Shared SQL for the exact tier (served by the unique indexes on the code columns)."""
+
+    def exact_ids(self, spec, query, limit):
+        stmt = (select(spec.model.id)
+                .where(or_(*[column == query for column in spec.columns(spec.exact)]), *spec.base_filters())
+                .limit(limit))
+        return db.session.scalars(stmt).all()
+
+
+class SqliteFtsSearchBackend(_SqlSearchBackend):
+    """FTS5 trigram tables for substrings; an index on lower(name) for prefixes."""
+    name = 'sqlite_fts'
+
+    def prefix_ids(self, spec, query, limit):
+        lowered = func.lower(spec.name_column); query = query.lower()
+        stmt = (select(spec.model.id)
+                .where(lowered >= query, lowered < query + _MAX_CHAR, *spec.base_filters())
+                .order_by(lowered).limit(limit))
+        return db.session.scalars(stmt).all()
+
+    def substring_ids(self, spec, query, limit):
+        table = spec.model.__tablename__
+        active = f"AND {table}.is_active = 1 " if spec.active_only else ""
+        stmt = text(f"SELECT {table}.id FROM {spec.fts_table} JOIN {table} ON {table}.id = {spec.fts_table}.rowid "
+                    f"WHERE {spec.fts_table} MATCH :match {active}LIMIT :limit").columns(spec.model.id) # A SELECT, so replica views can route it
+        match = '"' + query.replace('"', '""') + '"' # One quoted phrase: a plain substring match
+        return db.session.scalars(stmt, {'match': match, 'limit': limit}).all()
+
+
+class PostgresTrigramSearchBackend(_SqlSearchBackend):
+    """ILIKE on columns with pg_trgm GIN indexes (used for both prefix and substring patterns)."""
+    name = 'postgres_trgm'
+
+    def prefix_ids(self, spec, query, limit):
+        stmt = (select(spec.model.id)
+                .where(spec.name_column.ilike(_escape_like(query) + '%', escape='\\'), *spec.base_filters())
+                .order_by(spec.name_column).limit(limit))
+        return db.session.scalars(stmt).all()
+
+    def substring_ids(self, spec, query, limit):
+        pattern = '%' + _escape_like(query) + '%'
+        stmt = (select(spec.model.id)
+                .where(or_(*[column.ilike(pattern, escape='\\') for column in spec.columns(spec.text)]), *spec.base_filters())
+                .limit(limit))
+        return db.session.scalars(stmt).all()
+
+
+def _trigrams(value):
+    return {value[i:i + 3] for i in range(len(value) - 2)}
+
+
+class _TrigramTable:
+    """In-memory index of one search kind: exact codes, sorted names and trigram postings."""
+
+    def __init__(self):
+        self.by_code = {} # code -> id
+        self.names = [] # sorted (lower name, id)
+        self.texts = {} # id -> (lower name, codes tuple, searchable text)
+        self.postings = {} # trigram -> list of ids (may hold stale ids; results are re-checked)
+
+    def put(self, object_id, name, codes, searchable, keep_sorted=True):
+        old = self.texts.get(object_id)
+        self.drop(object_id)
+        name = (name or '').lower()
+        haystack = '\x00'.join((value or '').lower() for value in searchable) # \x00 keeps matches inside one field
+        self.texts[object_id] = (name, codes, haystack)
+        if keep_sorted: bisect.insort(self.names, (name, object_id))
+        else: self.names.append((name, object_id)) # Bulk load: caller sorts once at the end
+        for code in codes:
+            if code: self.by_code[code] = object_id
+        known = _trigrams(old[2]) if old else set()
+        for trigram in _trigrams(haystack) - known:
+            self.postings.setdefault(trigram, []).append(object_id)
+
+    def drop(self, object_id):
+        entry = self.texts.pop(object_id, None)
+        if entry is None: return
+        name, codes, _ = entry
+        position = bisect.bisect_left(self.names, (name, object_id))
+        if position < len(self.names) and self.names[position] == (name, object_id): del self.names[position]
+        for code in codes:
+            if self.by_code.get(code) == object_id: del self.by_code[code]
+
+
+class PythonTrigramSearchBackend(SearchBackend):
+    """
+    Pure-Python fallback. Each worker builds the index on first use, patches in
+    changes it commits itself, and rebuilds every SEARCH_INDEX_REFRESH_SECONDS
+    to pick up changes made by other workers.
+    """
+    name = 'python'
+
+    def __init__(self, refresh_seconds=300):
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.RLock()
+        self._tables = {}; self._built_at = {}
+
+    def _load_rows(self, spec):
+        columns = spec.columns(('id',) + tuple(dict.fromkeys(spec.text + spec.exact)))
+        stmt = select(*columns).where(*spec.base_filters()).execution_options(yield_per=10000)
+        return db.session.execute(stmt)
+
+    def _table(self, kind):
+        spec = SEARCH_SPECS[kind]
+        if kind not in self._tables or time.monotonic() - self._built_at[kind] >= self.refresh_seconds:
+            with self._lock:
+                table = _TrigramTable()
+                for row in self._load_rows(spec):
+                    self._put_row(table, spec, row, keep_sorted=False)
+                table.names.sort()
+                self._tables[kind] = table; self._built_at[kind] = time.monotonic()
+        return self._tables[kind]
+
+    @staticmethod
+    def _put_row(table, spec, row, keep_sorted=True):
+        table.put(row.id, getattr(row, spec.text[0]), tuple(getattr(row, name) for name in spec.exact),
+                  [getattr(row, name) for name in spec.text], keep_sorted)
+
+    def apply_changes(self, kind, rows):
+        """rows: {id: object with the spec's columns, or None if deleted/deactivated}."""
+        table = self._tables.get(kind)
+        if table is None: return
+        with self._lock:
+            for object_id, row in rows.items():
+                if row is None: table.drop(object_id)
+                else: self._put_row(table, SEARCH_SPECS[kind], row)
+
+    def exact_ids(self, spec, query, limit):
+        object_id = self._table(spec.kind).by_code.get(query)
+        return [object_id] if object_id is not None else []
+
+    def prefix_ids(self, spec, query, limit):
+        names = self._table(spec.kind).names; query = query.lower()
+        start = bisect.bisect_left(names, (query,))
+        ids = []
+        for name, object_id in names[start:start + limit]:
+            if not name.startswith(query): break
+            ids.append(object_id)
+        return ids
+
+    def substring_ids(self, spec, query, limit):
+        table = self._table(spec.kind); query = query.lower()
+        postings = [table.postings.get(trigram, ()) for trigram in _trigrams(query)]
+        candidates = min(postings, key=len) # Every match appears in the rarest trigram's list; re-check the rest
+        ids = []; seen = set()
+        for object_id in candidates:
+            entry = table.texts.get(object_id)
+            if entry is not None and object_id not in seen and query in entry[2]:
+                seen.add(object_id); ids.append(object_id)
+                if len(ids) >= limit: break
+        return ids
+
+
+BACKENDS = {backend.name: backend for backend in (SqliteFtsSearchBackend, PostgresTrigramSearchBackend, PythonTrigramSearchBackend)}
+
+
+def _detect_backend_name():
+    bind = db.session.get_bind(mapper=Product)
+    if bind.dialect.name == 'sqlite':
+        tables = set(inspect(bind).get_table_names())
+        if all(spec.fts_table in tables for spec in SEARCH_SPECS.values()):
+            return 'sqlite_fts'
+        current_app.logger.warning("FTS5 search tables not found (run 'flask db upgrade'); using the in-process search index.")
+    elif bind.dialect.name == 'postgresql':
+        return 'postgres_trgm'
+    return 'python'
+
+
+def get_search_backend():
+    """Returns the search backend of the current app, choosing it on first use."""
+    backend = current_app.extensions.get('search_backend')
+    if backend is None:
+        name = current_app.config.get('SEARCH_BACKEND', 'auto')
+        if name == 'auto': name = _detect_backend_name()
+        if name == 'python':
+            backend = PythonTrigramSearchBackend(refresh_seconds=current_app.config.get('SEARCH_INDEX_REFRESH_SECONDS', 300))
+        else:
+            backend = BACKENDS[name]()
+        current_app.extensions['search_backend'] = backend
+    return backend
+
+
+def search(kind, query, limit=10):
+    """Returns up to limit model instances of `kind` ('products' or 'customers') matching query, best first."""
+    ids = get_search_backend().search(kind, query, limit)
+    if not ids: return []
+    model = SEARCH_SPECS[kind].model
+    found = {obj.id: obj for obj in model.query.filter(model.id.in_(ids))}
+    return [found[object_id] for object_id in ids if object_id in found]
+
+
+# --- Keep the in-process fallback in step with this worker's own commits ---
+
+class _RowSnapshot:
+    """Plain copy of the searchable columns of a flushed object."""
+    def __init__(self, obj, spec):
+        self.id = obj.id
+        for name in spec.text + spec.exact:
+            setattr(self, name, getattr(obj, name))
+
+
+def _spec_of(obj):
+    return next((spec for spec in SEARCH_SPECS.values() if isinstance(obj, spec.model)), None)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _collect_search_changes(session, flush_context):
+    pending = session.info.setdefault(_PENDING_KEY, {})
+    for obj in chain(session.new, session.dirty):
+        spec = _spec_of(obj)
+        if spec is None: continue
+        visible = not spec.active_only or obj.is_active
+        pending.setdefault(spec.kind, {})[obj.id] = _RowSnapshot(obj, spec) if visible else None
+    for obj in session.deleted:
+        spec = _spec_of(obj)
+        if spec is not None: pending.setdefault(spec.kind, {})[obj.id] = None
+
+
+@event.listens_for(db.session, 'after_commit')
+def _apply_search_changes(session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending or not has_app_context(): return
+    backend = current_app.extensions.get('search_backend')
+    if isinstance(backend, PythonTrigramSearchBackend):
+        for kind, rows in pending.items():
+            backend.apply_changes(kind, rows)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_search_changes(session):
+    session.info.pop(_PENDING_KEY, None)
@@ -0,0 +1,168 @@
+# app/stock_import.py
+"""
+Bulk stock-take upload: sets absolute stock levels from a spreadsheet.
+
+The pipeline works on whole columns and chunks instead of row by row:
+
+1. The sheet is validated with vectorized pandas operations (missing values,
+   non-numeric, negative or fractional quantities).
+2. Identifiers (Barcode, SKU or ProductID) are resolved to product ids with one
+   keyed IN query per chunk of distinct identifiers.
+3. New levels are written through the stock ledger in chunks of
+   STOCK_UPLOAD_CHUNK_SIZE products. Each chunk commits on its own together
+   with its bulk-inserted StockAdjustment rows, so a large upload never holds
+   the write lock for long.
+
+Rows that were not applied are written to a CSV error report under
+UPLOAD_REPORT_DIR, downloadable from the upload page.
+"""
+import csv
+import os
+import uuid
+from datetime import datetime
+
+import pandas as pd
+from flask import current_app
+from sqlalchemy import insert, select
+
+from . import db
+from .models import Product, StockAdjustment
+from .stock_ledger import commit_with_retry, set_stock_levels
+
+QUANTITY_COLUMN = 'NewQuantity'
+# Accepted identifier columns, in order of preference, and the product column each is matched against
+IDENTIFIER_COLUMNS = {'Barcode': Product.barcode, 'SKU': Product.sku, 'ProductID': Product.id}
+REPORT_COLUMNS = ['Row', 'Identifier', QUANTITY_COLUMN, 'Error']
+LOOKUP_CHUNK_SIZE = 2000 # Identifiers per lookup query
+
+
+class StockSheetError(ValueError):
+    """The uploaded sheet cannot be processed at all (e.g. required columns are missing)."""
+
+
+class StockUploadResult:
+    """Outcome of an upload: counts, per-row errors as (row, identifier, quantity, message) and the report file name."""
+    def __init__(self, updated, skipped, errors, report_name=None):
+        self.updated = updated
+        self.skipped = skipped
+        self.errors = errors
+        self.report_name = report_name
+
+
+def read_stock_sheet(stream, filename):
+    """Reads the identifier and quantity columns of an .xlsx/.xls/.csv upload (codes kept as text)."""
+    wanted = set(IDENTIFIER_COLUMNS) | {QUANTITY_COLUMN}
+    options = dict(usecols=lambda column: column in wanted, dtype={'Barcode': str, 'SKU': str})
+    if filename.lower().endswith('.csv'):
+        return pd.read_csv(stream, **options)
+    return pd.read_excel(stream, engine='openpyxl', **options)
+
+
+def _validate(sheet):
+    """Splits the sheet into valid rows (row, identifier, quantity) and error tuples, without a Python loop over rows."""
+    identifier_col = next((column for column in IDENTIFIER_COLUMNS if column in sheet.columns), None)
+    if not identifier_col or QUANTITY_COLUMN not in sheet.columns:
+        raise StockSheetError(f'Excel file must contain "{QUANTITY_COLUMN}" and one of "Barcode", "SKU", or "ProductID".')
+    raw_identifier = sheet[identifier_col]; raw_quantity = sheet[QUANTITY_COLUMN]
+    if identifier_col == 'ProductID':
+        identifier = pd.to_numeric(raw_identifier, errors='coerce')
+        identifier = identifier.where(identifier % 1 == 0).astype('Int64') # Non-integer ids simply match nothing
+    else:
+        identifier = raw_identifier.astype('string').str.strip().replace('', pd.NA)
+    quantity = pd.to_numeric(raw_quantity, errors='coerce')
+    rows = sheet.index.to_series() + 2 # Spreadsheet row numbers (header is row 1)
+
+    missing = raw_identifier.isna() | (raw_identifier.astype('string').str.strip() == '').fillna(False) | raw_quantity.isna()
+    invalid_quantity = ~missing & (quantity.isna() | (quantity < 0) | (quantity % 1 != 0))
+    errors = [(row, ident, qty, 'Skipped missing data.')
+              for row, ident, qty in zip(rows[missing], raw_identifier[missing], raw_quantity[missing])]
+    errors += [(row, ident, qty, f"Invalid quantity '{qty}'. Must be a whole non-negative number.")
+               for row, ident, qty in zip(rows[invalid_quantity], raw_identifier[invalid_quantity], raw_quantity[invalid_quantity])]
+    valid = ~(missing | invalid_quantity)
+    return identifier_col, pd.DataFrame({'row': rows[valid], 'identifier': identifier[valid], 'raw_identifier': raw_identifier[valid],
+                                         'quantity': quantity[valid].astype('int64')}), errors
+
+
+def resolve_product_ids(identifier_col, identifiers):
+    """Maps a Series of identifiers to product ids (NaN where not found) with one query per chunk of distinct values."""
+    column = IDENTIFIER_COLUMNS[identifier_col]
+    distinct = identifiers.dropna().unique().tolist()
+    found = {}
+    for start in range(0, len(distinct), LOOKUP_CHUNK_SIZE):
+        chunk = distinct[start:start + LOOKUP_CHUNK_SIZE]
+        found.update(db.session.execute(select(column, Product.id).where(column.in_(chunk))).tuples().all())
+    return identifiers.map(found)
+
+
+def apply_stock_levels(new_levels, user_id, notes, progress=None):
+    """
+    Writes {product_id: level} in chunks, one transaction per chunk, with a StockAdjustment per product.
+    progress(percent, message), if given, is called after each chunk.
+    Returns (applied {product_id: (before, after)}, failed {product_id: error message}).
+    """
+    chunk_size = current_app.config.get('STOCK_UPLOAD_CHUNK_SIZE', 2000)
+    product_ids = sorted(new_levels); applied = {}; failed = {}
+    for start in range(0, len(product_ids), chunk_size):
+        chunk = {pid: new_levels[pid] for pid in product_ids[start:start + chunk_size]}
+        def save_chunk():
+            changes = set_stock_levels(chunk)
+            if changes:
+                timestamp = datetime.utcnow()
+                db.session.execute(insert(StockAdjustment), [
+                    {'product_id': pid, 'user_id': user_id, 'quantity_change': after - before, 'reason': 'Bulk Upload', 'notes': notes,
+                     'stock_level_before': before, 'stock_level_after': after, 'timestamp': timestamp}
+                    for pid, (before, after) in changes.items()])
+            return changes
+        try:
+            applied.update(commit_with_retry(save_chunk))
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f"Bulk stock upload: chunk of {len(chunk)} products failed: {e}")
+            failed.update(dict.fromkeys(chunk, f'Not applied: {e}'))
+        if progress:
+            done = min(start + chunk_size, len(product_ids))
+            progress(10 + 90 * done // len(product_ids), f'Updated {done:,} of {len(product_ids):,} products...')
+    return applied, failed
+
+
+def _report_dir():
+    return current_app.config.get('UPLOAD_REPORT_DIR') or os.path.join(current_app.instance_path, 'upload_reports')
+
+
+def write_report(errors, columns=REPORT_COLUMNS, prefix='stock_upload_errors'):
+    """Writes error tuples (one per row, in columns order) to a new CSV under UPLOAD_REPORT_DIR and returns its name."""
+    directory = _report_dir()
+    os.makedirs(directory, exist_ok=True)
+    report_name = f'{prefix}_{datetime.now():%Y%m%d_%H%M%S}_{uuid.uuid4().hex[:8]}.csv'
+    with open(os.path.join(directory, report_name), 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f); writer.writerow(columns)
+        writer.writerows(tuple('' if pd.isna(value) else value for value in error) for error in errors)
+    return report_name
+
+
+def report_path(report_name):
+    """Absolute path of a report file, or None if the name is not a report in UPLOAD_REPORT_DIR."""
+    if os.path.basename(report_name) != report_name or not report_name.endswith('.csv'): return None
+    path = os.path.join(_report_dir(), report_name)
+    return path if os.path.isfile(path) else None
+
+
+def import_stock_levels(sheet, user_id, filename, progress=None):
+    """
+    Runs the whole pipeline on a DataFrame read by read_stock_sheet. The last row wins for repeated products.
+    progress(percent, message) is called as chunks are written (used by the background job).
+    """
+    identifier_col, valid, errors = _validate(sheet)
+    valid['product_id'] = resolve_product_ids(identifier_col, valid['identifier'])
+    not_found = valid['product_id'].isna()
+    errors += [(row, ident, qty, f"Product {identifier_col} '{ident}' not found.")
+               for row, ident, qty in zip(valid['row'][not_found], valid['raw_identifier'][not_found], valid['quantity'][not_found])]
+    matched = valid[~not_found].astype({'product_id': 'int64'})
+    new_levels = dict(zip(matched['product_id'].tolist(), matched['quantity'].tolist()))
+
+    applied, failed = apply_stock_levels(new_levels, user_id, notes=f"File: {filename}", progress=progress)
+    written = matched['product_id'].isin(list(applied))
+    errors += [(row, ident, qty, failed.get(pid, f"Product {identifier_col} '{ident}' not found."))
+               for row, ident, qty, pid in zip(matched['row'][~written], matched['raw_identifier'][~written], matched['quantity'][~written], matched['product_id'][~written])]
+    updated = int(written.sum()); errors.sort(key=lambda error: error[0])
+    return StockUploadResult(updated, len(errors), errors, write_report(errors) if errors else None)
@@ -0,0 +1,295 @@
+# app/stock_ledger.py
+"""
+Stock ledger service: the one place that writes Product.stock_quantity.
+
+Every change is a set-based, conditional UPDATE evaluated by the database, so
+two tills selling the last units of a SKU cannot both succeed:
+
+* decrement_stock / increment_stock apply relative changes
+  (UPDATE ... SET stock = stock - n WHERE stock >= n [RETURNING]).
+* adjust_stock_level / set_stock_levels need the "before" level for the
+  StockAdjustment record, so they read it (SELECT ... FOR UPDATE where the
+  backend supports row locks) and write it back as a compare-and-set that
+  fails with StockConflictError if the row moved in between (the SQLite path).
+
+commit_with_retry wraps a route's whole write transaction and retries it with
+exponential backoff when the database reports a lock conflict. On SQLite it can
+take the write lock up front (SQLITE_IMMEDIATE_WRITES, see db_profile).
+
+Functions registered with on_stock_committed are called with
+{product_id: new_level} once the transaction that changed those levels
+has committed (rolled-back changes are discarded).
+"""
+import random
+import time
+
+from flask import current_app, has_app_context
+from sqlalchemy import bindparam, case, event, select, update
+from sqlalchemy.exc import DBAPIError
+
+from . import db
+from .db_profile import begin_write
+from .models import Product
+
+# Keeps the number of bound parameters per statement well under SQLite's limit
+CHUNK_SIZE = 400
+
+_LOCK_ERROR_MARKERS = (
+    'database is locked', 'database table is locked',          # SQLite
+    'deadlock detected', 'could not serialize access',          # PostgreSQL
+    'could not obtain lock', 'lock not available',
+    'deadlock found', 'lock wait timeout exceeded',             # MySQL
+)
+
+_products = Product.__table__
+
+_PENDING_LEVELS_KEY = 'stock_ledger.pending_levels'
+_stock_committed_callbacks = []
+
+
+class StockError(ValueError):
+    """Base class for stock ledger errors (a ValueError, so routes report it like other validation errors)."""
+
+
+class InsufficientStockError(StockError):
+    """Raised when a decrement would take one or more products below zero."""
+    def __init__(self, shortages):
+        # shortages: list of (product_id, product_name, available, requested)
+        self.shortages = shortages
+        super().__init__(" ".join(
+            f"Insufficient stock for product '{name}'. Available: {available}, Requested: {requested}."
+            for _, name, available, requested in shortages))
+
+
+class StockConflictError(StockError):
+    """Raised when a stock row changed between read and write. commit_with_retry retries these."""
+
+
+def on_stock_committed(callback):
+    """Registers callback({product_id: new_level}) to run after a stock change commits. Usable as a decorator."""
+    _stock_committed_callbacks.append(callback)
+    return callback
+
+
+def _record_levels(levels):
+    db.session.info.setdefault(_PENDING_LEVELS_KEY, {}).update(levels)
+
+
+def pending_stock_changes(session):
+    """{product_id: new_level} for stock changed in the session's open (not yet committed) transaction."""
+    return session.info.get(_PENDING_LEVELS_KEY, {})
+
+
+@event.listens_for(db.session, 'after_commit')
+def _notify_stock_committed(session):
+    levels = session.info.pop(_PENDING_LEVELS_KEY, None)
+    if not levels or not has_app_context():
+        return
+    for callback in _stock_committed_callbacks:
+        try:
+            callback(levels)
+        except Exception as e: # A failing listener must never fail the sale that already committed
+            current_app.logger.error(f"Stock commit listener {callback.__name__} failed: {e}", exc_info=True)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_pending_levels(session):
+    session.info.pop(_PENDING_LEVELS_KEY, None)
+
+
+def _chunks(items):
+    items = list(items)
+    for start in range(0, len(items), CHUNK_SIZE):
+        yield items[start:start + CHUNK_SIZE]
+
+
+def _dialect():
+    return db.session.get_bind(mapper=Product).dialect
+
+
+def _supports_row_locks():
+    return _dialect().name in ('postgresql', 'mysql', 'mariadb', 'oracle', 'mssql')
+
+
+def _supports_update_returning():
+    return bool(getattr(_dialect(), 'update_returning', False))
+
+
+def is_lock_conflict(error):
+    """True if the error is a transient lock/serialization failure worth retrying."""
+    if isinstance(error, StockConflictError):
+        return True
+    if isinstance(error, DBAPIError):
+        message = str(getattr(error, 'orig', error)).lower()
+        return any(marker in message for marker in _LOCK_ERROR_MARKERS)
+    return False
+
+
+def commit_with_retry(unit_of_work):
+    """
+    Runs unit_of_work() and commits, retrying the whole transaction on lock conflicts.
+    unit_of_work is called again from scratch after a rollback, so it must create
+    its ORM objects inside the function. Returns whatever unit_of_work returns.
+    Any other error is raised unchanged with the session left for the caller to roll back.
+    """
+    attempts = max(1, current_app.config.get('STOCK_LOCK_RETRIES', 5))
+    backoff = current_app.config.get('STOCK_LOCK_BACKOFF_SECONDS', 0.02)
+    for attempt in range(1, attempts + 1):
+        try:
+            begin_write(db.session)
+            result = unit_of_work()
+            db.session.commit()
+            return result
+        except (DBAPIError, StockConflictError) as e:
+            if attempt >= attempts or not is_lock_conflict(e):
+                raise
+            db.session.rollback()
+            delay = backoff * (2 ** (attempt - 1)) * (0.5 + random.random())
+            current_app.logger.warning(f"Stock lock conflict (attempt {attempt}/{attempts}), retrying in {delay:.3f}s: {e}")
+            time.sleep(delay)
+
+
+def get_stock_levels(product_ids, lock=False):
+    """
+    Returns {product_id: stock_quantity} for the given ids in one query per chunk.
+    With lock=True the rows are read with SELECT ... FOR UPDATE (in id order, to avoid
+    deadlocks) on backends that support row locks.
+    """
+    levels = {}
+    for chunk in _chunks(sorted(set(product_ids))):
+        stmt = select(_products.c.id, _products.c.stock_quantity).where(_products.c.id.in_(chunk)).order_by(_products.c.id)
+        if lock and _supports_row_locks():
+            stmt = stmt.with_for_update()
+        levels.update({row.id: row.stock_quantity or 0 for row in db.session.execute(stmt)})
+    return levels
+
+
+def _shortages(quantities, product_ids):
+    rows = db.session.execute(
+        select(_products.c.id, _products.c.name, _products.c.stock_quantity).where(_products.c.id.in_(list(product_ids)))
+    ).all()
+    found = {row.id: row for row in rows}
+    return [(pid, found[pid].name if pid in found else f"ID {pid}", found[pid].stock_quantity if pid in found else 0, quantities[pid])
+            for pid in sorted(product_ids)]
+
+
+def _stock_level():
+    """stock_quantity with NULL treated as 0 (the column is nullable)."""
+    return db.func.coalesce(_products.c.stock_quantity, 0)
+
+
+def _apply_delta(quantities, decrement):
+    """Adds (or removes) quantities with one UPDATE per chunk. Returns {product_id: new_level}."""
+    new_levels = {}
+    use_returning = _supports_update_returning()
+    for chunk in _chunks(sorted(quantities)):
+        delta = case({pid: quantities[pid] for pid in chunk}, value=_products.c.id)
+        stmt = update(_products).where(_products.c.id.in_(chunk))
+        if decrement:
+            stmt = stmt.where(_stock_level() >= delta).values(stock_quantity=_stock_level() - delta)
+        else:
+            stmt = stmt.values(stock_quantity=_stock_level() + delta)
+        if use_returning:
+            rows = db.session.execute(stmt.returning(_products.c.id, _products.c.stock_quantity)).all()
+            new_levels.update({row.id: row.stock_quantity for row in rows})
+            failed = set(chunk) - {row.id for row in rows}
+        else:
+            updated = db.session.execute(stmt).rowcount
+            levels = get_stock_levels(chunk)
+            new_levels.update(levels)
+            failed = set()
+            if updated != len(chunk):
+                failed = set(chunk) - set(levels)
+                if decrement: # which rows were skipped is not reported without RETURNING; best effort
+                    failed |= {pid for pid in levels if levels[pid] < quantities[pid]}
+                failed = failed or set(chunk)
+        if failed:
+            if decrement:
+                raise InsufficientStockError(_shortages(quantities, failed))
+            raise StockError(f"Product ID(s) not found: {', '.join(str(pid) for pid in sorted(failed))}")
+    _record_levels(new_levels)
+    return new_levels
+
+
+def _validated(quantities):
+    cleaned = {}
+    for product_id, quantity in quantities.items():
+        quantity = int(quantity)
+        if quantity <= 0:
+            raise StockError(f"Stock change for product ID {product_id} must be a positive quantity.")
+        cleaned[int(product_id)] = quantity
+    return cleaned
+
+
+def decrement_stock(quantities):
+    """
+    Atomically removes stock for several products (e.g. a sale).
+    Input: {product_id: quantity}. All-or-nothing: raises InsufficientStockError if any
+    product lacks stock, after which the caller must roll back.
+    Returns {product_id: new_stock_level}.
+    """
+    quantities = _validated(quantities)
+    return _apply_delta(quantities, decrement=True) if quantities else {}
+
+
+def increment_stock(quantities):
+    """
+    Atomically adds stock for several products (e.g. a purchase or a return).
+    Input: {product_id: quantity}. Returns {product_id: new_stock_level}.
+    """
+    quantities = _validated(quantities)
+    return _apply_delta(quantities, decrement=False) if quantities else {}
+
+
+def _compare_and_set(changes):
+    """Writes {product_id: (expected_level, new_level)}; raises StockConflictError if any row moved."""
+    if len(changes) > 1 and _dialect().supports_sane_multi_rowcount:
+        # One prepared UPDATE run with executemany: far cheaper to build than CASE expressions for large uploads
+        stmt = (update(_products)
+                .where(_products.c.id == bindparam('pid'), _stock_level() == bindparam('expected'))
+                .values(stock_quantity=bindparam('new_level')))
+        result = db.session.execute(stmt, [{'pid': pid, 'expected': expected, 'new_level': new_level}
+                                           for pid, (expected, new_level) in sorted(changes.items())])
+        if result.rowcount != len(changes):
+            raise StockConflictError("Stock changed while it was being updated.")
+        _record_levels({pid: change[1] for pid, change in changes.items()})
+        return
+    for chunk in _chunks(sorted(changes)):
+        expected = case({pid: changes[pid][0] for pid in chunk}, value=_products.c.id)
+        new_level = case({pid: changes[pid][1] for pid in chunk}, value=_products.c.id)
+        result = db.session.execute(
+            update(_products)
+            .where(_products.c.id.in_(chunk), _stock_level() == expected)
+            .values(stock_quantity=new_level))
+        if result.rowcount != len(chunk):
+            raise StockConflictError("Stock changed while it was being updated.")
+    _record_levels({pid: change[1] for pid, change in changes.items()})
+
+
+def set_stock_levels(new_levels):
+    """
+    Sets absolute stock levels (e.g. a stock-take upload).
+    Input: {product_id: new_level}. Unknown product ids are ignored.
+    Returns {product_id: (level_before, level_after)} for the products that were updated.
+    """
+    new_levels = {int(pid): int(level) for pid, level in new_levels.items()}
+    current = get_stock_levels(new_levels, lock=True)
+    changes = {pid: (current[pid], new_levels[pid]) for pid in current}
+    _compare_and_set({pid: change for pid, change in changes.items() if change[0] != change[1]})
+    return changes
+
+
+def adjust_stock_level(product_id, change, allow_negative=False):
+    """
+    Applies a signed change to one product and returns (level_before, level_after).
+    Raises InsufficientStockError if the result would be negative and allow_negative is False.
+    """
+    product_id = int(product_id); change = int(change)
+    current = get_stock_levels([product_id], lock=True)
+    if product_id not in current:
+        raise StockError(f"Product ID {product_id} not found.")
+    before = current[product_id]; after = before + change
+    if after < 0 and not allow_negative:
+        raise InsufficientStockError(_shortages({product_id: -change}, [product_id]))
+    _compare_and_set({product_id: (before, after)})
+    return before, after
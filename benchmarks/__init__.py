@@ -0,0 +1,3 @@
+# benchmarks/__init__.py
+# Standalone performance benchmarks. Run from the project root, e.g.:
+#   python -m benchmarks.bench_checkout
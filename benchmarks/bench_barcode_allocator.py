@@ -0,0 +1,116 @@
+# benchmarks/bench_barcode_allocator.py
+"""
+Barcode allocation throughput under concurrency.
+
+N worker processes (spawned, like Gunicorn workers) share one database and
+allocate barcodes as fast as they can, either one per call
+(generate_barcode_logic, as Add Product does) or in batches
+(allocate_barcodes(n), as bulk product creation does). Each configuration
+runs at every --workers level; the script reports allocations per second and
+the number of block reservations, and fails if any barcode was handed out
+twice.
+
+For comparison it also times the previous scan-and-probe generator
+(a LIKE scan for the newest prefixed barcode, then one SELECT per candidate)
+in a single process, on a catalogue of --products products: the first half
+with generated barcodes, the newer half with manufacturer barcodes.
+
+    python -m benchmarks.bench_barcode_allocator [--workers 1 2 4 8] [--allocations 2000] [--block-sizes 1 50] [--batch 100]
+"""
+import argparse
+import json
+import multiprocessing
+import sys
+import time
+
+from benchmarks.common import make_app, open_app, remove_db
+
+
+def _allocator_worker(db_path, block_size, allocations, batch, ready, start_event, results):
+    from app.barcode_sequence import allocate_barcodes, get_barcode_allocator
+    from app.utils import generate_barcode_logic
+    app = open_app(db_path, BARCODE_BLOCK_SIZE=block_size)
+    with app.app_context():
+        ready.release(); start_event.wait()
+        barcodes = []
+        started = time.perf_counter()
+        while len(barcodes) < allocations:
+            barcodes.extend(allocate_barcodes(min(batch, allocations - len(barcodes))) if batch > 1 else [generate_barcode_logic()])
+        elapsed = time.perf_counter() - started
+        results.put({'barcodes': barcodes, 'elapsed_s': elapsed, 'reservations': get_barcode_allocator().reservations})
+
+
+def run_round(db_path, workers, block_size, allocations, batch):
+    ctx = multiprocessing.get_context('spawn')
+    ready = ctx.Semaphore(0); start_event = ctx.Event(); results = ctx.Queue()
+    processes = [ctx.Process(target=_allocator_worker, args=(db_path, block_size, allocations, batch, ready, start_event, results))
+                 for _ in range(workers)]
+    for process in processes: process.start()
+    for _ in processes: ready.acquire() # Every worker has imported the app
+    started = time.perf_counter(); start_event.set()
+    outcomes = [results.get() for _ in processes]
+    elapsed = time.perf_counter() - started
+    for process in processes: process.join()
+    barcodes = [barcode for outcome in outcomes for barcode in outcome['barcodes']]
+    return {
+        'workers': workers, 'block_size': block_size, 'batch': batch, 'allocations': len(barcodes),
+        'elapsed_s': round(elapsed, 3), 'allocations_per_s': round(len(barcodes) / elapsed, 1) if elapsed else 0.0,
+        'reservations': sum(outcome['reservations'] for outcome in outcomes),
+        'duplicates': len(barcodes) - len(set(barcodes)), 'missing': sum(1 for barcode in barcodes if not barcode),
+    }
+
+
+def legacy_next_barcode(prefix='A3M', start_number=1, padding_digits=5):
+    """The generator this allocator replaced: scan for the newest prefixed barcode, then probe candidates one by one."""
+    from app import db
+    from app.models import Product
+    last_product = Product.query.filter(Product.barcode.like(f"{prefix}%")).order_by(Product.id.desc()).first()
+    next_num = start_number
+    if last_product and last_product.barcode[len(prefix):].isdigit(): next_num = int(last_product.barcode[len(prefix):]) + 1
+    while Product.query.filter_by(barcode=f"{prefix}{next_num:0{padding_digits}d}").first(): next_num += 1
+    db.session.rollback()
+    return f"{prefix}{next_num:0{padding_digits}d}"
+
+
+def time_legacy(app, products, calls=200):
+    from app import db
+    from app.models import Product
+    with app.app_context():
+        for start in range(0, products, 5000):
+            db.session.execute(Product.__table__.insert(), [{'name': f'Legacy {i}', 'selling_price': 10.0,
+                                                             'barcode': f'A3M{i:05d}' if i <= products // 2 else f'890{i:010d}'}
+                                                            for i in range(start + 1, min(start + 5000, products) + 1)])
+        db.session.commit()
+        started = time.perf_counter()
+        for _ in range(calls): legacy_next_barcode()
+        elapsed = time.perf_counter() - started
+        db.session.execute(Product.__table__.delete()); db.session.commit()
+    return {'products': products, 'calls': calls, 'allocations_per_s': round(calls / elapsed, 1), 'mean_ms': round(elapsed / calls * 1000, 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8], help='Concurrency levels (processes)')
+    parser.add_argument('--allocations', type=int, default=2000, help='Barcodes allocated per worker')
+    parser.add_argument('--block-sizes', type=int, nargs='+', default=[1, 50], help='BARCODE_BLOCK_SIZE values to compare (1: one reservation per barcode)')
+    parser.add_argument('--batch', type=int, default=100, help='Barcodes per allocate_barcodes call in the batch rounds')
+    parser.add_argument('--products', type=int, default=50000, help='Catalogue size for the legacy generator')
+    args = parser.parse_args()
+
+    app, db_path = make_app()
+    legacy = time_legacy(app, args.products)
+    rounds = []
+    for block_size in args.block_sizes:
+        for workers in args.workers:
+            rounds.append(run_round(db_path, workers, block_size, args.allocations, batch=1))
+    for workers in args.workers:
+        rounds.append(run_round(db_path, workers, max(args.block_sizes), args.allocations, batch=args.batch))
+    remove_db(db_path)
+    print(json.dumps({'legacy_scan_and_probe': legacy, 'rounds': rounds}, indent=2))
+    if any(r['duplicates'] or r['missing'] for r in rounds):
+        print('FAILED: a barcode was allocated twice (or not at all)', file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+# benchmarks/bench_bulk_stock_upload.py
+"""
+Bulk stock upload benchmark: synthetic stock-take sheets of 1k, 50k and 250k rows.
+
+Each sheet covers every seeded product by barcode, plus ~1% unknown barcodes and
+~0.5% invalid quantities. It is posted to /inventory/stock/bulk-upload as .xlsx
+and as .csv. For each run the script reports:
+
+- the end-to-end request time and rows/s;
+- the time spent parsing the file alone;
+- the number of StockAdjustment rows written;
+- the size of the error report.
+
+    python -m benchmarks.bench_bulk_stock_upload [--sizes 1000 50000] [--formats csv xlsx]
+"""
+import argparse
+import io
+import json
+import os
+import random
+import time
+
+from benchmarks.common import make_app, remove_db, seed_products, login
+
+SHEET_SIZES = (1_000, 50_000, 250_000)
+
+
+def make_sheet(size, file_format, seed=7):
+    """Returns the bytes of a Barcode/NewQuantity sheet with a few unknown codes and bad quantities."""
+    rng = random.Random(seed)
+    rows = [(f'BEN{i:08d}', rng.randrange(0, 500)) for i in range(size)]
+    for i in rng.sample(range(size), max(1, size // 100)): rows[i] = (f'MISSING{i:08d}', rows[i][1])
+    for i in rng.sample(range(size), max(1, size // 200)): rows[i] = (rows[i][0], rng.choice([-3, 'n/a', 2.5]))
+    output = io.BytesIO()
+    if file_format == 'csv':
+        text = io.StringIO(); text.write('Barcode,NewQuantity\n')
+        text.writelines(f'{code},{quantity}\n' for code, quantity in rows)
+        output.write(text.getvalue().encode('utf-8'))
+    else:
+        from openpyxl import Workbook
+        workbook = Workbook(write_only=True); sheet = workbook.create_sheet('Stock')
+        sheet.append(['Barcode', 'NewQuantity'])
+        for row in rows: sheet.append(row)
+        workbook.save(output)
+    return output.getvalue()
+
+
+def run_size(size, file_format):
+    app, db_path = make_app()
+    from app import db
+    from app.models import StockAdjustment
+    from app.stock_import import read_stock_sheet
+    with app.app_context():
+        seed_products(size, stock_quantity=100)
+    payload = make_sheet(size, file_format)
+    client = login(app.test_client())
+    with app.app_context():
+        start = time.perf_counter(); read_stock_sheet(io.BytesIO(payload), f'sheet.{file_format}'); parse_s = time.perf_counter() - start
+        start = time.perf_counter()
+        response = client.post('/inventory/stock/bulk-upload', data={'stock_file': (io.BytesIO(payload), f'stock_take.{file_format}')},
+                               content_type='multipart/form-data')
+        total_s = time.perf_counter() - start
+        if response.status_code != 302 or 'report=' not in response.location:
+            raise RuntimeError(f'Upload failed ({response.status_code}, {response.location})')
+        adjustments = db.session.query(StockAdjustment).count()
+        report_name = response.location.split('report=')[1]
+        report_rows = sum(1 for _ in open(os.path.join(app.config['UPLOAD_REPORT_DIR'], report_name), encoding='utf-8-sig')) - 1
+    os.remove(os.path.join(app.config['UPLOAD_REPORT_DIR'], report_name)); remove_db(db_path)
+    return {
+        'rows': size, 'format': file_format, 'file_mb': round(len(payload) / 2**20, 2),
+        'request_s': round(total_s, 2), 'parse_s': round(parse_s, 2), 'rows_per_s': round(size / total_s),
+        'stock_adjustments': adjustments, 'error_report_rows': report_rows,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(SHEET_SIZES), help='Sheet sizes (rows) to test')
+    parser.add_argument('--formats', nargs='+', default=['csv', 'xlsx'], choices=['csv', 'xlsx'], help='Upload formats to test')
+    args = parser.parse_args()
+    print(json.dumps([run_size(size, file_format) for size in args.sizes for file_format in args.formats], indent=2))
@@ -0,0 +1,88 @@
+# benchmarks/bench_catalogue_snapshot.py
+"""
+Catalogue snapshot benchmark: payload size and build time for the tills'
+product snapshot (inventory.product_snapshot_api) at 100k products.
+
+Sizes compare the columnar payload with the same products as a list of
+per-product objects (the shape the search/scan APIs return), both as plain
+JSON and gzip-compressed. Timings cover:
+
+- build_ms: reading and encoding a full snapshot (a new catalogue version);
+- full request cold/cached: GET of the full snapshot, before and after the
+  encoded body is cached for the version;
+- not modified: GET with the till's current ETag (304);
+- delta: GET ?since=<version> after `--changed` products were edited.
+
+    python -m benchmarks.bench_catalogue_snapshot [--products 100000] [--changed 100]
+"""
+import argparse
+import gzip
+import json
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, update
+
+from benchmarks.common import make_app, remove_db, seed_products, login, percentile
+
+URL = '/inventory/api/products/snapshot'
+
+
+def timed_ms(fn, repeat=5):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter(); fn(); samples.append((time.perf_counter() - start) * 1000)
+    return round(percentile(samples, 50), 1)
+
+
+def run(products, changed):
+    from app import db
+    from app.catalogue_snapshot import build_snapshot, current_version, encode_snapshot
+    from app.models import Product
+    from app.product_index import product_search_result
+    app, db_path = make_app()
+    try:
+        with app.app_context():
+            seed_products(products)
+            # Spread the seeded rows' last edits over the past 30 days, so a delta sees only the edits made below
+            start = datetime.utcnow() - timedelta(days=30); step = timedelta(days=29) / products
+            db.session.execute(update(Product.__table__).where(Product.__table__.c.id == bindparam('pid')).values(updated_at=bindparam('ts')),
+                               [{'pid': i + 1, 'ts': start + i * step} for i in range(products)])
+            db.session.commit()
+            version = current_version()
+            build_ms = timed_ms(lambda: encode_snapshot(build_snapshot(version)))
+            payload = build_snapshot(version)
+            columnar = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+            objects = json.dumps([product_search_result(p) for p in Product.query.filter_by(is_active=True)], separators=(',', ':')).encode('utf-8')
+            sizes = {'columnar_json_bytes': len(columnar), 'columnar_gzip_bytes': len(gzip.compress(columnar, 6)),
+                     'objects_json_bytes': len(objects), 'objects_gzip_bytes': len(gzip.compress(objects, 6))}
+
+        client = login(app.test_client()); headers = {'Accept-Encoding': 'gzip'}
+        start = time.perf_counter(); response = client.get(URL, headers=headers); cold_ms = (time.perf_counter() - start) * 1000
+        etag = response.headers['ETag']
+        cached_ms = timed_ms(lambda: client.get(URL, headers=headers))
+        not_modified_ms = timed_ms(lambda: client.get(URL, headers=dict(headers, **{'If-None-Match': etag})))
+        if client.get(URL, headers={'If-None-Match': etag}).status_code != 304: raise RuntimeError('Expected 304 for the current ETag')
+
+        with app.app_context():
+            for product in Product.query.order_by(Product.id).limit(changed): product.selling_price += 1
+            db.session.commit()
+        delta_url = f'{URL}?since={version}'
+        delta = client.get(delta_url, headers=headers)
+        delta_payload = json.loads(gzip.decompress(delta.data))
+        delta_ms = timed_ms(lambda: client.get(delta_url, headers=headers))
+        return {
+            'products': products, **sizes, 'build_ms': build_ms,
+            'full_request_cold_ms': round(cold_ms, 1), 'full_request_cached_ms': cached_ms, 'not_modified_ms': not_modified_ms,
+            'changed_products': changed, 'delta_rows': delta_payload['count'], 'delta_gzip_bytes': len(delta.data), 'delta_ms': delta_ms,
+        }
+    finally:
+        remove_db(db_path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=100_000, help='Number of products to seed')
+    parser.add_argument('--changed', type=int, default=100, help='Products edited before the delta request')
+    args = parser.parse_args()
+    print(json.dumps(run(args.products, args.changed), indent=2))
@@ -0,0 +1,52 @@
+# benchmarks/bench_checkout.py
+"""
+Checkout latency benchmark for billing.process_sale.
+
+Posts carts of 1, 20, 100 and 500 lines through the real route and reports
+p50/p99 latency plus the number of SQL statements issued per checkout.
+
+    python -m benchmarks.bench_checkout [--runs 30]
+"""
+import argparse
+import json
+import random
+
+from sqlalchemy import event
+
+from benchmarks.common import make_app, remove_db, seed_products, login, time_call, summarize
+
+CART_SIZES = (1, 20, 100, 500)
+
+
+def run(runs=30, cart_sizes=CART_SIZES, catalogue_size=2000):
+    app, db_path = make_app()
+    from app import db
+    with app.app_context():
+        seed_products(catalogue_size)
+        product_ids = list(range(1, catalogue_size + 1))
+        statements = []
+        event.listen(db.engine, 'before_cursor_execute', lambda *args: statements.append(1))
+
+    client = login(app.test_client())
+    rng = random.Random(42)
+    results = {}
+    for size in cart_sizes:
+        latencies = []; statement_counts = []
+        for _ in range(runs):
+            cart = [{'product_id': pid, 'quantity': 1, 'price_at_sale': 10.0, 'discount_applied': 0.0}
+                    for pid in rng.sample(product_ids, size)]
+            statements.clear()
+            elapsed, response = time_call(client.post, '/billing/billing/process', json={'items': cart, 'payment_method': 'Cash'})
+            if response.status_code != 200:
+                raise RuntimeError(f'Checkout failed ({response.status_code}): {response.get_data(as_text=True)[:200]}')
+            latencies.append(elapsed); statement_counts.append(len(statements))
+        results[f'{size}_lines'] = dict(summarize(latencies), sql_statements=max(statement_counts))
+    remove_db(db_path)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=30, help='Checkouts per cart size')
+    args = parser.parse_args()
+    print(json.dumps(run(runs=args.runs), indent=2))
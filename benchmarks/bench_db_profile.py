@@ -0,0 +1,87 @@
+# benchmarks/bench_db_profile.py
+"""
+Concurrent checkout throughput under each SQLite database profile.
+
+N writer processes (1 to 8) act as tills posting sales through
+billing.process_sale against one shared SQLite file. Each profile gets its
+own freshly built file, since journal_mode=WAL sticks to a database file:
+
+* default: no PRAGMAs (rollback journal, synchronous=FULL, pysqlite's 5 s lock wait),
+  transactions begun by the first write;
+* production: ProductionConfig.SQLITE_PRAGMAS (WAL, synchronous=NORMAL, busy_timeout,
+  mmap, cache) and SQLITE_IMMEDIATE_WRITES.
+
+Per round it reports sales/s, the sales that failed (a 'database is locked'
+that outlasted commit_with_retry surfaces as a 500) and checkout latency.
+The PostgreSQL pool options (DB_POOL_OPTIONS) are not exercised here.
+
+    python -m benchmarks.bench_db_profile [--writers 1 2 4 8] [--sales 100] [--products 2000]
+"""
+import argparse
+import json
+import multiprocessing
+import random
+import time
+
+from benchmarks.common import make_app, open_app, remove_db, seed_products, login, percentile
+
+PROFILES = {'default': {'SQLITE_PRAGMAS': {}, 'SQLITE_IMMEDIATE_WRITES': False}, 'production': {}} # Config overrides on top of ProductionConfig
+
+
+def _writer(db_path, overrides, products, sales, seed, ready, start_event, results):
+    import logging
+    logging.getLogger('app').setLevel(logging.ERROR) # Lock waits show up as slow query/request warnings
+    app = open_app(db_path, **overrides)
+    client = login(app.test_client())
+    rng = random.Random(seed); latencies = []; failed = 0
+    ready.release(); start_event.wait()
+    for _ in range(sales):
+        items = [{'product_id': pid, 'quantity': rng.randint(1, 3), 'price_at_sale': 10.0 + ((pid - 1) % 100)}
+                 for pid in rng.sample(range(1, products + 1), rng.randint(1, 6))]
+        start = time.perf_counter()
+        response = client.post('/billing/billing/process', json={'items': items, 'payment_method': 'Cash'})
+        latencies.append((time.perf_counter() - start) * 1000)
+        if response.status_code != 200: failed += 1
+    results.put({'latencies': latencies, 'failed': failed})
+
+
+def run_round(db_path, overrides, writers, products, sales):
+    ctx = multiprocessing.get_context('spawn')
+    ready = ctx.Semaphore(0); start_event = ctx.Event(); results = ctx.Queue()
+    workers = [ctx.Process(target=_writer, args=(db_path, overrides, products, sales, seed, ready, start_event, results)) for seed in range(writers)]
+    for worker in workers: worker.start()
+    for _ in workers: ready.acquire() # every writer has imported the app and logged in before the clock starts
+    started = time.perf_counter(); start_event.set()
+    outcomes = [results.get() for _ in workers]
+    elapsed = time.perf_counter() - started
+    for worker in workers: worker.join()
+    latencies = [ms for outcome in outcomes for ms in outcome['latencies']]
+    failed = sum(outcome['failed'] for outcome in outcomes)
+    return {'writers': writers, 'sales': len(latencies), 'failed': failed, 'elapsed_s': round(elapsed, 3),
+            'sales_per_s': round((len(latencies) - failed) / elapsed, 1),
+            'p50_ms': round(percentile(latencies, 50), 1), 'p99_ms': round(percentile(latencies, 99), 1)}
+
+
+def run_profile(name, writers_levels, products, sales):
+    from app import db
+    overrides = PROFILES[name]
+    app, db_path = make_app(**overrides)
+    try:
+        with app.app_context():
+            seed_products(products)
+            journal_mode = db.session.execute(db.text('PRAGMA journal_mode')).scalar()
+            synchronous = db.session.execute(db.text('PRAGMA synchronous')).scalar()
+        rounds = [run_round(db_path, overrides, writers, products, sales) for writers in writers_levels]
+        return {'profile': name, 'journal_mode': journal_mode, 'synchronous': synchronous, 'rounds': rounds}
+    finally:
+        remove_db(db_path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--writers', type=int, nargs='+', default=[1, 2, 4, 8], help='Writer process counts to run')
+    parser.add_argument('--sales', type=int, default=100, help='Sales posted per writer and round')
+    parser.add_argument('--products', type=int, default=2000, help='Products to seed')
+    parser.add_argument('--profiles', nargs='+', choices=list(PROFILES), default=list(PROFILES))
+    args = parser.parse_args()
+    print(json.dumps([run_profile(name, args.writers, args.products, args.sales) for name in args.profiles], indent=2))
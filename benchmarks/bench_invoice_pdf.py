@@ -0,0 +1,58 @@
+# benchmarks/bench_invoice_pdf.py
+"""
+A4 invoice PDF benchmark: invoices/s for 5, 50 and 500-line invoices.
+
+Each size is rendered three ways:
+
+- single: one PDF per invoice (the /billing/invoice/pdf route);
+- batch_pdf: all invoices in one document (the day's invoices download);
+- batch_zip: a zip of one PDF per invoice.
+
+The invoices are synthetic sale dictionaries, so the numbers cover PDF
+rendering only, with no database work.
+
+    python -m benchmarks.bench_invoice_pdf [--lines 5 50 500] [--seconds 3]
+"""
+import argparse
+import json
+import time
+
+from benchmarks.common import PROJECT_ROOT # noqa: F401 (puts the project root on sys.path)
+
+LINE_COUNTS = (5, 50, 500)
+
+
+def sale_data(sale_id, lines):
+    """Invoice dictionary with `lines` items; every 7th item name is long enough to wrap."""
+    return {
+        'sale_id': sale_id, 'timestamp': '2026-10-18T10:15:00', 'subtotal': '1250.00', 'discount': '62.50', 'total': '1187.50',
+        'payment_method': 'UPI', 'customer_name': 'Sharma & Sons Traders',
+        'items': [{
+            'name': f'Bench Product {i:05d}' + (' family pack with extra long description text' if i % 7 == 0 else ''),
+            'quantity': 1 + i % 4, 'price': '12.50', 'discount_percent': '5.00', 'net_amount': '11.88',
+        } for i in range(lines)],
+    }
+
+
+def run_lines(lines, seconds):
+    from app.invoice_pdf import render_invoice_pdf, render_invoices_pdf, render_invoices_zip
+    invoices = [sale_data(i, lines) for i in range(1, 11)]
+    results = {'lines': lines}
+    for label, render in (('single', lambda batch: [render_invoice_pdf(sale) for sale in batch]),
+                          ('batch_pdf', render_invoices_pdf), ('batch_zip', render_invoices_zip)):
+        rendered = 0; start = time.perf_counter()
+        while True:
+            render(invoices); rendered += len(invoices)
+            elapsed = time.perf_counter() - start
+            if elapsed >= seconds: break
+        results[f'{label}_invoices_per_s'] = round(rendered / elapsed, 1)
+    results['pdf_kb'] = round(len(render_invoice_pdf(invoices[0]).getvalue()) / 1024, 1)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lines', type=int, nargs='+', default=list(LINE_COUNTS), help='Invoice sizes (line items) to test')
+    parser.add_argument('--seconds', type=float, default=3.0, help='Minimum time spent on each measurement')
+    args = parser.parse_args()
+    print(json.dumps([run_lines(lines, args.seconds) for lines in args.lines], indent=2))
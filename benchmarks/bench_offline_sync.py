@@ -0,0 +1,114 @@
+# benchmarks/bench_offline_sync.py
+"""
+Offline sync benchmark: ingest rate of queued sales posted to
+billing.sync_offline_sales, against posting the same sales one by one to
+billing.process_sale (what a till would do without the bulk endpoint).
+
+Each queued sale has 1-8 lines over a 2,000-product catalogue. Per batch size:
+
+- fresh: every sale is new;
+- resend: the same batches posted again (a till retrying after a lost
+  response), so every sale is reported as a duplicate;
+- conflicts: a share of the products hold too little stock, so some sales are
+  rejected per sale and the rest are applied.
+
+    python -m benchmarks.bench_offline_sync [--sales 2000] [--batch-sizes 1 50 200 500]
+"""
+import argparse
+import json
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from benchmarks.common import make_app, remove_db, seed_products, login
+
+PRODUCTS = 2000
+SYNC_URL = '/billing/billing/sync'
+PROCESS_URL = '/billing/billing/process'
+
+
+def queued_sales(count, rng):
+    start = datetime.utcnow() - timedelta(hours=6)
+    return [{
+        'client_ref': str(uuid.UUID(int=rng.getrandbits(128))), 'created_at': (start + timedelta(seconds=5 * i)).isoformat() + 'Z',
+        'payment_method': rng.choice(['Cash', 'Card', 'UPI']), 'notes': None,
+        'items': [{'product_id': rng.randint(1, PRODUCTS), 'quantity': rng.randint(1, 3), 'price_at_sale': 10.0 + rng.randint(0, 99),
+                   'discount_applied': 0.0} for _ in range(rng.randint(1, 8))],
+    } for i in range(count)]
+
+
+def starve_stock(share, rng):
+    """Leaves `share` of the products with a single unit, so most sales of them conflict."""
+    from app import db
+    from app.models import Product
+    starved = rng.sample(range(1, PRODUCTS + 1), int(PRODUCTS * share))
+    db.session.query(Product).filter(Product.id.in_(starved)).update({Product.stock_quantity: 1}, synchronize_session=False)
+    db.session.commit()
+
+
+def post_batches(client, sales, batch_size):
+    """Posts the sales in batches; returns (seconds, {status: count})."""
+    counts = {}; start = time.perf_counter()
+    for offset in range(0, len(sales), batch_size):
+        response = client.post(SYNC_URL, json={'sales': sales[offset:offset + batch_size]})
+        if response.status_code != 200: raise RuntimeError(f'Sync returned {response.status_code}: {response.get_data(as_text=True)[:200]}')
+        for result in response.get_json()['results']: counts[result['status']] = counts.get(result['status'], 0) + 1
+    return time.perf_counter() - start, counts
+
+
+def post_one_by_one(client, sales):
+    start = time.perf_counter()
+    for sale in sales:
+        if client.post(PROCESS_URL, json=sale).status_code != 200: raise RuntimeError('process_sale failed')
+    return time.perf_counter() - start
+
+
+def fresh_client(rng, conflict_share=0.0):
+    app, db_path = make_app()
+    with app.app_context():
+        seed_products(PRODUCTS)
+        if conflict_share: starve_stock(conflict_share, rng)
+    return app, db_path, login(app.test_client())
+
+
+def row(mode, batch_size, sales, seconds, counts=None):
+    result = {'mode': mode, 'batch_size': batch_size, 'sales': sales, 'seconds': round(seconds, 3), 'sales_per_s': round(sales / seconds, 1)}
+    if counts is not None: result['results'] = counts
+    return result
+
+
+def run(sales_count, batch_sizes):
+    import logging
+    logging.disable(logging.INFO) # process_sale logs every step; keep the timing about the database work
+    rng = random.Random(14); results = []
+    sales = queued_sales(sales_count, rng)
+    app, db_path, client = fresh_client(rng)
+    try:
+        results.append(row('process_sale, one request per sale', 1, sales_count, post_one_by_one(client, sales)))
+    finally:
+        remove_db(db_path)
+    for batch_size in batch_sizes:
+        app, db_path, client = fresh_client(rng)
+        try:
+            seconds, counts = post_batches(client, sales, batch_size)
+            results.append(row('sync, fresh', batch_size, sales_count, seconds, counts))
+            seconds, counts = post_batches(client, sales, batch_size)
+            results.append(row('sync, resend (all duplicates)', batch_size, sales_count, seconds, counts))
+        finally:
+            remove_db(db_path)
+        app, db_path, client = fresh_client(rng, conflict_share=0.05)
+        try:
+            seconds, counts = post_batches(client, sales, batch_size)
+            results.append(row('sync, 5% of products short', batch_size, sales_count, seconds, counts))
+        finally:
+            remove_db(db_path)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sales', type=int, default=2000, help='Number of queued sales')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 50, 200, 500], help='Sales per sync request')
+    args = parser.parse_args()
+    print(json.dumps(run(args.sales, args.batch_sizes), indent=2))
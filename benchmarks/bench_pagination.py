@@ -0,0 +1,76 @@
+# benchmarks/bench_pagination.py
+"""
+Sales history pagination benchmark: OFFSET vs keyset at increasing depth.
+
+Seeds a sales table (300k rows by default), then times:
+
+- offset: the old .paginate(page=N) query pair (COUNT(*) plus LIMIT/OFFSET);
+- keyset: the seek query that continues from the sort key of the last row of
+  page N-1 (the total is cached, so no COUNT), and the full
+  GET /billing/sales?after=<cursor>&page=N request around it.
+
+    python -m benchmarks.bench_pagination [--sales 300000] [--pages 1 100 2000 10000]
+"""
+import argparse
+import json
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import tuple_
+
+from benchmarks.common import make_app, remove_db, login, percentile
+
+PER_PAGE = 15
+
+
+def seed_sales(count):
+    from app import db
+    from app.models import Sale
+    start = datetime(2024, 1, 1)
+    for chunk in range(0, count, 20000):
+        db.session.execute(Sale.__table__.insert(), [{
+            'sale_timestamp': start + timedelta(seconds=37 * i), 'total_amount': 100.0, 'discount_total': 0.0,
+            'final_amount': 100.0, 'payment_method': 'Cash', 'user_id': 1,
+        } for i in range(chunk, min(chunk + 20000, count))])
+    db.session.commit()
+
+
+def timed(fn, repeat=5):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter(); fn(); samples.append((time.perf_counter() - start) * 1000)
+    return round(percentile(samples, 50), 2)
+
+
+def run(sales, pages):
+    from app import db
+    from app.models import Sale
+    from app.pagination import encode_cursor
+    app, db_path = make_app()
+    try:
+        with app.app_context():
+            seed_sales(sales)
+        client = login(app.test_client()); results = []
+        for page in pages:
+            with app.app_context():
+                offset_ms = timed(lambda: Sale.query.order_by(Sale.sale_timestamp.desc()).paginate(page=page, per_page=PER_PAGE, error_out=False).items)
+                url = '/billing/sales'; seek = Sale.query
+                if page > 1:
+                    last = db.session.query(Sale.sale_timestamp, Sale.id).order_by(Sale.sale_timestamp.desc(), Sale.id.desc()).offset((page - 1) * PER_PAGE - 1).first()
+                    url = f'/billing/sales?after={encode_cursor(list(last))}&page={page}'
+                    seek = seek.filter(tuple_(Sale.sale_timestamp, Sale.id) < tuple_(*last))
+                keyset_ms = timed(lambda: seek.order_by(Sale.sale_timestamp.desc(), Sale.id.desc()).limit(PER_PAGE + 1).all())
+            client.get(url) # Fills the cached total
+            request_ms = timed(lambda: client.get(url))
+            results.append({'sales': sales, 'page': page, 'offset_query_ms': offset_ms, 'keyset_query_ms': keyset_ms, 'keyset_request_ms': request_ms})
+        return results
+    finally:
+        remove_db(db_path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sales', type=int, default=300_000, help='Number of sales to seed')
+    parser.add_argument('--pages', type=int, nargs='+', default=[1, 100, 2000, 10000], help='Page numbers to time')
+    args = parser.parse_args()
+    print(json.dumps(run(args.sales, args.pages), indent=2))
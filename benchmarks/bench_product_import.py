@@ -0,0 +1,104 @@
+# benchmarks/bench_product_import.py
+"""
+Bulk product catalogue import throughput.
+
+Generates a catalogue file of --rows products (CSV, or .xlsx with --excel) in
+which a share of rows is invalid (missing or bad prices, bad dates), repeats a
+barcode or SKU from earlier in the file, or collides with one of --existing
+products already in the database, and a share has no barcode (auto-generated).
+The schema is built by the migrations, so the search triggers fire as they do
+in production. The script times read_product_chunks + import_products and
+checks that every good row was created and every bad one rejected.
+
+    python -m benchmarks.bench_product_import [--rows 100000] [--existing 10000] [--excel] [--chunk-size 2000] [--target-s 60]
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.common import make_app, remove_db, seed_products
+
+COLUMNS = ['Name', 'Barcode', 'SKU', 'Category', 'Brand', 'PurchasePrice', 'SellingPrice', 'StockQuantity', 'LowStockThreshold', 'ExpiryDate']
+
+
+def catalogue_rows(rows, existing):
+    """Yields (row values, expected to be rejected) for the synthetic catalogue."""
+    for i in range(rows):
+        row = [f'Imported Product {i:07d}', f'IMP{i:09d}', f'ISKU-{i:07d}', f'Category {i % 50}', f'Brand {i % 200}',
+               f'{5 + i % 100}.50', f'{9 + i % 100}.99', str(i % 500), '10', f'2027-{1 + i % 12:02d}-{1 + i % 28:02d}' if i % 3 == 0 else '']
+        bad = True
+        if i % 100 == 1: row[5] = ''                               # Missing purchase price
+        elif i % 100 == 2: row[6] = 'n/a'                          # Invalid selling price
+        elif i % 100 == 3: row[9] = '31/12/2027'                   # Wrong date format
+        elif i % 100 == 4 and i >= 100: row[1] = f'IMP{i - 94:09d}'  # Barcode of an imported row earlier in the file
+        elif i % 100 == 5 and i >= 100: row[2] = f'ISKU-{i - 95:07d}' # SKU of an imported row earlier in the file
+        elif i % 100 == 6 and existing: row[1] = f'BEN{i // 100 % existing:08d}' # Barcode of an existing product
+        else: bad = False
+        if not bad and i % 10 == 7: row[1] = '' # Auto-generated barcode
+        yield row, bad
+
+
+def write_catalogue(path, rows, existing, excel):
+    expected_rejects = 0
+    if excel:
+        from openpyxl import Workbook
+        workbook = Workbook(write_only=True); sheet = workbook.create_sheet()
+        sheet.append(COLUMNS)
+        for row, bad in catalogue_rows(rows, existing): sheet.append(row); expected_rejects += bad
+        workbook.save(path)
+    else:
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f); writer.writerow(COLUMNS)
+            for row, bad in catalogue_rows(rows, existing): writer.writerow(row); expected_rejects += bad
+    return expected_rejects
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100000, help='Rows in the catalogue file')
+    parser.add_argument('--existing', type=int, default=10000, help='Products already in the database')
+    parser.add_argument('--excel', action='store_true', help='Import an .xlsx file instead of a CSV')
+    parser.add_argument('--chunk-size', type=int, default=2000, help='PRODUCT_IMPORT_CHUNK_SIZE')
+    parser.add_argument('--target-s', type=float, default=60.0, help='Fail if the import takes longer than this')
+    args = parser.parse_args()
+
+    fd, file_path = tempfile.mkstemp(prefix='a3mart_catalogue_', suffix='.xlsx' if args.excel else '.csv'); os.close(fd)
+    expected_rejects = write_catalogue(file_path, args.rows, args.existing, args.excel)
+    app, db_path = make_app(migrate=True, PRODUCT_IMPORT_CHUNK_SIZE=args.chunk_size, UPLOAD_REPORT_DIR=tempfile.gettempdir())
+    from app import db
+    from app.inventory_kpis import get_totals, reconcile
+    from app.models import Product
+    from app.product_import import import_products, read_product_chunks
+    from app.stock_import import report_path
+    with app.app_context():
+        seed_products(args.existing, stock_quantity=100)
+        reconcile()
+        started = time.perf_counter()
+        result = import_products(read_product_chunks(file_path, file_path))
+        elapsed = time.perf_counter() - started
+        products = db.session.query(Product).count()
+        active_products = get_totals()['active_products']
+        _, drift = reconcile()
+        report = report_path(result.report_name) if result.report_name else None
+    if report: os.remove(report)
+    os.remove(file_path); remove_db(db_path)
+    outcome = {
+        'rows': args.rows, 'format': 'xlsx' if args.excel else 'csv', 'existing_products': args.existing, 'chunk_size': args.chunk_size,
+        'elapsed_s': round(elapsed, 3), 'rows_per_s': round(args.rows / elapsed, 1) if elapsed else 0.0,
+        'created': result.created, 'rejected': result.skipped, 'expected_rejected': expected_rejects,
+        'products_after': products, 'kpi_active_products': active_products, 'kpi_drift': drift,
+        'within_target': elapsed <= args.target_s, 'target_s': args.target_s,
+    }
+    print(json.dumps(outcome, indent=2, default=str))
+    if result.skipped != expected_rejects or result.created != args.rows - expected_rejects or products != args.existing + result.created or drift:
+        print('FAILED: the import created or rejected the wrong rows', file=sys.stderr); sys.exit(1)
+    if not outcome['within_target']:
+        print(f'FAILED: import took longer than {args.target_s}s', file=sys.stderr); sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
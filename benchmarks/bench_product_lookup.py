@@ -0,0 +1,70 @@
+# benchmarks/bench_product_lookup.py
+"""
+Barcode/SKU lookup benchmark: in-process index vs. the `ilike` search query.
+
+For catalogues of 10k, 100k and 1M products, reports the index build time and
+memory growth, the raw per-lookup cost of the index, and p50/p99 latency of
+the scan endpoint (/inventory/api/products/scan) next to the previous
+substring search endpoint (/inventory/api/products/search) for the same codes.
+
+    python -m benchmarks.bench_product_lookup [--sizes 10000 100000] [--runs 200]
+"""
+import argparse
+import json
+import random
+import time
+import tracemalloc
+
+from benchmarks.common import make_app, remove_db, seed_products, login, time_call, summarize
+
+CATALOGUE_SIZES = (10_000, 100_000, 1_000_000)
+
+
+def _endpoint_latencies(client, url, codes):
+    latencies = []
+    for code in codes:
+        elapsed, response = time_call(client.get, url, query_string={'code': code, 'q': code})
+        if response.status_code != 200:
+            raise RuntimeError(f'{url} failed ({response.status_code}) for {code}')
+        latencies.append(elapsed)
+    return summarize(latencies)
+
+
+def run_size(size, runs=200):
+    app, db_path = make_app()
+    from app.product_index import get_product_index
+    with app.app_context():
+        seed_products(size)
+        index = get_product_index()
+        build_ms, _ = time_call(index.build)
+        tracemalloc.start() # Second build, traced separately since tracing slows allocation down
+        index.build()
+        index_bytes = tracemalloc.get_traced_memory()[0]; tracemalloc.stop()
+
+        rng = random.Random(42)
+        codes = [f'BEN{rng.randrange(size):08d}' if i % 2 else f'SKU-{rng.randrange(size):07d}' for i in range(runs)]
+        start = time.perf_counter()
+        for code in codes * 50:
+            index.lookup(code)
+        lookup_us = (time.perf_counter() - start) * 1e6 / (len(codes) * 50)
+
+    client = login(app.test_client())
+    with app.app_context(): # Index is already built; only request handling is measured
+        result = {
+            'products': size,
+            'index_build_ms': round(build_ms, 1),
+            'index_memory_mb': round(index_bytes / 2**20, 1),
+            'index_lookup_us': round(lookup_us, 3),
+            'scan_endpoint': _endpoint_latencies(client, '/inventory/api/products/scan', codes),
+            'ilike_search_endpoint': _endpoint_latencies(client, '/inventory/api/products/search', codes[:max(10, runs // 10)]),
+        }
+    remove_db(db_path)
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(CATALOGUE_SIZES), help='Catalogue sizes to test')
+    parser.add_argument('--runs', type=int, default=200, help='Lookups per catalogue size')
+    args = parser.parse_args()
+    print(json.dumps([run_size(size, runs=args.runs) for size in args.sizes], indent=2))
@@ -0,0 +1,140 @@
+# benchmarks/bench_reorder.py
+"""
+Reorder suggestion benchmark: --products active SKUs x --days days of sales.
+
+The daily product rollup is seeded with a synthetic history in which a
+--density share of product-days has sales (fast, slow and new products, some
+returns), and stock levels are spread around the reorder points. The script
+then times, for the whole catalogue:
+
+- load: the reads into NumPy arrays (active products; grouped daily rollup
+  rows of the velocity window; grouped rollup rows, monthly for whole months,
+  of the rest of the history);
+- plan: the vectorized pass computing velocity, safety stock, days of cover
+  and suggested quantities;
+- draft: GET /inventory/purchases/add?reorder=1, the purchase form with the
+  REORDER_MAX_DRAFT_ITEMS most urgent products prefilled.
+
+A per-product Python reference implementation is run on a sample of products
+to check the vectorized results.
+
+    python -m benchmarks.bench_reorder [--products 100000] [--days 365] [--density 0.08] [--sample 2000] [--target-s 5]
+"""
+import argparse
+import json
+import math
+import sys
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+from benchmarks.common import login, make_app, remove_db, seed_products
+
+
+def seed_history(products, days, density, as_of, seed=7):
+    """
+    Inserts the synthetic daily_product_rollup rows through the DBAPI (executemany of tuples) and
+    the monthly_product_rollup rows summing them. Returns the daily row count.
+    """
+    from app import db
+    rng = np.random.default_rng(seed)
+    rate = rng.gamma(0.6, 3.0, products) # Mean units per selling day, skewed: a few fast movers, many slow ones
+    share = np.clip(rng.gamma(1.0, density, products), 0.002, 1.0) # Share of days each product sells on
+    launched = np.where(rng.random(products) < 0.05, rng.integers(1, 60, products), days) # 5% of products are new
+    connection = db.session.connection().connection.driver_connection
+    sql = ('INSERT INTO daily_product_rollup (sale_date, product_id, category, quantity_sold, gross_revenue, discount_total, net_revenue, quantity_returned, refunded_amount) '
+           'VALUES (?, ?, NULL, ?, 0, 0, 0, ?, 0)')
+    rows = 0
+    for day in range(days):
+        selling = np.flatnonzero((rng.random(products) < share) & (day < launched))
+        sold = rng.poisson(rate[selling]) + 1
+        returned = np.where(rng.random(len(selling)) < 0.01, 1, 0)
+        sale_date = (as_of - timedelta(days=day)).isoformat()
+        connection.executemany(sql, zip([sale_date] * len(selling), (selling + 1).tolist(), sold.tolist(), returned.tolist()))
+        rows += len(selling)
+    connection.execute("INSERT INTO monthly_product_rollup (month, product_id, category, quantity_sold, gross_revenue, discount_total, net_revenue, quantity_returned, refunded_amount) "
+                       "SELECT date(sale_date, 'start of month'), product_id, NULL, SUM(quantity_sold), 0, 0, 0, SUM(quantity_returned), 0 "
+                       "FROM daily_product_rollup GROUP BY date(sale_date, 'start of month'), product_id")
+    connection.commit()
+    return rows
+
+
+def spread_stock(products, seed=11):
+    """Sets stock levels from 0 to 300, so some products are below their reorder point and some far above."""
+    from app import db
+    rng = np.random.default_rng(seed)
+    connection = db.session.connection().connection.driver_connection
+    connection.executemany('UPDATE products SET stock_quantity = ? WHERE id = ?', zip(rng.integers(0, 300, products).tolist(), range(1, products + 1)))
+    connection.commit()
+
+
+def reference_plan(stock, threshold, history, as_of, history_days, velocity_days, lead_time_days, cover_days, service_z):
+    """Suggested quantity of one product computed day by day in Python (history: {date: net units})."""
+    from app.reorder import MIN_AVERAGING_DAYS
+    daily = [history.get(as_of - timedelta(days=ago), 0) for ago in range(history_days)]
+    window = [max(units, 0) for units in daily[:velocity_days]]
+    window_units = sum(window); earlier_units = max(sum(daily[velocity_days:]), 0)
+    window_days = velocity_days
+    if window_units and not earlier_units: # New product: averaged since its first sale
+        window_days = min(max(max(ago for ago, units in enumerate(window) if units > 0) + 1, min(MIN_AVERAGING_DAYS, velocity_days)), velocity_days)
+    if window_units:
+        velocity = window_units / window_days
+        std = math.sqrt(max(sum(units * units for units in window) / window_days - velocity ** 2, 0))
+    else:
+        velocity = earlier_units / max(history_days - velocity_days, 1); std = 0.0
+    safety = service_z * std * math.sqrt(lead_time_days)
+    low_stock = stock <= threshold
+    if not (low_stock or (velocity > 0 and stock <= velocity * lead_time_days + safety)): return 0
+    return int(max(math.ceil(velocity * (lead_time_days + cover_days) + safety - stock), max(threshold, 1) if low_stock else 1))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=100000, help='Active products')
+    parser.add_argument('--days', type=int, default=365, help='Days of sales history (REORDER_HISTORY_DAYS)')
+    parser.add_argument('--density', type=float, default=0.08, help='Average share of product-days with sales')
+    parser.add_argument('--sample', type=int, default=2000, help='Products checked against the Python reference')
+    parser.add_argument('--target-s', type=float, default=5.0, help='Fail if load + plan takes longer than this')
+    args = parser.parse_args()
+
+    app, db_path = make_app(REORDER_HISTORY_DAYS=args.days)
+    from app import db
+    from app.reorder import _settings, load_active_products, load_sales, plan_reorders
+    as_of = date.today()
+    with app.app_context():
+        seed_products(args.products, stock_quantity=0); spread_stock(args.products)
+        started = time.perf_counter(); rollup_rows = seed_history(args.products, args.days, args.density, as_of); seed_s = time.perf_counter() - started
+        settings = _settings({})
+        started = time.perf_counter()
+        products = load_active_products(); sales = load_sales(products[0], as_of, settings['history_days'], settings['velocity_days'])
+        load_s = time.perf_counter() - started
+        started = time.perf_counter(); plan = plan_reorders(*products, *sales, **settings); plan_s = time.perf_counter() - started
+        sample = np.random.default_rng(3).choice(args.products, min(args.sample, args.products), replace=False)
+        history = {}
+        for product_id, sale_date, units in db.session.execute(db.text(
+                'SELECT product_id, sale_date, quantity_sold - quantity_returned FROM daily_product_rollup WHERE product_id IN (%s)' % ','.join(str(i + 1) for i in sample))):
+            history.setdefault(product_id, {})[date.fromisoformat(sale_date)] = units
+        mismatches = [int(plan.product_ids[i]) for i in sample if reference_plan(
+            plan.stock[i], plan.low_stock_threshold[i], history.get(int(plan.product_ids[i]), {}), as_of, **settings) != plan.suggested_quantity[i]]
+        db.session.rollback()
+    client = login(app.test_client())
+    started = time.perf_counter(); response = client.get('/inventory/purchases/add?reorder=1'); draft_s = time.perf_counter() - started
+    remove_db(db_path)
+    outcome = {
+        'products': args.products, 'days': args.days, 'rollup_rows': rollup_rows, 'seed_s': round(seed_s, 1),
+        'load_s': round(load_s, 3), 'plan_s': round(plan_s, 3), 'total_s': round(load_s + plan_s, 3),
+        'draft_request_s': round(draft_s, 3), 'draft_status': response.status_code,
+        'products_to_order': int((plan.suggested_quantity > 0).sum()), 'units_to_order': int(plan.suggested_quantity.sum()),
+        'checked_against_reference': len(sample), 'mismatches': mismatches[:20],
+        'within_target': load_s + plan_s <= args.target_s, 'target_s': args.target_s,
+    }
+    print(json.dumps(outcome, indent=2))
+    if mismatches or response.status_code != 200:
+        print('FAILED: suggestions differ from the reference or the draft did not render', file=sys.stderr); sys.exit(1)
+    if not outcome['within_target']:
+        print(f'FAILED: load + plan took longer than {args.target_s}s', file=sys.stderr); sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
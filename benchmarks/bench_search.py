@@ -0,0 +1,94 @@
+# benchmarks/bench_search.py
+"""
+Typeahead search benchmark on a 200k-product / 20k-customer catalogue.
+
+Builds the schema through the migrations (so the SQLite FTS5 tables exist),
+then reports p50/p99 latency of /inventory/api/products/search and
+/customers/api/customers/search per query type for each available backend,
+next to the previous leading-wildcard `ilike` query.
+
+    python -m benchmarks.bench_search [--products 200000] [--runs 100]
+"""
+import argparse
+import json
+import random
+
+from sqlalchemy import or_
+
+from benchmarks.common import make_app, remove_db, seed_products, login, time_call, summarize
+
+WORDS = ('basmati', 'rice', 'atta', 'sugar', 'salt', 'tea', 'coffee', 'masala', 'ghee', 'oil', 'soap', 'shampoo',
+         'biscuit', 'noodles', 'dal', 'chana', 'toor', 'moong', 'jeera', 'haldi', 'chilli', 'paneer', 'butter', 'milk',
+         'juice', 'detergent', 'toothpaste', 'namkeen', 'chips', 'honey', 'jam', 'ketchup', 'pickle', 'papad', 'poha')
+BRANDS = ('Tata', 'Amul', 'Aashirvaad', 'Fortune', 'Britannia', 'Parle', 'Haldiram', 'Dabur', 'Patanjali', 'Nestle')
+
+
+def _product_name(i):
+    rng = random.Random(i)
+    return f"{rng.choice(BRANDS)} {rng.choice(WORDS).title()} {rng.choice(WORDS).title()} {1 + i % 997}g"
+
+
+def _seed_customers(count):
+    from app import db
+    from app.models import Customer
+    rng = random.Random(7)
+    db.session.execute(Customer.__table__.insert(), [{
+        'name': f"{rng.choice(('Ravi', 'Anita', 'Suresh', 'Priya', 'Imran', 'Kavya'))} {rng.choice(('Kumar', 'Shah', 'Rao', 'Khan', 'Iyer'))} {i}",
+        'phone_number': f'9{i:09d}', 'email': f'customer{i}@example.com'} for i in range(count)])
+    db.session.commit()
+
+
+def _queries(products, rng, runs):
+    return {
+        'exact_barcode': [f'BEN{rng.randrange(products):08d}' for _ in range(runs)],
+        'name_prefix_2ch': [rng.choice(BRANDS)[:2].lower() for _ in range(runs)],
+        'name_prefix': [f'{rng.choice(BRANDS)} {rng.choice(WORDS)[:3]}'.lower() for _ in range(runs)],
+        'substring_common': [rng.choice(WORDS)[1:5] for _ in range(runs)],
+        'substring_rare': [f'{rng.choice(WORDS)} {rng.randrange(1, 998)}g'[-9:] for _ in range(runs)],
+        'no_match': [f'zq{rng.randrange(10**6)}x' for _ in range(runs)],
+    }
+
+
+def _legacy_product_search(query, limit=10):
+    from app.models import Product
+    term = f'%{query}%'
+    return Product.query.filter(Product.is_active == True, or_(Product.name.ilike(term), Product.barcode.ilike(term),
+                                                              Product.sku.ilike(term))).limit(limit).all()
+
+
+def run(products=200_000, customers=20_000, runs=100):
+    app, db_path = make_app(migrate=True)
+    from app import search_index
+    with app.app_context():
+        seed_products(products, name_for=_product_name)
+        _seed_customers(customers)
+    client = login(app.test_client())
+    queries = _queries(products, random.Random(42), runs)
+    customer_queries = {'phone_exact': [f'9{i:09d}' for i in range(runs)], 'name_prefix': ['ravi'] * runs,
+                        'phone_substring': [f'{i:05d}' for i in range(runs)]}
+    results = {}
+    with app.app_context():
+        for backend_name in ('sqlite_fts', 'python'):
+            backend = search_index.BACKENDS[backend_name]()
+            if backend_name == 'python': # Build outside the measured requests
+                build_ms, _ = time_call(lambda: [backend.search(kind, 'warm') for kind in search_index.SEARCH_SPECS])
+                results['python_index_build_ms'] = round(build_ms, 1)
+            app.extensions['search_backend'] = backend
+            results[backend_name] = {
+                'products': {name: summarize([time_call(client.get, '/inventory/api/products/search', query_string={'q': q})[0] for q in qs])
+                             for name, qs in queries.items()},
+                'customers': {name: summarize([time_call(client.get, '/customers/api/customers/search', query_string={'q': q})[0] for q in qs])
+                              for name, qs in customer_queries.items()},
+            }
+        results['legacy_ilike_query'] = {name: summarize([time_call(_legacy_product_search, q)[0] for q in qs[:max(5, runs // 10)]])
+                                         for name, qs in queries.items()}
+    remove_db(db_path)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=200_000, help='Catalogue size')
+    parser.add_argument('--runs', type=int, default=100, help='Requests per query type')
+    args = parser.parse_args()
+    print(json.dumps(run(products=args.products, runs=args.runs), indent=2))
@@ -0,0 +1,55 @@
+# benchmarks/bench_sticker_pdf.py
+"""
+Barcode sticker sheet benchmark.
+
+Builds sheets of N stickers, either N copies of one barcode or N distinct
+barcodes, through generate_barcode_sticker_pdf. Three renderers are timed:
+
+- raster_cold: PNGs rendered with an empty barcode image store;
+- raster_warm: the same sheet again, with every PNG already in the store;
+- vector: the bars are drawn by ReportLab, with no images.
+
+Each run reports the time, stickers/s, the number of PNG renders and the PDF size.
+
+    python -m benchmarks.bench_sticker_pdf [--stickers 500 2000]
+"""
+import argparse
+import json
+import time
+from types import SimpleNamespace
+
+from benchmarks.common import make_app, remove_db
+
+
+def sticker_items(count, distinct):
+    """Sticker rows as the sticker route builds them (objects with name and barcode)."""
+    if not distinct: return [SimpleNamespace(name='Bench Product 0000000', barcode='BEN00000000')] * count
+    return [SimpleNamespace(name=f'Bench Product {i:07d}', barcode=f'BEN{i:08d}') for i in range(count)]
+
+
+def run_case(app, count, distinct):
+    from app.barcode_images import BarcodeImageStore
+    from app.utils import generate_barcode_sticker_pdf
+    items = sticker_items(count, distinct); results = []
+    with app.test_request_context():
+        app.extensions['barcode_images'] = store = BarcodeImageStore(max_entries=max(count, 1))
+        for label, renderer in (('raster_cold', 'raster'), ('raster_warm', 'raster'), ('vector', 'vector')):
+            renders = store.renders
+            start = time.perf_counter(); pdf = generate_barcode_sticker_pdf(items, renderer=renderer); elapsed = time.perf_counter() - start
+            results.append({
+                'stickers': count, 'barcodes': 'distinct' if distinct else 'same', 'renderer': label,
+                'seconds': round(elapsed, 3), 'stickers_per_s': round(count / elapsed), 'png_renders': store.renders - renders,
+                'pdf_kb': round(len(pdf.getvalue()) / 1024),
+            })
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stickers', type=int, nargs='+', default=[500], help='Sticker counts to test')
+    args = parser.parse_args()
+    app, db_path = make_app()
+    try:
+        print(json.dumps([row for count in args.stickers for distinct in (False, True) for row in run_case(app, count, distinct)], indent=2))
+    finally:
+        remove_db(db_path)
@@ -0,0 +1,110 @@
+# benchmarks/bench_stock_contention.py
+"""
+Multi-process stock contention stress test.
+
+N worker processes (1 to 16) act as tills selling a handful of hot SKUs
+through billing.process_sale against one shared database. Demand is sized to
+exceed supply, so every round sells products out. After each round the
+script checks the stock ledger invariants and exits non-zero if any fails:
+
+* no product ends below zero (no oversell),
+* initial stock - final stock == units recorded in sale_items (no lost update),
+* units recorded == units the tills were told they sold.
+
+It also reports checkout throughput at each concurrency level.
+
+    python -m benchmarks.bench_stock_contention [--sellers 1 2 4 8 16] [--checkouts 40]
+"""
+import argparse
+import json
+import multiprocessing
+import random
+import sys
+import time
+
+from benchmarks.common import make_app, open_app, remove_db, login
+
+HOT_PRODUCTS = 5
+
+
+def _seller(db_path, checkouts, seed, start_event, results):
+    app = open_app(db_path)
+    client = login(app.test_client())
+    rng = random.Random(seed)
+    sold_units = 0; accepted = 0; rejected = 0; errors = 0
+    start_event.wait()
+    for _ in range(checkouts):
+        product_id = rng.randint(1, HOT_PRODUCTS); quantity = rng.randint(1, 3)
+        response = client.post('/billing/billing/process', json={
+            'items': [{'product_id': product_id, 'quantity': quantity, 'price_at_sale': 10.0}], 'payment_method': 'Cash'})
+        if response.status_code == 200: accepted += 1; sold_units += quantity
+        elif response.status_code == 400: rejected += 1
+        else: errors += 1
+    results.put({'sold_units': sold_units, 'accepted': accepted, 'rejected': rejected, 'errors': errors})
+
+
+def run_round(db_path, sellers, checkouts):
+    from app import db
+    from app.models import Product, SaleItem
+    app = open_app(db_path)
+    # Average demand is 2 units per checkout; stock covers about half of it
+    initial_stock = max(1, (sellers * checkouts * 2) // (2 * HOT_PRODUCTS))
+    with app.app_context():
+        db.session.query(SaleItem).delete()
+        db.session.query(Product).update({Product.stock_quantity: initial_stock})
+        db.session.commit()
+
+    ctx = multiprocessing.get_context('spawn')
+    start_event = ctx.Event(); results = ctx.Queue()
+    workers = [ctx.Process(target=_seller, args=(db_path, checkouts, seed, start_event, results)) for seed in range(sellers)]
+    for worker in workers: worker.start()
+    time.sleep(1.0) # let every worker import the app and log in before the clock starts
+    started = time.perf_counter(); start_event.set()
+    outcomes = [results.get() for _ in workers]
+    elapsed = time.perf_counter() - started
+    for worker in workers: worker.join()
+
+    with app.app_context():
+        final_levels = dict(db.session.query(Product.id, Product.stock_quantity).all())
+        recorded_units = db.session.query(db.func.coalesce(db.func.sum(SaleItem.quantity), 0)).scalar()
+    reported_units = sum(o['sold_units'] for o in outcomes)
+    drained_units = sum(initial_stock - level for level in final_levels.values())
+    processed = sum(o['accepted'] + o['rejected'] for o in outcomes)
+    return {
+        'sellers': sellers,
+        'checkouts': sellers * checkouts,
+        'accepted': sum(o['accepted'] for o in outcomes),
+        'rejected_out_of_stock': sum(o['rejected'] for o in outcomes),
+        'errors': sum(o['errors'] for o in outcomes),
+        'elapsed_s': round(elapsed, 3),
+        'checkouts_per_s': round(processed / elapsed, 1) if elapsed else 0.0,
+        'min_final_stock': min(final_levels.values()),
+        'no_oversell': min(final_levels.values()) >= 0,
+        'no_lost_updates': drained_units == recorded_units == reported_units,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sellers', type=int, nargs='+', default=[1, 2, 4, 8, 16], help='Concurrency levels to run')
+    parser.add_argument('--checkouts', type=int, default=40, help='Checkouts attempted per seller')
+    args = parser.parse_args()
+
+    from app import db
+    from app.models import Product
+    app, db_path = make_app()
+    with app.app_context():
+        for i in range(1, HOT_PRODUCTS + 1):
+            db.session.add(Product(name=f'Hot SKU {i}', barcode=f'HOT{i:05d}', selling_price=10.0, purchase_price=5.0, stock_quantity=0))
+        db.session.commit()
+
+    rounds = [run_round(db_path, sellers, args.checkouts) for sellers in args.sellers]
+    remove_db(db_path)
+    print(json.dumps(rounds, indent=2))
+    if not all(r['no_oversell'] and r['no_lost_updates'] for r in rounds):
+        print('FAILED: stock ledger invariant violated', file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+# benchmarks/bench_supplier_invoice.py
+"""
+Supplier invoice import benchmark: deliveries of 10 to 5,000 lines.
+
+For each size a synthetic invoice (SupplierCode, Quantity, UnitCost, Barcode)
+is posted to /inventory/purchases/import three ways:
+
+- first delivery: no supplier codes are mapped yet, so every line is matched
+  by barcode and its mapping saved;
+- mapped: the same supplier's next invoice, resolved through the mapping table
+  (with the moving-average purchase price update);
+- manual cart: the same lines posted as JSON to /inventory/purchases/add, the
+  hand-built cart path (one product lookup and one ORM insert per line).
+
+The script reports request time, lines/s and SQL statements per request, and
+checks that each import recorded every line.
+
+    python -m benchmarks.bench_supplier_invoice [--sizes 10 100 400 1000 5000] [--products 20000] [--format csv]
+"""
+import argparse
+import io
+import json
+import random
+import time
+
+from benchmarks.common import login, make_app, remove_db, seed_products
+
+INVOICE_SIZES = (10, 100, 400, 1000, 5000)
+
+
+def make_invoice(product_ids, file_format, seed):
+    """Returns (file bytes, lines) for an invoice of the given products; supplier codes are derived from the barcodes."""
+    rng = random.Random(seed)
+    lines = [(f'SUP-{pid - 1:08d}', rng.randrange(1, 48), round(rng.uniform(1, 200), 2), f'BEN{pid - 1:08d}', pid) for pid in product_ids]
+    output = io.BytesIO()
+    if file_format == 'csv':
+        text = io.StringIO(); text.write('SupplierCode,Quantity,UnitCost,Barcode\n')
+        text.writelines(f'{code},{quantity},{cost},{barcode}\n' for code, quantity, cost, barcode, _ in lines)
+        output.write(text.getvalue().encode('utf-8'))
+    else:
+        from openpyxl import Workbook
+        workbook = Workbook(write_only=True); sheet = workbook.create_sheet('Invoice')
+        sheet.append(['SupplierCode', 'Quantity', 'UnitCost', 'Barcode'])
+        for code, quantity, cost, barcode, _ in lines: sheet.append([code, quantity, cost, barcode])
+        workbook.save(output)
+    return output.getvalue(), lines
+
+
+def timed_post(client, url, **kwargs):
+    from app import db
+    from app.query_count import count_queries
+    with count_queries(db.engine) as counter:
+        start = time.perf_counter(); response = client.post(url, **kwargs); elapsed = time.perf_counter() - start
+    if response.status_code != 302: raise RuntimeError(f'{url} failed with status {response.status_code}')
+    return elapsed, counter.count, response
+
+
+def run_size(size, products, file_format):
+    app, db_path = make_app()
+    from app import db
+    from app.inventory_kpis import reconcile
+    from app.models import Purchase, PurchaseItem, SupplierProductCode
+    with app.app_context():
+        seed_products(products, stock_quantity=100); reconcile()
+    client = login(app.test_client())
+    product_ids = random.Random(size).sample(range(1, products + 1), size)
+    results = {'lines': size, 'format': file_format}
+    with app.app_context():
+        for label, form in (('first_delivery', {}), ('mapped', {'update_costs': '1'})):
+            payload, _ = make_invoice(product_ids, file_format, seed=len(results))
+            elapsed, queries, response = timed_post(client, '/inventory/purchases/import', content_type='multipart/form-data', data={
+                'invoice_file': (io.BytesIO(payload), f'invoice.{file_format}'), 'supplier_name': 'Bench Supplier', 'invoice_number': label, **form})
+            recorded = db.session.query(PurchaseItem).join(Purchase).filter(Purchase.invoice_number == label).count()
+            if recorded != size or 'report=' in (response.location or ''): raise RuntimeError(f'{label}: recorded {recorded} of {size} lines ({response.location})')
+            results[label] = {'request_ms': round(elapsed * 1000, 1), 'lines_per_s': round(size / elapsed), 'queries': queries}
+        results['mapped_codes'] = db.session.query(SupplierProductCode).count()
+        _, lines = make_invoice(product_ids, file_format, seed=99)
+        cart = {'supplier_name': 'Bench Supplier', 'invoice_number': 'manual', 'items': [
+            {'product_id': pid, 'quantity': quantity, 'cost_price': cost} for _, quantity, cost, _, pid in lines]}
+        elapsed, queries, _ = timed_post(client, '/inventory/purchases/add', json=cart)
+        results['manual_cart'] = {'request_ms': round(elapsed * 1000, 1), 'lines_per_s': round(size / elapsed), 'queries': queries}
+    remove_db(db_path)
+    results['speedup_vs_manual_cart'] = round(results['manual_cart']['request_ms'] / results['mapped']['request_ms'], 1)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(INVOICE_SIZES), help='Invoice sizes (lines) to test')
+    parser.add_argument('--products', type=int, default=20000, help='Products in the catalogue')
+    parser.add_argument('--format', default='csv', choices=['csv', 'xlsx'], help='Invoice file format')
+    args = parser.parse_args()
+    print(json.dumps([run_size(size, args.products, args.format) for size in args.sizes], indent=2))
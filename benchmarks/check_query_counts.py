@@ -0,0 +1,79 @@
+# benchmarks/check_query_counts.py
+"""
+Query-count check: pins the number of SQL statements each page runs.
+
+Seeds sales of very different sizes (1 to 60 line items, with and without a
+customer). Each route below is then requested for a small and a large case.
+Both must stay within the route's budget, so a page whose query count grows
+with its rows (an N+1) fails even if the small case is cheap. Every count
+includes the Flask-Login user load.
+
+Prints the counts as JSON and exits with status 1 if any budget is exceeded:
+
+    python -m benchmarks.check_query_counts [--verbose]
+"""
+import argparse
+import json
+import random
+import sys
+from datetime import datetime, timedelta
+
+from benchmarks.common import make_app, remove_db, seed_products, login
+
+# route label -> (budget, [(case, url), ...]); {big}/{small} are sale ids filled in after seeding
+QUERY_BUDGETS = {
+    'list_sales': (4, [('page 1', '/billing/sales'), ('repeat, cached total', '/billing/sales')]),
+    'list_sales_search': (4, [('by payment method', '/billing/sales?query=Card'), ('by customer', '/billing/sales?query=Customer')]),
+    'view_sale': (4, [('1 item', '/billing/sales/view/{small}'), ('60 items', '/billing/sales/view/{big}')]),
+    'download_invoice_pdf': (3, [('1 item', '/billing/invoice/pdf/{small}'), ('60 items', '/billing/invoice/pdf/{big}')]),
+}
+
+
+def seed_sales(count=60, seed=3):
+    """Sales with 1..60 items each; returns (id of a 1-item sale, id of a 60-item sale). Needs an app context."""
+    from app import db
+    from app.models import Customer, Sale, SaleItem
+    rng = random.Random(seed)
+    seed_products(200)
+    customers = [Customer(name=f'Customer {i:03d}', phone_number=f'90000{i:05d}') for i in range(10)]
+    db.session.add_all(customers); db.session.flush()
+    sizes = [1, 60] + [rng.randint(1, 60) for _ in range(count - 2)]; ids = []
+    for i, size in enumerate(sizes):
+        sale = Sale(total_amount=100.0, discount_total=0.0, final_amount=100.0, payment_method=rng.choice(['Cash', 'Card', 'UPI']),
+                    sale_timestamp=datetime.utcnow() - timedelta(minutes=i), user_id=1, customer_id=rng.choice(customers).id if i % 2 else None)
+        db.session.add(sale); db.session.flush(); ids.append(sale.id)
+        db.session.add_all(SaleItem(sale_id=sale.id, product_id=rng.randint(1, 200), quantity=1, price_at_sale=10.0, discount_applied=0.0)
+                           for _ in range(size))
+    db.session.commit()
+    return ids[0], ids[1]
+
+
+def run(verbose=False):
+    from app import db
+    from app.query_count import count_queries
+    app, db_path = make_app()
+    try:
+        with app.app_context():
+            small, big = seed_sales(); engine = db.engine
+        client = login(app.test_client()); results = []
+        for route, (budget, cases) in QUERY_BUDGETS.items():
+            for case, url in cases:
+                url = url.format(small=small, big=big)
+                with count_queries(engine) as counter: # Each request runs in its own app context, as in production
+                    response = client.get(url)
+                if response.status_code != 200: raise RuntimeError(f'{url} returned {response.status_code}')
+                row = {'route': route, 'case': case, 'queries': counter.count, 'budget': budget, 'ok': counter.count <= budget}
+                if verbose: row['statements'] = counter.statements
+                results.append(row)
+        return results
+    finally:
+        remove_db(db_path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--verbose', action='store_true', help='Include the SQL statements of every request')
+    args = parser.parse_args()
+    results = run(args.verbose)
+    print(json.dumps(results, indent=2))
+    sys.exit(0 if all(row['ok'] for row in results) else 1)
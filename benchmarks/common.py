@@ -0,0 +1,108 @@
+# benchmarks/common.py
+"""
+Shared helpers for the benchmark scripts: a throwaway app backed by its own
+SQLite file, seeding helpers and latency statistics.
+"""
+import os
+import sys
+import tempfile
+import time
+
+# Make the project root importable when run as `python benchmarks/<script>.py`
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, PROJECT_ROOT)
+
+BENCH_USERNAME = 'bench_admin'
+BENCH_PASSWORD = 'bench_password'
+
+
+def open_app(db_path, config_name='production', **overrides):
+    """
+    Creates an app bound to an existing SQLite database file (also used by worker processes).
+    The engine is created inside create_app, so the URI (and any config overrides) are
+    supplied through a config subclass.
+    """
+    from config import config
+    from app import create_app
+    bench_config = type('BenchmarkConfig', (config[config_name],), {
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + db_path, 'WTF_CSRF_ENABLED': False, 'TESTING': True, **overrides})
+    config['benchmark'] = bench_config
+    return create_app('benchmark')
+
+
+def remove_db(db_path):
+    """Deletes a benchmark database with its WAL and shared-memory files."""
+    for path in (db_path, db_path + '-wal', db_path + '-shm'):
+        if os.path.exists(path): os.remove(path)
+
+
+def make_app(db_path=None, config_name='production', migrate=False, **overrides):
+    """
+    Creates an app bound to a fresh SQLite database (a temp file unless db_path is given)
+    with the schema and a benchmark admin user. Returns (app, db_path).
+    With migrate=True the schema is built by running the Alembic migrations instead of
+    db.create_all(), which also creates migration-only objects such as search indexes.
+    """
+    if db_path is None:
+        fd, db_path = tempfile.mkstemp(prefix='a3mart_bench_', suffix='.db'); os.close(fd)
+    remove_db(db_path)
+    app = open_app(db_path, config_name, **overrides)
+    from app import db
+    with app.app_context():
+        if migrate:
+            from flask_migrate import Migrate, upgrade
+            Migrate(app, db, directory=os.path.join(PROJECT_ROOT, 'migrations')); upgrade()
+        else:
+            db.create_all()
+        from app.models import User
+        admin = User(username=BENCH_USERNAME, is_admin=True); admin.set_password(BENCH_PASSWORD)
+        db.session.add(admin); db.session.commit()
+    return app, db_path
+
+
+def seed_products(count, stock_quantity=1_000_000, start=0, name_for=None):
+    """Bulk inserts `count` synthetic products (name_for(i) overrides the name). Must be called inside an app context."""
+    from app import db
+    from app.models import Product
+    name_for = name_for or (lambda i: f'Bench Product {i:07d}')
+    for chunk_start in range(start, start + count, 5000):
+        db.session.execute(Product.__table__.insert(), [{
+            'name': name_for(i), 'barcode': f'BEN{i:08d}', 'sku': f'SKU-{i:07d}',
+            'category': f'Category {i % 50}', 'brand': f'Brand {i % 200}',
+            'purchase_price': 5.0 + (i % 100), 'selling_price': 10.0 + (i % 100),
+            'stock_quantity': stock_quantity, 'low_stock_threshold': 10, 'discount_percent': 0.0, 'is_active': True,
+        } for i in range(chunk_start, min(chunk_start + 5000, start + count))])
+    db.session.commit()
+
+
+def login(client):
+    """Logs the benchmark admin into a test client."""
+    response = client.post('/auth/login', data={'username': BENCH_USERNAME, 'password': BENCH_PASSWORD})
+    if response.status_code != 302:
+        raise RuntimeError(f'Benchmark login failed with status {response.status_code}')
+    return client
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of numbers."""
+    if not samples: return 0.0
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def time_call(func, *args, **kwargs):
+    """Runs func once and returns (elapsed_ms, result)."""
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return (time.perf_counter() - start) * 1000.0, result
+
+
+def summarize(samples_ms):
+    """Returns p50/p99/mean summary (milliseconds) of a list of latencies."""
+    return {
+        'runs': len(samples_ms),
+        'p50_ms': round(percentile(samples_ms, 50), 3),
+        'p99_ms': round(percentile(samples_ms, 99), 3),
+        'mean_ms': round(sum(samples_ms) / len(samples_ms), 3) if samples_ms else 0.0,
+    }
@@ -0,0 +1,94 @@
+# benchmarks/dataset.py
+"""
+Seeded synthetic dataset for the benchmarks: a product catalogue, customers and
+a sales history with line items spread over the past `days` days, plus the
+reporting rollups rebuilt from that history (the dashboard and reports read
+them). The same seed always produces the same data.
+
+Builds a reusable database file (schema from the migrations):
+
+    python -m benchmarks.dataset --db /tmp/a3mart_bench.db [--products 20000] [--customers 2000]
+                                 [--sales 20000] [--items 4] [--days 90] [--seed 1]
+"""
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from benchmarks.bench_search import BRANDS, WORDS
+from benchmarks.common import make_app, seed_products
+
+DEFAULTS = {'products': 20_000, 'customers': 2_000, 'sales': 20_000, 'items': 4, 'days': 90, 'seed': 1}
+FIRST_NAMES = ('Ravi', 'Anita', 'Suresh', 'Priya', 'Imran', 'Kavya', 'Arjun', 'Meena', 'Farhan', 'Lakshmi')
+LAST_NAMES = ('Kumar', 'Shah', 'Rao', 'Khan', 'Iyer', 'Patel', 'Singh', 'Das')
+PAYMENT_METHODS = ('Cash', 'Cash', 'UPI', 'UPI', 'Card')
+CHUNK = 10_000
+
+
+def product_name(i):
+    rng = random.Random(i)
+    return f"{rng.choice(BRANDS)} {rng.choice(WORDS).title()} {rng.choice(WORDS).title()} {1 + i % 997}g"
+
+
+def selling_price(product_id):
+    """Selling price seed_products gives product `product_id` (ids start at 1)."""
+    return 10.0 + ((product_id - 1) % 100)
+
+
+def _insert(table, rows):
+    from app import db
+    for start in range(0, len(rows), CHUNK):
+        db.session.execute(table.insert(), rows[start:start + CHUNK])
+
+
+def generate_dataset(products=DEFAULTS['products'], customers=DEFAULTS['customers'], sales=DEFAULTS['sales'],
+                     items=DEFAULTS['items'], days=DEFAULTS['days'], seed=DEFAULTS['seed']):
+    """
+    Fills an empty database (inside an app context). Sales get ids 1..sales in time order and
+    1..2*items-1 lines each (items on average); a third of them are billed to a customer.
+    Returns the counts written and the time taken.
+    """
+    from app import db
+    from app.models import Customer, Sale, SaleItem
+    from app.inventory_kpis import reconcile
+    from app.sales_rollup import rebuild_rollups
+    if db.session.query(Sale.id).first() is not None: raise RuntimeError('generate_dataset needs an empty database')
+    rng = random.Random(seed); started = time.perf_counter()
+    slow_query_ms = current_app.config.get('SLOW_QUERY_MS'); current_app.config['SLOW_QUERY_MS'] = 0 # The bulk INSERTs are slow on purpose
+    seed_products(products, name_for=product_name)
+    _insert(Customer.__table__, [{
+        'name': f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {i}', 'phone_number': f'9{i:09d}',
+        'email': f'customer{i}@example.com'} for i in range(customers)])
+    now = datetime.utcnow(); first = now - timedelta(days=days); step = (now - first) / max(sales, 1)
+    sale_rows = []; item_rows = []
+    for sale_id in range(1, sales + 1):
+        lines = []
+        for product_id in rng.sample(range(1, products + 1), min(rng.randint(1, 2 * items - 1), products)):
+            quantity = rng.randint(1, 3); price = selling_price(product_id)
+            discount = round(quantity * price * 0.05, 2) if rng.random() < 0.1 else 0.0
+            lines.append({'sale_id': sale_id, 'product_id': product_id, 'quantity': quantity, 'price_at_sale': price, 'discount_applied': discount})
+        gross = sum(line['quantity'] * line['price_at_sale'] for line in lines); discount = sum(line['discount_applied'] for line in lines)
+        sale_rows.append({'id': sale_id, 'sale_timestamp': first + step * (sale_id - 1), 'total_amount': gross, 'discount_total': discount,
+                          'final_amount': gross - discount, 'payment_method': rng.choice(PAYMENT_METHODS), 'user_id': 1,
+                          'customer_id': rng.randint(1, customers) if customers and rng.random() < 1 / 3 else None})
+        item_rows.extend(lines)
+    _insert(Sale.__table__, sale_rows); _insert(SaleItem.__table__, item_rows)
+    db.session.commit()
+    rebuild_rollups(); reconcile()
+    current_app.config['SLOW_QUERY_MS'] = slow_query_ms
+    return {'products': products, 'customers': customers, 'sales': sales, 'sale_items': len(item_rows), 'days': days, 'seed': seed,
+            'seconds': round(time.perf_counter() - started, 1)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', required=True, help='SQLite file to create (replaced if it exists)')
+    for name, default in DEFAULTS.items():
+        parser.add_argument(f'--{name}', type=int, default=default)
+    args = parser.parse_args()
+    app, _ = make_app(args.db, migrate=True)
+    with app.app_context():
+        print(json.dumps(generate_dataset(**{name: getattr(args, name) for name in DEFAULTS}), indent=2))
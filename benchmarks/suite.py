@@ -0,0 +1,198 @@
+# benchmarks/suite.py
+"""
+Benchmark suite for the POS hot paths.
+
+Builds an app with create_app on a synthetic dataset (benchmarks/dataset.py)
+and drives the real routes through the Flask test client, as a logged-in
+till would:
+
+    scan            GET  inventory.scan_product_api (barcode lookup)
+    typeahead       GET  inventory.search_products_api
+    process_sale    POST billing.process_sale (1-7 lines)
+    process_return  POST billing.process_return (return_all of a different past sale each
+                    time; a request only succeeds if it flashes the processed return)
+    add_purchase    POST inventory.add_purchase (5 lines)
+    dashboard       GET  main.dashboard
+    report_sales_by_date, report_monthly_sales, report_product_sales
+                    GET  the three reports over the dataset's history
+    sticker_pdf     POST inventory.download_sticker_pdf (20 products x 5 labels)
+    invoice_pdf     GET  billing.download_invoice_pdf
+
+Each scenario is warmed up, then timed over --requests requests, spread over
+--concurrency threads (one test client each). It reports throughput and
+latency percentiles as JSON.
+
+--save-baseline FILE stores the results. --baseline FILE compares a run with
+them: a scenario regresses when its p50 is more than --tolerance (default 25%)
+and more than 1 ms slower. Any regression makes the run exit with status 1.
+
+    python -m benchmarks.suite [--requests 200] [--scenarios scan typeahead ...]
+                               [--products 20000 --customers 2000 --sales 20000 --items 4 --days 90 --seed 1]
+                               [--db FILE] [--concurrency 1] [--save-baseline FILE] [--baseline FILE]
+
+--db reuses a dataset built by `python -m benchmarks.dataset --db FILE` (or builds it there).
+Write scenarios add rows to it, so compare baselines on freshly built datasets.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from benchmarks.common import make_app, open_app, remove_db, login, percentile
+from benchmarks.dataset import DEFAULTS, generate_dataset, product_name, selling_price
+
+WARMUP_REQUESTS = 3
+REGRESSION_FLOOR_MS = 1.0 # Slowdowns smaller than this are noise, whatever the percentage
+
+
+class Scenario:
+    """
+    A route exercised by the suite: request(client, rng) returns the response; `expect` is the success status.
+    check(client, response), if given, also has to be true for a success (run outside the timing).
+    """
+    def __init__(self, name, request, expect=200, check=None):
+        self.name = name; self.request = request; self.expect = expect; self.check = check
+
+    def succeeded(self, client, response):
+        return response.status_code == self.expect and (self.check is None or self.check(client, response))
+
+
+def flashed_success(client, response):
+    """True when the request flashed a success message (and clears the flashes, so they do not pile up in the session)."""
+    with client.session_transaction() as session:
+        return any(category == 'success' for category, _ in session.pop('_flashes', []))
+
+
+def build_scenarios(dataset):
+    products = dataset['products']; days = dataset['days']
+    return_ids = iter(dataset['returnable_sale_ids']); return_lock = threading.Lock()
+    today = date.today(); history_start = (today - timedelta(days=days)).isoformat()
+
+    def cart(rng, lines):
+        return [{'product_id': pid, 'quantity': rng.randint(1, 3), 'price_at_sale': selling_price(pid), 'discount_applied': 0.0}
+                for pid in rng.sample(range(1, products + 1), lines)]
+
+    def process_return(client, rng):
+        with return_lock: sale_id = next(return_ids)
+        return client.post(f'/billing/sales/return/{sale_id}', data={'return_all': '1', 'return_reason': 'Benchmark return'})
+
+    def sticker_pdf(client, rng):
+        ids = rng.sample(range(1, products + 1), 20)
+        return client.post('/inventory/products/stickers/pdf', data={'product_ids': [str(pid) for pid in ids], **{f'sticker_qty_{pid}': '5' for pid in ids}})
+
+    return [
+        Scenario('scan', lambda client, rng: client.get('/inventory/api/products/scan', query_string={'code': f'BEN{rng.randrange(products):08d}'})),
+        Scenario('typeahead', lambda client, rng: client.get('/inventory/api/products/search', query_string={'q': ' '.join(product_name(rng.randrange(products)).lower().split()[:2])[:-2]})),
+        Scenario('process_sale', lambda client, rng: client.post('/billing/billing/process', json={'items': cart(rng, rng.randint(1, 7)), 'payment_method': 'Cash'})),
+        Scenario('process_return', process_return, expect=302, check=flashed_success), # A failed return redirects too
+        Scenario('add_purchase', lambda client, rng: client.post('/inventory/purchases/add', json={
+            'supplier_name': 'Benchmark Supplier', 'invoice_number': f'INV-{rng.randrange(10**6)}',
+            'items': [{'product_id': line['product_id'], 'quantity': 10, 'cost_price': line['price_at_sale'] / 2} for line in cart(rng, 5)]}), expect=302),
+        Scenario('dashboard', lambda client, rng: client.get('/dashboard')),
+        Scenario('report_sales_by_date', lambda client, rng: client.get('/reports/sales_by_date', query_string={'start_date': history_start, 'end_date': today.isoformat()})),
+        Scenario('report_monthly_sales', lambda client, rng: client.get('/reports/monthly_sales', query_string={'year': today.year})),
+        Scenario('report_product_sales', lambda client, rng: client.get('/reports/product_sales', query_string={'start_date': history_start, 'end_date': today.isoformat()})),
+        Scenario('sticker_pdf', sticker_pdf),
+        Scenario('invoice_pdf', lambda client, rng: client.get(f'/billing/invoice/pdf/{rng.randint(1, dataset["sales"])}')),
+    ]
+
+
+def run_scenario(scenario, clients, requests):
+    """Times `requests` requests spread over the clients (one thread each). Returns the scenario's result row."""
+    latencies = []; errors = []; lock = threading.Lock()
+
+    def worker(index, count):
+        rng = random.Random(f'{scenario.name}-{index}'); client = clients[index]; mine = []
+        for _ in range(count):
+            start = time.perf_counter(); response = scenario.request(client, rng); mine.append((time.perf_counter() - start) * 1000)
+            if not scenario.succeeded(client, response):
+                with lock: errors.append(response.status_code)
+        with lock: latencies.extend(mine)
+
+    warmup_rng = random.Random(f'{scenario.name}-warmup')
+    for _ in range(WARMUP_REQUESTS): scenario.request(clients[0], warmup_rng)
+    shares = [requests // len(clients) + (1 if i < requests % len(clients) else 0) for i in range(len(clients))]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(clients)) as pool:
+        for future in [pool.submit(worker, i, count) for i, count in enumerate(shares) if count]: future.result()
+    elapsed = time.perf_counter() - started
+    return {'requests': requests, 'errors': len(errors), 'error_statuses': sorted(set(errors)),
+            'throughput_rps': round(requests / elapsed, 1), 'p50_ms': round(percentile(latencies, 50), 2),
+            'p90_ms': round(percentile(latencies, 90), 2), 'p99_ms': round(percentile(latencies, 99), 2),
+            'mean_ms': round(sum(latencies) / len(latencies), 2)}
+
+
+def compare(results, baseline, tolerance):
+    """Per-scenario p50 change against a saved run; 'regressed' marks slowdowns beyond the tolerance."""
+    comparison = {}
+    for name, row in results.items():
+        before = baseline.get('scenarios', {}).get(name)
+        if not before: continue
+        change = row['p50_ms'] - before['p50_ms']
+        comparison[name] = {'p50_ms': row['p50_ms'], 'baseline_p50_ms': before['p50_ms'],
+                            'change_pct': round(100.0 * change / before['p50_ms'], 1) if before['p50_ms'] else None,
+                            'throughput_rps': row['throughput_rps'], 'baseline_throughput_rps': before['throughput_rps'],
+                            'regressed': change > REGRESSION_FLOOR_MS and row['p50_ms'] > before['p50_ms'] * (1 + tolerance)}
+    return comparison
+
+
+def prepare_app(db_path, spec):
+    """App on db_path with the dataset; built first when the file does not exist yet."""
+    import logging
+    logging.getLogger('app').setLevel(logging.ERROR) # process_sale and the jobs log at INFO; keep stdout for the JSON
+    if db_path and os.path.exists(db_path):
+        app = open_app(db_path); built = None
+    else:
+        app, db_path = make_app(db_path, migrate=True)
+        with app.app_context(): built = generate_dataset(**spec)
+    from app import db
+    from app.models import Product, Sale, SaleReturn
+    with app.app_context():
+        dataset = {'products': db.session.query(db.func.max(Product.id)).scalar() or 0,
+                   'sales': db.session.query(db.func.max(Sale.id)).scalar() or 0, 'days': spec['days']}
+        returned = {sale_id for sale_id, in db.session.query(SaleReturn.original_sale_id)}
+        dataset['returnable_sale_ids'] = [sale_id for sale_id, in db.session.query(Sale.id).order_by(Sale.id.desc()) if sale_id not in returned]
+    return app, db_path, dataset, built
+
+
+def run(requests, scenario_names, spec, db_path=None, concurrency=1):
+    keep = db_path is not None
+    app, db_path, dataset, built = prepare_app(db_path, spec)
+    try:
+        clients = [login(app.test_client()) for _ in range(concurrency)]
+        scenarios = [s for s in build_scenarios(dataset) if not scenario_names or s.name in scenario_names]
+        results = {scenario.name: run_scenario(scenario, clients, requests) for scenario in scenarios}
+        return {'dataset': built or {'db': db_path, 'products': dataset['products'], 'sales': dataset['sales']},
+                'requests_per_scenario': requests, 'concurrency': concurrency, 'scenarios': results}
+    finally:
+        if not keep: remove_db(db_path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=200, help='Timed requests per scenario')
+    parser.add_argument('--scenarios', nargs='+', help='Only these scenarios')
+    parser.add_argument('--concurrency', type=int, default=1, help='Client threads')
+    parser.add_argument('--db', help='Reuse (or build) the dataset in this SQLite file')
+    for name, default in DEFAULTS.items():
+        parser.add_argument(f'--{name}', type=int, default=default, help=f'Dataset {name} (default {default})')
+    parser.add_argument('--save-baseline', metavar='FILE', help='Write the results to FILE')
+    parser.add_argument('--baseline', metavar='FILE', help='Compare with the results saved in FILE')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed p50 slowdown against the baseline (0.25 = 25%%)')
+    args = parser.parse_args()
+    output = run(args.requests, args.scenarios, {name: getattr(args, name) for name in DEFAULTS}, args.db, args.concurrency)
+    regressed = []
+    if args.baseline:
+        with open(args.baseline) as f: output['comparison'] = compare(output['scenarios'], json.load(f), args.tolerance)
+        regressed = [name for name, row in output['comparison'].items() if row['regressed']]
+        output['regressions'] = regressed
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f: json.dump(output, f, indent=2)
+    print(json.dumps(output, indent=2))
+    errors = [name for name, row in output['scenarios'].items() if row['errors']]
+    sys.exit(1 if regressed or errors else 0)
@@ -17,12 +17,66 @@ class Config:
     LOW_STOCK_THRESHOLD = 10 # Threshold for low stock warnings
     BARCODE_PREFIX = "A3M" # Prefix for auto-generated barcodes
     BARCODE_START_NUMBER = 1 # Starting number for barcodes
+    BARCODE_BLOCK_SIZE = int(os.environ.get('BARCODE_BLOCK_SIZE', 50)) # Barcode numbers each worker reserves at a time (a restart skips its unused ones)
     BARCODE_SYSTEM = 'code128' # Type of barcode to generate (e.g., 'ean13', 'code128')
+    STOCK_LOCK_RETRIES = 5 # Attempts for a stock-changing transaction that hits a lock conflict
+    STOCK_LOCK_BACKOFF_SECONDS = 0.02 # Initial retry delay, doubled on each attempt (with jitter)
+    PRODUCT_INDEX_REFRESH_SECONDS = 30 # How often each worker pulls product changes made by other workers into its scan index
+    CATALOGUE_SNAPSHOT_TTL = 600 # Seconds an encoded full catalogue snapshot is cached (per catalogue version)
+    CATALOGUE_DELTA_OVERLAP_SECONDS = 60 # since=<version> deltas reach back this far, covering writes that committed late
+    SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND', 'auto') # Typeahead search: 'auto', 'sqlite_fts', 'postgres_trgm' or 'python'
+    SEARCH_INDEX_REFRESH_SECONDS = 300 # Rebuild interval of the in-process ('python') search index
+    CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'memory') # 'memory', 'file', 'redis' or 'null'
+    CACHE_DEFAULT_TTL = 60 # Seconds; also bounds how stale another worker's cache can be with the 'memory' backend
+    CACHE_MAX_ENTRIES = 1024 # LRU size of the 'memory' backend
+    CACHE_DIR = os.environ.get('CACHE_DIR') or os.path.join(instance_path, 'cache') # 'file' backend
+    CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/0') # 'redis' backend
+    PAGINATION_COUNT_TTL = 300 # Seconds the approximate total of a listing is cached (0: no totals, pages show only Previous/Next)
+    BARCODE_STICKER_RENDERER = os.environ.get('BARCODE_STICKER_RENDERER', 'raster') # 'raster' (cached PNGs) or 'vector' (bars drawn by ReportLab)
+    BARCODE_CACHE_MAX_ENTRIES = 2048 # Rendered barcode PNGs kept in memory per worker
+    BARCODE_DISK_CACHE = os.environ.get('BARCODE_DISK_CACHE', 'false').lower() in ('true', '1', 'on')
+    BARCODE_CACHE_DIR = os.environ.get('BARCODE_CACHE_DIR') or os.path.join(instance_path, 'barcodes') # Used when BARCODE_DISK_CACHE is on
+    STOCK_UPLOAD_CHUNK_SIZE = 2000 # Products per transaction in bulk stock uploads
+    PRODUCT_IMPORT_CHUNK_SIZE = 2000 # Rows read, checked and inserted per transaction in product catalogue imports
+    UPLOAD_REPORT_DIR = os.environ.get('UPLOAD_REPORT_DIR') or os.path.join(instance_path, 'upload_reports') # Per-row error reports of bulk uploads
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2)) # Worker threads per `flask run-workers` process
+    JOB_EMBEDDED_WORKERS = int(os.environ.get('JOB_EMBEDDED_WORKERS', 0)) # Worker threads inside each web process (0: only `flask run-workers` runs jobs)
+    JOB_POLL_SECONDS = 1.0 # How often an idle worker checks the queue
+    JOB_HEARTBEAT_SECONDS = 5 # How often progress and heartbeats of running jobs are written
+    JOB_STALE_SECONDS = 120 # A running job without a heartbeat for this long is requeued
+    JOB_MAX_ATTEMPTS = 3
+    JOB_RETENTION_DAYS = 7 # Finished jobs and their files are deleted after this many days
+    JOB_FILES_DIR = os.environ.get('JOB_FILES_DIR') or os.path.join(instance_path, 'jobs') # Job inputs and results
+    JOB_STOCK_UPLOAD_MIN_BYTES = 256 * 1024 # Larger stock-take files are processed by a background job
+    JOB_PRODUCT_IMPORT_MIN_BYTES = 256 * 1024 # Larger product catalogues are imported by a background job
+    JOB_EXPORT_MIN_ROWS = 50000 # Larger sales exports are prepared by a background job
+    JOB_STICKER_MIN_LABELS = 300 # Larger sticker sheets are drawn by a background job
+    JOB_INVOICE_BATCH_MIN_SALES = 100 # Larger invoice batches are rendered by a background job
+    INVENTORY_KPI_RECONCILE_SECONDS = int(os.environ.get('INVENTORY_KPI_RECONCILE_SECONDS', 3600)) # Job workers recount the dashboard's inventory totals this often (0: never)
+    OFFLINE_SYNC_MAX_SALES = 500 # Queued offline sales accepted per /billing/sync request
+    REORDER_HISTORY_DAYS = 365 # Days of daily product sales the reorder suggestions read
+    REORDER_VELOCITY_DAYS = 28 # Moving-average window of the sales velocity
+    REORDER_LEAD_TIME_DAYS = int(os.environ.get('REORDER_LEAD_TIME_DAYS', 7)) # Days from ordering to delivery
+    REORDER_COVER_DAYS = int(os.environ.get('REORDER_COVER_DAYS', 14)) # Days of sales an order covers beyond the lead time
+    REORDER_SERVICE_Z = 1.65 # Safety stock in standard deviations of daily sales (about a 95% service level)
+    REORDER_MAX_DRAFT_ITEMS = 500 # Most urgent products put in a generated purchase order draft
+    INSTRUMENTATION_ENABLED = os.environ.get('INSTRUMENTATION_ENABLED', 'true').lower() in ('true', 'on', '1')
+    SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 200)) # Statements slower than this are logged with their parameters (0: off)
+    SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', 1000)) # Requests slower than this are logged with their SQL totals (0: off)
+    HOT_PATH_LOG_SAMPLE_RATE = float(os.environ.get('HOT_PATH_LOG_SAMPLE_RATE', 0.0)) # Share of requests whose hot-path debug lines are logged
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN') # Bearer token for Prometheus on /metrics; without it only admins may read it
+    SQLITE_PRAGMAS = {} # PRAGMAs run on every new SQLite connection (see app/db_profile.py)
+    SQLITE_IMMEDIATE_WRITES = False # Stock-changing transactions start with BEGIN IMMEDIATE on SQLite (see app/db_profile.py)
+    DB_POOL_OPTIONS = {} # Connection pool settings for server databases such as PostgreSQL (not used for SQLite)
+    READ_YOUR_WRITES_SECONDS = 10 # After a user's request writes, their dashboard/report/list views read the primary for this long
+    REPLICA_RETRY_SECONDS = 30 # A replica that failed is left out for this long before it is tried again
 
     # Database configuration (using SQLite by default)
     # The actual URI is best kept in the instance/.env file for security
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
         'sqlite:///' + os.path.join(instance_path, 'a3mart.db')
+    # Optional read replica for the dashboard, reports, listings and search (see app/db_routing.py)
+    SQLALCHEMY_BINDS = {'replica': os.environ['DATABASE_REPLICA_URL']} if os.environ.get('DATABASE_REPLICA_URL') else {}
 
     # Ensure the instance folder exists
     try:
@@ -37,10 +91,30 @@ class Config:
 class DevelopmentConfig(Config):
     """Development configuration."""
     DEBUG = True
+    HOT_PATH_LOG_SAMPLE_RATE = float(os.environ.get('HOT_PATH_LOG_SAMPLE_RATE', 1.0)) # Every request while developing
+    JOB_EMBEDDED_WORKERS = int(os.environ.get('JOB_EMBEDDED_WORKERS', 1)) # `python run.py` runs jobs without a separate worker
 
 class ProductionConfig(Config):
     """Production configuration."""
     DEBUG = False
+    # SQLite: WAL lets readers run alongside the writer, synchronous=NORMAL syncs at checkpoints instead of every commit,
+    # and writers wait up to busy_timeout for the lock instead of failing with 'database is locked'
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000)), # Milliseconds
+        'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)), # Bytes of the file read through memory mapping
+        'cache_size': -int(os.environ.get('SQLITE_CACHE_KIB', 32 * 1024)), # Page cache per connection (negative: KiB)
+    }
+    SQLITE_IMMEDIATE_WRITES = True # Writers queue for the lock (busy_timeout) instead of failing and backing off
+    # PostgreSQL and other server databases: pool per worker process
+    DB_POOL_OPTIONS = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 10)), # Connections kept open
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)), # Extra connections opened under load, closed when returned
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 30)), # Seconds to wait for a free connection
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)), # Reconnect connections older than this (seconds), before server/proxy idle timeouts
+        'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', 'true').lower() in ('true', 'on', '1'), # Test connections on checkout
+    }
     # Add production-specific settings here (e.g., logging)
     # Ensure SECRET_KEY and DATABASE_URL are set securely via environment variables
 
@@ -51,6 +51,18 @@ def get_metadata():
     return target_db.metadata
 
 
+def include_object(object, name, type_, reflected, compare_to):
+    """Keeps autogenerate away from the search objects of f3a9c1d27b64, which
+    are not in the models: the FTS5 tables (products_fts, customers_fts and
+    their shadow tables), the lower(name) expression indexes and, on
+    PostgreSQL, the pg_trgm GIN indexes."""
+    if type_ == 'table' and '_fts' in name:
+        return False
+    if type_ == 'index' and name and name.endswith(('_name_lower', '_trgm')):
+        return False
+    return True
+
+
 def run_migrations_offline():
     """Run migrations in 'offline' mode.
 
@@ -65,7 +77,8 @@ def run_migrations_offline():
     """
     url = config.get_main_option("sqlalchemy.url")
     context.configure(
-        url=url, target_metadata=get_metadata(), literal_binds=True
+        url=url, target_metadata=get_metadata(), literal_binds=True,
+        include_object=include_object
     )
 
     with context.begin_transaction():
@@ -93,6 +106,7 @@ def run_migrations_online():
     conf_args = current_app.extensions['migrate'].configure_args
     if conf_args.get("process_revision_directives") is None:
         conf_args["process_revision_directives"] = process_revision_directives
+    conf_args.setdefault("include_object", include_object)
 
     connectable = get_engine()
 
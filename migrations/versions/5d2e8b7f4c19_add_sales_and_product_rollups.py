@@ -0,0 +1,79 @@
+"""Add daily sales, daily product and monthly product rollup tables
+
+Populate them from existing sales with `flask rebuild-rollups` after upgrading.
+
+Revision ID: 5d2e8b7f4c19
+Revises: f3a9c1d27b64
+Create Date: 2026-10-18 13:40:05.118827
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d2e8b7f4c19'
+down_revision = 'f3a9c1d27b64'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('daily_sales_rollup',
+    sa.Column('sale_date', sa.Date(), nullable=False),
+    sa.Column('payment_method', sa.String(length=50), nullable=False),
+    sa.Column('order_count', sa.Integer(), nullable=False),
+    sa.Column('gross_amount', sa.Float(), nullable=False),
+    sa.Column('discount_total', sa.Float(), nullable=False),
+    sa.Column('net_sales', sa.Float(), nullable=False),
+    sa.Column('return_count', sa.Integer(), nullable=False),
+    sa.Column('refunded_amount', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('sale_date', 'payment_method')
+    )
+    op.create_table('daily_product_rollup',
+    sa.Column('sale_date', sa.Date(), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('category', sa.String(length=64), nullable=True),
+    sa.Column('quantity_sold', sa.Integer(), nullable=False),
+    sa.Column('gross_revenue', sa.Float(), nullable=False),
+    sa.Column('discount_total', sa.Float(), nullable=False),
+    sa.Column('net_revenue', sa.Float(), nullable=False),
+    sa.Column('quantity_returned', sa.Integer(), nullable=False),
+    sa.Column('refunded_amount', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['product_id'], ['products.id'], ),
+    sa.PrimaryKeyConstraint('sale_date', 'product_id')
+    )
+    with op.batch_alter_table('daily_product_rollup', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_daily_product_rollup_category'), ['category'], unique=False)
+        batch_op.create_index(batch_op.f('ix_daily_product_rollup_product_id'), ['product_id'], unique=False)
+
+    op.create_table('monthly_product_rollup',
+    sa.Column('month', sa.Date(), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('category', sa.String(length=64), nullable=True),
+    sa.Column('quantity_sold', sa.Integer(), nullable=False),
+    sa.Column('gross_revenue', sa.Float(), nullable=False),
+    sa.Column('discount_total', sa.Float(), nullable=False),
+    sa.Column('net_revenue', sa.Float(), nullable=False),
+    sa.Column('quantity_returned', sa.Integer(), nullable=False),
+    sa.Column('refunded_amount', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['product_id'], ['products.id'], ),
+    sa.PrimaryKeyConstraint('month', 'product_id')
+    )
+    with op.batch_alter_table('monthly_product_rollup', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_monthly_product_rollup_category'), ['category'], unique=False)
+        batch_op.create_index(batch_op.f('ix_monthly_product_rollup_product_id'), ['product_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('monthly_product_rollup', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_monthly_product_rollup_product_id'))
+        batch_op.drop_index(batch_op.f('ix_monthly_product_rollup_category'))
+
+    op.drop_table('monthly_product_rollup')
+    with op.batch_alter_table('daily_product_rollup', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_daily_product_rollup_product_id'))
+        batch_op.drop_index(batch_op.f('ix_daily_product_rollup_category'))
+
+    op.drop_table('daily_product_rollup')
+    op.drop_table('daily_sales_rollup')
@@ -0,0 +1,52 @@
+"""Add inventory KPI totals and per-product contribution tables
+
+Populate them with `flask reconcile-inventory-kpis` after upgrading (the
+dashboard also fills them on first use).
+
+Revision ID: a7d4e2c91b36
+Revises: e5c3a8d1f742
+Create Date: 2026-10-18 19:12:40.503117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7d4e2c91b36'
+down_revision = 'e5c3a8d1f742'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('inventory_kpi_totals',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('stock_value', sa.Float(), nullable=False),
+    sa.Column('active_products', sa.Integer(), nullable=False),
+    sa.Column('low_stock_count', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.Column('reconciled_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('inventory_kpi_products',
+    sa.Column('product_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('stock_value', sa.Float(), nullable=False),
+    sa.Column('is_active', sa.Boolean(), nullable=False),
+    sa.Column('is_low_stock', sa.Boolean(), nullable=False),
+    sa.Column('stock_quantity', sa.Integer(), nullable=False),
+    sa.Column('expiry_date', sa.Date(), nullable=True),
+    sa.PrimaryKeyConstraint('product_id')
+    )
+    with op.batch_alter_table('inventory_kpi_products', schema=None) as batch_op:
+        batch_op.create_index('ix_inventory_kpi_products_low_stock', ['is_low_stock', 'stock_quantity'], unique=False)
+        batch_op.create_index(batch_op.f('ix_inventory_kpi_products_expiry_date'), ['expiry_date'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('inventory_kpi_products', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_inventory_kpi_products_expiry_date'))
+        batch_op.drop_index('ix_inventory_kpi_products_low_stock')
+
+    op.drop_table('inventory_kpi_products')
+    op.drop_table('inventory_kpi_totals')
@@ -0,0 +1,65 @@
+"""Add line-level return ledger and return lookup indexes
+
+sale_item_returns holds the quantity returned and amount refunded so far per
+sale line; sale_return_items.sale_item_id links a return line to the line it
+returns. Sales with a return recorded before line-level returns (always a full
+return) get ledger rows marking every line as fully returned.
+
+Revision ID: b3e8f1a6d254
+Revises: f6a2d9b4c731
+Create Date: 2026-10-18 23:05:48.219377
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3e8f1a6d254'
+down_revision = 'f6a2d9b4c731'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('sale_returns', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_sale_returns_original_sale_id'), ['original_sale_id'], unique=False)
+
+    with op.batch_alter_table('sale_return_items', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('sale_item_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_sale_return_items_sale_item_id', 'sale_items', ['sale_item_id'], ['id'])
+        batch_op.create_index(batch_op.f('ix_sale_return_items_sale_item_id'), ['sale_item_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_sale_return_items_sale_return_id'), ['sale_return_id'], unique=False)
+
+    op.create_table('sale_item_returns',
+    sa.Column('sale_item_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('sale_id', sa.Integer(), nullable=False),
+    sa.Column('quantity_returned', sa.Integer(), nullable=False),
+    sa.Column('amount_refunded', sa.Float(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['sale_id'], ['sales.id'], ),
+    sa.ForeignKeyConstraint(['sale_item_id'], ['sale_items.id'], ),
+    sa.PrimaryKeyConstraint('sale_item_id')
+    )
+    with op.batch_alter_table('sale_item_returns', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_sale_item_returns_sale_id'), ['sale_id'], unique=False)
+
+    op.execute(
+        "INSERT INTO sale_item_returns (sale_item_id, sale_id, quantity_returned, amount_refunded, updated_at) "
+        "SELECT si.id, si.sale_id, si.quantity, si.quantity * si.price_at_sale - COALESCE(si.discount_applied, 0), CURRENT_TIMESTAMP "
+        "FROM sale_items si WHERE si.sale_id IN (SELECT original_sale_id FROM sale_returns)")
+
+
+def downgrade():
+    with op.batch_alter_table('sale_item_returns', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_sale_item_returns_sale_id'))
+
+    op.drop_table('sale_item_returns')
+    with op.batch_alter_table('sale_return_items', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_sale_return_items_sale_return_id'))
+        batch_op.drop_index(batch_op.f('ix_sale_return_items_sale_item_id'))
+        batch_op.drop_constraint('fk_sale_return_items_sale_item_id', type_='foreignkey')
+        batch_op.drop_column('sale_item_id')
+
+    with op.batch_alter_table('sale_returns', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_sale_returns_original_sale_id'))
@@ -0,0 +1,31 @@
+"""Add barcode_sequences table for block-reserved barcode numbers
+
+The row for BARCODE_PREFIX is created on first use, starting after the highest
+existing barcode with that prefix.
+
+Revision ID: c18b5f3e7a92
+Revises: a7d4e2c91b36
+Create Date: 2026-10-18 20:05:11.847263
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c18b5f3e7a92'
+down_revision = 'a7d4e2c91b36'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('barcode_sequences',
+    sa.Column('prefix', sa.String(length=16), nullable=False),
+    sa.Column('next_value', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('prefix')
+    )
+
+
+def downgrade():
+    op.drop_table('barcode_sequences')
@@ -0,0 +1,26 @@
+"""Add index on sale_items.sale_id
+
+Revision ID: c6b1e4f08a27
+Revises: 8a4f2c6d9e13
+Create Date: 2026-10-18 16:40:12.904311
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c6b1e4f08a27'
+down_revision = '8a4f2c6d9e13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('sale_items', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_sale_items_sale_id'), ['sale_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('sale_items', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_sale_items_sale_id'))
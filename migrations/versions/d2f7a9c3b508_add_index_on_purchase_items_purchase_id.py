@@ -0,0 +1,26 @@
+"""Add index on purchase_items.purchase_id
+
+Revision ID: d2f7a9c3b508
+Revises: c6b1e4f08a27
+Create Date: 2026-10-18 18:05:37.221406
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2f7a9c3b508'
+down_revision = 'c6b1e4f08a27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('purchase_items', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_purchase_items_purchase_id'), ['purchase_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('purchase_items', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_purchase_items_purchase_id'))
@@ -0,0 +1,28 @@
+"""Add client_ref to sales
+
+Revision ID: e5c3a8d1f742
+Revises: d2f7a9c3b508
+Create Date: 2026-10-18 19:12:48.530174
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5c3a8d1f742'
+down_revision = 'd2f7a9c3b508'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('sales', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('client_ref', sa.String(length=64), nullable=True))
+        batch_op.create_index(batch_op.f('ix_sales_client_ref'), ['client_ref'], unique=True)
+
+
+def downgrade():
+    with op.batch_alter_table('sales', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_sales_client_ref'))
+        batch_op.drop_column('client_ref')
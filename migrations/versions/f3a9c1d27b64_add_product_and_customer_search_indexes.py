@@ -0,0 +1,84 @@
+"""Add product and customer search indexes
+
+SQLite: FTS5 trigram tables kept in sync by triggers, plus lower(name) indexes.
+PostgreSQL: pg_trgm GIN indexes on the searched columns.
+Other databases fall back to the in-process index in app/search_index.py.
+Note: batch_alter_table on products/customers recreates the table on SQLite and
+drops its triggers; such migrations must recreate the *_fts triggers.
+
+Revision ID: f3a9c1d27b64
+Revises: b41d7c2e9a10
+Create Date: 2026-10-18 11:02:17.540391
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3a9c1d27b64'
+down_revision = 'b41d7c2e9a10'
+branch_labels = None
+depends_on = None
+
+# table -> (fts table, searched columns)
+SEARCHED = {
+    'products': ('products_fts', ('name', 'barcode', 'sku')),
+    'customers': ('customers_fts', ('name', 'phone_number', 'email')),
+}
+
+
+def _sqlite_upgrade():
+    for table, (fts, columns) in SEARCHED.items():
+        cols = ', '.join(columns)
+        new_values = ', '.join(f'new.{c}' for c in columns)
+        old_values = ', '.join(f'old.{c}' for c in columns)
+        op.execute(f"CREATE VIRTUAL TABLE {fts} USING fts5({cols}, content='{table}', content_rowid='id', tokenize='trigram')")
+        op.execute(f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {table} BEGIN "
+                   f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_values}); END")
+        op.execute(f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {table} BEGIN "
+                   f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_values}); END")
+        # Only fires when a searched column changes, so stock updates don't touch the FTS table
+        op.execute(f"CREATE TRIGGER {fts}_au AFTER UPDATE OF {cols} ON {table} BEGIN "
+                   f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_values}); "
+                   f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_values}); END")
+        op.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+        op.create_index(f'ix_{table}_name_lower', table, [sa.text('lower(name)')], unique=False)
+
+
+def _sqlite_downgrade():
+    for table, (fts, _) in SEARCHED.items():
+        op.drop_index(f'ix_{table}_name_lower', table_name=table)
+        for suffix in ('ai', 'ad', 'au'):
+            op.execute(f"DROP TRIGGER IF EXISTS {fts}_{suffix}")
+        op.execute(f"DROP TABLE IF EXISTS {fts}")
+
+
+def _postgres_upgrade():
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for table, (_, columns) in SEARCHED.items():
+        for column in columns:
+            op.create_index(f'ix_{table}_{column}_trgm', table, [column], unique=False,
+                            postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'})
+
+
+def _postgres_downgrade():
+    for table, (_, columns) in SEARCHED.items():
+        for column in columns:
+            op.drop_index(f'ix_{table}_{column}_trgm', table_name=table)
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        _sqlite_upgrade()
+    elif dialect == 'postgresql':
+        _postgres_upgrade()
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        _sqlite_downgrade()
+    elif dialect == 'postgresql':
+        _postgres_downgrade()
@@ -0,0 +1,41 @@
+"""Add supplier_product_codes table mapping supplier codes to products
+
+Supplier invoice imports resolve their lines through the unique
+(supplier_name, supplier_code) index.
+
+Revision ID: f6a2d9b4c731
+Revises: c18b5f3e7a92
+Create Date: 2026-10-18 21:40:37.512904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f6a2d9b4c731'
+down_revision = 'c18b5f3e7a92'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('supplier_product_codes',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('supplier_name', sa.String(length=128), nullable=False),
+    sa.Column('supplier_code', sa.String(length=64), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['product_id'], ['products.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('supplier_name', 'supplier_code', name='uq_supplier_product_codes_supplier_code')
+    )
+    with op.batch_alter_table('supplier_product_codes', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_supplier_product_codes_product_id'), ['product_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('supplier_product_codes', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_supplier_product_codes_product_id'))
+
+    op.drop_table('supplier_product_codes')
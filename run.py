@@ -36,6 +36,54 @@ def create_admin(username, password):
     db.session.commit()
     print(f'Admin user {username} created successfully.')
 
+@app.cli.command('rebuild-rollups')
+@click.option('--start', 'start', default=None, help='First day to rebuild (YYYY-MM-DD). Defaults to the first sale.')
+@click.option('--end', 'end', default=None, help='Last day to rebuild (YYYY-MM-DD). Defaults to the last sale or return.')
+def rebuild_rollups_command(start, end):
+    """Recomputes the daily sales/product rollups from the sales and returns history."""
+    from datetime import date
+    from app.sales_rollup import rebuild_rollups
+    try:
+        start = date.fromisoformat(start) if start else None; end = date.fromisoformat(end) if end else None
+    except ValueError:
+        raise click.BadParameter('Dates must be in YYYY-MM-DD format.')
+    sales_rows, product_rows = rebuild_rollups(start, end)
+    print(f'Rollups rebuilt: {sales_rows} daily sales rows, {product_rows} daily product rows.')
+
+@app.cli.command('reconcile-inventory-kpis')
+def reconcile_inventory_kpis_command():
+    """Recounts the dashboard's inventory totals (stock value, active and low-stock products) and corrects any drift."""
+    from app.inventory_kpis import describe_reconcile, reconcile
+    print(describe_reconcile(*reconcile()))
+
+@app.cli.command('run-workers')
+@click.option('--workers', 'workers', default=None, type=int, help='Worker threads (default: JOB_WORKERS).')
+@click.option('--poll-interval', 'poll_interval', default=None, type=float, help='Seconds between queue checks when idle (default: JOB_POLL_SECONDS).')
+def run_workers_command(workers, poll_interval):
+    """Runs background jobs (large uploads, exports, sticker PDFs) until stopped with Ctrl+C or SIGTERM."""
+    from app.job_queue import WorkerPool
+    pool = WorkerPool(app, size=workers, poll_interval=poll_interval)
+    print(f'Running {pool.size} job worker(s). Press Ctrl+C to stop (running jobs are finished first).')
+    pool.run_forever()
+    print('Job workers stopped.')
+
+@app.cli.command('sync-replica')
+@click.option('--interval', 'interval', default=None, type=float, help='Keep copying every N seconds until stopped (default: copy once).')
+def sync_replica_command(interval):
+    """Copies the SQLite database into the SQLite read replica (DATABASE_REPLICA_URL), for local testing."""
+    import time
+    from app.db_routing import REPLICA_BIND, sync_sqlite_replica
+    if REPLICA_BIND not in app.config.get('SQLALCHEMY_BINDS', {}):
+        raise click.UsageError('No read replica configured: set DATABASE_REPLICA_URL.')
+    try:
+        while True:
+            try: print(f'Replica synced in {sync_sqlite_replica():.2f}s.')
+            except ValueError as e: raise click.UsageError(str(e))
+            if not interval: break
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+
 # Add more CLI commands as needed, e.g., for seeding data
 
 if __name__ == '__main__':